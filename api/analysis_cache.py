@@ -0,0 +1,311 @@
+"""
+Per-stock analysis cache module.
+Caches analyze_stock verdicts keyed by (stock code, K-line data version,
+analyzer-relevant config subset), so scans that only differ in non-analyzer
+settings (max_stock_count, expected_count, fundamental filter, ...) or that
+re-run over unchanged data reuse earlier per-stock results.
+
+Next to the verdicts it keeps each stock's quick-check features (box range
+and volatility per window), which do not depend on any threshold. A scan
+with different thresholds re-applies its box/volatility thresholds to them
+and rejects most stocks without analyzing them again.
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from colorama import Fore, Style
+
+try:
+    from .analyzers.analysis_result import RejectedAnalysis, STAGE_QUICK_CHECK, is_compact_result
+    from .analyzers.frame_utils import prepare_analysis_frame
+    from .analyzers.price_analyzer import quick_price_check
+    from .json_utils import dumps_json
+    from .stock_database import get_stock_database
+except ImportError:
+    from api.analyzers.analysis_result import RejectedAnalysis, STAGE_QUICK_CHECK, is_compact_result
+    from api.analyzers.frame_utils import prepare_analysis_frame
+    from api.analyzers.price_analyzer import quick_price_check
+    from api.json_utils import dumps_json
+    from api.stock_database import get_stock_database
+
+# Bump when analyzer logic changes so old verdicts are no longer reused
+ANALYSIS_CACHE_VERSION = 2
+
+# Entries older than this are pruned when new results are saved
+ANALYSIS_CACHE_MAX_AGE_DAYS = 30
+
+# Config fields that influence analyze_stock; everything else
+# (max_stock_count, expected_count, fundamental filter, workers...) does not
+ANALYZER_CONFIG_FIELDS = [
+    'windows', 'box_threshold', 'ma_diff_threshold', 'volatility_threshold',
+    'volume_change_threshold', 'volume_stability_threshold', 'volume_increase_threshold',
+    'use_volume_analysis', 'use_breakthrough_prediction', 'use_window_weights',
+    'window_weights', 'use_low_position', 'high_point_lookback_days',
+    'decline_period_days', 'decline_threshold', 'use_rapid_decline_detection',
+    'rapid_decline_days', 'rapid_decline_threshold', 'use_breakthrough_confirmation',
+    'breakthrough_confirmation_days', 'use_box_detection', 'box_quality_threshold',
+    'max_turnover_rate', 'allow_turnover_spikes', 'check_relative_strength',
+    'outperform_index_threshold', 'relative_strength_benchmark'
+]
+
+# K-line columns that define a stock's data version
+KLINE_VERSION_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume', 'turn',
+                         'preclose', 'pctChg', 'peTTM', 'pbMRQ']
+
+
+def analyzer_config_hash(config: Any) -> str:
+    """
+    Hash the analyzer-relevant subset of a scan config.
+
+    Args:
+        config: ScanConfig instance or config dictionary
+
+    Returns:
+        MD5 hash string
+    """
+    config_dict = config if isinstance(config, dict) else config.model_dump()
+    subset = {field: config_dict.get(field) for field in ANALYZER_CONFIG_FIELDS}
+    subset['_version'] = ANALYSIS_CACHE_VERSION
+    config_str = json.dumps(subset, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(config_str.encode('utf-8')).hexdigest()
+
+
+def quick_features_hash(windows: List[int]) -> str:
+    """
+    Hash the key of the threshold-independent quick-check features.
+
+    Args:
+        windows: Windows checked by the scan
+
+    Returns:
+        MD5 hash string
+    """
+    key_str = json.dumps({'_kind': 'quick_features', 'windows': windows,
+                          '_version': ANALYSIS_CACHE_VERSION}, sort_keys=True)
+    return hashlib.md5(key_str.encode('utf-8')).hexdigest()
+
+
+def kline_data_version(df: pd.DataFrame) -> str:
+    """
+    Compute a content hash of a K-line DataFrame.
+    Any corrected bar (price, volume, date) produces a different version.
+
+    Args:
+        df: K-line DataFrame
+
+    Returns:
+        MD5 hash string ('' for empty data)
+    """
+    if df is None or df.empty:
+        return ''
+    columns = [col for col in KLINE_VERSION_COLUMNS if col in df.columns]
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return hashlib.md5(row_hashes.values.tobytes()).hexdigest()
+
+
+def _restore_int_keys(value: Any) -> Any:
+    """JSON turns window-size keys (int) into strings; convert them back."""
+    if isinstance(value, dict):
+        return {
+            (int(k) if isinstance(k, str) and k.isdigit() else k): _restore_int_keys(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_restore_int_keys(item) for item in value]
+    return value
+
+
+def compute_quick_features(df: pd.DataFrame, windows: List[int],
+                           result: Any = None) -> Optional[Dict[str, Any]]:
+    """
+    Get a stock's threshold-independent quick-check features.
+
+    Args:
+        df: K-line DataFrame the analysis ran on
+        windows: Windows checked by the scan
+        result: analyze_stock result; a rejection that already carries the
+            features is reused instead of recomputing them
+
+    Returns:
+        Dict with box_ranges and volatilities (one value per window), or
+        None for a rejection without features
+    """
+    if isinstance(result, RejectedAnalysis):
+        if not result.box_ranges:
+            return None
+        return {'box_ranges': result.box_ranges, 'volatilities': result.volatilities}
+    # 通过快速检查的股票结果里只有平台窗口的特征，这里补算全部窗口（只算极值和标准差）
+    frame = prepare_analysis_frame(df)
+    box_ranges, volatilities = [], []
+    for window in windows:
+        _, features = quick_price_check(frame, window, float('inf'), float('inf'))
+        box_ranges.append(float(features['box_range']))
+        volatilities.append(float(features['volatility']))
+    return {'box_ranges': box_ranges, 'volatilities': volatilities}
+
+
+class StockAnalysisCache:
+    """
+    Per-scan view of the analysis cache.
+    Looks entries up in the database per stock (only the current data
+    version can hit), falls back to re-applying the scan's quick-check
+    thresholds to cached features, and writes new entries back in a single
+    transaction on flush().
+    Not thread-safe: scan_stocks analyzes results on a single thread.
+    """
+
+    def __init__(self, config: Any, end_date: str,
+                 market_df: Optional[pd.DataFrame] = None,
+                 enabled: bool = True):
+        """
+        Initialize the cache for one scan.
+
+        Args:
+            config: Scan configuration
+            end_date: Scan end date (YYYY-MM-DD)
+            market_df: Market index data used for relative strength (part of the version)
+            enabled: If False, get() always misses and nothing is stored
+        """
+        self.enabled = enabled
+        self.config_hash = analyzer_config_hash(config)
+        self.hits = 0
+        self.misses = 0
+        self.windows = list(getattr(config, 'windows', None) or [])
+        self.box_threshold = getattr(config, 'box_threshold', None)
+        self.volatility_threshold = getattr(config, 'volatility_threshold', None)
+        self.features_hash = quick_features_hash(self.windows)
+        self._pending: Dict[str, tuple] = {}
+        self._pending_features: Dict[str, tuple] = {}
+        self._versions: Dict[str, Tuple[str, str]] = {}
+
+        # 相对强度依赖大盘数据，大盘数据变化时个股结论也需失效
+        market_version = ''
+        if getattr(config, 'check_relative_strength', False) and market_df is not None:
+            market_version = kline_data_version(market_df)
+        self._version_salt = f"{end_date}:{market_version}"
+
+    def _data_versions(self, code: str, df: pd.DataFrame) -> Tuple[str, str]:
+        """(verdict version, feature version) of a stock's data; features need no salt."""
+        if code not in self._versions:
+            kline_version = kline_data_version(df)
+            verdict_version = hashlib.md5(
+                f"{kline_version}:{self._version_salt}".encode('utf-8')
+            ).hexdigest()
+            self._versions[code] = (verdict_version, kline_version)
+        return self._versions[code]
+
+    def _load(self, config_hash: str, code: str, version: str) -> Optional[Any]:
+        try:
+            blob = get_stock_database().get_analysis_cache_entry(config_hash, code, version)
+            if blob is None:
+                return None
+            return _restore_int_keys(json.loads(zlib.decompress(blob).decode('utf-8')))
+        except (zlib.error, ValueError) as e:
+            print(f"{Fore.YELLOW}[ANALYSIS_CACHE] Corrupt entry for {code}: {e}{Style.RESET_ALL}")
+        except Exception as e:
+            print(f"{Fore.YELLOW}[ANALYSIS_CACHE] Failed to read cache entry for {code}: {e}{Style.RESET_ALL}")
+        return None
+
+    def _reject_from_features(self, features: Dict[str, Any]) -> Optional[RejectedAnalysis]:
+        """
+        Re-apply this scan's quick-check thresholds to cached features.
+
+        Returns:
+            The quick-check rejection analyze_stock would return, or None if
+            any window passes (the stock needs a full analysis)
+        """
+        if self.box_threshold is None or self.volatility_threshold is None:
+            return None
+        # JSON 把 inf/NaN 写成 null，按未通过处理（与 quick_price_check 的比较结果一致）
+        box_ranges = [float('inf') if v is None else v for v in features.get('box_ranges') or []]
+        volatilities = [float('inf') if v is None else v for v in features.get('volatilities') or []]
+        if len(box_ranges) != len(self.windows) or len(volatilities) != len(self.windows):
+            return None
+        for box_range, volatility in zip(box_ranges, volatilities):
+            if box_range <= self.box_threshold and volatility <= self.volatility_threshold:
+                return None
+        return RejectedAnalysis(STAGE_QUICK_CHECK, self.windows, box_ranges, volatilities,
+                                self.box_threshold, self.volatility_threshold)
+
+    def get(self, code: str, df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """
+        Get a cached analysis result for a stock.
+
+        Args:
+            code: Stock code
+            df: K-line DataFrame the analysis would run on
+
+        Returns:
+            Cached analyze_stock result (RejectedAnalysis for rejected
+            stocks), or None on miss
+        """
+        if not self.enabled:
+            return None
+        verdict_version, kline_version = self._data_versions(code, df)
+        result = self._load(self.config_hash, code, verdict_version)
+        if result is None and kline_version:
+            # 阈值变化后整条结论失效，但快速检查特征仍可复用
+            features = self._load(self.features_hash, code, kline_version)
+            result = self._reject_from_features(features) if features else None
+            if result is not None:
+                self.hits += 1
+                return result
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if is_compact_result(result):
+            return RejectedAnalysis.from_compact(result)
+        return result
+
+    def put(self, code: str, df: pd.DataFrame, result: Dict[str, Any]) -> None:
+        """
+        Record an analysis result to be saved on flush().
+
+        Args:
+            code: Stock code
+            df: K-line DataFrame the analysis ran on
+            result: analyze_stock result
+        """
+        if not self.enabled:
+            return
+        verdict_version, kline_version = self._data_versions(code, df)
+        try:
+            # 被拒绝的股票只保存紧凑记录
+            payload = result.to_compact() if isinstance(result, RejectedAnalysis) else result
+            self._pending[code] = (code, verdict_version, zlib.compress(dumps_json(payload), 6))
+            features = compute_quick_features(df, self.windows, result) if kline_version else None
+            if features is not None:
+                self._pending_features[code] = (
+                    code, kline_version, zlib.compress(dumps_json(features), 6)
+                )
+        except Exception as e:
+            print(f"{Fore.YELLOW}[ANALYSIS_CACHE] Failed to encode result for {code}: {e}{Style.RESET_ALL}")
+
+    def flush(self) -> int:
+        """
+        Save pending results to the database.
+
+        Returns:
+            Number of verdicts written
+        """
+        if not self.enabled or not self._pending:
+            return 0
+        entries = list(self._pending.values())
+        try:
+            db = get_stock_database()
+            db.save_analysis_cache_entries(self.config_hash, entries)
+            db.save_analysis_cache_entries(
+                self.features_hash, list(self._pending_features.values()),
+                max_age_days=ANALYSIS_CACHE_MAX_AGE_DAYS
+            )
+            self._pending.clear()
+            self._pending_features.clear()
+        except Exception as e:
+            print(f"{Fore.YELLOW}[ANALYSIS_CACHE] Failed to save analysis cache: {e}{Style.RESET_ALL}")
+            return 0
+        print(f"{Fore.GREEN}[ANALYSIS_CACHE] Saved {len(entries)} verdicts (hits={self.hits}, misses={self.misses}){Style.RESET_ALL}")
+        return len(entries)
@@ -0,0 +1,173 @@
+"""
+Analysis Result module with the compact record for rejected stocks.
+
+Most stocks of a scan fail one of analyze_stock's early checks and only
+their is_platform flag is read. RejectedAnalysis keeps the few numbers
+behind the verdict and builds the verbose per-window explanation only when
+the result is inspected (check endpoint, cases, debugging), so scans no
+longer build thousands of nested dicts that are thrown away.
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+# Rejection stages, in the order analyze_stock reaches them
+STAGE_NO_DATA = 'no_data'
+STAGE_QUICK_CHECK = 'quick_check'
+STAGE_BASIC_PLATFORM = 'basic_platform'
+
+_EARLY_EXIT_REASONS = {
+    STAGE_QUICK_CHECK: "快速价格检查未通过",
+    STAGE_BASIC_PLATFORM: "基本平台期条件未满足",
+}
+
+# Marker of the compact form stored in the analysis cache
+COMPACT_KIND = 'rejected'
+
+
+class RejectedAnalysis(Mapping):
+    """
+    Read-only analyze_stock result of a rejected stock.
+
+    Behaves like the result dictionary analyze_stock used to return
+    (result["is_platform"], .get(), "key" in result, dict(result)); the
+    dictionary is built on first access to any key other than is_platform.
+    """
+
+    __slots__ = ('stage', 'windows', 'box_ranges', 'volatilities',
+                 'box_threshold', 'volatility_threshold', 'window_details', '_expanded')
+
+    def __init__(self, stage: str, windows: List[int],
+                 box_ranges: Optional[List[float]] = None,
+                 volatilities: Optional[List[float]] = None,
+                 box_threshold: Optional[float] = None,
+                 volatility_threshold: Optional[float] = None,
+                 window_details: Optional[Dict[int, Dict[str, Any]]] = None):
+        """
+        Initialize the record.
+
+        Args:
+            stage: Stage the stock was rejected at (STAGE_* constant)
+            windows: Windows checked
+            box_ranges: Quick-check box range per window (aligned with windows)
+            volatilities: Quick-check volatility per window (aligned with windows)
+            box_threshold: Box threshold used by the quick check
+            volatility_threshold: Volatility threshold used by the quick check
+            window_details: Full details of the windows analyzed past the
+                quick check (basic_platform stage only)
+        """
+        self.stage = stage
+        self.windows = windows
+        self.box_ranges = box_ranges or []
+        self.volatilities = volatilities or []
+        self.box_threshold = box_threshold
+        self.volatility_threshold = volatility_threshold
+        self.window_details = window_details or {}
+        self._expanded: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_platform(self) -> bool:
+        return False
+
+    def expand(self) -> Dict[str, Any]:
+        """
+        Build (once) the verbose result dictionary.
+
+        Returns:
+            The analyze_stock result dictionary for this rejection
+        """
+        if self._expanded is None:
+            self._expanded = self._build()
+        return self._expanded
+
+    def _build(self) -> Dict[str, Any]:
+        if self.stage == STAGE_NO_DATA:
+            return {
+                "is_platform": False,
+                "windows_checked": self.windows,
+                "platform_windows": [],
+                "details": {w: {"status": "无数据"} for w in self.windows},
+                "selection_reasons": {}
+            }
+
+        details: Dict[int, Dict[str, Any]] = dict(self.window_details)
+        for window, box_range, volatility in zip(self.windows, self.box_ranges, self.volatilities):
+            if window in details:
+                continue
+            quick_check = {"box_range": box_range, "volatility": volatility}
+            if self.stage == STAGE_QUICK_CHECK:
+                quick_check["box_threshold"] = self.box_threshold
+                quick_check["volatility_threshold"] = self.volatility_threshold
+            details[window] = {"status": "快速检查未通过", "quick_check": quick_check}
+
+        return {
+            "is_platform": False,
+            "windows_checked": self.windows,
+            "platform_windows": [],
+            "details": details,
+            "selection_reasons": {},
+            "early_exit": True,
+            "early_exit_reason": _EARLY_EXIT_REASONS[self.stage]
+        }
+
+    def __getitem__(self, key: str) -> Any:
+        # 扫描只读取 is_platform，不需要展开完整结果
+        if key == "is_platform":
+            return False
+        return self.expand()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.expand())
+
+    def __len__(self) -> int:
+        return len(self.expand())
+
+    def __repr__(self) -> str:
+        return f"RejectedAnalysis(stage={self.stage!r}, windows={self.windows!r})"
+
+    def to_compact(self) -> Dict[str, Any]:
+        """
+        Get the compact form saved by the analysis cache.
+
+        Returns:
+            JSON-serializable dictionary (restored with from_compact)
+        """
+        return {
+            "_kind": COMPACT_KIND,
+            "stage": self.stage,
+            "windows": self.windows,
+            "box_ranges": self.box_ranges,
+            "volatilities": self.volatilities,
+            "box_threshold": self.box_threshold,
+            "volatility_threshold": self.volatility_threshold,
+            "window_details": self.window_details,
+        }
+
+    @classmethod
+    def from_compact(cls, data: Dict[str, Any]) -> 'RejectedAnalysis':
+        """
+        Restore a record from its compact form.
+
+        Args:
+            data: Dictionary produced by to_compact (window keys as int)
+
+        Returns:
+            RejectedAnalysis instance
+        """
+        # JSON 把 inf 写成 null，还原为 inf 以保持原有语义
+        def restore(values: List[Optional[float]]) -> List[float]:
+            return [float('inf') if v is None else v for v in values]
+
+        return cls(
+            stage=data["stage"],
+            windows=data["windows"],
+            box_ranges=restore(data.get("box_ranges") or []),
+            volatilities=restore(data.get("volatilities") or []),
+            box_threshold=data.get("box_threshold"),
+            volatility_threshold=data.get("volatility_threshold"),
+            window_details=data.get("window_details") or {},
+        )
+
+
+def is_compact_result(data: Any) -> bool:
+    """Check whether a decoded cache entry is a RejectedAnalysis compact form."""
+    return isinstance(data, dict) and data.get("_kind") == COMPACT_KIND
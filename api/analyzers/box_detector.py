@@ -64,7 +64,7 @@ def identify_support_resistance(df: pd.DataFrame, window: int,
         }
 
     # Get recent data for the window
-    recent_df = df.iloc[-window:].copy()
+    recent_df = df.iloc[-window:]
 
     # Get high and low prices
     highs = recent_df['high'].values
@@ -258,7 +258,7 @@ def analyze_box_pattern(df: pd.DataFrame, window: int,
 
     # Calculate additional box pattern metrics
     if len(df) >= window:
-        recent_df = df.iloc[-window:].copy()
+        recent_df = df.iloc[-window:]
 
         # Calculate price volatility within the box
         volatility = recent_df['close'].pct_change(fill_method=None).std()
@@ -32,7 +32,7 @@ def check_macd_signal(df: pd.DataFrame, lookback_period: int = 5) -> Tuple[bool,
         return False, {"status": "数据不足", "indicator": "MACD"}
 
     # Get recent data
-    recent_df = df.iloc[-lookback_period-2:].copy()
+    recent_df = df.iloc[-lookback_period-2:]
 
     # Check for MACD crossover (MACD line crosses above signal line)
     macd_values = recent_df['macd'].values
@@ -88,7 +88,7 @@ def check_rsi_signal(df: pd.DataFrame, oversold_threshold: float = 30, overbough
         return False, {"status": "数据不足", "indicator": "RSI"}
 
     # Get recent data
-    recent_df = df.iloc[-5:].copy()
+    recent_df = df.iloc[-5:]
 
     # Get current RSI and previous RSI
     current_rsi = recent_df['rsi'].iloc[-1]
@@ -137,7 +137,7 @@ def check_kdj_signal(df: pd.DataFrame) -> Tuple[bool, Dict[str, Any]]:
         return False, {"status": "数据不足", "indicator": "KDJ"}
 
     # Get recent data
-    recent_df = df.iloc[-5:].copy()
+    recent_df = df.iloc[-5:]
 
     # Check for golden cross (K line crosses above D line)
     k_values = recent_df['k'].values
@@ -189,7 +189,7 @@ def check_bollinger_bands_signal(df: pd.DataFrame) -> Tuple[bool, Dict[str, Any]
         return False, {"status": "数据不足", "indicator": "布林带"}
 
     # Get recent data
-    recent_df = df.iloc[-5:].copy()
+    recent_df = df.iloc[-5:]
 
     # Check if price is near upper band
     close_to_upper = recent_df['close'].iloc[-1] > (recent_df['bb_middle'].iloc[-1] + 0.5 * (
@@ -304,7 +304,7 @@ def check_breakthrough_confirmation(df: pd.DataFrame,
         }
 
     # Get the most recent data
-    recent_df = df.iloc[-5-confirmation_days:].copy()
+    recent_df = df.iloc[-5-confirmation_days:]
 
     # Check for potential breakthrough day
     # A breakthrough day typically has higher volume and a significant price increase
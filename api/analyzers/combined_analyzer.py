@@ -13,7 +13,13 @@ from .window_weight_analyzer import apply_window_weights
 from .enhanced_platform_analyzer import analyze_enhanced_platform, check_enhanced_platform
 from .box_detector import analyze_box_pattern, check_box_pattern
 from .decline_analyzer import analyze_decline_speed, check_decline_pattern
-from .relative_strength_analyzer import analyze_relative_strength_for_windows
+from .relative_strength_analyzer import MarketReference, analyze_relative_strength_for_windows
+from .frame_utils import prepare_analysis_frame
+from .window_stats import volume_stats, turnover_stats
+from .analysis_result import (RejectedAnalysis, STAGE_NO_DATA, STAGE_QUICK_CHECK,
+                              STAGE_BASIC_PLATFORM)
+from ..logging_utils import get_logger
+from ..scan_profiler import stage_timer
 
 # Import default values from config to ensure consistency
 from ..config import (
@@ -31,6 +37,8 @@ from ..config import (
     DEFAULT_CHECK_RELATIVE_STRENGTH, DEFAULT_OUTPERFORM_INDEX_THRESHOLD
 )
 
+logger = get_logger('analyzer')
+
 
 def analyze_stock(df: pd.DataFrame,
                   windows: List[int] = None,
@@ -60,14 +68,16 @@ def analyze_stock(df: pd.DataFrame,
                   check_relative_strength: bool = None,
                   outperform_index_threshold: float = None,
                   market_df: Optional[pd.DataFrame] = None,
-                  end_date: Optional[str] = None) -> Dict[str, Any]:
+                  end_date: Optional[str] = None,
+                  market_reference: Optional[MarketReference] = None) -> Dict[str, Any]:
     """
     Analyze a stock for platform periods across multiple time windows,
     including price analysis, volume analysis, breakthrough prediction, position analysis,
     decline speed analysis, box pattern detection, and window weighting.
 
     Args:
-        df: DataFrame containing stock price and volume data
+        df: DataFrame containing stock price and volume data (read-only:
+            the analyzers work on views of it and never modify it)
         windows: List of window sizes to check
         box_threshold: Maximum allowed price range
         ma_diff_threshold: Maximum allowed MA convergence
@@ -90,9 +100,17 @@ def analyze_stock(df: pd.DataFrame,
         breakthrough_confirmation_days: Number of days to look for confirmation
         use_box_detection: Whether to use box pattern detection
         box_quality_threshold: Minimum quality score for a valid box pattern
+        market_df: Benchmark index data for relative strength (used when no
+            market_reference is given)
+        end_date: End date of the relative strength windows
+        market_reference: Benchmark series prepared once per scan
+            (relative_strength_analyzer.MarketReference)
 
     Returns:
-        Dict containing comprehensive analysis results
+        Dict containing comprehensive analysis results. Stocks rejected by
+        the quick price check or the basic platform check get a
+        RejectedAnalysis record instead, a read-only mapping that builds the
+        same dictionary only when a key other than is_platform is read.
     """
     # Apply default values from config if not provided
     if windows is None:
@@ -147,13 +165,13 @@ def analyze_stock(df: pd.DataFrame,
         outperform_index_threshold = DEFAULT_OUTPERFORM_INDEX_THRESHOLD
 
     if df.empty:
-        return {
-            "is_platform": False,
-            "windows_checked": windows,
-            "platform_windows": [],
-            "details": {w: {"status": "无数据"} for w in windows},
-            "selection_reasons": {}
-        }
+        return RejectedAnalysis(STAGE_NO_DATA, windows)
+
+    # 分析器只读取 df 的切片视图，不复制；这里统一保证日期有序、RangeIndex
+    df = prepare_analysis_frame(df)
+
+    # 分阶段计时（仅在扫描开启 enable_profiling 时记录）
+    timer = stage_timer('analyze')
 
     # ============================================================
     # STEP 1: Quick Price Check (Fast Failure)
@@ -162,40 +180,27 @@ def analyze_stock(df: pd.DataFrame,
     # stocks that don't meet basic criteria before expensive computations
     from .price_analyzer import quick_price_check
     
-    quick_check_results = {}
+    # 快速检查结果按窗口顺序存成两个列表，拒绝时直接放进紧凑结果
+    quick_box_ranges = []
+    quick_volatilities = []
     candidate_windows = []  # Windows that pass quick check
     
     for window in windows:
         passes_quick, quick_features = quick_price_check(
             df, window, box_threshold, volatility_threshold
         )
-        quick_check_results[window] = {
-            'passes': passes_quick,
-            'features': quick_features
-        }
+        quick_box_ranges.append(float(quick_features['box_range']))
+        quick_volatilities.append(float(quick_features['volatility']))
         
         if passes_quick:
             candidate_windows.append(window)
     
+    timer.lap('quick_check')
+
     # Early exit: if no windows pass quick check, return immediately
     if not candidate_windows:
-        return {
-            "is_platform": False,
-            "windows_checked": windows,
-            "platform_windows": [],
-            "details": {w: {
-                "status": "快速检查未通过",
-                "quick_check": {
-                    "box_range": quick_check_results[w]["features"]["box_range"],
-                    "volatility": quick_check_results[w]["features"]["volatility"],
-                    "box_threshold": box_threshold,
-                    "volatility_threshold": volatility_threshold
-                }
-            } for w in windows},
-            "selection_reasons": {},
-            "early_exit": True,
-            "early_exit_reason": "快速价格检查未通过"
-        }
+        return RejectedAnalysis(STAGE_QUICK_CHECK, windows, quick_box_ranges, quick_volatilities,
+                                box_threshold, volatility_threshold)
 
     # ============================================================
     # STEP 2: Full Price Analysis (only for candidate windows)
@@ -226,6 +231,10 @@ def analyze_stock(df: pd.DataFrame,
     # STEP 4: Full Analysis for Candidate Windows Only
     # ============================================================
     # Only analyze windows that passed quick check
+    # Volume and turnover prefix sums are built once and shared by all windows
+    volume_kernel = volume_stats(df)
+    turnover_kernel = turnover_stats(df)
+
     if use_box_detection:
         # Perform enhanced platform analysis (only on candidate windows)
         enhanced_result = analyze_enhanced_platform(
@@ -237,7 +246,8 @@ def analyze_stock(df: pd.DataFrame,
             volume_change_threshold,
             volume_stability_threshold,
             box_quality_threshold,
-            use_box_detection
+            use_box_detection,
+            volume_stats=volume_kernel
         )
 
         # Extract platform windows and details
@@ -258,7 +268,8 @@ def analyze_stock(df: pd.DataFrame,
             # Add turnover rate analysis for enhanced platform windows
             if 'turn' in df.columns:
                 turnover_analysis = analyze_turnover(
-                    df, window, max_turnover_rate, allow_turnover_spikes
+                    df, window, max_turnover_rate, allow_turnover_spikes,
+                    turnover_stats=turnover_kernel
                 )
                 turnover_analysis_results[window] = turnover_analysis
                 
@@ -286,7 +297,8 @@ def analyze_stock(df: pd.DataFrame,
             if use_volume_analysis and 'volume' in df.columns:
                 volume_analysis = analyze_volume(
                     df, window, volume_change_threshold,
-                    volume_stability_threshold, volume_increase_threshold
+                    volume_stability_threshold, volume_increase_threshold,
+                    volume_stats=volume_kernel
                 )
                 volume_analysis_results[window] = volume_analysis
             else:
@@ -301,7 +313,8 @@ def analyze_stock(df: pd.DataFrame,
             turnover_analysis = None
             if 'turn' in df.columns:
                 turnover_analysis = analyze_turnover(
-                    df, window, max_turnover_rate, allow_turnover_spikes
+                    df, window, max_turnover_rate, allow_turnover_spikes,
+                    turnover_stats=turnover_kernel
                 )
                 turnover_analysis_results[window] = turnover_analysis
             else:
@@ -368,6 +381,8 @@ def analyze_stock(df: pd.DataFrame,
 
                 selection_reasons[window] = reason
 
+    timer.lap('window_analysis')
+
     # ============================================================
     # STEP 5: Basic Platform Judgment
     # ============================================================
@@ -382,26 +397,9 @@ def analyze_stock(df: pd.DataFrame,
 
     # Early exit: if no basic platform found, skip expensive analyses
     if not is_basic_platform:
-        # Add quick check details for failed windows
-        for window in windows:
-            if window not in details:
-                details[window] = {
-                    "status": "快速检查未通过",
-                    "quick_check": {
-                        "box_range": quick_check_results[window]["features"]["box_range"],
-                        "volatility": quick_check_results[window]["features"]["volatility"]
-                    }
-                }
-        
-        return {
-            "is_platform": False,
-            "windows_checked": windows,
-            "platform_windows": [],
-            "details": details,
-            "selection_reasons": {},
-            "early_exit": True,
-            "early_exit_reason": "基本平台期条件未满足"
-        }
+        # Quick check details for the other windows are added on expansion
+        return RejectedAnalysis(STAGE_BASIC_PLATFORM, windows, quick_box_ranges, quick_volatilities,
+                                window_details=details)
 
     # ============================================================
     # STEP 6: Expensive Analyses (only if basic platform exists)
@@ -422,6 +420,8 @@ def analyze_stock(df: pd.DataFrame,
             breakthrough_confirmation_days
         )
     
+    timer.lap('breakthrough')
+
     # Perform position analysis if requested (expensive operation)
     if use_low_position:
         if use_rapid_decline_detection:
@@ -455,6 +455,8 @@ def analyze_stock(df: pd.DataFrame,
             is_platform = is_platform and is_low_position
             platform_judgment_log.append(f"低位判断: {is_low_position}")
 
+    timer.lap('position')
+
     # 如果启用了快速下跌检测，还需要满足快速下跌条件
     if use_rapid_decline_detection and decline_result:
         is_rapid_decline = decline_result.get("is_rapid_decline", False)
@@ -484,37 +486,41 @@ def analyze_stock(df: pd.DataFrame,
         is_platform = is_platform and is_box_pattern
         platform_judgment_log.append(f"箱体检测: {is_box_pattern}")
 
+    timer.lap('box')
+
     # 记录最终判断结果（在计算相对强度之前）
     platform_judgment_log.append(f"最终平台期判断（相对强度计算前）: {is_platform}")
-    print(f"平台期判断过程: {' -> '.join(platform_judgment_log)}")
+    logger.debug("平台期判断过程: %s", ' -> '.join(platform_judgment_log))
 
     # ============================================================
     # STEP 7: Calculate Relative Strength (only for confirmed platform stocks)
     # ============================================================
     # 只有在最终确认是平台期后，才计算相对强度
     relative_strength_results = {}
-    print(f"[RELATIVE_STRENGTH_DEBUG] Final is_platform={is_platform}, check_relative_strength={check_relative_strength}, market_df is None={market_df is None}, market_df empty={market_df.empty if market_df is not None else 'N/A'}")
+    # 扫描时由调用方传入预先构建的基准序列；单独调用时才从 market_df 构建
+    if market_reference is None and market_df is not None and not market_df.empty and is_platform and check_relative_strength:
+        market_reference = MarketReference(market_df)
+    has_market_data = market_reference is not None and not market_reference.empty
+    logger.debug("[RELATIVE_STRENGTH_DEBUG] Final is_platform=%s, check_relative_strength=%s, market data available=%s", is_platform, check_relative_strength, has_market_data)
     
-    if is_platform and check_relative_strength and market_df is not None and not market_df.empty:
+    if is_platform and check_relative_strength and has_market_data:
         # 只对确认的平台窗口计算相对强度
-        print(f"[RELATIVE_STRENGTH_DEBUG] Calculating relative strength for platform windows: {platform_windows}")
-        for window in platform_windows:
-            try:
-                from .relative_strength_analyzer import calculate_relative_strength
-                print(f"[RELATIVE_STRENGTH_DEBUG] Calculating relative strength for window {window}, end_date={end_date}")
-                rs_result = calculate_relative_strength(df, market_df, window, end_date)
-                relative_strength_results[window] = rs_result
-                print(f"[RELATIVE_STRENGTH_DEBUG] Window {window} result: outperform_index={rs_result.get('outperform_index')}, stock_return={rs_result.get('stock_return')}, market_return={rs_result.get('market_return')}, status={rs_result.get('status')}")
-                # Save relative strength result to details for this window
-                if window in details:
-                    details[window]["relative_strength"] = rs_result
-                # Note: Relative strength will be added to selection_reasons at the end
-            except Exception as e:
-                print(f"[RELATIVE_STRENGTH_DEBUG] Warning: Failed to calculate relative strength for window {window}: {e}")
-                import traceback
-                traceback.print_exc()
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Calculating relative strength for platform windows: %s", platform_windows)
+        try:
+            relative_strength_results = analyze_relative_strength_for_windows(
+                df, market_reference, platform_windows, end_date)
+        except Exception as e:
+            logger.warning("[RELATIVE_STRENGTH_DEBUG] Warning: Failed to calculate relative strength: %s", e)
+            import traceback
+            traceback.print_exc()
+        for window, rs_result in relative_strength_results.items():
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Window %s result: outperform_index=%s, stock_return=%s, market_return=%s, status=%s", window, rs_result.get('outperform_index'), rs_result.get('stock_return'), rs_result.get('market_return'), rs_result.get('status'))
+            # Save relative strength result to details for this window
+            if window in details:
+                details[window]["relative_strength"] = rs_result
+            # Note: Relative strength will be added to selection_reasons at the end
         
-        print(f"[RELATIVE_STRENGTH_DEBUG] Collected {len(relative_strength_results)} relative strength results")
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Collected %s relative strength results", len(relative_strength_results))
         
         # 如果启用了相对强度检查且设置了阈值，需要满足相对强度阈值
         # 如果阈值为 None，则不进行过滤，但仍计算和保存相对强度
@@ -539,12 +545,14 @@ def analyze_stock(df: pd.DataFrame,
             platform_judgment_log.append("相对强度检查: 已计算（无阈值限制）")
     else:
         if not is_platform:
-            print(f"[RELATIVE_STRENGTH_DEBUG] Skipping relative strength calculation: not a platform stock")
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Skipping relative strength calculation: not a platform stock")
         elif not check_relative_strength:
-            print(f"[RELATIVE_STRENGTH_DEBUG] Relative strength check is disabled")
-        elif market_df is None or market_df.empty:
-            print(f"[RELATIVE_STRENGTH_DEBUG] Market data unavailable: market_df is None={market_df is None}, empty={market_df.empty if market_df is not None else 'N/A'}")
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Relative strength check is disabled")
+        elif not has_market_data:
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Market data unavailable")
     
+    timer.lap('relative_strength')
+
     # 记录最终判断结果（在相对强度检查之后）
     platform_judgment_log.append(f"最终平台期判断（相对强度检查后）: {is_platform}")
 
@@ -558,6 +566,28 @@ def analyze_stock(df: pd.DataFrame,
                                    is_basic_platform)
             platform_judgment_log.append(f"标准模式判断: {has_decline_pattern}")
 
+    # 记录各平台窗口的原始特征值（用于阈值收紧后的免重算筛选，见 feature_table）
+    # 注意：必须在下方标记线处理之前生成，那里会覆盖 details 变量
+    window_features = {}
+    window_index = {window: i for i, window in enumerate(windows)}
+    for window in platform_windows:
+        window_details = details.get(window, {})
+        price_details = window_details.get("price_analysis", window_details)
+        box_details = window_details.get("box_analysis", {})
+        turnover_details = turnover_analysis_results.get(window, {}).get("details", {})
+        rs_result = relative_strength_results.get(window)
+        i = window_index[window]
+        window_features[window] = {
+            "box_range": quick_box_ranges[i],
+            "volatility": quick_volatilities[i],
+            "ma_diff": price_details.get("ma_diff"),
+            "box_volatility": box_details.get("volatility") if use_box_detection else None,
+            "avg_turnover_rate": turnover_details.get("avg_turnover_rate"),
+            "max_turnover_rate": turnover_details.get("max_turnover_rate"),
+            "has_relative_strength": rs_result is not None,
+            "outperform_index": rs_result.get("outperform_index") if rs_result else None
+        }
+
     # 生成标记线数据
     mark_lines = []
 
@@ -626,14 +656,14 @@ def analyze_stock(df: pd.DataFrame,
     overall_outperform_index = None
     overall_stock_return = None
     overall_market_return = None
-    print(f"[RELATIVE_STRENGTH_DEBUG] Extracting overall values from {len(relative_strength_results)} results")
+    logger.debug("[RELATIVE_STRENGTH_DEBUG] Extracting overall values from %s results", len(relative_strength_results))
     if relative_strength_results:
         # Find the window with maximum outperform_index
         max_window = None
         max_outperform_index = None
         for window, rs_result in relative_strength_results.items():
             outperform_index = rs_result.get("outperform_index")
-            print(f"[RELATIVE_STRENGTH_DEBUG] Checking window {window}: outperform_index={outperform_index}")
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Checking window %s: outperform_index=%s", window, outperform_index)
             if outperform_index is not None:
                 if max_outperform_index is None or outperform_index > max_outperform_index:
                     max_outperform_index = outperform_index
@@ -645,24 +675,24 @@ def analyze_stock(df: pd.DataFrame,
             max_rs_result = relative_strength_results[max_window]
             overall_stock_return = max_rs_result.get("stock_return")
             overall_market_return = max_rs_result.get("market_return")
-            print(f"[RELATIVE_STRENGTH_DEBUG] Using window {max_window}: outperform_index={overall_outperform_index}, stock_return={overall_stock_return}, market_return={overall_market_return}")
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] Using window %s: outperform_index=%s, stock_return=%s, market_return=%s", max_window, overall_outperform_index, overall_stock_return, overall_market_return)
         else:
             # No valid outperform_index found, but try to extract stock_return and market_return
             # from any window that has valid stock_return (fallback)
-            print(f"[RELATIVE_STRENGTH_DEBUG] No valid outperform_index found, trying fallback...")
+            logger.debug("[RELATIVE_STRENGTH_DEBUG] No valid outperform_index found, trying fallback...")
             for window, rs_result in relative_strength_results.items():
                 stock_return = rs_result.get("stock_return")
                 market_return = rs_result.get("market_return")
-                print(f"[RELATIVE_STRENGTH_DEBUG] Fallback check window {window}: stock_return={stock_return}, market_return={market_return}")
+                logger.debug("[RELATIVE_STRENGTH_DEBUG] Fallback check window %s: stock_return=%s, market_return=%s", window, stock_return, market_return)
                 if stock_return is not None:
                     overall_stock_return = stock_return
                     overall_market_return = market_return
-                    print(f"[RELATIVE_STRENGTH_DEBUG] Fallback success: stock_return={overall_stock_return}, market_return={overall_market_return}")
+                    logger.debug("[RELATIVE_STRENGTH_DEBUG] Fallback success: stock_return=%s, market_return=%s", overall_stock_return, overall_market_return)
                     break  # Use the first window with valid stock_return
     else:
-        print(f"[RELATIVE_STRENGTH_DEBUG] No relative_strength_results available")
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] No relative_strength_results available")
     
-    print(f"[RELATIVE_STRENGTH_DEBUG] Final values: outperform_index={overall_outperform_index}, stock_return={overall_stock_return}, market_return={overall_market_return}")
+    logger.debug("[RELATIVE_STRENGTH_DEBUG] Final values: outperform_index=%s, stock_return=%s, market_return=%s", overall_outperform_index, overall_stock_return, overall_market_return)
 
     result = {
         "is_platform": is_platform,  # 使用新的平台期判断结果
@@ -680,6 +710,7 @@ def analyze_stock(df: pd.DataFrame,
         "mark_lines": mark_lines,  # 直接添加标记线数据
         "platform_judgment_log": platform_judgment_log,  # 添加判断过程日志
         "candidate_windows": candidate_windows,  # 通过快速检查的窗口
+        "window_features": window_features,  # 平台窗口的原始阈值特征
         "quick_check_performed": True  # 标记已执行快速检查
     }
 
@@ -849,4 +880,5 @@ def analyze_stock(df: pd.DataFrame,
                 if rs_info_parts:
                     selection_reasons[window] += f", {'/'.join(rs_info_parts)}"
 
+    timer.lap('finalize')
     return result
@@ -9,61 +9,130 @@ import pandas as pd
 import numpy as np
 from typing import Dict, Any, Tuple, List, Optional
 import logging
+from collections import deque
+
+from .frame_utils import prepare_analysis_frame
 
 logger = logging.getLogger(__name__)
 
 
-def analyze_decline_speed(df: pd.DataFrame,
-                          lookback_days: int = 365,
-                          decline_period_days: int = 180,
-                          decline_threshold: float = 0.3,
-                          rapid_decline_days: int = 30,
-                          rapid_decline_threshold: float = 0.15) -> Dict[str, Any]:
+def rolling_decline(highs: np.ndarray, lows: np.ndarray, days: int) -> np.ndarray:
     """
-    Analyze the decline speed and characteristics of a stock.
+    Decline of every window of `days` bars: (window high - window low) / window high.
+
+    The window extremes come from monotonic deques in one pass over the bars
+    (O(n) for any window length).
 
     Args:
-        df: DataFrame containing stock price data
-        lookback_days: Number of days to look back for finding the high point
-        decline_period_days: Number of days within which the decline should have occurred
-        decline_threshold: Minimum decline percentage from high to be considered at low position
-        rapid_decline_days: Number of days to define a rapid decline
-        rapid_decline_threshold: Minimum decline percentage within rapid_decline_days to be considered rapid
+        highs: High prices
+        lows: Low prices (aligned with highs)
+        days: Window length in bars
 
     Returns:
-        Dict containing decline analysis results
+        Array with one entry per window start (len(highs) - days + 1 entries;
+        empty if there are fewer bars than days). Windows without a valid
+        decline are -inf.
     """
-    try:
-        if len(df) < 60:  # Require at least 60 days of data
+    count = len(highs) - days + 1
+    if days <= 0 or count <= 0:
+        return np.full(0, -np.inf)
+
+    # 缺失值不参与极值计算（与 pandas 的 max/min 跳过 NaN 一致）
+    high_values = np.where(np.isnan(highs), -np.inf, highs).tolist()
+    low_values = np.where(np.isnan(lows), np.inf, lows).tolist()
+    window_highs = np.empty(count)
+    window_lows = np.empty(count)
+    max_queue: deque = deque()
+    min_queue: deque = deque()
+    for i in range(len(high_values)):
+        while max_queue and high_values[max_queue[-1]] <= high_values[i]:
+            max_queue.pop()
+        max_queue.append(i)
+        while min_queue and low_values[min_queue[-1]] >= low_values[i]:
+            min_queue.pop()
+        min_queue.append(i)
+
+        start = i - days + 1
+        if max_queue[0] < start:
+            max_queue.popleft()
+        if min_queue[0] < start:
+            min_queue.popleft()
+        if start >= 0:
+            window_highs[start] = high_values[max_queue[0]]
+            window_lows[start] = low_values[min_queue[0]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        declines = (window_highs - window_lows) / window_highs
+    declines[~np.isfinite(declines)] = -np.inf
+    return declines
+
+
+class DeclineEngine:
+    """
+    Array-based decline analysis of one stock.
+
+    Converts the K-lines to arrays once; analyze() then finds the high with
+    argmax, the following low with argmin and the most rapid decline from
+    rolling_decline, which is cached per window length so several lookback
+    settings can be evaluated on the same stock at little extra cost.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Initialize the engine.
+
+        Args:
+            df: DataFrame containing stock price data (date, high, low, close)
+        """
+        # Sorted by date, RangeIndex (no-op for frames from fetch_kline_data)
+        df = prepare_analysis_frame(df)
+        self.dates = df['date']
+        self.highs = df['high'].to_numpy(dtype=np.float64)
+        self.lows = df['low'].to_numpy(dtype=np.float64)
+        self.closes = df['close'].to_numpy(dtype=np.float64)
+        self._declines: Dict[int, np.ndarray] = {}
+
+    def rapid_declines(self, days: int) -> np.ndarray:
+        """Cached rolling_decline of this stock for a window length."""
+        declines = self._declines.get(days)
+        if declines is None:
+            declines = rolling_decline(self.highs, self.lows, days)
+            self._declines[days] = declines
+        return declines
+
+    def analyze(self,
+                lookback_days: int = 365,
+                decline_period_days: int = 180,
+                decline_threshold: float = 0.3,
+                rapid_decline_days: int = 30,
+                rapid_decline_threshold: float = 0.15) -> Dict[str, Any]:
+        """
+        Analyze the decline for one set of settings (see analyze_decline_speed).
+
+        Returns:
+            Dict containing decline analysis results
+        """
+        n = len(self.highs)
+        if n < 60:  # Require at least 60 days of data
             return {
                 "status": "insufficient_data",
                 "is_low_position": False,
                 "is_rapid_decline": False,
                 "details": {
-                    "data_points": len(df),
+                    "data_points": n,
                     "required_points": 60
                 }
             }
 
-        # Sort DataFrame by date
-        df = df.sort_values('date')
-
-        # Calculate lookback period
-        if len(df) <= lookback_days:
-            lookback_df = df.copy()
-        else:
-            lookback_df = df.iloc[-lookback_days:].copy()
-
-        # Find the highest price in the lookback period
-        max_price = lookback_df['high'].max()
-        max_idx = lookback_df[lookback_df['high'] == max_price].index[0]
-        max_date = lookback_df.loc[max_idx, 'date']
-
-        # Get data after the high point
-        after_high_df = lookback_df.loc[max_idx:].copy()
+        # Highest price in the lookback period (first occurrence)
+        lookback_start = max(0, n - lookback_days) if lookback_days > 0 else 0
+        high_pos = lookback_start + int(np.nanargmax(self.highs[lookback_start:]))
+        max_price = self.highs[high_pos]
+        max_date = self.dates.iloc[high_pos]
 
         # If there's not enough data after high point, return early
-        if len(after_high_df) < 20:
+        bars_after_high = n - high_pos
+        if bars_after_high < 20:
             return {
                 "status": "insufficient_after_high_data",
                 "is_low_position": False,
@@ -71,14 +140,14 @@ def analyze_decline_speed(df: pd.DataFrame,
                 "details": {
                     "high_price": max_price,
                     "high_date": max_date,
-                    "data_points_after_high": len(after_high_df)
+                    "data_points_after_high": bars_after_high
                 }
             }
 
-        # Find the lowest price after the high point
-        min_price = after_high_df['low'].min()
-        min_idx = after_high_df[after_high_df['low'] == min_price].index[0]
-        min_date = after_high_df.loc[min_idx, 'date']
+        # Lowest price after the high point (first occurrence)
+        low_pos = high_pos + int(np.nanargmin(self.lows[high_pos:]))
+        min_price = self.lows[low_pos]
+        min_date = self.dates.iloc[low_pos]
 
         # Calculate decline percentage
         decline_percentage = (max_price - min_price) / max_price
@@ -86,36 +155,27 @@ def analyze_decline_speed(df: pd.DataFrame,
         # Check if the decline occurred within the specified period
         decline_period_satisfied = True
         if decline_period_days > 0:
-            high_date = pd.to_datetime(max_date)
-            low_date = pd.to_datetime(min_date)
-            days_between = (low_date - high_date).days
+            days_between = (pd.to_datetime(min_date) - pd.to_datetime(max_date)).days
             decline_period_satisfied = days_between <= decline_period_days
 
         # Determine if it's a low position
         is_low_position = decline_percentage >= decline_threshold and decline_period_satisfied
 
         # Calculate decline speed metrics
-        decline_days = len(after_high_df.loc[max_idx:min_idx])
-        daily_decline_rate = decline_percentage / \
-            decline_days if decline_days > 0 else 0
+        decline_days = low_pos - high_pos + 1
+        daily_decline_rate = decline_percentage / decline_days
 
-        # Check for rapid decline periods
-        rapid_decline_detected = False
+        # Most rapid decline among the windows starting at or after the high
         max_rapid_decline = 0
         rapid_decline_start_date = None
         rapid_decline_end_date = None
-
-        # Scan for the most rapid decline period
-        for i in range(len(after_high_df) - rapid_decline_days + 1):
-            window = after_high_df.iloc[i:i+rapid_decline_days]
-            window_high = window['high'].max()
-            window_low = window['low'].min()
-            window_decline = (window_high - window_low) / window_high
-
-            if window_decline > max_rapid_decline:
-                max_rapid_decline = window_decline
-                rapid_decline_start_date = window.iloc[0]['date']
-                rapid_decline_end_date = window.iloc[-1]['date']
+        candidates = self.rapid_declines(rapid_decline_days)[high_pos:]
+        if len(candidates) > 0:
+            offset = int(np.argmax(candidates))
+            if candidates[offset] > 0:
+                max_rapid_decline = float(candidates[offset])
+                rapid_decline_start_date = self.dates.iloc[high_pos + offset]
+                rapid_decline_end_date = self.dates.iloc[high_pos + offset + rapid_decline_days - 1]
 
         # Determine if there was a rapid decline
         is_rapid_decline = max_rapid_decline >= rapid_decline_threshold
@@ -125,12 +185,9 @@ def analyze_decline_speed(df: pd.DataFrame,
             decline_percentage if decline_percentage > 0 else 0
 
         # Calculate decline volatility (standard deviation of daily returns during decline)
-        decline_volatility = after_high_df.loc[max_idx:min_idx]['close'].pct_change(
-            fill_method=None
-        ).std()
+        decline_volatility = _return_std(self.closes[high_pos:low_pos + 1])
 
-        # Prepare result
-        result = {
+        return {
             "status": "analyzed",
             "is_low_position": is_low_position,
             "is_rapid_decline": is_rapid_decline,
@@ -151,7 +208,65 @@ def analyze_decline_speed(df: pd.DataFrame,
             }
         }
 
-        return result
+    def analyze_many(self, settings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Analyze the decline for several settings at once.
+
+        Args:
+            settings: Keyword argument dicts for analyze()
+
+        Returns:
+            One analysis result per settings entry
+        """
+        return [self.analyze(**kwargs) for kwargs in settings]
+
+
+def _return_std(closes: np.ndarray) -> float:
+    """Sample std of daily returns (pandas pct_change(fill_method=None).std())."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = closes[1:] / closes[:-1] - 1
+    returns = returns[~np.isnan(returns)]
+    if len(returns) < 2:
+        return float('nan')
+    return float(np.std(returns, ddof=1))
+
+
+def analyze_decline_speed(df: pd.DataFrame,
+                          lookback_days: int = 365,
+                          decline_period_days: int = 180,
+                          decline_threshold: float = 0.3,
+                          rapid_decline_days: int = 30,
+                          rapid_decline_threshold: float = 0.15) -> Dict[str, Any]:
+    """
+    Analyze the decline speed and characteristics of a stock.
+
+    Args:
+        df: DataFrame containing stock price data
+        lookback_days: Number of days to look back for finding the high point
+        decline_period_days: Number of days within which the decline should have occurred
+        decline_threshold: Minimum decline percentage from high to be considered at low position
+        rapid_decline_days: Number of days to define a rapid decline
+        rapid_decline_threshold: Minimum decline percentage within rapid_decline_days to be considered rapid
+
+    Returns:
+        Dict containing decline analysis results
+    """
+    try:
+        if len(df) < 60:  # Require at least 60 days of data
+            return {
+                "status": "insufficient_data",
+                "is_low_position": False,
+                "is_rapid_decline": False,
+                "details": {
+                    "data_points": len(df),
+                    "required_points": 60
+                }
+            }
+
+        return DeclineEngine(df).analyze(
+            lookback_days, decline_period_days, decline_threshold,
+            rapid_decline_days, rapid_decline_threshold
+        )
 
     except Exception as e:
         logger.error(f"Error in analyze_decline_speed: {str(e)}")
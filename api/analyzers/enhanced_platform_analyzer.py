@@ -12,6 +12,7 @@ from typing import Dict, Any, Tuple, List, Optional
 from .price_analyzer import analyze_price, check_price_pattern
 from .volume_analyzer import analyze_volume
 from .box_detector import check_box_pattern
+from .window_stats import WindowStats, volume_stats as build_volume_stats
 
 # Import default values from config to ensure consistency
 from ..config import (
@@ -26,7 +27,8 @@ def check_enhanced_platform(df: pd.DataFrame, window: int,
                             volume_change_threshold: float = None,
                             volume_stability_threshold: float = None,
                             box_quality_threshold: float = None,
-                            use_box_detection: bool = None) -> Tuple[bool, Dict[str, Any]]:
+                            use_box_detection: bool = None,
+                            volume_stats: Optional[WindowStats] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     Check if a stock is in a platform consolidation period using enhanced detection.
 
@@ -40,6 +42,7 @@ def check_enhanced_platform(df: pd.DataFrame, window: int,
         volume_stability_threshold: Maximum allowed volume stability
         box_quality_threshold: Minimum quality score for a valid box pattern
         use_box_detection: Whether to use box pattern detection
+        volume_stats: Volume kernel of df, shared across windows (optional)
 
     Returns:
         Tuple of (is_platform, details)
@@ -72,7 +75,8 @@ def check_enhanced_platform(df: pd.DataFrame, window: int,
 
     if 'volume' in df.columns:
         volume_analysis = analyze_volume(
-            df, window, volume_change_threshold, volume_stability_threshold
+            df, window, volume_change_threshold, volume_stability_threshold,
+            volume_stats=volume_stats
         )
         is_volume_ok = volume_analysis.get('has_consolidation_volume', False)
         volume_details = volume_analysis.get('consolidation_details', {})
@@ -129,7 +133,8 @@ def analyze_enhanced_platform(df: pd.DataFrame,
                               volume_change_threshold: float = None,
                               volume_stability_threshold: float = None,
                               box_quality_threshold: float = None,
-                              use_box_detection: bool = None) -> Dict[str, Any]:
+                              use_box_detection: bool = None,
+                              volume_stats: Optional[WindowStats] = None) -> Dict[str, Any]:
     """
     Analyze a stock for platform periods across multiple time windows using enhanced detection.
 
@@ -143,6 +148,7 @@ def analyze_enhanced_platform(df: pd.DataFrame,
         volume_stability_threshold: Maximum allowed volume stability
         box_quality_threshold: Minimum quality score for a valid box pattern
         use_box_detection: Whether to use box pattern detection
+        volume_stats: Volume kernel of df (built here if not provided)
 
     Returns:
         Dict containing analysis results
@@ -166,6 +172,10 @@ def analyze_enhanced_platform(df: pd.DataFrame,
             "selection_reasons": {}
         }
 
+    # Volume statistics of every window come from one kernel
+    if volume_stats is None:
+        volume_stats = build_volume_stats(df)
+
     # Check each window
     platform_windows = []
     details = {}
@@ -175,7 +185,7 @@ def analyze_enhanced_platform(df: pd.DataFrame,
         is_platform, window_details = check_enhanced_platform(
             df, window, box_threshold, ma_diff_threshold, volatility_threshold,
             volume_change_threshold, volume_stability_threshold,
-            box_quality_threshold, use_box_detection
+            box_quality_threshold, use_box_detection, volume_stats
         )
 
         details[window] = window_details
@@ -0,0 +1,37 @@
+"""
+Frame utilities shared by the analyzers.
+
+Analyzers receive K-line frames in one agreed form (datetime64 'date'
+column, ascending dates, RangeIndex) and treat them as read-only: windows
+are taken with df.iloc[...] views and nothing is copied unless a function
+adds columns to its own result (technical_indicators).
+"""
+import pandas as pd
+
+
+def prepare_analysis_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bring a K-line DataFrame into the form the analyzers expect.
+
+    Frames from fetch_kline_data already conform, in which case df itself is
+    returned and nothing is copied; only the steps that are needed run.
+
+    Args:
+        df: K-line DataFrame with a 'date' column
+
+    Returns:
+        DataFrame with datetime64 dates in ascending order and a RangeIndex
+    """
+    if df is None or df.empty or 'date' not in df.columns:
+        return df
+    if not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df = df.assign(date=pd.to_datetime(df['date']))
+    if not df['date'].is_monotonic_increasing:
+        df = df.sort_values('date')
+    if not _is_default_index(df.index):
+        df = df.reset_index(drop=True)
+    return df
+
+
+def _is_default_index(index: pd.Index) -> bool:
+    return isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1
@@ -4,13 +4,122 @@ Fundamental Analyzer module for stock fundamental analysis.
 import pandas as pd
 import numpy as np
 import baostock as bs
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List, Optional, Tuple
 import logging
 
+from ..stock_database import get_stock_database
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 未发布（或查询时缺失）的年报在此天数后重新检查
+FUNDAMENTALS_RECHECK_DAYS = 7
+
+# 批量刷新基本面数据时的并发数
+FUNDAMENTALS_REFRESH_WORKERS = 4
+
+# PE/PB 取最近多少天内的K线数据
+VALUATION_LOOKBACK_DAYS = 30
+
+# 行业百分位筛选规则:
+# (指标列, 连续性列, 升序排名, 百分位上限/下限, 阈值参数名, 不连续原因, 缺失原因, 百分位原因模板)
+# 升序排名时百分位越小数值越小；'max' 表示百分位不得超过阈值，'min' 表示不得低于阈值
+FUNDAMENTAL_RULES = [
+    ('avg_revenue_growth', 'revenue_growth_consistent', False, 'max', 'revenue_growth_percentile',
+     "营收增长不连续", "缺少营收增长数据", "营收增长率行业百分位({})不达标"),
+    ('avg_profit_growth', 'profit_growth_consistent', False, 'max', 'profit_growth_percentile',
+     "净利润增长不连续", "缺少净利润增长数据", "净利润增长率行业百分位({})不达标"),
+    ('avg_roe', 'roe_consistent', False, 'max', 'roe_percentile',
+     "ROE不连续", "缺少ROE数据", "ROE行业百分位({})不达标"),
+    ('avg_liability_ratio', 'liability_ratio_consistent', True, 'max', 'liability_percentile',
+     "资产负债率不稳定", "缺少资产负债率数据", "资产负债率行业百分位({})不达标"),
+    ('pe_ttm', None, True, 'min', 'pe_percentile',
+     None, "缺少PE数据", "PE行业百分位({})过高"),
+    ('pb_mrq', None, True, 'min', 'pb_percentile',
+     None, "缺少PB数据", "PB行业百分位({})过高"),
+]
+
+FUNDAMENTAL_VALUE_COLUMNS = [rule[0] for rule in FUNDAMENTAL_RULES]
+
+
+def rank_industry_percentiles(frame: pd.DataFrame, industry_column: str = 'industry') -> pd.DataFrame:
+    """
+    Compute industry percentiles of all fundamental metrics in one groupby-rank pass.
+    The percentile is the share of valid industry values ranked strictly ahead of
+    the stock (ties share the best rank). Stocks without an industry are ranked
+    together as one group instead of being dropped.
+    
+    Args:
+        frame: One row per stock with the industry column and FUNDAMENTAL_VALUE_COLUMNS
+        industry_column: Name of the industry column
+    
+    Returns:
+        DataFrame (same index) with one percentile column per metric (NaN where the value is missing)
+    """
+    grouped = frame.groupby(industry_column, dropna=False)
+    percentiles = pd.DataFrame(index=frame.index)
+    for column, _, ascending, *_ in FUNDAMENTAL_RULES:
+        ranks = grouped[column].rank(method='min', ascending=ascending)
+        counts = grouped[column].transform('count')
+        percentiles[column] = (ranks - 1) / counts
+    return percentiles
+
+
+def evaluate_fundamental_filters(frame: pd.DataFrame,
+                                 thresholds: Dict[str, float]) -> Tuple[pd.Series, pd.Series]:
+    """
+    Evaluate all fundamental filter predicates as boolean column operations.
+    
+    Args:
+        frame: One row per stock with industry, consistency and value columns
+        thresholds: Percentile thresholds keyed by parameter name (e.g. 'roe_percentile')
+    
+    Returns:
+        Tuple of (boolean pass mask, reasons Series indexed by rejected rows only)
+    """
+    percentiles = rank_industry_percentiles(frame)
+    passes = pd.Series(True, index=frame.index)
+    outcomes = []
+    
+    for column, consistent_column, _, bound, param, inconsistent_msg, missing_msg, rank_msg in FUNDAMENTAL_RULES:
+        if consistent_column:
+            inconsistent = frame[consistent_column].eq(False)
+        else:
+            inconsistent = pd.Series(False, index=frame.index)
+        missing = ~inconsistent & frame[column].isna()
+        percentile = percentiles[column]
+        if bound == 'max':
+            out_of_range = percentile > thresholds[param]
+        else:
+            out_of_range = percentile < thresholds[param]
+        failed_rank = ~inconsistent & ~missing & out_of_range
+        passes &= ~(inconsistent | missing | failed_rank)
+        outcomes.append((inconsistent, missing, failed_rank, percentile, inconsistent_msg, missing_msg, rank_msg))
+    
+    # 只为未通过的股票生成原因
+    rejected = frame.index[~passes]
+    reason_columns = []
+    for inconsistent, missing, failed_rank, percentile, inconsistent_msg, missing_msg, rank_msg in outcomes:
+        reason = pd.Series('', index=rejected, dtype=object)
+        failed_rows = failed_rank.loc[rejected]
+        reason[failed_rows] = percentile.loc[rejected][failed_rows].map(
+            lambda value: rank_msg.format(f"{value:.2f}"))
+        reason[missing.loc[rejected]] = missing_msg
+        if inconsistent_msg:
+            reason[inconsistent.loc[rejected]] = inconsistent_msg
+        reason_columns.append(reason)
+    
+    if reason_columns and len(rejected) > 0:
+        reasons = pd.concat(reason_columns, axis=1).apply(
+            lambda row: ', '.join(value for value in row if value), axis=1)
+    else:
+        reasons = pd.Series(dtype=object)
+    return passes, reasons
+
+
 def analyze_fundamentals(stock_list: List[Dict[str, Any]], 
                          use_fundamental_filter: bool = False,
                          revenue_growth_percentile: float = 0.3,
@@ -50,223 +159,229 @@ def analyze_fundamentals(stock_list: List[Dict[str, Any]],
             industry_groups[industry] = []
         industry_groups[industry].append(stock)
     
-    # 获取并计算每个行业内的基本面指标
-    filtered_stocks = []
+    # 批量刷新并从本地数据库读取基本面数据（只有单只股票的行业无需计算百分位）
+    codes = [stock['code'] for stocks in industry_groups.values() if len(stocks) > 1 for stock in stocks]
+    try:
+        refresh_fundamentals(codes, years_to_check)
+    except Exception as e:
+        logger.error(f"Error refreshing fundamentals: {str(e)}")
+    fundamentals_by_code = load_fundamentals(codes, years_to_check)
     
+    # 组装为一张表：每只有基本面数据的股票一行
+    rows = []
     for industry, stocks in industry_groups.items():
-        if len(stocks) <= 1:  # 如果行业内只有一只股票，直接保留
-            filtered_stocks.extend(stocks)
+        if len(stocks) <= 1:
             continue
-            
-        logger.info(f"Analyzing {len(stocks)} stocks in industry: {industry}")
+        for stock in stocks:
+            stock_fundamentals = fundamentals_by_code.get(stock['code'])
+            if stock_fundamentals:
+                rows.append(dict(stock_fundamentals, code=stock['code'], industry=industry))
+    
+    analysis_by_code = {}
+    if rows:
+        consistent_columns = [rule[1] for rule in FUNDAMENTAL_RULES if rule[1]]
+        frame = pd.DataFrame(rows).reindex(
+            columns=['code', 'industry'] + consistent_columns + FUNDAMENTAL_VALUE_COLUMNS)
+        for column in FUNDAMENTAL_VALUE_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
         
-        # 获取该行业所有股票的基本面数据
-        industry_fundamentals = []
+        passes, reasons = evaluate_fundamental_filters(frame, {
+            'revenue_growth_percentile': revenue_growth_percentile,
+            'profit_growth_percentile': profit_growth_percentile,
+            'roe_percentile': roe_percentile,
+            'liability_percentile': liability_percentile,
+            'pe_percentile': pe_percentile,
+            'pb_percentile': pb_percentile
+        })
         
-        for stock in stocks:
-            code = stock['code']
-            try:
-                # 获取基本面数据
-                stock_fundamentals = get_stock_fundamentals(code, years_to_check)
-                if stock_fundamentals:
-                    stock_fundamentals['code'] = code
-                    industry_fundamentals.append(stock_fundamentals)
-            except Exception as e:
-                logger.error(f"Error getting fundamentals for {code}: {str(e)}")
+        # 记录未通过的原因
+        for code, reason in zip(frame.loc[reasons.index, 'code'], reasons):
+            logger.info(f"Stock {code} failed fundamental filter: {reason}")
         
-        if not industry_fundamentals:
+        passed = frame.loc[passes, ['code'] + FUNDAMENTAL_VALUE_COLUMNS]
+        passed = passed.astype(object).where(passed.notna(), None)
+        analysis_by_code = passed.set_index('code').to_dict('index')
+    
+    # 按原始顺序输出：单只股票的行业直接保留，其余只保留通过筛选的股票
+    filtered_stocks = []
+    for industry, stocks in industry_groups.items():
+        if len(stocks) <= 1:  # 如果行业内只有一只股票，直接保留
+            filtered_stocks.extend(stocks)
             continue
-            
-        # 转换为DataFrame便于计算行业百分位
-        industry_df = pd.DataFrame(industry_fundamentals)
-        
-        # 计算行业内各指标的百分位
-        for stock in industry_fundamentals:
-            code = stock['code']
-            
-            # 检查是否满足所有基本面条件
-            meets_criteria = True
-            reasons = []
-            
-            # 1. 营收增长率 - 要求位于行业前revenue_growth_percentile
-            if 'revenue_growth_consistent' in stock and not stock['revenue_growth_consistent']:
-                meets_criteria = False
-                reasons.append("营收增长不连续")
-            elif 'avg_revenue_growth' in stock:
-                percentile = calculate_percentile(industry_df, 'avg_revenue_growth', stock['avg_revenue_growth'], ascending=False)
-                if percentile > revenue_growth_percentile:
-                    meets_criteria = False
-                    reasons.append(f"营收增长率行业百分位({percentile:.2f})不达标")
-            else:
-                meets_criteria = False
-                reasons.append("缺少营收增长数据")
-                
-            # 2. 净利润增长率 - 要求位于行业前profit_growth_percentile
-            if 'profit_growth_consistent' in stock and not stock['profit_growth_consistent']:
-                meets_criteria = False
-                reasons.append("净利润增长不连续")
-            elif 'avg_profit_growth' in stock:
-                percentile = calculate_percentile(industry_df, 'avg_profit_growth', stock['avg_profit_growth'], ascending=False)
-                if percentile > profit_growth_percentile:
-                    meets_criteria = False
-                    reasons.append(f"净利润增长率行业百分位({percentile:.2f})不达标")
-            else:
-                meets_criteria = False
-                reasons.append("缺少净利润增长数据")
-                
-            # 3. ROE - 要求位于行业前roe_percentile
-            if 'roe_consistent' in stock and not stock['roe_consistent']:
-                meets_criteria = False
-                reasons.append("ROE不连续")
-            elif 'avg_roe' in stock:
-                percentile = calculate_percentile(industry_df, 'avg_roe', stock['avg_roe'], ascending=False)
-                if percentile > roe_percentile:
-                    meets_criteria = False
-                    reasons.append(f"ROE行业百分位({percentile:.2f})不达标")
-            else:
-                meets_criteria = False
-                reasons.append("缺少ROE数据")
-                
-            # 4. 资产负债率 - 要求位于行业后liability_percentile (较低)
-            if 'liability_ratio_consistent' in stock and not stock['liability_ratio_consistent']:
-                meets_criteria = False
-                reasons.append("资产负债率不稳定")
-            elif 'avg_liability_ratio' in stock:
-                percentile = calculate_percentile(industry_df, 'avg_liability_ratio', stock['avg_liability_ratio'], ascending=True)
-                if percentile > liability_percentile:
-                    meets_criteria = False
-                    reasons.append(f"资产负债率行业百分位({percentile:.2f})不达标")
-            else:
-                meets_criteria = False
-                reasons.append("缺少资产负债率数据")
-                
-            # 5. PE - 要求不在行业前pe_percentile (较高)
-            if 'pe_ttm' in stock:
-                percentile = calculate_percentile(industry_df, 'pe_ttm', stock['pe_ttm'], ascending=True)
-                if percentile < pe_percentile:
-                    meets_criteria = False
-                    reasons.append(f"PE行业百分位({percentile:.2f})过高")
-            else:
-                meets_criteria = False
-                reasons.append("缺少PE数据")
-                
-            # 6. PB - 要求不在行业前pb_percentile (较高)
-            if 'pb_mrq' in stock:
-                percentile = calculate_percentile(industry_df, 'pb_mrq', stock['pb_mrq'], ascending=True)
-                if percentile < pb_percentile:
-                    meets_criteria = False
-                    reasons.append(f"PB行业百分位({percentile:.2f})过高")
-            else:
-                meets_criteria = False
-                reasons.append("缺少PB数据")
-            
-            # 如果满足所有条件，添加到过滤后的列表
-            if meets_criteria:
-                # 找到原始stock对象
-                for original_stock in stocks:
-                    if original_stock['code'] == code:
-                        # 添加基本面分析结果
-                        original_stock['fundamental_analysis'] = {
-                            'avg_revenue_growth': stock.get('avg_revenue_growth'),
-                            'avg_profit_growth': stock.get('avg_profit_growth'),
-                            'avg_roe': stock.get('avg_roe'),
-                            'avg_liability_ratio': stock.get('avg_liability_ratio'),
-                            'pe_ttm': stock.get('pe_ttm'),
-                            'pb_mrq': stock.get('pb_mrq')
-                        }
-                        filtered_stocks.append(original_stock)
-                        break
-            else:
-                # 记录未通过的原因
-                logger.info(f"Stock {code} failed fundamental filter: {', '.join(reasons)}")
+        for stock in stocks:
+            analysis = analysis_by_code.get(stock['code'])
+            if analysis is not None:
+                # 添加基本面分析结果
+                stock['fundamental_analysis'] = analysis
+                filtered_stocks.append(stock)
     
     logger.info(f"Fundamental analysis complete. {len(filtered_stocks)} stocks passed out of {len(stock_list)}")
     return filtered_stocks
 
-def get_stock_fundamentals(code: str, years_to_check: int = 3) -> Dict[str, Any]:
+def _to_float(value: Any) -> Optional[float]:
+    """Convert a baostock field value ('' for missing) to float."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _report_years(years_to_check: int) -> List[int]:
+    """Annual report years checked by the fundamental filter (oldest first)."""
+    current_year = datetime.now().year
+    return list(range(current_year - years_to_check, current_year))
+
+
+def fetch_fundamental_report(code: str, year: int, quarter: int = 4) -> Optional[Dict[str, Any]]:
     """
-    Get fundamental data for a stock over multiple years.
+    Fetch one report (growth, profit and balance data) for a stock from Baostock.
+    Module-level so it can be used with ProcessPoolExecutor.
     
     Args:
         code: Stock code
-        years_to_check: Number of years to check
+        year: Report year
+        quarter: Report quarter (4 = annual report)
     
     Returns:
-        Dictionary with fundamental metrics
+        Record for StockDatabase.save_fundamentals (has_report=False if not yet published),
+        or None if a query failed
     """
-    # 获取当前年份和季度
-    import datetime
-    current_year = datetime.datetime.now().year
-    
-    # 获取最近几年的财务数据
-    growth_data = []
-    profit_data = []
-    balance_data = []
-    
-    # 获取最近years_to_check年的年报数据
-    for year in range(current_year-years_to_check, current_year):
-        # 获取成长能力数据
-        rs_growth = bs.query_growth_data(code=code, year=year, quarter=4)
-        if rs_growth.error_code != '0':
-            logger.warning(f"Failed to get growth data for {code}, year {year}: {rs_growth.error_msg}")
-            continue
-            
-        growth_list = []
-        while (rs_growth.error_code == '0') and rs_growth.next():
-            growth_list.append(rs_growth.get_row_data())
-        
-        if growth_list:
-            growth_data.append(pd.DataFrame(growth_list, columns=rs_growth.fields))
-        
-        # 获取盈利能力数据
-        rs_profit = bs.query_profit_data(code=code, year=year, quarter=4)
-        if rs_profit.error_code != '0':
-            logger.warning(f"Failed to get profit data for {code}, year {year}: {rs_profit.error_msg}")
-            continue
-            
-        profit_list = []
-        while (rs_profit.error_code == '0') and rs_profit.next():
-            profit_list.append(rs_profit.get_row_data())
-        
-        if profit_list:
-            profit_data.append(pd.DataFrame(profit_list, columns=rs_profit.fields))
-        
-        # 获取偿债能力数据
-        rs_balance = bs.query_balance_data(code=code, year=year, quarter=4)
-        if rs_balance.error_code != '0':
-            logger.warning(f"Failed to get balance data for {code}, year {year}: {rs_balance.error_msg}")
-            continue
-            
-        balance_list = []
-        while (rs_balance.error_code == '0') and rs_balance.next():
-            balance_list.append(rs_balance.get_row_data())
-        
-        if balance_list:
-            balance_data.append(pd.DataFrame(balance_list, columns=rs_balance.fields))
+    from ..data_fetcher import baostock_login
+    baostock_login()
     
-    # 如果没有足够的数据，返回空字典
-    if len(growth_data) < years_to_check or len(profit_data) < years_to_check or len(balance_data) < years_to_check:
-        logger.warning(f"Insufficient data for {code}, need {years_to_check} years but got growth:{len(growth_data)}, profit:{len(profit_data)}, balance:{len(balance_data)}")
-        return {}
+    rows = {}
+    queries = [
+        ('growth', bs.query_growth_data),    # 成长能力数据
+        ('profit', bs.query_profit_data),    # 盈利能力数据
+        ('balance', bs.query_balance_data),  # 偿债能力数据
+    ]
+    for name, query in queries:
+        rs = query(code=code, year=year, quarter=quarter)
+        if rs.error_code != '0':
+            logger.warning(f"Failed to get {name} data for {code}, year {year}: {rs.error_msg}")
+            return None
+        data = []
+        while (rs.error_code == '0') and rs.next():
+            data.append(rs.get_row_data())
+        rows[name] = dict(zip(rs.fields, data[0])) if data else {}
+    
+    growth, profit, balance = rows['growth'], rows['profit'], rows['balance']
+    first_row = growth or profit or balance
+    return {
+        'code': code,
+        'year': year,
+        'quarter': quarter,
+        'pub_date': first_row.get('pubDate'),
+        'stat_date': first_row.get('statDate'),
+        'yoy_asset': _to_float(growth.get('YOYAsset')),
+        'yoy_pni': _to_float(growth.get('YOYPNI')),
+        'roe_avg': _to_float(profit.get('roeAvg')),
+        'liability_to_asset': _to_float(balance.get('liabilityToAsset')),
+        'has_report': bool(growth and profit and balance)
+    }
+
+
+def refresh_fundamentals(codes: List[str], years_to_check: int = 3,
+                         max_workers: int = FUNDAMENTALS_REFRESH_WORKERS,
+                         recheck_days: int = FUNDAMENTALS_RECHECK_DAYS) -> int:
+    """
+    Bring the local fundamentals table up to date for the given stocks.
+    Annual reports already stored are final and never re-fetched; reports that
+    were missing on the last check are re-checked after recheck_days.
+    
+    Args:
+        codes: Stock codes
+        years_to_check: Number of recent annual reports needed per stock
+        max_workers: Number of parallel fetch workers
+        recheck_days: Days before a missing report is checked again
+    
+    Returns:
+        Number of report records fetched and saved
+    """
+    if not codes:
+        return 0
+    
+    db = get_stock_database()
+    years = _report_years(years_to_check)
+    stored = db.get_fundamentals(codes, years)
+    recheck_before = datetime.now(timezone.utc) - timedelta(days=recheck_days)
     
-    # 合并数据
-    growth_df = pd.concat(growth_data)
-    profit_df = pd.concat(profit_data)
-    balance_df = pd.concat(balance_data)
+    pending = []
+    for code in codes:
+        for year in years:
+            record = stored.get(code, {}).get(year)
+            if record:
+                if record['has_report']:
+                    continue
+                fetched_at = record.get('fetched_at')
+                if fetched_at and datetime.fromisoformat(fetched_at) > recheck_before:
+                    continue
+            pending.append((code, year))
     
-    # 获取当前的市盈率和市净率
-    # 获取最近的K线数据
+    if not pending:
+        return 0
+    
+    logger.info(f"Refreshing {len(pending)} fundamental reports for {len(codes)} stocks")
+    
+    saved_count = 0
+    records = []
+    if max_workers <= 1 or len(pending) == 1:
+        # 单只股票（如平台期检查接口）直接在当前线程获取
+        for code, year in pending:
+            try:
+                record = fetch_fundamental_report(code, year)
+            except Exception as e:
+                logger.error(f"Error fetching fundamentals for {code}, year {year}: {str(e)}")
+                continue
+            if record:
+                records.append(record)
+    else:
+        # 与扫描保持一致：Linux 上使用线程池，其他平台使用进程池
+        from ..platform_scanner import should_use_process_pool
+        executor_class = ProcessPoolExecutor if should_use_process_pool() else ThreadPoolExecutor
+        
+        with executor_class(max_workers=min(max_workers, len(pending))) as executor:
+            futures = {
+                executor.submit(fetch_fundamental_report, code, year): (code, year)
+                for code, year in pending
+            }
+            for future in as_completed(futures):
+                code, year = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching fundamentals for {code}, year {year}: {str(e)}")
+                    continue
+                if record:
+                    records.append(record)
+                # 分批写入，避免长时间持有大量未保存数据
+                if len(records) >= 500:
+                    db.save_fundamentals(records)
+                    saved_count += len(records)
+                    records = []
+    
+    db.save_fundamentals(records)
+    saved_count += len(records)
+    logger.info(f"Fundamentals refresh complete: {saved_count} reports saved")
+    return saved_count
+
+
+def _fetch_latest_valuation(code: str) -> Dict[str, float]:
+    """
+    Fetch the latest peTTM / pbMRQ from Baostock (fallback when local K-lines are missing).
+    The calling thread must be logged in (see load_fundamentals).
+    """
     rs_k = bs.query_history_k_data_plus(
         code,
         "date,code,close,peTTM,pbMRQ",
-        start_date=(datetime.datetime.now() - datetime.timedelta(days=30)).strftime('%Y-%m-%d'),
-        end_date=datetime.datetime.now().strftime('%Y-%m-%d'),
+        start_date=(datetime.now() - timedelta(days=VALUATION_LOOKBACK_DAYS)).strftime('%Y-%m-%d'),
+        end_date=datetime.now().strftime('%Y-%m-%d'),
         frequency="d"
     )
     
-    pe_ttm = None
-    pb_mrq = None
-    
+    valuation = {}
     if rs_k.error_code == '0':
         k_list = []
         while rs_k.next():
@@ -274,114 +389,121 @@ def get_stock_fundamentals(code: str, years_to_check: int = 3) -> Dict[str, Any]
         
         if k_list:
             k_df = pd.DataFrame(k_list, columns=rs_k.fields)
-            # 转换为数值类型
-            k_df['peTTM'] = pd.to_numeric(k_df['peTTM'], errors='coerce')
-            k_df['pbMRQ'] = pd.to_numeric(k_df['pbMRQ'], errors='coerce')
-            
-            # 获取最新的非NaN值
-            pe_ttm = k_df.loc[k_df['peTTM'].notna(), 'peTTM'].iloc[-1] if not k_df.loc[k_df['peTTM'].notna()].empty else None
-            pb_mrq = k_df.loc[k_df['pbMRQ'].notna(), 'pbMRQ'].iloc[-1] if not k_df.loc[k_df['pbMRQ'].notna()].empty else None
-    
-    # 提取并计算关键指标
-    result = {}
-    
-    # 1. 营收增长率 - 检查连续性和计算平均值
-    try:
-        revenue_growth_values = []
-        for i in range(years_to_check):
-            yoy_value = growth_df.iloc[i]['YOYAsset']
-            if yoy_value and yoy_value != '' and float(yoy_value) > 0:
-                revenue_growth_values.append(float(yoy_value))
-            else:
-                break
-        
-        result['revenue_growth_consistent'] = len(revenue_growth_values) == years_to_check
-        if result['revenue_growth_consistent']:
-            result['avg_revenue_growth'] = sum(revenue_growth_values) / len(revenue_growth_values)
-    except Exception as e:
-        logger.error(f"Error calculating revenue growth for {code}: {str(e)}")
-    
-    # 2. 净利润增长率 - 检查连续性和计算平均值
-    try:
-        profit_growth_values = []
-        for i in range(years_to_check):
-            yoy_value = growth_df.iloc[i]['YOYPNI']
-            if yoy_value and yoy_value != '' and float(yoy_value) > 0:
-                profit_growth_values.append(float(yoy_value))
-            else:
-                break
-        
-        result['profit_growth_consistent'] = len(profit_growth_values) == years_to_check
-        if result['profit_growth_consistent']:
-            result['avg_profit_growth'] = sum(profit_growth_values) / len(profit_growth_values)
-    except Exception as e:
-        logger.error(f"Error calculating profit growth for {code}: {str(e)}")
+            for column, key in (('peTTM', 'pe_ttm'), ('pbMRQ', 'pb_mrq')):
+                values = pd.to_numeric(k_df[column], errors='coerce').dropna()
+                if not values.empty:
+                    valuation[key] = float(values.iloc[-1])
+    return valuation
+
+
+def _consistent_values(values: List[Optional[float]], require_positive: bool = True) -> List[float]:
+    """Leading run of valid (and positive, if required) values."""
+    result = []
+    for value in values:
+        if value is None or (require_positive and value <= 0):
+            break
+        result.append(value)
+    return result
+
+
+def _compute_fundamental_metrics(code: str, reports: List[Dict[str, Any]], years_to_check: int,
+                                 valuation: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Compute consistency flags and averages from stored annual reports.
     
-    # 3. ROE - 检查连续性和计算平均值
-    try:
-        roe_values = []
-        for i in range(years_to_check):
-            roe_value = profit_df.iloc[i]['roeAvg']
-            if roe_value and roe_value != '' and float(roe_value) > 0:
-                roe_values.append(float(roe_value))
-            else:
-                break
-        
-        result['roe_consistent'] = len(roe_values) == years_to_check
-        if result['roe_consistent']:
-            result['avg_roe'] = sum(roe_values) / len(roe_values)
-    except Exception as e:
-        logger.error(f"Error calculating ROE for {code}: {str(e)}")
+    Args:
+        code: Stock code
+        reports: Annual report records, oldest first
+        years_to_check: Number of years required
+        valuation: Latest pe_ttm / pb_mrq
     
-    # 4. 资产负债率 - 检查连续性和计算平均值
-    try:
-        liability_ratio_values = []
-        for i in range(years_to_check):
-            ratio_value = balance_df.iloc[i]['liabilityToAsset']
-            if ratio_value and ratio_value != '':
-                liability_ratio_values.append(float(ratio_value))
-            else:
-                break
-        
-        result['liability_ratio_consistent'] = len(liability_ratio_values) == years_to_check
-        if result['liability_ratio_consistent']:
-            result['avg_liability_ratio'] = sum(liability_ratio_values) / len(liability_ratio_values)
-    except Exception as e:
-        logger.error(f"Error calculating liability ratio for {code}: {str(e)}")
+    Returns:
+        Dictionary with fundamental metrics ({} if reports are incomplete)
+    """
+    if len(reports) < years_to_check:
+        logger.warning(f"Insufficient data for {code}, need {years_to_check} years but got {len(reports)}")
+        return {}
     
-    # 5. 市盈率
-    if pe_ttm is not None:
-        result['pe_ttm'] = float(pe_ttm)
+    result = {}
+    metrics = [
+        # (stored column, consistency key, average key, require positive)
+        ('yoy_asset', 'revenue_growth_consistent', 'avg_revenue_growth', True),   # 1. 营收增长率
+        ('yoy_pni', 'profit_growth_consistent', 'avg_profit_growth', True),       # 2. 净利润增长率
+        ('roe_avg', 'roe_consistent', 'avg_roe', True),                            # 3. ROE
+        ('liability_to_asset', 'liability_ratio_consistent', 'avg_liability_ratio', False),  # 4. 资产负债率
+    ]
+    for column, consistent_key, avg_key, require_positive in metrics:
+        values = _consistent_values([report.get(column) for report in reports], require_positive)
+        result[consistent_key] = len(values) == years_to_check
+        if result[consistent_key]:
+            result[avg_key] = sum(values) / len(values)
     
-    # 6. 市净率
-    if pb_mrq is not None:
-        result['pb_mrq'] = float(pb_mrq)
+    # 5. 市盈率 / 6. 市净率
+    if valuation.get('pe_ttm') is not None:
+        result['pe_ttm'] = float(valuation['pe_ttm'])
+    if valuation.get('pb_mrq') is not None:
+        result['pb_mrq'] = float(valuation['pb_mrq'])
     
     return result
 
-def calculate_percentile(df: pd.DataFrame, column: str, value: float, ascending: bool = True) -> float:
+
+def load_fundamentals(codes: List[str], years_to_check: int = 3) -> Dict[str, Dict[str, Any]]:
     """
-    Calculate the percentile of a value within a DataFrame column.
+    Compute fundamental metrics for many stocks from the local fundamentals table.
+    PE/PB come from local K-line data (Baostock only for stocks without recent K-lines).
     
     Args:
-        df: DataFrame containing the data
-        column: Column name to calculate percentile for
-        value: Value to find percentile for
-        ascending: Whether to sort in ascending order
+        codes: Stock codes
+        years_to_check: Number of years to check
     
     Returns:
-        Percentile as a float between 0 and 1
+        Dict mapping code to fundamental metrics (stocks with incomplete data map to {})
     """
-    if column not in df.columns or df[column].isna().all():
-        return 1.0  # 如果列不存在或全为NaN，返回最大百分位
+    if not codes:
+        return {}
+    
+    db = get_stock_database()
+    years = _report_years(years_to_check)
+    stored = db.get_fundamentals(codes, years)
+    since_date = (datetime.now() - timedelta(days=VALUATION_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    valuations = db.get_latest_valuations(codes, since_date=since_date)
     
-    # 过滤有效值
-    valid_values = df[column].dropna()
-    if len(valid_values) == 0:
-        return 1.0
+    reports_by_code = {}
+    for code in codes:
+        stock_reports = stored.get(code, {})
+        reports_by_code[code] = [stock_reports[year] for year in years
+                                 if year in stock_reports and stock_reports[year]['has_report']]
     
-    # 排序并计算百分位
-    sorted_values = sorted(valid_values, reverse=not ascending)
-    rank = sorted_values.index(value) if value in sorted_values else len(sorted_values)
+    # 本地缺少估值的股票才访问 Baostock，在当前线程登录并在结束后登出
+    missing = [code for code in codes
+               if valuations.get(code) is None and len(reports_by_code[code]) >= years_to_check]
+    if missing:
+        from ..data_fetcher import BaostockConnectionManager
+        with BaostockConnectionManager():
+            for code in missing:
+                try:
+                    valuations[code] = _fetch_latest_valuation(code)
+                except Exception as e:
+                    logger.error(f"Error fetching valuation for {code}: {str(e)}")
+    
+    return {
+        code: _compute_fundamental_metrics(code, reports_by_code[code], years_to_check,
+                                           valuations.get(code) or {})
+        for code in codes
+    }
+
+
+def get_stock_fundamentals(code: str, years_to_check: int = 3) -> Dict[str, Any]:
+    """
+    Get fundamental data for a stock over multiple years.
+    Reads the local fundamentals table, fetching only reports not stored yet.
     
-    return rank / len(sorted_values)
+    Args:
+        code: Stock code
+        years_to_check: Number of years to check
+    
+    Returns:
+        Dictionary with fundamental metrics
+    """
+    refresh_fundamentals([code], years_to_check, max_workers=1)
+    return load_fundamentals([code], years_to_check).get(code, {})
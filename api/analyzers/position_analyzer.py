@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 from typing import Dict, Any, Tuple
 
+from .frame_utils import prepare_analysis_frame
+
 def analyze_position(df: pd.DataFrame, 
                     high_point_lookback_days: int = 365,
                     decline_period_days: int = 180,
@@ -27,8 +29,8 @@ def analyze_position(df: pd.DataFrame,
             "details": {"status": "数据不足"}
         }
     
-    # Sort by date to ensure chronological order
-    df = df.sort_values('date')
+    # Sorted by date, RangeIndex (no-op for frames from fetch_kline_data)
+    df = prepare_analysis_frame(df)
     
     # Get current price (most recent close)
     current_price = df['close'].iloc[-1]
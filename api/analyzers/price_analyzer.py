@@ -29,7 +29,7 @@ def quick_price_check(df: pd.DataFrame, window: int,
         }
     
     # Get the most recent window of data
-    recent_df = df.iloc[-window:].copy()
+    recent_df = df.iloc[-window:]
     
     # Calculate price range (box) - fast operation
     price_high = recent_df['high'].max()
@@ -74,7 +74,7 @@ def calculate_price_features(df: pd.DataFrame, window: int) -> Dict[str, float]:
         }
     
     # Get the most recent window of data
-    recent_df = df.iloc[-window:].copy()
+    recent_df = df.iloc[-window:]
     
     # Calculate price range (box)
     price_high = recent_df['high'].max()
@@ -3,27 +3,111 @@ Relative Strength Analyzer module for calculating stock performance relative to
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, Union
+
+from .frame_utils import prepare_analysis_frame
+from ..logging_utils import get_logger
+
+logger = get_logger('analyzer')
+
+
+class MarketReference:
+    """
+    Benchmark index series prepared once per scan.
+
+    Holds the index trading days with an ordinal lookup (date -> position)
+    and the cumulative log return up to each day, so the index return over
+    any window is the difference of two array entries.
+    """
+
+    __slots__ = ('code', 'dates', 'cum_log_returns', '_ordinals')
+
+    def __init__(self, market_df: pd.DataFrame, code: Optional[str] = None):
+        """
+        Build the reference from index K-lines.
+
+        Args:
+            market_df: Index K-line DataFrame with 'date' and 'close' columns
+            code: Benchmark index code (e.g. 'sh.000001')
+        """
+        self.code = code
+        if market_df is None or market_df.empty:
+            self.dates = np.array([], dtype='datetime64[ns]')
+            self.cum_log_returns = np.array([], dtype=np.float64)
+            self._ordinals: Dict[int, int] = {}
+            return
+
+        market_df = prepare_analysis_frame(market_df)
+        self.dates = market_df['date'].to_numpy(dtype='datetime64[ns]')
+        closes = market_df['close'].to_numpy(dtype=np.float64)
+        # 非正收盘价视为无效（NaN），涉及该日的区间收益无法计算
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_close = np.where(closes > 0, np.log(closes), np.nan)
+        finite = log_close[np.isfinite(log_close)]
+        self.cum_log_returns = log_close - finite[0] if len(finite) else log_close
+        self._ordinals = {day: i for i, day in enumerate(self.dates.view('int64').tolist())}
+
+    @property
+    def empty(self) -> bool:
+        return len(self.dates) == 0
+
+    def ordinal(self, date: Any) -> int:
+        """
+        Get the position of the last index trading day on or before date.
+
+        Args:
+            date: Date (Timestamp, datetime64 or 'YYYY-MM-DD')
+
+        Returns:
+            Trading-day ordinal, or -1 if date is before the first index day
+        """
+        day = pd.Timestamp(date).value
+        position = self._ordinals.get(day)
+        if position is not None:
+            return position
+        # 非指数交易日（如个股数据中多出的日期）：取之前最近的交易日
+        return int(np.searchsorted(self.dates, np.datetime64(day, 'ns'), side='right')) - 1
+
+    def window_return(self, start_ordinal: int, end_ordinal: int) -> Optional[float]:
+        """
+        Get the index return between two trading-day ordinals.
+
+        Args:
+            start_ordinal: Ordinal of the window start
+            end_ordinal: Ordinal of the window end
+
+        Returns:
+            Return in percent, or None if either close is invalid
+        """
+        log_return = self.cum_log_returns[end_ordinal] - self.cum_log_returns[start_ordinal]
+        if not np.isfinite(log_return):
+            return None
+        return float(np.expm1(log_return) * 100)
+
+
+def _format_date(value: Any) -> str:
+    return str(value.date()) if hasattr(value, 'date') else str(value)
 
 
 def calculate_relative_strength(
     stock_df: pd.DataFrame,
-    market_df: pd.DataFrame,
+    market: Union[pd.DataFrame, MarketReference],
     window: int,
     end_date: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Calculate relative strength (outperform_index) for a stock compared to market index.
-    
+
     Relative strength is calculated as: (stock_return - market_return) * 100
     where returns are calculated over the platform period window.
-    
+
     Args:
         stock_df: DataFrame containing stock price data with 'date' and 'close' columns
-        market_df: DataFrame containing market index data with 'date' and 'close' columns
+        market: MarketReference built once per scan, or a DataFrame containing
+            market index data with 'date' and 'close' columns
         window: Platform period window size in days
         end_date: End date for calculation (default: last date in stock_df)
-    
+
     Returns:
         Dict containing:
             - outperform_index: float, relative strength percentage
@@ -31,162 +115,135 @@ def calculate_relative_strength(
             - market_return: float, market return percentage
             - start_date: str, calculation start date
             - end_date: str, calculation end date
+            - benchmark: str, benchmark index code (if known)
             - status: str, status message
     """
-    if stock_df.empty or market_df.empty:
-        print(f"[RELATIVE_STRENGTH_DEBUG] Data insufficient: stock_df.empty={stock_df.empty}, market_df.empty={market_df.empty}")
-        return {
-            "outperform_index": None,
-            "stock_return": None,
-            "market_return": None,
-            "start_date": None,
-            "end_date": None,
-            "status": "数据不足"
-        }
-    
-    # Ensure dataframes are sorted by date
-    stock_df = stock_df.sort_values('date').reset_index(drop=True)
-    market_df = market_df.sort_values('date').reset_index(drop=True)
-    
-    # Convert date column to datetime if needed
-    if not pd.api.types.is_datetime64_any_dtype(stock_df['date']):
-        stock_df['date'] = pd.to_datetime(stock_df['date'])
-    if not pd.api.types.is_datetime64_any_dtype(market_df['date']):
-        market_df['date'] = pd.to_datetime(market_df['date'])
-    
-    # Determine end date
+    if not isinstance(market, MarketReference):
+        market = MarketReference(market)
+    stock_df = prepare_analysis_frame(stock_df)
+    end_idx = _stock_end_index(stock_df, end_date)
+    if end_idx is None:
+        return _empty_result("数据不足", market)
+    return _relative_strength_for_window(stock_df, market, window, end_idx)
+
+
+def _stock_end_index(stock_df: pd.DataFrame, end_date: Optional[str]) -> Optional[int]:
+    """Position of the last stock bar on or before end_date (None without data; stock_df prepared)."""
+    if stock_df.empty:
+        return None
     if end_date:
-        end_date_dt = pd.to_datetime(end_date)
-    else:
-        end_date_dt = stock_df['date'].max()
-    
-    # Find the end date index in stock dataframe
-    end_idx = stock_df[stock_df['date'] <= end_date_dt].index
-    if len(end_idx) == 0:
-        print(f"[RELATIVE_STRENGTH_DEBUG] Cannot find end date: end_date_dt={end_date_dt}, stock_df date range: {stock_df['date'].min()} to {stock_df['date'].max()}")
-        return {
-            "outperform_index": None,
-            "stock_return": None,
-            "market_return": None,
-            "start_date": None,
-            "end_date": None,
-            "status": "无法找到结束日期"
-        }
-    
-    end_idx = end_idx[-1]
-    
+        return int(stock_df['date'].searchsorted(pd.to_datetime(end_date), side='right')) - 1
+    return len(stock_df) - 1
+
+
+def _empty_result(status: str, market: MarketReference,
+                  stock_return: Optional[float] = None,
+                  start_date: Optional[str] = None,
+                  end_date: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "outperform_index": None,
+        "stock_return": stock_return,
+        "market_return": None,
+        "start_date": start_date,
+        "end_date": end_date,
+        "benchmark": market.code,
+        "status": status
+    }
+
+
+def _relative_strength_for_window(stock_df: pd.DataFrame, market: MarketReference,
+                                  window: int, end_idx: int) -> Dict[str, Any]:
+    """Relative strength over the window ending at stock bar end_idx (stock_df prepared)."""
+    if market.empty:
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Data insufficient: market data empty")
+        return _empty_result("数据不足", market)
+
+    if end_idx < 0:
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Cannot find end date: stock_df date range: %s to %s", stock_df['date'].iloc[0], stock_df['date'].iloc[-1])
+        return _empty_result("无法找到结束日期", market)
+
     # Calculate start index (window days before end)
     start_idx = max(0, end_idx - window + 1)
-    
-    # Get the window data
-    window_stock_df = stock_df.iloc[start_idx:end_idx + 1].copy()
-    
-    if len(window_stock_df) < 2:
-        print(f"[RELATIVE_STRENGTH_DEBUG] Window data insufficient: window={window}, data_points={len(window_stock_df)}, start_idx={start_idx}, end_idx={end_idx}")
-        return {
-            "outperform_index": None,
-            "stock_return": None,
-            "market_return": None,
-            "start_date": None,
-            "end_date": None,
-            "status": "窗口数据不足"
-        }
-    
+
+    if end_idx - start_idx + 1 < 2:
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Window data insufficient: window=%s, data_points=%s, start_idx=%s, end_idx=%s", window, end_idx - start_idx + 1, start_idx, end_idx)
+        return _empty_result("窗口数据不足", market)
+
     # Get start and end dates
-    start_date_dt = window_stock_df['date'].iloc[0]
-    end_date_actual = window_stock_df['date'].iloc[-1]
-    
+    dates = stock_df['date']
+    start_date_dt = dates.iloc[start_idx]
+    end_date_actual = dates.iloc[end_idx]
+    start_date_str = _format_date(start_date_dt)
+    end_date_str = _format_date(end_date_actual)
+
     # Calculate stock return
-    start_price = float(window_stock_df['close'].iloc[0])
-    end_price = float(window_stock_df['close'].iloc[-1])
-    
+    closes = stock_df['close']
+    start_price = float(closes.iloc[start_idx])
+    end_price = float(closes.iloc[end_idx])
+
     if start_price == 0 or pd.isna(start_price) or pd.isna(end_price):
-        print(f"[RELATIVE_STRENGTH_DEBUG] Invalid price data: start_price={start_price}, end_price={end_price}, start_date={start_date_dt}, end_date={end_date_actual}")
-        return {
-            "outperform_index": None,
-            "stock_return": None,
-            "market_return": None,
-            "start_date": str(start_date_dt.date()) if hasattr(start_date_dt, 'date') else str(start_date_dt),
-            "end_date": str(end_date_actual.date()) if hasattr(end_date_actual, 'date') else str(end_date_actual),
-            "status": "价格数据无效"
-        }
-    
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Invalid price data: start_price=%s, end_price=%s, start_date=%s, end_date=%s", start_price, end_price, start_date_dt, end_date_actual)
+        return _empty_result("价格数据无效", market, None, start_date_str, end_date_str)
+
     stock_return = ((end_price - start_price) / start_price) * 100
-    
-    # Find corresponding market data for the same date range
-    market_start_idx = market_df[market_df['date'] <= start_date_dt].index
-    market_end_idx = market_df[market_df['date'] <= end_date_actual].index
-    
-    if len(market_start_idx) == 0 or len(market_end_idx) == 0:
-        print(f"[RELATIVE_STRENGTH_DEBUG] Cannot find market data: start_date={start_date_dt}, end_date={end_date_actual}, market_df date range: {market_df['date'].min()} to {market_df['date'].max()}, market_start_idx={len(market_start_idx)}, market_end_idx={len(market_end_idx)}")
-        return {
-            "outperform_index": None,
-            "stock_return": stock_return,
-            "market_return": None,
-            "start_date": str(start_date_dt.date()) if hasattr(start_date_dt, 'date') else str(start_date_dt),
-            "end_date": str(end_date_actual.date()) if hasattr(end_date_actual, 'date') else str(end_date_actual),
-            "status": "无法找到对应的大盘数据"
-        }
-    
-    market_start_idx = market_start_idx[-1]
-    market_end_idx = market_end_idx[-1]
-    
-    # Get market prices
-    market_start_price = float(market_df.iloc[market_start_idx]['close'])
-    market_end_price = float(market_df.iloc[market_end_idx]['close'])
-    
-    if market_start_price == 0 or pd.isna(market_start_price) or pd.isna(market_end_price):
-        print(f"[RELATIVE_STRENGTH_DEBUG] Invalid market price data: market_start_price={market_start_price}, market_end_price={market_end_price}, start_date={start_date_dt}, end_date={end_date_actual}")
-        return {
-            "outperform_index": None,
-            "stock_return": stock_return,
-            "market_return": None,
-            "start_date": str(start_date_dt.date()) if hasattr(start_date_dt, 'date') else str(start_date_dt),
-            "end_date": str(end_date_actual.date()) if hasattr(end_date_actual, 'date') else str(end_date_actual),
-            "status": "大盘价格数据无效"
-        }
-    
-    # Calculate market return
-    market_return = ((market_end_price - market_start_price) / market_start_price) * 100
-    
+
+    # Align the window on index trading-day ordinals
+    market_start_idx = market.ordinal(start_date_dt)
+    market_end_idx = market.ordinal(end_date_actual)
+
+    if market_start_idx < 0 or market_end_idx < 0:
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Cannot find market data: start_date=%s, end_date=%s, market_start_idx=%s, market_end_idx=%s", start_date_dt, end_date_actual, market_start_idx, market_end_idx)
+        return _empty_result("无法找到对应的大盘数据", market, stock_return, start_date_str, end_date_str)
+
+    market_return = market.window_return(market_start_idx, market_end_idx)
+    if market_return is None:
+        logger.debug("[RELATIVE_STRENGTH_DEBUG] Invalid market price data: start_date=%s, end_date=%s", start_date_dt, end_date_actual)
+        return _empty_result("大盘价格数据无效", market, stock_return, start_date_str, end_date_str)
+
     # Calculate relative strength (outperform_index)
     outperform_index = stock_return - market_return
-    
-    print(f"[RELATIVE_STRENGTH_DEBUG] Calculation successful: window={window}, stock_return={stock_return:.2f}%, market_return={market_return:.2f}%, outperform_index={outperform_index:.2f}%, start_date={start_date_dt}, end_date={end_date_actual}")
-    
+
+    logger.debug("[RELATIVE_STRENGTH_DEBUG] Calculation successful: window=%s, stock_return=%.2f%%, market_return=%.2f%%, outperform_index=%.2f%%, start_date=%s, end_date=%s", window, stock_return, market_return, outperform_index, start_date_dt, end_date_actual)
+
     return {
         "outperform_index": outperform_index,
         "stock_return": stock_return,
         "market_return": market_return,
-        "start_date": str(start_date_dt.date()) if hasattr(start_date_dt, 'date') else str(start_date_dt),
-        "end_date": str(end_date_actual.date()) if hasattr(end_date_actual, 'date') else str(end_date_actual),
+        "start_date": start_date_str,
+        "end_date": end_date_str,
+        "benchmark": market.code,
         "status": "计算成功"
     }
 
 
 def analyze_relative_strength_for_windows(
     stock_df: pd.DataFrame,
-    market_df: pd.DataFrame,
+    market: Union[pd.DataFrame, MarketReference],
     windows: list,
     end_date: Optional[str] = None
 ) -> Dict[int, Dict[str, Any]]:
     """
     Calculate relative strength for multiple windows.
-    
+
     Args:
         stock_df: DataFrame containing stock price data
-        market_df: DataFrame containing market index data
+        market: MarketReference, or DataFrame containing market index data
         windows: List of window sizes to analyze
         end_date: End date for calculation
-    
+
     Returns:
         Dict mapping window size to relative strength analysis results
     """
+    if not isinstance(market, MarketReference):
+        market = MarketReference(market)
+    # The stock end position is the same for every window
+    stock_df = prepare_analysis_frame(stock_df)
+    end_idx = _stock_end_index(stock_df, end_date)
+    if end_idx is None:
+        return {window: _empty_result("数据不足", market) for window in windows}
+
     results = {}
-    
     for window in windows:
-        result = calculate_relative_strength(stock_df, market_df, window, end_date)
-        results[window] = result
-    
-    return results
+        results[window] = _relative_strength_for_window(stock_df, market, window, end_idx)
 
+    return results
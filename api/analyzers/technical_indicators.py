@@ -5,43 +5,47 @@ import pandas as pd
 import numpy as np
 from typing import Dict, Any, List, Optional, Tuple
 
-def calculate_ma(df: pd.DataFrame, periods: List[int] = [5, 10, 20, 30, 60]) -> pd.DataFrame:
+def calculate_ma(df: pd.DataFrame, periods: List[int] = [5, 10, 20, 30, 60], copy: bool = True) -> pd.DataFrame:
     """
     Calculate Moving Averages for the given periods.
     
     Args:
         df: DataFrame containing price data with 'close' column
         periods: List of periods to calculate MA for
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional MA columns
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     for period in periods:
         result_df[f'ma{period}'] = result_df['close'].rolling(window=period).mean()
     
     return result_df
 
-def calculate_ema(df: pd.DataFrame, periods: List[int] = [12, 26]) -> pd.DataFrame:
+def calculate_ema(df: pd.DataFrame, periods: List[int] = [12, 26], copy: bool = True) -> pd.DataFrame:
     """
     Calculate Exponential Moving Averages for the given periods.
     
     Args:
         df: DataFrame containing price data with 'close' column
         periods: List of periods to calculate EMA for
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional EMA columns
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     for period in periods:
         result_df[f'ema{period}'] = result_df['close'].ewm(span=period, adjust=False).mean()
     
     return result_df
 
-def calculate_macd(df: pd.DataFrame, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> pd.DataFrame:
+def calculate_macd(df: pd.DataFrame, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9, copy: bool = True) -> pd.DataFrame:
     """
     Calculate MACD (Moving Average Convergence Divergence).
     
@@ -50,11 +54,13 @@ def calculate_macd(df: pd.DataFrame, fast_period: int = 12, slow_period: int = 2
         fast_period: Period for fast EMA
         slow_period: Period for slow EMA
         signal_period: Period for signal line
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional MACD columns
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     # Calculate fast and slow EMAs
     fast_ema = result_df['close'].ewm(span=fast_period, adjust=False).mean()
@@ -71,18 +77,20 @@ def calculate_macd(df: pd.DataFrame, fast_period: int = 12, slow_period: int = 2
     
     return result_df
 
-def calculate_rsi(df: pd.DataFrame, period: int = 14) -> pd.DataFrame:
+def calculate_rsi(df: pd.DataFrame, period: int = 14, copy: bool = True) -> pd.DataFrame:
     """
     Calculate RSI (Relative Strength Index).
     
     Args:
         df: DataFrame containing price data with 'close' column
         period: Period for RSI calculation
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional RSI column
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     # Calculate price changes
     delta = result_df['close'].diff()
@@ -103,7 +111,7 @@ def calculate_rsi(df: pd.DataFrame, period: int = 14) -> pd.DataFrame:
     
     return result_df
 
-def calculate_kdj(df: pd.DataFrame, k_period: int = 9, d_period: int = 3, j_period: int = 3) -> pd.DataFrame:
+def calculate_kdj(df: pd.DataFrame, k_period: int = 9, d_period: int = 3, j_period: int = 3, copy: bool = True) -> pd.DataFrame:
     """
     Calculate KDJ indicator.
     
@@ -112,11 +120,13 @@ def calculate_kdj(df: pd.DataFrame, k_period: int = 9, d_period: int = 3, j_peri
         k_period: Period for K line
         d_period: Period for D line
         j_period: Period for J line
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional KDJ columns
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     # Calculate lowest low and highest high
     low_min = result_df['low'].rolling(window=k_period).min()
@@ -136,7 +146,7 @@ def calculate_kdj(df: pd.DataFrame, k_period: int = 9, d_period: int = 3, j_peri
     
     return result_df
 
-def calculate_bollinger_bands(df: pd.DataFrame, period: int = 20, std_dev: float = 2.0) -> pd.DataFrame:
+def calculate_bollinger_bands(df: pd.DataFrame, period: int = 20, std_dev: float = 2.0, copy: bool = True) -> pd.DataFrame:
     """
     Calculate Bollinger Bands.
     
@@ -144,11 +154,13 @@ def calculate_bollinger_bands(df: pd.DataFrame, period: int = 20, std_dev: float
         df: DataFrame containing price data with 'close' column
         period: Period for moving average
         std_dev: Number of standard deviations for bands
+        copy: If False, add the columns to df itself (df must be a frame the
+            caller owns)
     
     Returns:
         DataFrame with additional Bollinger Bands columns
     """
-    result_df = df.copy()
+    result_df = df.copy() if copy else df
     
     # Calculate middle band (SMA)
     result_df['bb_middle'] = result_df['close'].rolling(window=period).mean()
@@ -178,22 +190,23 @@ def calculate_all_indicators(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty or 'close' not in df.columns:
         return df
     
+    # Copy once; the indicators then add their columns in place
     result_df = df.copy()
     
     # Calculate Moving Averages
-    result_df = calculate_ma(result_df)
+    result_df = calculate_ma(result_df, copy=False)
     
     # Calculate MACD
-    result_df = calculate_macd(result_df)
+    result_df = calculate_macd(result_df, copy=False)
     
     # Calculate RSI
-    result_df = calculate_rsi(result_df)
+    result_df = calculate_rsi(result_df, copy=False)
     
     # Calculate KDJ
     if all(col in result_df.columns for col in ['high', 'low']):
-        result_df = calculate_kdj(result_df)
+        result_df = calculate_kdj(result_df, copy=False)
     
     # Calculate Bollinger Bands
-    result_df = calculate_bollinger_bands(result_df)
+    result_df = calculate_bollinger_bands(result_df, copy=False)
     
     return result_df
@@ -9,10 +9,12 @@ from typing import Dict, Any, Tuple, Optional
 from ..config import (
     DEFAULT_MAX_TURNOVER_RATE, DEFAULT_ALLOW_TURNOVER_SPIKES
 )
+from .window_stats import WindowStats, turnover_stats as build_turnover_stats
 
 
 def calculate_turnover_features(df: pd.DataFrame, window: int, 
-                                exclude_recent_days: int = 5) -> Dict[str, float]:
+                                exclude_recent_days: int = 5,
+                                turnover_stats: Optional[WindowStats] = None) -> Dict[str, float]:
     """
     Calculate turnover rate-related features for a given window.
     
@@ -23,6 +25,8 @@ def calculate_turnover_features(df: pd.DataFrame, window: int,
         df: DataFrame containing stock price and volume data (must have 'turn' column)
         window: Window size in days
         exclude_recent_days: Number of recent days to exclude from platform analysis
+        turnover_stats: Turnover kernel of df (window_stats.turnover_stats),
+            shared across windows; built here if not provided
     
     Returns:
         Dict containing calculated turnover features:
@@ -39,15 +43,8 @@ def calculate_turnover_features(df: pd.DataFrame, window: int,
             'spike_count': 0
         }
     
-    # For platform period analysis, exclude recent days to separate from breakthrough
-    # Get the platform period data (excluding recent days)
-    if exclude_recent_days > 0 and len(df) > window:
-        platform_df = df.iloc[-window:-exclude_recent_days].copy()
-    else:
-        platform_df = df.iloc[-window:].copy()
-    
     # Check if 'turn' column exists
-    if 'turn' not in platform_df.columns:
+    if 'turn' not in df.columns:
         return {
             'avg_turnover_rate': float('nan'),
             'max_turnover_rate': float('nan'),
@@ -55,11 +52,17 @@ def calculate_turnover_features(df: pd.DataFrame, window: int,
             'spike_count': 0
         }
     
-    # Filter out invalid turnover rates (NaN, negative, or extremely large values)
-    valid_turnover = platform_df['turn'].dropna()
-    valid_turnover = valid_turnover[(valid_turnover >= 0) & (valid_turnover <= 100)]
+    # Invalid turnover rates (NaN, negative, or extremely large values) are masked out by the kernel
+    if turnover_stats is None:
+        turnover_stats = build_turnover_stats(df)
+    
+    # For platform period analysis, exclude recent days to separate from breakthrough
+    if exclude_recent_days > 0 and len(df) > window:
+        platform_range = (-window, -exclude_recent_days)
+    else:
+        platform_range = (-window, None)
     
-    if len(valid_turnover) == 0:
+    if turnover_stats.count(*platform_range) == 0:
         return {
             'avg_turnover_rate': float('nan'),
             'max_turnover_rate': float('nan'),
@@ -68,18 +71,18 @@ def calculate_turnover_features(df: pd.DataFrame, window: int,
         }
     
     # Calculate average turnover rate
-    avg_turnover_rate = valid_turnover.mean()
-    max_turnover_rate = valid_turnover.max()
+    avg_turnover_rate = turnover_stats.mean(*platform_range)
+    max_turnover_rate = turnover_stats.max(*platform_range)
     
     # Calculate turnover stability (coefficient of variation)
     if avg_turnover_rate > 0:
-        turnover_stability = valid_turnover.std() / avg_turnover_rate
+        turnover_stability = turnover_stats.std(*platform_range) / avg_turnover_rate
     else:
         turnover_stability = float('nan')
     
     # Count spikes (days with turnover rate exceeding 2x average)
     spike_threshold = avg_turnover_rate * 2
-    spike_count = (valid_turnover > spike_threshold).sum()
+    spike_count = turnover_stats.count_above(spike_threshold, *platform_range)
     
     return {
         'avg_turnover_rate': avg_turnover_rate,
@@ -92,7 +95,8 @@ def calculate_turnover_features(df: pd.DataFrame, window: int,
 def check_turnover_rate(df: pd.DataFrame, window: int,
                         max_turnover_rate: float = None,
                         allow_turnover_spikes: bool = None,
-                        exclude_recent_days: int = 5) -> Tuple[bool, Dict[str, Any]]:
+                        exclude_recent_days: int = 5,
+                        turnover_stats: Optional[WindowStats] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     Check if a stock's turnover rate meets the platform period criteria.
     
@@ -105,6 +109,7 @@ def check_turnover_rate(df: pd.DataFrame, window: int,
         max_turnover_rate: Maximum allowed average turnover rate (%)
         allow_turnover_spikes: Whether to allow occasional turnover spikes
         exclude_recent_days: Number of recent days to exclude (default 5, for breakthrough detection)
+        turnover_stats: Turnover kernel of df, shared across windows (optional)
     
     Returns:
         Tuple of (meets_criteria, details)
@@ -130,7 +135,8 @@ def check_turnover_rate(df: pd.DataFrame, window: int,
         }
     
     # Calculate turnover features (excluding recent days for platform analysis)
-    features = calculate_turnover_features(df, window, exclude_recent_days=exclude_recent_days)
+    features = calculate_turnover_features(df, window, exclude_recent_days=exclude_recent_days,
+                                           turnover_stats=turnover_stats)
     
     # Check if average turnover rate is valid
     if pd.isna(features['avg_turnover_rate']):
@@ -182,7 +188,8 @@ def check_turnover_rate(df: pd.DataFrame, window: int,
 def analyze_turnover(df: pd.DataFrame, window: int,
                      max_turnover_rate: float = None,
                      allow_turnover_spikes: bool = None,
-                     exclude_recent_days: int = 5) -> Dict[str, Any]:
+                     exclude_recent_days: int = 5,
+                     turnover_stats: Optional[WindowStats] = None) -> Dict[str, Any]:
     """
     Analyze turnover rate patterns for a stock.
     
@@ -195,6 +202,8 @@ def analyze_turnover(df: pd.DataFrame, window: int,
         max_turnover_rate: Maximum allowed average turnover rate (%)
         allow_turnover_spikes: Whether to allow occasional turnover spikes
         exclude_recent_days: Number of recent days to exclude (default 5, for breakthrough detection)
+        turnover_stats: Turnover kernel of df (window_stats.turnover_stats); pass
+            the same kernel for every window of a stock
     
     Returns:
         Dict containing turnover analysis results
@@ -215,7 +224,7 @@ def analyze_turnover(df: pd.DataFrame, window: int,
     # Check turnover rate criteria
     meets_criteria, details = check_turnover_rate(
         df, window, max_turnover_rate, allow_turnover_spikes,
-        exclude_recent_days=exclude_recent_days
+        exclude_recent_days=exclude_recent_days, turnover_stats=turnover_stats
     )
     
     return {
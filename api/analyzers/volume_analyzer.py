@@ -2,7 +2,6 @@
 Volume Analyzer module for analyzing stock volume patterns.
 """
 import pandas as pd
-import numpy as np
 from typing import Dict, Any, Tuple, Optional
 
 # Import default values from config to ensure consistency
@@ -10,9 +9,11 @@ from ..config import (
     DEFAULT_VOLUME_CHANGE_THRESHOLD, DEFAULT_VOLUME_STABILITY_THRESHOLD,
     DEFAULT_VOLUME_INCREASE_THRESHOLD
 )
+from .window_stats import WindowStats, volume_stats as build_volume_stats
 
 def calculate_volume_features(df: pd.DataFrame, window: int, 
-                              exclude_recent_days: int = 5) -> Dict[str, float]:
+                              exclude_recent_days: int = 5,
+                              volume_stats: Optional[WindowStats] = None) -> Dict[str, float]:
     """
     Calculate volume-related features for a given window.
     
@@ -25,6 +26,8 @@ def calculate_volume_features(df: pd.DataFrame, window: int,
         df: DataFrame containing stock price and volume data
         window: Window size in days
         exclude_recent_days: Number of recent days to exclude from platform analysis
+        volume_stats: Volume kernel of df (window_stats.volume_stats), shared
+            across windows; built here if not provided
     
     Returns:
         Dict containing calculated volume features:
@@ -39,17 +42,16 @@ def calculate_volume_features(df: pd.DataFrame, window: int,
             'volume_trend': float('nan')
         }
     
-    # For platform period analysis, exclude recent days to separate from breakthrough
-    # Use window - exclude_recent_days for platform consolidation judgment
-    platform_window = max(window - exclude_recent_days, window // 2)  # At least half the window
+    if volume_stats is None:
+        volume_stats = build_volume_stats(df)
     
-    # Get the platform period data (excluding recent days) and previous data for comparison
-    platform_df = df.iloc[-window:-exclude_recent_days].copy() if exclude_recent_days > 0 else df.iloc[-window:].copy()
-    previous_df = df.iloc[-(window*2):-window].copy()
+    # Platform period (excluding recent days to separate from breakthrough) and previous period for comparison
+    platform_range = (-window, -exclude_recent_days) if exclude_recent_days > 0 else (-window, None)
+    previous_range = (-(window*2), -window)
     
     # Calculate average volume
-    platform_avg_volume = platform_df['volume'].mean()
-    previous_avg_volume = previous_df['volume'].mean()
+    platform_avg_volume = volume_stats.mean(*platform_range)
+    previous_avg_volume = volume_stats.mean(*previous_range)
     
     # Calculate volume change ratio (for platform period, we want stable/decreasing)
     if previous_avg_volume > 0:
@@ -59,15 +61,13 @@ def calculate_volume_features(df: pd.DataFrame, window: int,
     
     # Calculate volume stability (coefficient of variation) for platform period
     if platform_avg_volume > 0:
-        volume_stability = platform_df['volume'].std() / platform_avg_volume
+        volume_stability = volume_stats.std(*platform_range) / platform_avg_volume
     else:
         volume_stability = float('nan')
     
     # Calculate volume trend (linear regression slope) for platform period
-    if len(platform_df) >= 5:
-        x = np.arange(len(platform_df))
-        y = platform_df['volume'].values
-        slope, _ = np.polyfit(x, y, 1)
+    if volume_stats.length(*platform_range) >= 5:
+        slope = volume_stats.slope(*platform_range)
         volume_trend = slope / platform_avg_volume if platform_avg_volume > 0 else float('nan')
     else:
         volume_trend = float('nan')
@@ -81,7 +81,8 @@ def calculate_volume_features(df: pd.DataFrame, window: int,
 def check_volume_pattern(df: pd.DataFrame, window: int, 
                          volume_change_threshold: float = None,
                          volume_stability_threshold: float = None,
-                         exclude_recent_days: int = 5) -> Tuple[bool, Dict[str, Any]]:
+                         exclude_recent_days: int = 5,
+                         volume_stats: Optional[WindowStats] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     Check if a stock has a consolidation volume pattern (stable or decreasing volume).
     
@@ -95,6 +96,7 @@ def check_volume_pattern(df: pd.DataFrame, window: int,
         volume_change_threshold: Maximum allowed volume change ratio (for stable/decreasing)
         volume_stability_threshold: Maximum allowed volume stability
         exclude_recent_days: Number of recent days to exclude (default 5, for breakthrough detection)
+        volume_stats: Volume kernel of df, shared across windows (optional)
     
     Returns:
         Tuple of (is_consolidation_volume, details)
@@ -113,7 +115,8 @@ def check_volume_pattern(df: pd.DataFrame, window: int,
         }
     
     # Calculate volume features (excluding recent days for platform analysis)
-    features = calculate_volume_features(df, window, exclude_recent_days=exclude_recent_days)
+    features = calculate_volume_features(df, window, exclude_recent_days=exclude_recent_days,
+                                         volume_stats=volume_stats)
     
     # Check conditions for consolidation volume pattern
     # For platform period, we want stable or slightly decreasing volume
@@ -162,7 +165,8 @@ def check_volume_pattern(df: pd.DataFrame, window: int,
 
 def check_volume_breakthrough(df: pd.DataFrame, window: int = 5, 
                              volume_increase_threshold: float = None,
-                             comparison_window: int = None) -> Tuple[bool, Dict[str, Any]]:
+                             comparison_window: int = None,
+                             volume_stats: Optional[WindowStats] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     Check if a stock has a volume breakthrough pattern (increasing volume in recent days).
     
@@ -176,6 +180,7 @@ def check_volume_breakthrough(df: pd.DataFrame, window: int = 5,
         window: Window size in days for recent volume (default 5)
         volume_increase_threshold: Minimum required volume increase ratio
         comparison_window: Window size for comparison period (default window*3)
+        volume_stats: Volume kernel of df, shared across windows (optional)
     
     Returns:
         Tuple of (is_breakthrough, details)
@@ -193,15 +198,14 @@ def check_volume_breakthrough(df: pd.DataFrame, window: int = 5,
             "data_points": len(df)
         }
     
-    # Get ONLY the most recent days for breakthrough detection
+    if volume_stats is None:
+        volume_stats = build_volume_stats(df)
+    
+    # Use ONLY the most recent days for breakthrough detection
     # This is separate from platform period analysis
-    recent_df = df.iloc[-window:].copy()
+    recent_avg_volume = volume_stats.mean(-window, None)
     # Compare with period before the recent window (not overlapping with platform analysis)
-    previous_df = df.iloc[-(window + comparison_window):-window].copy()
-    
-    # Calculate average volume
-    recent_avg_volume = recent_df['volume'].mean()
-    previous_avg_volume = previous_df['volume'].mean()
+    previous_avg_volume = volume_stats.mean(-(window + comparison_window), -window)
     
     # Calculate volume increase ratio
     if previous_avg_volume > 0:
@@ -232,7 +236,8 @@ def analyze_volume(df: pd.DataFrame, window: int,
                   volume_change_threshold: float = None,
                   volume_stability_threshold: float = None,
                   volume_increase_threshold: float = None,
-                  breakthrough_window: int = 5) -> Dict[str, Any]:
+                  breakthrough_window: int = 5,
+                  volume_stats: Optional[WindowStats] = None) -> Dict[str, Any]:
     """
     Analyze volume patterns for a stock with time-separated logic.
     
@@ -250,6 +255,8 @@ def analyze_volume(df: pd.DataFrame, window: int,
         volume_stability_threshold: Maximum allowed volume stability for consolidation
         volume_increase_threshold: Minimum required volume increase ratio for breakthrough
         breakthrough_window: Window size in days for breakthrough detection (default 5)
+        volume_stats: Volume kernel of df (window_stats.volume_stats); pass the
+            same kernel for every window of a stock
     
     Returns:
         Dict containing volume analysis results
@@ -270,17 +277,21 @@ def analyze_volume(df: pd.DataFrame, window: int,
             "breakthrough_details": {"status": "无数据"}
         }
     
+    # Both checks read range statistics from one kernel
+    if volume_stats is None:
+        volume_stats = build_volume_stats(df)
+    
     # Check for consolidation volume pattern (excludes recent days for breakthrough)
     # This analyzes the main period for stable/decreasing volume
     has_consolidation_volume, consolidation_details = check_volume_pattern(
         df, window, volume_change_threshold, volume_stability_threshold,
-        exclude_recent_days=breakthrough_window
+        exclude_recent_days=breakthrough_window, volume_stats=volume_stats
     )
     
     # Check for volume breakthrough (only analyzes recent days)
     # This is separate from platform consolidation analysis
     has_breakthrough, breakthrough_details = check_volume_breakthrough(
-        df, breakthrough_window, volume_increase_threshold
+        df, breakthrough_window, volume_increase_threshold, volume_stats=volume_stats
     )
     
     return {
@@ -0,0 +1,151 @@
+"""
+Window Stats module with prefix-sum kernels for volume and turnover.
+
+The volume and turnover analyzers look at several overlapping ranges of the
+same series for every candidate window (platform period, comparison period,
+recent breakthrough days). WindowStats builds prefix sums of count, sum, sum
+of squares and index-weighted sum once per stock, so the mean, standard
+deviation, coefficient of variation and trend slope of any range are O(1).
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class WindowStats:
+    """
+    Range statistics over one numeric series.
+
+    Ranges use iloc slice semantics (start, stop), negative positions
+    included. Invalid entries (NaN, or excluded by the valid mask) are
+    skipped like pandas' skipna.
+    """
+
+    __slots__ = ('n', 'values', 'valid', '_shift', '_count', '_sum', '_sumsq', '_sumxy')
+
+    def __init__(self, values: np.ndarray, valid: Optional[np.ndarray] = None):
+        """
+        Build the prefix sums.
+
+        Args:
+            values: Series values
+            valid: Mask of entries to include (defaults to the non-NaN entries)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if valid is None:
+            valid = ~np.isnan(values)
+        self.n = len(values)
+        self.values = values
+        self.valid = valid
+
+        # 先减去均值再累加，避免平方和相减时损失精度（成交量数值很大）
+        self._shift = float(values[valid].mean()) if valid.any() else 0.0
+        shifted = np.where(valid, values - self._shift, 0.0)
+        positions = np.arange(self.n, dtype=np.float64)
+        self._count = _prefix(valid.astype(np.float64))
+        self._sum = _prefix(shifted)
+        self._sumsq = _prefix(shifted * shifted)
+        self._sumxy = _prefix(shifted * positions)
+
+    def bounds(self, start: Optional[int] = None, stop: Optional[int] = None) -> Tuple[int, int]:
+        """Resolve an iloc-style slice to absolute (start, stop) positions."""
+        resolved = range(self.n)[start:stop]
+        return resolved.start, max(resolved.start, resolved.stop)
+
+    def length(self, start: Optional[int] = None, stop: Optional[int] = None) -> int:
+        """Number of rows in the range (valid or not)."""
+        lo, hi = self.bounds(start, stop)
+        return hi - lo
+
+    def count(self, start: Optional[int] = None, stop: Optional[int] = None) -> int:
+        """Number of valid entries in the range."""
+        lo, hi = self.bounds(start, stop)
+        return int(round(self._count[hi] - self._count[lo]))
+
+    def mean(self, start: Optional[int] = None, stop: Optional[int] = None) -> float:
+        """Mean of the valid entries (NaN if there are none)."""
+        lo, hi = self.bounds(start, stop)
+        count = self._count[hi] - self._count[lo]
+        if count < 0.5:
+            return float('nan')
+        return self._shift + (self._sum[hi] - self._sum[lo]) / count
+
+    def std(self, start: Optional[int] = None, stop: Optional[int] = None) -> float:
+        """Sample standard deviation (ddof=1) of the valid entries (NaN if fewer than 2)."""
+        lo, hi = self.bounds(start, stop)
+        count = self._count[hi] - self._count[lo]
+        if count < 1.5:
+            return float('nan')
+        total = self._sum[hi] - self._sum[lo]
+        variance = (self._sumsq[hi] - self._sumsq[lo] - total * total / count) / (count - 1)
+        return float(np.sqrt(max(variance, 0.0)))
+
+    def slope(self, start: Optional[int] = None, stop: Optional[int] = None) -> float:
+        """
+        Least-squares slope of the values against 0, 1, 2, ... over the range
+        (np.polyfit degree 1); NaN if the range has invalid entries or fewer
+        than 2 rows.
+        """
+        lo, hi = self.bounds(start, stop)
+        m = hi - lo
+        if m < 2 or self._count[hi] - self._count[lo] < m - 0.5:
+            return float('nan')
+        sum_y = self._sum[hi] - self._sum[lo]
+        # 以区间起点为 x=0：sum((i - lo) * y) = sum(i * y) - lo * sum(y)
+        sum_xy = self._sumxy[hi] - self._sumxy[lo] - lo * sum_y
+        sum_x = m * (m - 1) / 2.0
+        sum_xx = (m - 1) * m * (2 * m - 1) / 6.0
+        return (m * sum_xy - sum_x * sum_y) / (m * sum_xx - sum_x * sum_x)
+
+    def max(self, start: Optional[int] = None, stop: Optional[int] = None) -> float:
+        """Maximum of the valid entries (NaN if there are none)."""
+        lo, hi = self.bounds(start, stop)
+        values = self.values[lo:hi][self.valid[lo:hi]]
+        return float(values.max()) if len(values) else float('nan')
+
+    def count_above(self, threshold: float, start: Optional[int] = None,
+                    stop: Optional[int] = None) -> int:
+        """Number of valid entries greater than threshold."""
+        lo, hi = self.bounds(start, stop)
+        return int(np.count_nonzero(self.values[lo:hi][self.valid[lo:hi]] > threshold))
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    prefix = np.zeros(len(values) + 1, dtype=np.float64)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+def volume_stats(df: pd.DataFrame) -> Optional[WindowStats]:
+    """
+    Build the volume kernel of a stock.
+
+    Args:
+        df: K-line DataFrame
+
+    Returns:
+        WindowStats over 'volume', or None without a volume column
+    """
+    if 'volume' not in df.columns:
+        return None
+    return WindowStats(df['volume'].to_numpy(dtype=np.float64))
+
+
+def turnover_stats(df: pd.DataFrame) -> Optional[WindowStats]:
+    """
+    Build the turnover kernel of a stock. Turnover rates outside 0-100% are
+    treated as invalid, like missing values.
+
+    Args:
+        df: K-line DataFrame
+
+    Returns:
+        WindowStats over 'turn', or None without a turnover column
+    """
+    if 'turn' not in df.columns:
+        return None
+    values = df['turn'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        valid = ~np.isnan(values) & (values >= 0) & (values <= 100)
+    return WindowStats(values, valid)
@@ -12,13 +12,17 @@ from enum import Enum
 try:
     from api.stock_database import get_stock_database
     from api.config import ScanConfig
-    from api.data_fetcher import fetch_stock_basics, fetch_industry_data, BaostockConnectionManager, set_use_local_database_first
-    from api.platform_scanner import prepare_stock_list, scan_stocks
+    from api.data_fetcher import BaostockConnectionManager, set_use_local_database_first
+    from api.platform_scanner import scan_stocks
+    from api.security_master import get_security_master
+    from api.task_queue import get_task_queue
 except ImportError:
     from .stock_database import get_stock_database
     from .config import ScanConfig
-    from .data_fetcher import fetch_stock_basics, fetch_industry_data, BaostockConnectionManager, set_use_local_database_first
-    from .platform_scanner import prepare_stock_list, scan_stocks
+    from .data_fetcher import BaostockConnectionManager, set_use_local_database_first
+    from .platform_scanner import scan_stocks
+    from .security_master import get_security_master
+    from .task_queue import get_task_queue
 
 from colorama import Fore, Style
 import colorama
@@ -38,7 +42,6 @@ class BatchScanManager:
     
     _instance = None
     _lock = threading.Lock()
-    _running_tasks: Dict[str, threading.Thread] = {}
     
     def __new__(cls):
         """Singleton pattern."""
@@ -68,29 +71,29 @@ class BatchScanManager:
     
     def start_batch_scan_task(self, task_id: str) -> bool:
         """
-        Start a batch scan task in the background.
+        Queue a batch scan task on the task queue.
         
         Args:
             task_id: Task ID
             
         Returns:
-            True if started successfully, False otherwise
+            True if queued successfully, False otherwise
         """
         with self._lock:
-            if task_id in self._running_tasks:
-                return False  # Task already running
-            
             # Check if task exists
             db = get_stock_database()
             task = db.get_batch_scan_task(task_id)
             if not task:
                 return False
             
-            # Start background thread
-            thread = threading.Thread(target=self._run_batch_scan_task, args=(task_id,), daemon=True)
-            thread.start()
-            self._running_tasks[task_id] = thread
+            # 同一批量任务已在排队或运行时不重复提交
+            _, deduplicated = get_task_queue().submit(
+                'batch_scan', {'batch_task_id': task_id}, dedupe_key=task_id
+            )
+            if deduplicated:
+                return False  # Task already queued or running
             
+            db.update_batch_scan_task(task_id, message='排队等待执行')
             return True
     
     def cancel_batch_scan_task(self, task_id: str) -> bool:
@@ -111,13 +114,9 @@ class BatchScanManager:
         if task['status'] not in ['pending', 'running']:
             return False  # Cannot cancel completed/failed/cancelled tasks
         
-        # Update status to cancelled
+        # Update status to cancelled (排队中的任务出队后会直接跳过)
         db.update_batch_scan_task(task_id, status='cancelled', message='任务已取消')
         
-        # Remove from running tasks
-        with self._lock:
-            self._running_tasks.pop(task_id, None)
-        
         return True
     
     def _run_batch_scan_task(self, task_id: str):
@@ -136,6 +135,9 @@ class BatchScanManager:
             if not task:
                 print(f"{Fore.RED}Task {task_id} not found{Style.RESET_ALL}")
                 return
+            if task['status'] == 'cancelled':
+                print(f"{Fore.YELLOW}Task {task_id} was cancelled before it started{Style.RESET_ALL}")
+                return
             
             # Update status to running
             db.update_batch_scan_task(
@@ -188,19 +190,8 @@ class BatchScanManager:
             set_use_local_database_first(use_db_first)
             
             with BaostockConnectionManager():
-                stock_basics_df = fetch_stock_basics(use_local_database_first=use_db_first)
-                try:
-                    industry_df = fetch_industry_data(use_local_database_first=use_db_first)
-                except Exception as e:
-                    print(f"{Fore.YELLOW}Warning: Failed to fetch industry data: {e}{Style.RESET_ALL}")
-                    industry_df = None
-                
-                # 准备股票列表
-                if industry_df is not None:
-                    stock_list = prepare_stock_list(stock_basics_df, industry_df)
-                else:
-                    import pandas as pd
-                    stock_list = prepare_stock_list(stock_basics_df, pd.DataFrame())
+                # 准备股票列表（共享的证券主数据索引）
+                stock_list = get_security_master().get_stock_list(use_local_database_first=use_db_first)
                 
                 # 限制股票数量（如果配置了）
                 if scan_config_dict.get('max_stock_count') and scan_config_dict['max_stock_count'] > 0:
@@ -220,8 +211,12 @@ class BatchScanManager:
             # ===== 预加载完成 =====
             
             # Execute each scan
+            # 服务重启后恢复的任务：已有结果的日期直接计为完成，不再重复扫描
+            scanned_dates = set(db.get_batch_scan_result_dates(task_id))
             completed_scans = 0
             failed_scans = 0
+            if scanned_dates:
+                print(f"{Fore.CYAN}[BATCH_SCAN] Resuming task, {len(scanned_dates)} dates already scanned{Style.RESET_ALL}")
             
             for idx, scan_date in enumerate(scan_dates):
                 # Check if task was cancelled
@@ -230,6 +225,15 @@ class BatchScanManager:
                     print(f"{Fore.YELLOW}Task {task_id} was cancelled{Style.RESET_ALL}")
                     break
                 
+                if scan_date in scanned_dates:
+                    completed_scans += 1
+                    db.update_batch_scan_task(
+                        task_id,
+                        completed_scans=completed_scans,
+                        progress=int((idx + 1) / total_scans * 100)
+                    )
+                    continue
+                
                 try:
                     # Update current scan date
                     db.update_batch_scan_task(
@@ -307,10 +311,6 @@ class BatchScanManager:
                 error=str(e),
                 message=f'批量扫描失败: {str(e)}'
             )
-        finally:
-            # Remove from running tasks
-            with self._lock:
-                self._running_tasks.pop(task_id, None)
     
     def _preload_kline_data(self, stock_list: List[Dict[str, Any]], start_date: str, end_date: str, 
                             task_id: str, use_db_first: bool):
@@ -416,21 +416,8 @@ class BatchScanManager:
             if stock_list is None:
                 # Fetch stock basics
                 with BaostockConnectionManager():
-                    stock_basics_df = fetch_stock_basics(use_local_database_first=use_db_first)
-                    
-                    # Fetch industry data
-                    try:
-                        industry_df = fetch_industry_data(use_local_database_first=use_db_first)
-                    except Exception as e:
-                        print(f"{Fore.YELLOW}Warning: Failed to fetch industry data: {e}{Style.RESET_ALL}")
-                        industry_df = None
-                    
-                    # Prepare stock list
-                    if industry_df is not None:
-                        stock_list = prepare_stock_list(stock_basics_df, industry_df)
-                    else:
-                        import pandas as pd
-                        stock_list = prepare_stock_list(stock_basics_df, pd.DataFrame())
+                    # Prepare stock list from the shared security master
+                    stock_list = get_security_master().get_stock_list(use_local_database_first=use_db_first)
                     
                     # Limit stock count if specified
                     if scan_config_dict.get('max_stock_count') and scan_config_dict['max_stock_count'] > 0:
@@ -474,3 +461,10 @@ class BatchScanManager:
 # Create singleton instance
 batch_scan_manager = BatchScanManager()
 
+
+def run_batch_scan_queue_task(task_id: str, payload: Dict[str, Any]):
+    """Task queue handler: run the batch scan task named in the payload."""
+    batch_scan_manager._run_batch_scan_task(payload['batch_task_id'])
+
+
+get_task_queue().register_handler('batch_scan', run_batch_scan_queue_task)
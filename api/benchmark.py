@@ -0,0 +1,693 @@
+"""
+Offline benchmark suite.
+Generates a synthetic market database (stock basics, industries, the market
+index and daily K-lines from a seeded random walk) and times the main hot paths
+against it: database ingest, analyze_stock, scan_stocks (cold and warm
+analysis cache), run_backtest_with_progress and a batch scan. Baostock is
+replaced by an offline stub, so runs need no network and are reproducible for
+a given seed. About a quarter of the synthetic stocks have a platform shape
+that the default ScanConfig accepts; benchmarks report how many platform
+stocks they found and the run fails if one found none.
+
+Usage (from the project root):
+    python -m api.benchmark --stocks 500 --days 500 --output bench.json
+    python -m api.benchmark --stocks 500 --days 500 --baseline bench.json
+
+Results are written as JSON; with --baseline, benchmarks slower than the
+baseline by more than --max-regression are reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style
+
+try:
+    from . import cache_manager
+    from . import data_fetcher
+    from . import stock_database
+    from .config import ScanConfig
+    from .logging_utils import setup_logging
+    from .scan_profiler import ScanProfiler
+except ImportError:
+    from api import cache_manager
+    from api import data_fetcher
+    from api import stock_database
+    from api.config import ScanConfig
+    from api.logging_utils import setup_logging
+    from api.scan_profiler import ScanProfiler
+
+# Bump when benchmarks are added/changed so results are only compared like for like
+BENCHMARK_VERSION = 2
+
+# Last trading day of the synthetic history (fixed so runs are reproducible)
+DEFAULT_END_DATE = '2024-06-28'
+
+MARKET_INDEX_CODE = 'sh.000001'
+
+SYNTHETIC_INDUSTRIES = [
+    '银行', '医药生物', '电子', '计算机', '机械设备', '化工', '汽车', '食品饮料',
+    '房地产', '有色金属', '电力设备', '建筑装饰', '交通运输', '传媒', '公用事业', '农林牧渔'
+]
+
+# Share of stocks generated with a decline followed by a low-volume consolidation
+# platform. Most of them pass the default ScanConfig (73 of 84 for 300 stocks
+# and seed 42), so scans exercise the full analysis path, ranking and result
+# serialization rather than only the early rejections
+PLATFORM_SHAPE_RATIO = 0.25
+
+KLINE_FIELDS = ['date', 'open', 'high', 'low', 'close', 'volume', 'turn',
+                'preclose', 'pctChg', 'peTTM', 'pbMRQ']
+
+
+class _OfflineResultSet:
+    """Empty Baostock result set."""
+
+    def __init__(self):
+        self.error_code = '0'
+        self.error_msg = 'success'
+        self.fields: List[str] = []
+
+    def next(self) -> bool:
+        return False
+
+    def get_row_data(self) -> List[str]:
+        return []
+
+
+class OfflineBaostock:
+    """
+    Stand-in for the baostock module: login always succeeds and every query
+    returns an empty result set. Counts queries, so a benchmark can confirm it
+    was served entirely from the synthetic database.
+    """
+
+    def __init__(self):
+        self.query_count = 0
+
+    def login(self) -> _OfflineResultSet:
+        return _OfflineResultSet()
+
+    def logout(self) -> _OfflineResultSet:
+        return _OfflineResultSet()
+
+    def __getattr__(self, name: str):
+        if not name.startswith('query_'):
+            raise AttributeError(name)
+
+        def query(*args, **kwargs) -> _OfflineResultSet:
+            self.query_count += 1
+            return _OfflineResultSet()
+        return query
+
+
+def install_offline_baostock() -> OfflineBaostock:
+    """
+    Replace baostock in the modules that call it with an offline stub.
+
+    Returns:
+        The installed OfflineBaostock instance
+    """
+    stub = OfflineBaostock()
+    data_fetcher.bs = stub
+    try:
+        from .analyzers import fundamental_analyzer
+    except ImportError:
+        from api.analyzers import fundamental_analyzer
+    fundamental_analyzer.bs = stub
+    return stub
+
+
+def use_database(db_path: str) -> stock_database.StockDatabase:
+    """
+    Make a database at db_path the global stock database instance.
+    The data cache moves to a cache/ directory next to it, so the disk tier
+    of the project's cache directory is left untouched.
+
+    Args:
+        db_path: Path of the SQLite database file
+
+    Returns:
+        StockDatabase instance
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'cache')
+    cache_manager._cache_manager = cache_manager.CacheManager(cache_dir)
+    with stock_database._db_lock:
+        stock_database._db_instance = stock_database.StockDatabase(db_path)
+    return stock_database._db_instance
+
+
+def _synthetic_kline(rng: np.random.Generator, dates: pd.DatetimeIndex,
+                     platform_shape: bool) -> pd.DataFrame:
+    """
+    Generate one stock's daily K-lines as a random walk.
+
+    Args:
+        rng: Random generator of this stock
+        dates: Trading days
+        platform_shape: If True, end with a decline followed by a consolidation
+
+    Returns:
+        DataFrame with the columns of KLINE_FIELDS
+    """
+    days = len(dates)
+    volatility = rng.uniform(0.012, 0.035)
+    returns = rng.normal(0.0002, volatility, days)
+    activity = np.ones(days)
+
+    if platform_shape and days > 200:
+        # 先快速下跌，再低位缩量窄幅横盘
+        platform_days = int(rng.integers(82, 95))
+        decline_days = int(rng.integers(15, 25))
+        decline_start = days - platform_days - decline_days
+        total_decline = rng.uniform(0.45, 0.8)
+        returns[decline_start:days - platform_days] = rng.normal(
+            -total_decline / decline_days, volatility * 0.5, decline_days)
+        returns[days - platform_days:] = rng.normal(0.0, 0.006, platform_days)
+        activity[days - platform_days:] = rng.uniform(0.2, 0.3)
+
+    close = np.round(rng.uniform(4, 80) * np.exp(np.cumsum(returns)), 2).clip(min=0.5)
+    preclose = np.concatenate(([round(close[0] / np.exp(returns[0]), 2)], close[:-1])).clip(min=0.5)
+    open_ = np.round(preclose * (1 + rng.normal(0, volatility / 3, days)), 2).clip(min=0.5)
+    body_high = np.maximum(open_, close)
+    body_low = np.minimum(open_, close)
+    high = np.round(body_high * (1 + np.abs(rng.normal(0, volatility / 2, days))), 2)
+    low = np.round(body_low * (1 - np.abs(rng.normal(0, volatility / 2, days))), 2).clip(min=0.01)
+
+    # 成交量随涨跌幅放大，换手率按流通股本折算
+    float_shares = rng.uniform(2e8, 5e9)
+    volume = np.round(float_shares * rng.uniform(0.005, 0.03) * activity *
+                      np.exp(rng.normal(0, 0.3, days)) * (1 + 5 * np.abs(returns)))
+    eps = rng.uniform(0.1, 3.0)
+    bps = rng.uniform(2.0, 15.0)
+
+    return pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'turn': np.round(volume / float_shares * 100, 4),
+        'preclose': preclose,
+        'pctChg': np.round((close / preclose - 1) * 100, 4),
+        'peTTM': np.round(close / eps, 4),
+        'pbMRQ': np.round(close / bps, 4),
+    }, columns=KLINE_FIELDS)
+
+
+def _stock_code(index: int) -> str:
+    """Synthetic stock code: alternating Shanghai 60xxxx / Shenzhen 00xxxx."""
+    if index % 2 == 0:
+        return f"sh.{600000 + index // 2:06d}"
+    return f"sz.{1 + index // 2:06d}"
+
+
+def generate_market(num_stocks: int, num_days: int, end_date: str = DEFAULT_END_DATE,
+                    seed: int = 42) -> Dict[str, Any]:
+    """
+    Generate a synthetic market.
+
+    Args:
+        num_stocks: Number of stocks
+        num_days: Trading days of history per stock
+        end_date: Last trading day (YYYY-MM-DD)
+        seed: Random seed (same seed -> same market)
+
+    Returns:
+        Dict with 'basics' and 'industries' DataFrames, 'klines'
+        (code -> K-line DataFrame, including the market index) and 'dates'
+    """
+    if num_stocks > 20000:
+        raise ValueError("num_stocks must be at most 20000")
+
+    dates = pd.bdate_range(end=end_date, periods=num_days)
+    codes = [_stock_code(i) for i in range(num_stocks)]
+
+    klines = {}
+    for i, code in enumerate(codes):
+        rng = np.random.default_rng([seed, i])
+        klines[code] = _synthetic_kline(rng, dates, rng.random() < PLATFORM_SHAPE_RATIO)
+    index_rng = np.random.default_rng([seed, num_stocks])
+    klines[MARKET_INDEX_CODE] = _synthetic_kline(index_rng, dates, False)
+
+    basics = pd.DataFrame({
+        'code': codes + [MARKET_INDEX_CODE],
+        'code_name': [f"合成股票{i:05d}" for i in range(num_stocks)] + ['上证指数'],
+        'type': ['1'] * num_stocks + ['2'],
+        'status': ['1'] * (num_stocks + 1),
+    })
+    industries = pd.DataFrame({
+        'code': codes,
+        'industry': [SYNTHETIC_INDUSTRIES[i % len(SYNTHETIC_INDUSTRIES)] for i in range(num_stocks)],
+    })
+    return {'basics': basics, 'industries': industries, 'klines': klines, 'dates': dates}
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    """
+    Silence the console output of the benchmarked code: prints on stdout,
+    progress bars (tqdm writes to stderr) and log records below WARNING (the
+    log handler keeps the original stdout, and subsystems may log at INFO).
+    """
+    if not enabled:
+        yield
+        return
+    logging.disable(logging.INFO)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _summarize_runs(runs: List[float], items: int) -> Dict[str, Any]:
+    """Summarize repeated runs (median is the compared value)."""
+    median = statistics.median(runs)
+    return {
+        'seconds': round(median, 4),
+        'min_seconds': round(min(runs), 4),
+        'runs': [round(run, 4) for run in runs],
+        'items': items,
+        'items_per_second': round(items / median, 2) if median > 0 else None,
+    }
+
+
+def _scan_date_range(config: ScanConfig, end_date: str) -> tuple:
+    """Data range scan_stocks loads for a scan ending on end_date."""
+    max_window = max(config.windows) if config.windows else 90
+    min_data_days = max(max_window * 2, 180)
+    start_date = datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=min_data_days)
+    return start_date.strftime('%Y-%m-%d'), end_date
+
+
+def bench_ingest(db: stock_database.StockDatabase, market: Dict[str, Any]) -> Dict[str, Any]:
+    """Time saving basics, industries and all K-lines into an empty database."""
+    profiler = ScanProfiler()
+    rows = 0
+    start = time.perf_counter()
+    db.save_stock_basics(market['basics'])
+    db.save_industry_data(market['industries'])
+    for code, df in market['klines'].items():
+        save_start = time.perf_counter()
+        db.save_kline_data(code, df)
+        profiler.record('save_kline_data', time.perf_counter() - save_start)
+        rows += len(df)
+    elapsed = time.perf_counter() - start
+
+    result = _summarize_runs([elapsed], len(market['klines']))
+    result['rows'] = rows
+    result['rows_per_second'] = round(rows / elapsed, 2) if elapsed > 0 else None
+    result['per_item'] = profiler.report()['stages']['save_kline_data']
+    return result
+
+
+def bench_analyze_stock(stock_list: List[Dict[str, Any]], config: ScanConfig,
+                        end_date: str, repeat: int) -> Dict[str, Any]:
+    """Time _run_analyze_stock per stock on the K-lines a scan would load."""
+    try:
+        from .platform_scanner import _run_analyze_stock
+        from .analyzers.relative_strength_analyzer import MarketReference
+    except ImportError:
+        from api.platform_scanner import _run_analyze_stock
+        from api.analyzers.relative_strength_analyzer import MarketReference
+
+    start_date, end_date = _scan_date_range(config, end_date)
+    frames = []
+    for stock in stock_list:
+        df = data_fetcher.fetch_kline_data(stock['code'], start_date, end_date)
+        if not df.empty:
+            frames.append(df)
+    market_df = pd.DataFrame()
+    if getattr(config, 'check_relative_strength', False):
+        market_df = data_fetcher.fetch_kline_data(MARKET_INDEX_CODE, start_date, end_date)
+    market_reference = MarketReference(market_df, MARKET_INDEX_CODE)
+
+    profiler = ScanProfiler()
+    runs = []
+    platform_count = 0
+    for _ in range(repeat):
+        run_time = 0.0
+        platform_count = 0
+        for df in frames:
+            frame = df.copy()
+            call_start = time.perf_counter()
+            analysis = _run_analyze_stock(frame, config, market_reference, end_date)
+            call_time = time.perf_counter() - call_start
+            profiler.record('analyze_stock', call_time)
+            run_time += call_time
+            platform_count += bool(analysis.get('is_platform'))
+        runs.append(run_time)
+
+    result = _summarize_runs(runs, len(frames))
+    result['platform_count'] = platform_count
+    result['per_item'] = profiler.report()['stages'].get('analyze_stock')
+    return result
+
+
+def bench_scan_stocks(stock_list: List[Dict[str, Any]], end_date: str, repeat: int,
+                      use_analysis_cache: bool, profile: bool) -> Dict[str, Any]:
+    """
+    Time scan_stocks over the stock list.
+    With use_analysis_cache, one untimed run first fills the analysis cache.
+    """
+    try:
+        from .platform_scanner import scan_stocks
+    except ImportError:
+        from api.platform_scanner import scan_stocks
+
+    config = ScanConfig(use_analysis_cache=use_analysis_cache, enable_profiling=profile)
+    if use_analysis_cache:
+        scan_stocks(list(stock_list), config, end_date=end_date)
+
+    runs = []
+    results: List[Dict[str, Any]] = []
+    stats: Dict[str, Any] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results, stats = scan_stocks(list(stock_list), config, end_date=end_date, return_stats=True)
+        runs.append(time.perf_counter() - start)
+
+    result = _summarize_runs(runs, len(stock_list))
+    result['platform_count'] = len(stats.get('platform_stocks') or [])
+    result['selected_count'] = len(results)
+    result['selected'] = [{'code': stock['code'], 'name': stock.get('name', '')} for stock in results]
+    if stats.get('profile'):
+        result['profile'] = stats['profile']
+    return result
+
+
+def bench_backtest(selected_stocks: List[Dict[str, Any]], backtest_date: str,
+                   stat_date: str, repeat: int) -> Dict[str, Any]:
+    """Time run_backtest_with_progress for the selected stocks."""
+    try:
+        from .index import BacktestRequest, run_backtest_with_progress
+    except ImportError:
+        from api.index import BacktestRequest, run_backtest_with_progress
+
+    request = BacktestRequest(backtest_date=backtest_date, stat_date=stat_date,
+                              selected_stocks=selected_stocks)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_backtest_with_progress(request)
+        runs.append(time.perf_counter() - start)
+
+    result = _summarize_runs(runs, len(selected_stocks))
+    result['backtest_date'] = backtest_date
+    result['stat_date'] = stat_date
+    return result
+
+
+def bench_batch_scan(db: stock_database.StockDatabase, num_stocks: int, num_scans: int,
+                     scan_period_days: int, end_date: str) -> Dict[str, Any]:
+    """Time a batch scan task (preload plus one scan per scan date), run synchronously."""
+    try:
+        from .batch_scan_manager import BatchScanManager
+    except ImportError:
+        from api.batch_scan_manager import BatchScanManager
+
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    start_date = (end - timedelta(days=scan_period_days * (num_scans - 1))).strftime('%Y-%m-%d')
+    scan_config = ScanConfig().model_dump()
+    scan_config['max_stock_count'] = num_stocks
+
+    manager = BatchScanManager()
+    task_id = manager.create_batch_scan_task('benchmark', start_date, end_date,
+                                             scan_period_days, scan_config)
+    start = time.perf_counter()
+    manager._run_batch_scan_task(task_id)
+    elapsed = time.perf_counter() - start
+
+    task = db.get_batch_scan_task(task_id) or {}
+    scans = db.get_batch_scan_results(task_id, include_kline=False)
+    result = _summarize_runs([elapsed], task.get('totalScans', 0))
+    result['status'] = task.get('status')
+    result['completed_scans'] = task.get('completedScans', 0)
+    result['failed_scans'] = task.get('failedScans', 0)
+    result['stocks'] = num_stocks
+    # 批量扫描只保存每次扫描选出的股票
+    result['selected_count'] = sum(scan['stockCount'] for scan in scans)
+    return result
+
+
+def _require_platform_stocks(name: str, result: Dict[str, Any]) -> None:
+    """
+    Fail a benchmark that found no platform stocks: it would only have timed
+    the early rejections, not the full analysis path.
+
+    Raises:
+        RuntimeError: If the result has a platform_count (or, for the batch
+            scan, selected_count) of 0
+    """
+    if not result.get('platform_count', result.get('selected_count')):
+        raise RuntimeError(
+            f"{name}: no platform stocks found in the synthetic market "
+            f"(use more --stocks or another --seed)"
+        )
+
+
+def _environment() -> Dict[str, Any]:
+    """Describe the machine and code version the benchmark ran on."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'git_commit': commit,
+    }
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Generate the synthetic database and run all selected benchmarks.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Benchmark report dictionary
+    """
+    print(f"{Fore.CYAN}[BENCHMARK] Generating synthetic market: {args.stocks} stocks x {args.days} days (seed {args.seed}){Style.RESET_ALL}", file=sys.stderr)
+    market = generate_market(args.stocks, args.days, args.end_date, args.seed)
+    dates = market['dates']
+    end_date = dates[-1].strftime('%Y-%m-%d')
+
+    quiet = not args.verbose
+    stub = install_offline_baostock()
+    with _quiet(quiet):
+        data_fetcher.set_use_local_database_first(True)
+    db = use_database(args.db_path)
+
+    selected = set(args.only) if args.only else None
+    benchmarks: Dict[str, Any] = {}
+
+    def enabled(name: str) -> bool:
+        return selected is None or name in selected
+
+    # 导入是后续所有基准测试的前提，始终执行
+    print(f"{Fore.CYAN}[BENCHMARK] ingest{Style.RESET_ALL}", file=sys.stderr)
+    with _quiet(quiet):
+        benchmarks['ingest'] = bench_ingest(db, market)
+
+    try:
+        from .security_master import get_security_master
+    except ImportError:
+        from api.security_master import get_security_master
+    with _quiet(quiet):
+        stock_list = get_security_master().get_stock_list()
+
+    if enabled('analyze_stock'):
+        print(f"{Fore.CYAN}[BENCHMARK] analyze_stock{Style.RESET_ALL}", file=sys.stderr)
+        with _quiet(quiet):
+            benchmarks['analyze_stock'] = bench_analyze_stock(
+                stock_list[:args.analyze_stocks], ScanConfig(), end_date, args.repeat)
+
+    if enabled('scan_stocks'):
+        print(f"{Fore.CYAN}[BENCHMARK] scan_stocks{Style.RESET_ALL}", file=sys.stderr)
+        with _quiet(quiet):
+            benchmarks['scan_stocks'] = bench_scan_stocks(
+                stock_list, end_date, args.repeat, use_analysis_cache=False, profile=args.profile)
+
+    if enabled('scan_stocks_warm_cache'):
+        print(f"{Fore.CYAN}[BENCHMARK] scan_stocks_warm_cache{Style.RESET_ALL}", file=sys.stderr)
+        with _quiet(quiet):
+            benchmarks['scan_stocks_warm_cache'] = bench_scan_stocks(
+                stock_list, end_date, args.repeat, use_analysis_cache=True, profile=args.profile)
+
+    if enabled('backtest'):
+        print(f"{Fore.CYAN}[BENCHMARK] backtest{Style.RESET_ALL}", file=sys.stderr)
+        # 以扫描选出的股票回测；没有扫描结果时取股票列表前若干只
+        scanned = (benchmarks.get('scan_stocks') or benchmarks.get('scan_stocks_warm_cache') or {})
+        selected_stocks = (scanned.get('selected') or
+                           [{'code': s['code'], 'name': s['name']} for s in stock_list])[:args.backtest_stocks]
+        backtest_offset = min(args.backtest_days, len(dates) - 1)
+        with _quiet(quiet):
+            benchmarks['backtest'] = bench_backtest(
+                selected_stocks, dates[-1 - backtest_offset].strftime('%Y-%m-%d'), end_date, args.repeat)
+
+    if enabled('batch_scan'):
+        print(f"{Fore.CYAN}[BENCHMARK] batch_scan{Style.RESET_ALL}", file=sys.stderr)
+        with _quiet(quiet):
+            benchmarks['batch_scan'] = bench_batch_scan(
+                db, min(args.batch_stocks, len(stock_list)), args.batch_scans, 7, end_date)
+
+    for name, result in benchmarks.items():
+        result.pop('selected', None)
+        if 'platform_count' in result or 'selected_count' in result:
+            _require_platform_stocks(name, result)
+
+    return {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {
+            'stocks': args.stocks,
+            'days': args.days,
+            'end_date': end_date,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'analyze_stocks': args.analyze_stocks,
+            'backtest_stocks': args.backtest_stocks,
+            'backtest_days': args.backtest_days,
+            'batch_stocks': args.batch_stocks,
+            'batch_scans': args.batch_scans,
+            'profile': args.profile,
+        },
+        'environment': _environment(),
+        # 离线桩收到的 Baostock 查询次数（数据完全来自合成数据库时应接近 0）
+        'baostock_queries': stub.query_count,
+        'benchmarks': benchmarks,
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any],
+                    max_regression: float) -> List[Dict[str, Any]]:
+    """
+    Compare benchmark times against a baseline report.
+
+    Args:
+        current: Report of this run
+        baseline: Earlier report
+        max_regression: Allowed slowdown ratio (0.2 = 20% slower)
+
+    Returns:
+        One entry per benchmark present in both reports, with the time ratio
+        and whether it counts as a regression
+    """
+    if current.get('params') != baseline.get('params'):
+        print(f"{Fore.YELLOW}[BENCHMARK] Warning: baseline was run with different parameters{Style.RESET_ALL}", file=sys.stderr)
+    if current.get('benchmark_version') != baseline.get('benchmark_version'):
+        print(f"{Fore.YELLOW}[BENCHMARK] Warning: baseline benchmark version differs{Style.RESET_ALL}", file=sys.stderr)
+
+    comparison = []
+    for name, result in current['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base or not base.get('seconds'):
+            continue
+        ratio = result['seconds'] / base['seconds']
+        comparison.append({
+            'benchmark': name,
+            'baseline_seconds': base['seconds'],
+            'seconds': result['seconds'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + max_regression,
+        })
+    return comparison
+
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    """Print a one-line summary per benchmark (and the baseline comparison)."""
+    for name, result in report['benchmarks'].items():
+        print(f"{Fore.GREEN}[BENCHMARK] {name:<24} {result['seconds']:>10.3f}s  ({result['items']} items){Style.RESET_ALL}", file=sys.stderr)
+    for entry in report.get('comparison', []):
+        color = Fore.RED if entry['regression'] else Fore.GREEN
+        print(f"{color}[BENCHMARK] {entry['benchmark']:<24} {entry['baseline_seconds']:.3f}s -> {entry['seconds']:.3f}s (x{entry['ratio']}){Style.RESET_ALL}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Offline benchmark suite on a synthetic market database')
+    parser.add_argument('--stocks', type=int, default=300, help='Number of synthetic stocks')
+    parser.add_argument('--days', type=int, default=500, help='Trading days of history per stock')
+    parser.add_argument('--end-date', default=DEFAULT_END_DATE, help='Last trading day of the history')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark (median is reported)')
+    parser.add_argument('--analyze-stocks', type=int, default=200, help='Stocks timed in the analyze_stock benchmark')
+    parser.add_argument('--backtest-stocks', type=int, default=20, help='Stocks in the backtest')
+    parser.add_argument('--backtest-days', type=int, default=20, help='Trading days between backtest date and stat date')
+    parser.add_argument('--batch-stocks', type=int, default=100, help='Stocks per batch scan')
+    parser.add_argument('--batch-scans', type=int, default=4, help='Scan dates in the batch scan (weekly)')
+    parser.add_argument('--only', nargs='+', choices=[
+        'analyze_stock', 'scan_stocks', 'scan_stocks_warm_cache', 'backtest', 'batch_scan'
+    ], help='Run only these benchmarks (ingest always runs)')
+    parser.add_argument('--profile', action='store_true', help='Include scan stage profiles in the report')
+    parser.add_argument('--db', dest='db_path', help='Synthetic database path (must not exist; kept after the run)')
+    parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed slowdown vs baseline before failing (0.2 = 20%%)')
+    parser.add_argument('--verbose', action='store_true', help='Show the console output of benchmarked code')
+    args = parser.parse_args(argv)
+
+    if args.days < 250:
+        parser.error('--days must be at least 250 (scans load up to a year of history)')
+
+    temp_dir = None
+    if args.db_path:
+        if os.path.exists(args.db_path):
+            parser.error(f'--db {args.db_path} already exists')
+    else:
+        temp_dir = tempfile.mkdtemp(prefix='stock-benchmark-')
+        args.db_path = os.path.join(temp_dir, 'stock_data.db')
+
+    setup_logging(level='WARNING')
+    try:
+        report = run_benchmarks(args)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'] = compare_reports(report, baseline, args.max_regression)
+        if any(entry['regression'] for entry in report['comparison']):
+            exit_code = 1
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"{Fore.GREEN}[BENCHMARK] Report written to {args.output}{Style.RESET_ALL}", file=sys.stderr)
+    else:
+        print(output)
+    _print_summary(report)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,28 @@
 """
 Cache Manager module for caching stock data to improve API response speed.
-Implements file-based cache with JSON storage and automatic expiration.
-Since data is from yesterday, cache entries are valid for the entire day.
+Implements a tiered cache: a bounded in-process LRU (byte-size accounted) in
+front of a compact binary disk tier (zlib-compressed pickle, size bounded).
+Entries expire at the next rollover (config KLINE_PUBLISH_TIME), when the data
+source has published the new trading day's data.
 """
 import os
+import pickle
+import re
 import time
 import hashlib
 import json
-from typing import Any, Optional, Dict
-from datetime import datetime, timedelta, date
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Dict, Tuple
+from datetime import datetime, timedelta, time as dt_time
 from threading import Lock
 from functools import wraps
 import pandas as pd
 
-# Import JSON utilities for handling special values
 try:
-    from .json_utils import convert_numpy_types, sanitize_float_for_json
+    from .config import KLINE_PUBLISH_TIME
 except ImportError:
-    from api.json_utils import convert_numpy_types, sanitize_float_for_json
+    from api.config import KLINE_PUBLISH_TIME
 
 # Define cache directory
 CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
@@ -25,370 +30,393 @@ CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
 # Ensure cache directory exists
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Disk tier file extension
+CACHE_FILE_EXTENSION = '.bin'
+
+# Tier size bounds (bytes)
+CACHE_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+CACHE_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+# 数据源在 KLINE_PUBLISH_TIME 完成当日数据入库；缓存条目在下一个交易日的该时刻之后失效
+CACHE_ROLLOVER_TIME = dt_time(*map(int, KLINE_PUBLISH_TIME.split(':')))
+
+# Files of the old JSON cache format (md5 key + .json); removed by clear() only
+LEGACY_CACHE_FILE_PATTERN = re.compile(r'^[0-9a-f]{32}\.json$')
+
+
+def next_cache_rollover(now: Optional[datetime] = None) -> datetime:
+    """
+    Get the next market-close rollover after now (weekends are skipped).
+
+    Args:
+        now: Reference time (defaults to the current local time)
+
+    Returns:
+        Datetime of the next rollover
+    """
+    now = now or datetime.now()
+    rollover = datetime.combine(now.date(), CACHE_ROLLOVER_TIME)
+    if now >= rollover:
+        rollover += timedelta(days=1)
+    # 周末不产生新数据，顺延到周一
+    while rollover.weekday() >= 5:
+        rollover += timedelta(days=1)
+    return rollover
+
+
+def _estimate_size(data: Any) -> int:
+    """Estimate the in-memory size of cached data in bytes."""
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
 
 class CacheEntry:
     """Represents a single cache entry with data and expiration time."""
-    
-    def __init__(self, data: Any, expires_at: float, cache_date: str = None):
+
+    def __init__(self, data: Any, expires_at: float, size: Optional[int] = None,
+                 tag: Optional[str] = None):
         """
         Initialize a cache entry.
-        
+
         Args:
             data: The data to cache
             expires_at: Expiration timestamp
-            cache_date: Date string (YYYY-MM-DD) when cache was created
+            size: Estimated in-memory size in bytes (computed if omitted)
+            tag: Group name used for invalidation (memory tier only)
         """
         self.data = data
         self.created_at = time.time()
         self.expires_at = expires_at
-        self.cache_date = cache_date or date.today().isoformat()
-    
+        self.size = size if size is not None else _estimate_size(data)
+        self.tag = tag
+
     def is_expired(self) -> bool:
         """Check if the cache entry has expired."""
         return time.time() > self.expires_at
-    
-    def is_valid_for_today(self) -> bool:
-        """
-        Check if cache is valid for today.
-        Since data is from yesterday, cache is valid for the entire day.
-        """
-        today = date.today().isoformat()
-        return self.cache_date == today
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert cache entry to dictionary for JSON serialization."""
-        return {
-            'data': self.data,
-            'created_at': self.created_at,
-            'expires_at': self.expires_at,
-            'cache_date': self.cache_date
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'CacheEntry':
-        """Create cache entry from dictionary."""
-        return cls(
-            data=data['data'],
-            expires_at=data['expires_at'],
-            cache_date=data.get('cache_date', date.today().isoformat())
-        )
 
 
 class CacheManager:
     """
-    Thread-safe file-based cache manager with time-based expiration.
-    Cache files are stored as JSON in the cache/ directory.
+    Thread-safe tiered cache manager.
+    Memory tier: LRU bounded by estimated bytes. Disk tier: one compressed
+    pickle file per key in the cache/ directory, bounded by total file size
+    (oldest files are evicted first). Entries can be memory-only.
     """
-    
-    def __init__(self, cache_dir: str = CACHE_DIR):
+
+    def __init__(self, cache_dir: str = CACHE_DIR,
+                 memory_max_bytes: int = CACHE_MEMORY_MAX_BYTES,
+                 disk_max_bytes: int = CACHE_DISK_MAX_BYTES):
         """
         Initialize the cache manager.
-        
+
         Args:
             cache_dir: Directory to store cache files
+            memory_max_bytes: Size bound of the memory tier
+            disk_max_bytes: Size bound of the disk tier
         """
         self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
         os.makedirs(cache_dir, exist_ok=True)
-        
-        # In-memory cache for faster access (optional optimization)
-        self._memory_cache: Dict[str, CacheEntry] = {}
+
+        self._memory_cache: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
         self._lock = Lock()
         self._stats = {
             'hits': 0,
             'misses': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
             'evictions': 0,
             'file_reads': 0,
             'file_writes': 0
         }
-    
+        self._scan_disk()
+
+    def _scan_disk(self) -> None:
+        """Measure the disk tier (files of other formats are left untouched)."""
+        total = 0
+        try:
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(CACHE_FILE_EXTENSION):
+                    try:
+                        total += os.path.getsize(os.path.join(self.cache_dir, filename))
+                    except OSError:
+                        pass
+        except OSError as e:
+            print(f"Error scanning cache directory: {e}")
+        self._disk_bytes = total
+
     def _get_cache_file_path(self, key: str) -> str:
         """
         Get the file path for a cache key.
-        
+
         Args:
             key: Cache key
-        
+
         Returns:
             Full path to cache file
         """
         # Use key as filename (it's already a hash, so safe)
-        return os.path.join(self.cache_dir, f"{key}.json")
-    
+        return os.path.join(self.cache_dir, f"{key}{CACHE_FILE_EXTENSION}")
+
     def _generate_key(self, prefix: str, *args, **kwargs) -> str:
         """
         Generate a cache key from arguments.
-        
+
         Args:
             prefix: Key prefix
             *args: Positional arguments
             **kwargs: Keyword arguments
-        
+
         Returns:
             Cache key string
         """
         # Create a hashable representation of the arguments
         key_parts = [prefix]
-        
+
         # Add positional arguments
         for arg in args:
             key_parts.append(str(arg))
-        
+
         # Add keyword arguments (sorted for consistency)
         if kwargs:
             sorted_kwargs = sorted(kwargs.items())
             key_parts.append(json.dumps(sorted_kwargs, sort_keys=True))
-        
+
         # Create a hash of the key parts
         key_string = '|'.join(key_parts)
         return hashlib.md5(key_string.encode()).hexdigest()
-    
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        """Put an entry in the memory tier and evict LRU entries over the byte bound. Must hold lock."""
+        old = self._memory_cache.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        if entry.size > self.memory_max_bytes:
+            return  # 单个条目超过内存上限时只保存在磁盘层
+        self._memory_cache[key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self.memory_max_bytes and self._memory_cache:
+            _, evicted = self._memory_cache.popitem(last=False)
+            self._memory_bytes -= evicted.size
+            self._stats['evictions'] += 1
+
+    def _forget(self, key: str) -> bool:
+        """Remove an entry from the memory tier. Must hold lock."""
+        entry = self._memory_cache.pop(key, None)
+        if entry is None:
+            return False
+        self._memory_bytes -= entry.size
+        return True
+
+    def _remove_file(self, file_path: str) -> bool:
+        """Delete a disk tier file and update the size accounting. Must hold lock."""
+        try:
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+        except OSError:
+            return False
+        self._disk_bytes = max(0, self._disk_bytes - size)
+        return True
+
     def _load_from_file(self, key: str) -> Optional[CacheEntry]:
         """
-        Load cache entry from file.
-        
+        Load cache entry from the disk tier. Must hold lock.
+
         Args:
             key: Cache key
-        
+
         Returns:
             CacheEntry or None if not found or expired
         """
         file_path = self._get_cache_file_path(key)
-        
+
         if not os.path.exists(file_path):
             return None
-        
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            entry = CacheEntry.from_dict(cache_data)
+            with open(file_path, 'rb') as f:
+                payload = f.read()
+            expires_at, data = pickle.loads(zlib.decompress(payload))
             self._stats['file_reads'] += 1
-            
-            # Check if expired
-            if entry.is_expired() or not entry.is_valid_for_today():
-                # Delete expired file
-                try:
-                    os.remove(file_path)
-                except Exception:
-                    pass
-                self._stats['evictions'] += 1
-                return None
-            
-            return entry
         except Exception as e:
             # If file is corrupted, delete it
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+            self._remove_file(file_path)
             print(f"Error loading cache file {file_path}: {e}")
             return None
-    
+
+        if time.time() > expires_at:
+            self._remove_file(file_path)
+            self._stats['evictions'] += 1
+            return None
+        return CacheEntry(data, expires_at)
+
     def _save_to_file(self, key: str, entry: CacheEntry) -> bool:
         """
-        Save cache entry to file.
-        
+        Save cache entry to the disk tier, evicting the oldest files over the size bound. Must hold lock.
+
         Args:
             key: Cache key
             entry: CacheEntry to save
-        
+
         Returns:
             True if successful, False otherwise
         """
         file_path = self._get_cache_file_path(key)
-        
+
         try:
-            # Convert data to JSON-serializable format
-            cache_dict = entry.to_dict()
-            
-            # Sanitize data for JSON (handle NaN, Infinity, etc.)
-            cache_dict['data'] = self._prepare_data_for_json(cache_dict['data'])
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_dict, f, ensure_ascii=False, indent=2)
-            
+            payload = zlib.compress(
+                pickle.dumps((entry.expires_at, entry.data), protocol=pickle.HIGHEST_PROTOCOL), 6)
+            if len(payload) > self.disk_max_bytes:
+                return False
+
+            self._remove_file(file_path)
+            # 先写临时文件再替换，避免读到写了一半的文件
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, file_path)
+            self._disk_bytes += len(payload)
             self._stats['file_writes'] += 1
-            return True
         except Exception as e:
             print(f"Error saving cache file {file_path}: {e}")
             return False
-    
-    def _prepare_data_for_json(self, data: Any) -> Any:
-        """
-        Prepare data for JSON serialization.
-        Handles pandas DataFrames and special values.
-        
-        Args:
-            data: Data to prepare
-        
-        Returns:
-            JSON-serializable data
-        """
-        # Handle pandas DataFrame
-        if isinstance(data, pd.DataFrame):
-            # Convert DataFrame to list of records
-            data = data.to_dict(orient='records')
-        
-        # Convert NumPy types and sanitize floats
-        data = convert_numpy_types(data)
-        data = sanitize_float_for_json(data)
-        
-        return data
-    
-    def _restore_data_from_json(self, data: Any) -> Any:
-        """
-        Restore data from JSON format.
-        Converts list of records back to DataFrame if needed.
-        
-        Args:
-            data: JSON data
-        
-        Returns:
-            Restored data (DataFrame or original format)
-        """
-        # If data is a list of dicts and looks like DataFrame records, convert back
-        if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict):
-            # Check if it has DataFrame-like structure
-            # Look for common DataFrame indicators: date column or financial data columns
-            first_dict = data[0]
-            has_date = 'date' in first_dict
-            has_financial_cols = any(col in first_dict for col in ['open', 'high', 'low', 'close', 'volume', 'turn', 'preclose', 'pctChg'])
-            has_stock_cols = any(col in first_dict for col in ['code', 'name', 'industry', 'area'])
-            
-            # If it looks like tabular data (has consistent structure), convert to DataFrame
-            if has_date or has_financial_cols or has_stock_cols:
-                try:
-                    df = pd.DataFrame(data)
-                    # Convert date column to datetime if it exists
-                    if 'date' in df.columns:
-                        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                    # Convert numeric columns
-                    numeric_cols = ['open', 'high', 'low', 'close', 'volume', 'turn', 'preclose', 'pctChg', 'peTTM', 'pbMRQ']
-                    for col in numeric_cols:
-                        if col in df.columns:
-                            df[col] = pd.to_numeric(df[col], errors='coerce')
-                    return df
-                except Exception as e:
-                    # If conversion fails, return original data
-                    print(f"Warning: Failed to restore DataFrame from JSON: {e}")
-                    pass
-        
-        return data
-    
-    def get(self, key: str) -> Optional[Any]:
+
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict_disk(keep=file_path)
+        return True
+
+    def _evict_disk(self, keep: Optional[str] = None) -> None:
+        """Delete the oldest disk tier files until it is under 90% of its bound. Must hold lock."""
+        try:
+            files = []
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(CACHE_FILE_EXTENSION):
+                    file_path = os.path.join(self.cache_dir, filename)
+                    if file_path != keep:
+                        files.append((os.path.getmtime(file_path), file_path))
+        except OSError as e:
+            print(f"Error scanning cache directory: {e}")
+            return
+
+        target = int(self.disk_max_bytes * 0.9)
+        for _, file_path in sorted(files):
+            if self._disk_bytes <= target:
+                break
+            if self._remove_file(file_path):
+                self._stats['evictions'] += 1
+
+    def get(self, key: str, memory_only: bool = False) -> Optional[Any]:
         """
-        Get data from cache (checks memory first, then file).
-        
+        Get data from cache (checks memory first, then disk).
+
         Args:
             key: Cache key
-        
+            memory_only: If True, the disk tier is not read (for entries stored with persist=False)
+
         Returns:
-            Cached data or None if not found or expired
+            Cached data (a copy for DataFrames) or None if not found or expired
         """
         with self._lock:
             # Check memory cache first
-            if key in self._memory_cache:
-                entry = self._memory_cache[key]
-                if not entry.is_expired() and entry.is_valid_for_today():
+            entry = self._memory_cache.get(key)
+            if entry is not None:
+                if not entry.is_expired():
+                    self._memory_cache.move_to_end(key)
                     self._stats['hits'] += 1
-                    # Restore DataFrame if needed (data might be a list from JSON)
+                    self._stats['memory_hits'] += 1
                     data = entry.data
-                    if isinstance(data, list) and len(data) > 0:
-                        data = self._restore_data_from_json(data)
                     return data.copy() if hasattr(data, 'copy') else data
-                else:
-                    # Remove expired entry from memory
-                    del self._memory_cache[key]
-            
-            # Load from file
-            entry = self._load_from_file(key)
-            
+                # Remove expired entry from memory
+                self._forget(key)
+                self._stats['evictions'] += 1
+
+            # Load from disk
+            entry = None if memory_only else self._load_from_file(key)
+
             if entry is None:
                 self._stats['misses'] += 1
                 return None
-            
-            # Restore DataFrame if needed before storing in memory
-            data = entry.data
-            if isinstance(data, list) and len(data) > 0:
-                data = self._restore_data_from_json(data)
-                # Update entry with restored DataFrame
-                entry.data = data
-            
-            # Store in memory cache for faster access
-            self._memory_cache[key] = entry
-            
+
+            # Promote to memory tier for faster access
+            self._remember(key, entry)
+
             self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            data = entry.data
             return data.copy() if hasattr(data, 'copy') else data
-    
-    def set(self, key: str, data: Any, ttl_seconds: int) -> None:
+
+    def set(self, key: str, data: Any, expires_at: Optional[float] = None,
+            persist: bool = True, tag: Optional[str] = None) -> None:
         """
-        Store data in cache (saves to file and memory).
-        
+        Store data in cache.
+
         Args:
             key: Cache key
             data: Data to cache
-            ttl_seconds: Time to live in seconds (not used, cache is valid for the entire day)
+            expires_at: Expiration timestamp (defaults to the next market-close rollover)
+            persist: If False, the entry is kept in the memory tier only
+            tag: Group name for invalidate_tag() (only used for memory-only entries)
         """
+        if expires_at is None:
+            expires_at = next_cache_rollover().timestamp()
+        entry = CacheEntry(data=data, expires_at=expires_at, tag=tag)
+
         with self._lock:
-            # Calculate expiration time
-            # Since data is from yesterday, cache is valid until end of today
-            now = datetime.now()
-            end_of_today = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
-            # Cache is valid until end of today (23:59:59.999)
-            expires_at = end_of_today.timestamp()
-            
-            # Create cache entry
-            entry = CacheEntry(
-                data=data,
-                expires_at=expires_at,
-                cache_date=date.today().isoformat()
-            )
-            
-            # Save to file
-            self._save_to_file(key, entry)
-            
-            # Store in memory cache
-            self._memory_cache[key] = entry
-    
+            if persist:
+                self._save_to_file(key, entry)
+            self._remember(key, entry)
+
     def delete(self, key: str) -> bool:
         """
-        Delete a cache entry (from both file and memory).
-        
+        Delete a cache entry (from both tiers).
+
         Args:
             key: Cache key
-        
+
         Returns:
             True if deleted, False if not found
         """
         with self._lock:
-            deleted = False
-            
-            # Delete from memory
-            if key in self._memory_cache:
-                del self._memory_cache[key]
+            deleted = self._forget(key)
+            if self._remove_file(self._get_cache_file_path(key)):
                 deleted = True
-            
-            # Delete from file
-            file_path = self._get_cache_file_path(key)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    deleted = True
-                except Exception as e:
-                    print(f"Error deleting cache file {file_path}: {e}")
-            
             return deleted
-    
+
+    def invalidate_tag(self, tag: str) -> int:
+        """
+        Remove all memory tier entries stored with a tag.
+
+        Args:
+            tag: Group name passed to set()
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            keys = [key for key, entry in self._memory_cache.items() if entry.tag == tag]
+            for key in keys:
+                self._forget(key)
+            self._stats['evictions'] += len(keys)
+            return len(keys)
+
     def clear(self) -> None:
-        """Clear all cache entries (from both file and memory)."""
+        """Clear all cache entries (from both tiers, including files of the old JSON format)."""
         with self._lock:
             # Clear memory cache
             self._memory_cache.clear()
-            
+            self._memory_bytes = 0
+
             # Clear file cache
             try:
                 for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.json'):
+                    if filename.endswith(CACHE_FILE_EXTENSION) or LEGACY_CACHE_FILE_PATTERN.match(filename):
                         file_path = os.path.join(self.cache_dir, filename)
                         try:
                             os.remove(file_path)
@@ -396,45 +424,41 @@ class CacheManager:
                             print(f"Error deleting cache file {file_path}: {e}")
             except Exception as e:
                 print(f"Error clearing cache directory: {e}")
-    
+            self._disk_bytes = 0
+
     def cleanup_expired(self) -> int:
         """
-        Remove expired entries from cache (both file and memory).
-        
+        Remove expired entries from cache (both tiers).
+
         Returns:
             Number of entries removed
         """
         with self._lock:
             removed_count = 0
-            
+
             # Clean memory cache
-            expired_keys = [
-                key for key, entry in self._memory_cache.items()
-                if entry.is_expired() or not entry.is_valid_for_today()
-            ]
+            expired_keys = [key for key, entry in self._memory_cache.items() if entry.is_expired()]
             for key in expired_keys:
-                del self._memory_cache[key]
+                self._forget(key)
                 removed_count += 1
-            
-            # Clean file cache
+
+            # Clean file cache (expired files are deleted on load)
             try:
                 for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.json'):
-                        file_path = os.path.join(self.cache_dir, filename)
-                        key = filename[:-5]  # Remove .json extension
-                        entry = self._load_from_file(key)
-                        if entry is None:  # File was deleted because expired
+                    if filename.endswith(CACHE_FILE_EXTENSION):
+                        key = filename[:-len(CACHE_FILE_EXTENSION)]
+                        if self._load_from_file(key) is None:
                             removed_count += 1
             except Exception as e:
                 print(f"Error cleaning cache directory: {e}")
-            
+
             self._stats['evictions'] += removed_count
             return removed_count
-    
+
     def get_stats(self) -> Dict[str, Any]:
         """
         Get cache statistics.
-        
+
         Returns:
             Dictionary with cache statistics
         """
@@ -442,16 +466,18 @@ class CacheManager:
             # Count file cache entries
             file_count = 0
             try:
-                file_count = len([f for f in os.listdir(self.cache_dir) if f.endswith('.json')])
+                file_count = len([f for f in os.listdir(self.cache_dir) if f.endswith(CACHE_FILE_EXTENSION)])
             except Exception:
                 pass
-            
+
             total_requests = self._stats['hits'] + self._stats['misses']
             hit_rate = (self._stats['hits'] / total_requests * 100) if total_requests > 0 else 0
-            
+
             return {
                 'hits': self._stats['hits'],
                 'misses': self._stats['misses'],
+                'memory_hits': self._stats['memory_hits'],
+                'disk_hits': self._stats['disk_hits'],
                 'evictions': self._stats['evictions'],
                 'hit_rate': round(hit_rate, 2),
                 'size': max(len(self._memory_cache), file_count),  # Use max of memory and file count
@@ -459,14 +485,16 @@ class CacheManager:
                 'file_reads': self._stats['file_reads'],
                 'file_writes': self._stats['file_writes'],
                 'memory_cache_size': len(self._memory_cache),
-                'file_cache_size': file_count
+                'memory_cache_bytes': self._memory_bytes,
+                'file_cache_size': file_count,
+                'file_cache_bytes': self._disk_bytes
             }
-    
+
     def get_size(self) -> int:
         """Get the number of entries in the cache."""
         with self._lock:
             try:
-                return len([f for f in os.listdir(self.cache_dir) if f.endswith('.json')])
+                return len([f for f in os.listdir(self.cache_dir) if f.endswith(CACHE_FILE_EXTENSION)])
             except Exception:
                 return len(self._memory_cache)
 
@@ -480,105 +508,139 @@ def get_cache_manager() -> CacheManager:
     return _cache_manager
 
 
-# Cache TTL constants (in seconds)
-# Note: These are kept for interface compatibility but not actually used.
-# Since data is from yesterday, cache is valid for the entire day (until 23:59:59).
-# All cache entries expire at the end of the day regardless of these values.
-CACHE_TTL_STOCK_BASICS = 3600  # 保留用于接口兼容性 - 股票基本信息
-CACHE_TTL_INDUSTRY_DATA = 3600  # 保留用于接口兼容性 - 行业数据
-CACHE_TTL_KLINE_DATA = 300  # 保留用于接口兼容性 - K线数据
+def _cached_call(prefix: str, key_args: Tuple[Any, ...], persist: bool,
+                 refresh: bool, fetch: Callable[[], Any],
+                 on_hit: Optional[Callable[[], None]] = None,
+                 cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+    """Serve a call from the cache, or fetch and cache non-empty (and cacheable) data."""
+    cache_key = _cache_manager._generate_key(prefix, *key_args)
+    if not refresh:
+        cached_data = _cache_manager.get(cache_key, memory_only=not persist)
+        if cached_data is not None:
+            if on_hit:
+                on_hit()
+            return cached_data
+
+    data = fetch()
+
+    # Only cache non-empty data
+    if data is None or (isinstance(data, pd.DataFrame) and data.empty):
+        return data
+    if cacheable is None or cacheable(data):
+        _cache_manager.set(cache_key, data.copy() if hasattr(data, 'copy') else data,
+                           persist=persist, tag=None if persist else prefix)
+    return data
+
+
+def invalidate_kline_cache() -> int:
+    """
+    Drop all cached K-line ranges (e.g. after new bars were written to the database).
+
+    Returns:
+        Number of entries removed
+    """
+    return _cache_manager.invalidate_tag('kline_data')
+
+
+def _never(*args, **kwargs) -> bool:
+    return False
 
 
-def cache_stock_basics(func):
+def _no_scope() -> Any:
+    return None
+
+
+def cache_stock_basics(bypass: Callable[..., bool] = _never,
+                       scope: Callable[[], Any] = _no_scope):
     """
-    Decorator to cache stock basics data.
-    
+    Decorator factory to cache stock basics data.
+    Stored in both tiers, so the scope must identify the data across restarts
+    and processes (e.g. database path and the persisted basics version).
+
+    Args:
+        bypass: Called with the call's arguments; if it returns True the
+            cache is not read and the fresh result replaces the cached one
+        scope: Called on every call; its value is part of the cache key
+            (e.g. database path and data version)
+
     Usage:
-        @cache_stock_basics
+        @cache_stock_basics(bypass=..., scope=...)
         def fetch_stock_basics():
             ...
     """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        cache_key = _cache_manager._generate_key('stock_basics')
-        cached_data = _cache_manager.get(cache_key)
-        
-        if cached_data is not None:
-            return cached_data.copy() if hasattr(cached_data, 'copy') else cached_data
-        
-        # Fetch fresh data
-        data = func(*args, **kwargs)
-        
-        # Cache the data
-        _cache_manager.set(cache_key, data.copy() if hasattr(data, 'copy') else data, CACHE_TTL_STOCK_BASICS)
-        
-        return data
-    
-    return wrapper
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return _cached_call('stock_basics', (scope(),), True, bypass(*args, **kwargs),
+                                lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
 
 
-def cache_industry_data(func):
+def cache_industry_data(bypass: Callable[..., bool] = _never,
+                        scope: Callable[[], Any] = _no_scope):
     """
-    Decorator to cache industry data.
-    
+    Decorator factory to cache industry data.
+    Stored in both tiers, like cache_stock_basics.
+
+    Args:
+        bypass: Called with the call's arguments; if it returns True the
+            cache is not read and the fresh result replaces the cached one
+        scope: Called on every call; its value is part of the cache key
+
     Usage:
-        @cache_industry_data
+        @cache_industry_data(bypass=..., scope=...)
         def fetch_industry_data():
             ...
     """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        cache_key = _cache_manager._generate_key('industry_data')
-        cached_data = _cache_manager.get(cache_key)
-        
-        if cached_data is not None:
-            return cached_data.copy() if hasattr(cached_data, 'copy') else cached_data
-        
-        # Fetch fresh data
-        data = func(*args, **kwargs)
-        
-        # Cache the data
-        _cache_manager.set(cache_key, data.copy() if hasattr(data, 'copy') else data, CACHE_TTL_INDUSTRY_DATA)
-        
-        return data
-    
-    return wrapper
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return _cached_call('industry_data', (scope(),), True, bypass(*args, **kwargs),
+                                lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
 
 
-def cache_kline_data(func):
+def cache_kline_data(bypass: Callable[..., bool] = _never,
+                     scope: Callable[[], Any] = _no_scope,
+                     on_hit: Optional[Callable[[str, float], None]] = None):
     """
-    Decorator to cache K-line data based on stock code and date range.
-    
+    Decorator factory to cache K-line data based on stock code and date range.
+    Memory tier only: the stock database already is the persistent tier for
+    K-lines, so only hot ranges are kept (LRU by bytes).
+
+    The wrapped function must accept return_source and return a
+    (DataFrame, source) tuple when it is True. Only ranges served completely
+    from the database (source 'db') are cached, so a partial API fetch is
+    retried on the next call; cache hits report source 'db'.
+
+    Args:
+        bypass: Called with the call's arguments; if it returns True the
+            cache is not read and the fresh result replaces the cached one
+        scope: Called on every call; its value is part of the cache key
+        on_hit: Called with (code, perf_counter start) on a cache hit
+
     Usage:
-        @cache_kline_data
+        @cache_kline_data(bypass=..., scope=...)
         def fetch_kline_data(code, start_date, end_date, ...):
             ...
     """
-    @wraps(func)
-    def wrapper(code: str, start_date: str, end_date: str, *args, **kwargs):
-        # Generate cache key based on code and date range
-        # Include retry_attempts and retry_delay in key to handle different retry configs
-        cache_key = _cache_manager._generate_key(
-            'kline_data',
-            code,
-            start_date,
-            end_date,
-            retry_attempts=kwargs.get('retry_attempts', 3),
-            retry_delay=kwargs.get('retry_delay', 1)
-        )
-        
-        cached_data = _cache_manager.get(cache_key)
-        
-        if cached_data is not None:
-            return cached_data.copy() if hasattr(cached_data, 'copy') else cached_data
-        
-        # Fetch fresh data
-        data = func(code, start_date, end_date, *args, **kwargs)
-        
-        # Only cache non-empty data
-        if not data.empty:
-            _cache_manager.set(cache_key, data.copy(), CACHE_TTL_KLINE_DATA)
-        
-        return data
-    
-    return wrapper
+    def decorator(func):
+        @wraps(func)
+        def wrapper(code: str, start_date: str, end_date: str, *args, **kwargs):
+            started_at = time.perf_counter()
+            return_source = kwargs.get('return_source', False)
+            source = ['db']
+
+            def fetch():
+                df, source[0] = func(code, start_date, end_date, *args, **dict(kwargs, return_source=True))
+                return df
+
+            df = _cached_call('kline_data', (scope(), code, start_date, end_date), False,
+                              bypass(code, start_date, end_date, *args, **kwargs), fetch,
+                              on_hit=(lambda: on_hit(code, started_at)) if on_hit else None,
+                              cacheable=lambda _: source[0] == 'db')
+            return (df, source[0]) if return_source else df
+        return wrapper
+    return decorator
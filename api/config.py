@@ -3,6 +3,7 @@ Configuration module for stock platform scanner.
 """
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
+import os
 import platform
 from datetime import datetime
 
@@ -91,6 +92,7 @@ class ScanConfig(BaseModel):
     # Relative strength settings
     check_relative_strength: bool = True  # 是否启用相对大盘强度检查
     outperform_index_threshold: Optional[float] = None  # 相对强度需大于此值（None表示不限制，但仍计算和保存相对强度）
+    relative_strength_benchmark: str = 'sh.000001'  # 相对强度的基准指数（见 RELATIVE_STRENGTH_BENCHMARKS）
 
     # System settings
     max_workers: int = 5
@@ -101,6 +103,13 @@ class ScanConfig(BaseModel):
     # Data source settings
     use_local_database_first: bool = True  # 优先使用本地数据库数据，默认为开启
 
+    # Cache settings
+    use_analysis_cache: bool = True  # 复用相同K线数据和分析参数下的个股分析结论
+    use_feature_table: bool = False  # 保存平台窗口特征表和快速检查特征，调整阈值时免全量重新扫描
+
+    # Diagnostics
+    enable_profiling: bool = False  # 记录扫描各阶段耗时（数据库、API、各分析步骤、序列化）并生成分位数报告
+
 
 def get_default_max_workers() -> int:
     """
@@ -148,6 +157,14 @@ DEFAULT_MAX_TURNOVER_RATE = DEFAULT_CONFIG.max_turnover_rate
 DEFAULT_ALLOW_TURNOVER_SPIKES = DEFAULT_CONFIG.allow_turnover_spikes
 DEFAULT_CHECK_RELATIVE_STRENGTH = DEFAULT_CONFIG.check_relative_strength
 DEFAULT_OUTPERFORM_INDEX_THRESHOLD = DEFAULT_CONFIG.outperform_index_threshold
+DEFAULT_RELATIVE_STRENGTH_BENCHMARK = DEFAULT_CONFIG.relative_strength_benchmark
+
+# 可用作相对强度基准的指数（K线同步任务会一并同步这些指数）
+RELATIVE_STRENGTH_BENCHMARKS = {
+    'sh.000001': '上证指数',
+    'sz.399001': '深证成指',
+    'sh.000300': '沪深300',
+}
 
 
 def merge_config(user_config: Dict[str, Any]) -> ScanConfig:
@@ -170,3 +187,82 @@ def merge_config(user_config: Dict[str, Any]) -> ScanConfig:
 
     # Create new config object
     return ScanConfig(**config_dict)
+
+
+# Logging settings
+# 全局日志级别，可通过环境变量 LOG_LEVEL 覆盖
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# 各子系统日志级别（未列出的子系统使用 LOG_LEVEL）
+# *.stock 为逐只股票的事件，扫描数千只股票时默认只输出警告及以上
+LOG_LEVELS: Dict[str, str] = {
+    'scanner': 'INFO',
+    'scanner.stock': 'WARNING',
+    'data_fetcher': 'INFO',
+    'data_fetcher.stock': 'WARNING',
+    'database': 'INFO',
+    'analyzer': 'WARNING',
+    'api.stock': 'WARNING',
+}
+
+# 逐只股票的 INFO/DEBUG 事件按消息模板采样，每 N 条输出 1 条（警告及以上不采样）
+LOG_STOCK_EVENT_SAMPLE_EVERY = 100
+
+
+# Task queue settings
+# 同时运行的后台任务总数上限（超出的任务按优先级排队），可通过环境变量 TASK_QUEUE_MAX_WORKERS 覆盖
+TASK_QUEUE_MAX_WORKERS = int(os.environ.get('TASK_QUEUE_MAX_WORKERS', '3'))
+
+# 各类任务的并发上限（全市场扫描共用同一个 SQLite 锁，默认同一时间只运行一个）
+TASK_QUEUE_CONCURRENCY: Dict[str, int] = {
+    'backtest': 2,
+    'scan': 1,
+    'fundamentals': 1,
+    'post_close': 1,
+    'batch_scan': 1,
+}
+
+# 各类任务的优先级（数值越小越先执行）：交互式回测 > 扫描 > 基本面刷新 > 收盘后同步 > 批量扫描
+TASK_QUEUE_PRIORITIES: Dict[str, int] = {
+    'backtest': 0,
+    'scan': 10,
+    'fundamentals': 20,
+    'post_close': 25,
+    'batch_scan': 30,
+}
+
+# 已结束任务在队列表中保留的天数
+TASK_QUEUE_RETENTION_DAYS = 7
+
+
+# K-line sync (kline_sync.py)
+# Baostock 完成当日日K线入库的时刻（HH:MM，服务器本地时间，按北京时间部署）；
+# 在此之前当日K线不存在，按需取数不会为缺失的当日K线请求 API
+KLINE_PUBLISH_TIME = '17:30'
+
+# 增量同步并发请求 Baostock 的线程数，以及所有线程合计的每秒请求数上限
+KLINE_SYNC_WORKERS = int(os.environ.get('KLINE_SYNC_WORKERS', '4'))
+KLINE_SYNC_RATE_LIMIT = float(os.environ.get('KLINE_SYNC_RATE_LIMIT', '20'))
+
+# 每累计多少只股票的新K线批量写入一次数据库
+KLINE_SYNC_BATCH_SIZE = 200
+
+# 数据库中还没有K线的股票（如新股）首次同步的历史天数（自然日，覆盖扫描所需的一年数据）
+KLINE_SYNC_NEW_CODE_DAYS = 400
+
+
+# Post-close scheduler (market_close_scheduler.py)
+# 每个交易日在该时刻之后增量同步当日K线、使相关缓存失效并预先计算默认配置的扫描（HH:MM）
+POST_CLOSE_RUN_TIME = os.environ.get('POST_CLOSE_RUN_TIME', '18:00')
+
+# 是否启用收盘后调度（多进程部署时只应在一个进程中启用）
+POST_CLOSE_SCHEDULER_ENABLED = os.environ.get('POST_CLOSE_SCHEDULER_ENABLED', '1') != '0'
+
+
+# Single-stock platform check (/api/platform/check)
+# 单只股票检查使用的窗口期（覆盖扫描常用窗口，与扫描结果保持一致）
+PLATFORM_CHECK_WINDOWS: List[int] = [30, 60, 80, 90, 100, 120]
+
+# 热点股票检查结果的内存缓存：条目数上限与有效期（K线数据变化时立即失效）
+PLATFORM_CHECK_CACHE_SIZE = 512
+PLATFORM_CHECK_CACHE_TTL_SECONDS = 3600
@@ -5,8 +5,9 @@ Implements robust connection handling and retry logic with database-first strate
 import baostock as bs
 import pandas as pd
 import time
+import logging
 import threading
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from colorama import Fore, Style
 import traceback
 from datetime import datetime, timedelta
@@ -15,8 +16,25 @@ from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 # Import database manager
 try:
     from .stock_database import get_stock_database
+    from .logging_utils import get_logger
+    from .scan_profiler import profile_stage
+    from .metrics import FETCH_LATENCY, BAOSTOCK_ERRORS
+    from .cache_manager import cache_stock_basics, cache_industry_data, cache_kline_data
+    from .config import KLINE_PUBLISH_TIME
 except ImportError:
     from api.stock_database import get_stock_database
+    from api.logging_utils import get_logger
+    from api.scan_profiler import profile_stage
+    from api.metrics import FETCH_LATENCY, BAOSTOCK_ERRORS
+    from api.cache_manager import cache_stock_basics, cache_industry_data, cache_kline_data
+    from api.config import KLINE_PUBLISH_TIME
+
+logger = get_logger('data_fetcher')
+stock_logger = get_logger('data_fetcher.stock')
+
+class KlineFetchError(ConnectionError):
+    """K-line request that still failed after all retry attempts."""
+
 
 # Global flag for database-first strategy (can be overridden per call)
 _USE_LOCAL_DATABASE_FIRST = True
@@ -49,6 +67,19 @@ def get_data_source_stats() -> Dict[str, str]:
     with _data_source_lock:
         return _data_source_stats.copy()
 
+def _record_data_source(code: str, source: str, started_at: float) -> None:
+    """
+    Record the data source of a fetch_kline_data call and its latency.
+    
+    Args:
+        code: Stock code
+        source: Data source ('db', 'api', or 'mixed')
+        started_at: time.perf_counter() at the start of the call
+    """
+    with _data_source_lock:
+        _data_source_stats[code] = source
+    FETCH_LATENCY.observe(time.perf_counter() - started_at, source=source)
+
 def clear_data_source_stats() -> None:
     """
     Clear data source statistics.
@@ -80,6 +111,7 @@ def baostock_login() -> None:
     # Login
     lg = bs.login()
     if lg.error_code != '0':
+        BAOSTOCK_ERRORS.inc(kind='login')
         print(f"{Fore.RED}Baostock login failed: {lg.error_msg}{Style.RESET_ALL}")
         raise ConnectionError(f"Baostock login failed: {lg.error_msg}")
     
@@ -125,6 +157,28 @@ def is_trading_day(date_str: str) -> bool:
         return False
 
 
+def latest_published_trading_day(now: Optional[datetime] = None) -> str:
+    """
+    Get the latest trading day whose daily bars the data source has published
+    (today after KLINE_PUBLISH_TIME on a trading day, else the previous trading day).
+    Like is_trading_day, only weekends are treated as non-trading days.
+    
+    Args:
+        now: Reference time (defaults to the current local time)
+    
+    Returns:
+        Date string in 'YYYY-MM-DD' format
+    """
+    now = now or datetime.now()
+    hour, minute = KLINE_PUBLISH_TIME.split(':')
+    day = now.date()
+    if (now.hour, now.minute) < (int(hour), int(minute)):
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
 def adjust_date_range_to_trading_days(start_date: str, end_date: str) -> Optional[Tuple[str, str]]:
     """
     Adjust date range to only include trading days (exclude weekends).
@@ -164,7 +218,7 @@ def adjust_date_range_to_trading_days(start_date: str, end_date: str) -> Optiona
         
         return (adjusted_start_str, adjusted_end_str)
     except (ValueError, TypeError) as e:
-        print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Error adjusting date range: {e}{Style.RESET_ALL}")
+        stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Error adjusting date range: %s", e)
         return None
 
 class BaostockConnectionManager:
@@ -180,6 +234,28 @@ class BaostockConnectionManager:
         baostock_logout()
         return False  # Don't suppress exceptions
 
+def _bypass_cache(*args, use_local_database_first: Optional[bool] = None, **kwargs) -> bool:
+    """Fetches that skip the database (use_local_database_first=False) also skip and refresh the cache."""
+    use_db_first = use_local_database_first if use_local_database_first is not None else _USE_LOCAL_DATABASE_FIRST
+    return not use_db_first
+
+
+def _basics_cache_scope() -> Tuple[str, int]:
+    """
+    Cache scope of basics/industry data: database file and basics version.
+    basics_version is persisted in the database (bumped on every save), so
+    the scope stays valid across restarts and these caches use the disk tier.
+    """
+    db = get_stock_database()
+    return db.db_path, db.basics_version
+
+
+def _kline_cache_scope() -> str:
+    """Cache scope of K-line data: database file."""
+    return get_stock_database().db_path
+
+
+@cache_stock_basics(bypass=_bypass_cache, scope=_basics_cache_scope)
 def fetch_stock_basics(use_local_database_first: Optional[bool] = None) -> pd.DataFrame:
     """
     Fetch basic information for all stocks.
@@ -233,6 +309,7 @@ def fetch_stock_basics(use_local_database_first: Optional[bool] = None) -> pd.Da
         
         return df
 
+@cache_industry_data(bypass=_bypass_cache, scope=_basics_cache_scope)
 def fetch_industry_data(use_local_database_first: Optional[bool] = None) -> pd.DataFrame:
     """
     Fetch industry classification data for all stocks.
@@ -286,6 +363,8 @@ def fetch_industry_data(use_local_database_first: Optional[bool] = None) -> pd.D
         
         return df
 
+@cache_kline_data(bypass=_bypass_cache, scope=_kline_cache_scope,
+                  on_hit=lambda code, started_at: _record_data_source(code, 'db', started_at))
 def fetch_kline_data(code: str, start_date: str, end_date: str,
                      retry_attempts: int = 3,
                      retry_delay: int = 1,
@@ -314,19 +393,20 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
     import threading
     # Use parameter if provided, otherwise use global default
     use_db_first = use_local_database_first if use_local_database_first is not None else _USE_LOCAL_DATABASE_FIRST
+    fetch_started = time.perf_counter()
     
-    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 📥 START fetch_kline_data for {code} (thread: {threading.current_thread().name}, use_db_first={use_db_first}){Style.RESET_ALL}")
+    stock_logger.debug("[SCAN_CHECKPOINT] 📥 START fetch_kline_data for %s (thread: %s, use_db_first=%s)", code, threading.current_thread().name, use_db_first)
     
     db = get_stock_database()
     
     # Try to get from database first (if enabled)
     df = pd.DataFrame()
     if use_db_first:
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔍 Querying database for {code} (requested range: {start_date} to {end_date})...{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] 🔍 Querying database for %s (requested range: %s to %s)...", code, start_date, end_date)
         df = db.get_kline_data(code, start_date, end_date)
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Database query completed for {code}, got {len(df)} records{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] ✓ Database query completed for %s, got %s records", code, len(df))
     else:
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ⏭️ Skipping database query (use_local_database_first=False) for {code}{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] ⏭️ Skipping database query (use_local_database_first=False) for %s", code)
     
     # Track data sources for logging
     db_date_ranges = []
@@ -346,12 +426,14 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
         min_date_str = min_date.strftime('%Y-%m-%d')
         max_date_str = max_date.strftime('%Y-%m-%d')
         db_date_ranges.append((min_date_str, max_date_str))
-        print(f"{Fore.GREEN}[DATA_SOURCE] 📊 Database data for {code}: {min_date_str} to {max_date_str} ({len(df)} records){Style.RESET_ALL}")
+        stock_logger.debug("[DATA_SOURCE] 📊 Database data for %s: %s to %s (%s records)", code, min_date_str, max_date_str, len(df))
         
         # Check if we need to fetch additional data
         # Use a small tolerance (1 day) to account for date comparison edge cases
+        # 尚未发布的K线（如盘中或收盘后入库前的当日K线）不会向 API 请求
         need_earlier = (min_date - start_dt).days > 1
-        need_later = (end_dt - max_date).days > 1
+        published_end = min(end_dt, pd.to_datetime(latest_published_trading_day()))
+        need_later = (published_end - max_date).days > 1
         
         # Check if data completeness is reasonable
         # Estimate expected trading days: approximately 70% of calendar days (accounting for weekends and holidays)
@@ -366,21 +448,20 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
             # Date range looks complete, but check if record count is reasonable
             if date_range_days > 7 and actual_records < expected_min_trading_days:
                 # For ranges longer than a week, if records are less than expected minimum, likely incomplete
-                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Suspicious data completeness for {code}: {actual_records} records for {date_range_days} days (expected at least {expected_min_trading_days} trading days){Style.RESET_ALL}")
+                stock_logger.info("[SCAN_CHECKPOINT] ⚠️ Suspicious data completeness for %s: %s records for %s days (expected at least %s trading days)", code, actual_records, date_range_days, expected_min_trading_days)
                 data_seems_incomplete = True
             elif (max_date - min_date).days > 7 and actual_records < 10:
                 # If data spans more than a week but has very few records, likely incomplete
-                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Suspicious data completeness for {code}: {actual_records} records spanning {(max_date - min_date).days} days{Style.RESET_ALL}")
+                stock_logger.info("[SCAN_CHECKPOINT] ⚠️ Suspicious data completeness for %s: %s records spanning %s days", code, actual_records, (max_date - min_date).days)
                 data_seems_incomplete = True
         
         if not need_earlier and not need_later and not data_seems_incomplete:
             # We have all the data we need
-            print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ Complete data for {code} from database ({len(df)} records){Style.RESET_ALL}")
-            print(f"{Fore.GREEN}[DATA_SOURCE] ✅ All data from DATABASE: {min_date_str} to {max_date_str} ({len(df)} records){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ Complete data for %s from database (%s records)", code, len(df))
+            stock_logger.debug("[DATA_SOURCE] ✅ All data from DATABASE: %s to %s (%s records)", min_date_str, max_date_str, len(df))
             # Track data source: all from database
             source = 'db'
-            with _data_source_lock:
-                _data_source_stats[code] = source
+            _record_data_source(code, source, fetch_started)
             if return_source:
                 return df, source
             return df
@@ -389,7 +470,7 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
         missing_ranges = []
         if data_seems_incomplete:
             # Data seems incomplete, re-fetch the entire range
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔄 Re-fetching data for {code} due to suspected incompleteness{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 🔄 Re-fetching data for %s due to suspected incompleteness", code)
             missing_ranges.append((start_date, end_date))
         else:
             # Fetch missing ranges at the edges
@@ -398,13 +479,13 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
                 earlier_end = (min_date - timedelta(days=1)).strftime('%Y-%m-%d')
                 missing_ranges.append((start_date, earlier_end))
             if need_later:
-                # Fetch from one day after max_date to end_date
+                # Fetch from one day after max_date to the last published day
                 later_start = (max_date + timedelta(days=1)).strftime('%Y-%m-%d')
-                missing_ranges.append((later_start, end_date))
+                missing_ranges.append((later_start, published_end.strftime('%Y-%m-%d')))
     else:
         # No data in database, need to fetch all
         missing_ranges = [(start_date, end_date)]
-        print(f"{Fore.YELLOW}[DATA_SOURCE] ⚠️ No database data for {code}, will fetch all from API: {start_date} to {end_date}{Style.RESET_ALL}")
+        stock_logger.info("[DATA_SOURCE] ⚠️ No database data for %s, will fetch all from API: %s to %s", code, start_date, end_date)
     
     # Fetch missing data from API
     all_data = []
@@ -415,21 +496,22 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
         
         if adjusted_range is None:
             # No trading days in this range (e.g., weekend only)
-            print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⏭️ Skipping API request for {code}: no trading days in range {range_start} to {range_end} (likely weekend){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ⏭️ Skipping API request for %s: no trading days in range %s to %s (likely weekend)", code, range_start, range_end)
             continue
         
         adjusted_start, adjusted_end = adjusted_range
         
         # Log if we adjusted the range
         if adjusted_start != range_start or adjusted_end != range_end:
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 📅 Adjusted date range for {code}: {range_start}~{range_end} -> {adjusted_start}~{adjusted_end} (excluded non-trading days){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 📅 Adjusted date range for %s: %s~%s -> %s~%s (excluded non-trading days)", code, range_start, range_end, adjusted_start, adjusted_end)
         
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🌐 Fetching missing K-line data for {code} from {adjusted_start} to {adjusted_end}...{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] 🌐 Fetching missing K-line data for %s from %s to %s...", code, adjusted_start, adjusted_end)
         
-        fetched_df = _fetch_kline_data_from_api(
-            code, adjusted_start, adjusted_end, retry_attempts, retry_delay, api_timeout
-        )
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ API fetch completed for {code}, got {len(fetched_df)} records{Style.RESET_ALL}")
+        with profile_stage('fetch.api'):
+            fetched_df = _fetch_kline_data_from_api(
+                code, adjusted_start, adjusted_end, retry_attempts, retry_delay, api_timeout
+            )
+        stock_logger.debug("[SCAN_CHECKPOINT] ✓ API fetch completed for %s, got %s records", code, len(fetched_df))
         
         if not fetched_df.empty:
             # Log API date range
@@ -437,13 +519,13 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
             api_min_date = api_dates.min().strftime('%Y-%m-%d')
             api_max_date = api_dates.max().strftime('%Y-%m-%d')
             api_date_ranges.append((api_min_date, api_max_date))
-            print(f"{Fore.BLUE}[DATA_SOURCE] 🌐 API data for {code}: {api_min_date} to {api_max_date} ({len(fetched_df)} records){Style.RESET_ALL}")
+            stock_logger.debug("[DATA_SOURCE] 🌐 API data for %s: %s to %s (%s records)", code, api_min_date, api_max_date, len(fetched_df))
             
             # Save to database
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 💾 Saving {len(fetched_df)} records to database for {code}...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 💾 Saving %s records to database for %s...", len(fetched_df), code)
             db.save_kline_data(code, fetched_df)
             all_data.append(fetched_df)
-            print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ Saved {len(fetched_df)} records to database for {code}{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ Saved %s records to database for %s", len(fetched_df), code)
     
     # Combine all data
     if all_data:
@@ -454,22 +536,22 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
             combined_df = combined_df.drop_duplicates(subset=['date'], keep='last')
             combined_df = combined_df.sort_values('date').reset_index(drop=True)
             
-            # Log final data source summary
-            final_dates = pd.to_datetime(combined_df['date'])
-            final_min = final_dates.min().strftime('%Y-%m-%d')
-            final_max = final_dates.max().strftime('%Y-%m-%d')
-            print(f"{Fore.GREEN}[DATA_SOURCE] 📋 Final combined data for {code}: {final_min} to {final_max} ({len(combined_df)} records){Style.RESET_ALL}")
-            if db_date_ranges:
-                db_ranges_str = ", ".join([f"{s}~{e}" for s, e in db_date_ranges])
-                print(f"{Fore.GREEN}[DATA_SOURCE]   └─ From DATABASE: {db_ranges_str}{Style.RESET_ALL}")
-            if api_date_ranges:
-                api_ranges_str = ", ".join([f"{s}~{e}" for s, e in api_date_ranges])
-                print(f"{Fore.BLUE}[DATA_SOURCE]   └─ From API: {api_ranges_str}{Style.RESET_ALL}")
+            # Log final data source summary (only computed when debug logging is on)
+            if stock_logger.isEnabledFor(logging.DEBUG):
+                final_dates = pd.to_datetime(combined_df['date'])
+                final_min = final_dates.min().strftime('%Y-%m-%d')
+                final_max = final_dates.max().strftime('%Y-%m-%d')
+                stock_logger.debug("[DATA_SOURCE] 📋 Final combined data for %s: %s to %s (%s records)", code, final_min, final_max, len(combined_df))
+                if db_date_ranges:
+                    db_ranges_str = ", ".join([f"{s}~{e}" for s, e in db_date_ranges])
+                    stock_logger.debug("[DATA_SOURCE]   └─ From DATABASE: %s", db_ranges_str)
+                if api_date_ranges:
+                    api_ranges_str = ", ".join([f"{s}~{e}" for s, e in api_date_ranges])
+                    stock_logger.debug("[DATA_SOURCE]   └─ From API: %s", api_ranges_str)
             
             # Track data source: mixed (database + API)
             source = 'mixed'
-            with _data_source_lock:
-                _data_source_stats[code] = source
+            _record_data_source(code, source, fetch_started)
             
             if return_source:
                 return combined_df, source
@@ -481,18 +563,18 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
             combined_df = combined_df.sort_values('date').reset_index(drop=True)
             
             # Log final data source summary (API only)
-            final_dates = pd.to_datetime(combined_df['date'])
-            final_min = final_dates.min().strftime('%Y-%m-%d')
-            final_max = final_dates.max().strftime('%Y-%m-%d')
-            print(f"{Fore.BLUE}[DATA_SOURCE] 📋 Final data for {code} (API only): {final_min} to {final_max} ({len(combined_df)} records){Style.RESET_ALL}")
-            if api_date_ranges:
-                api_ranges_str = ", ".join([f"{s}~{e}" for s, e in api_date_ranges])
-                print(f"{Fore.BLUE}[DATA_SOURCE]   └─ All from API: {api_ranges_str}{Style.RESET_ALL}")
+            if stock_logger.isEnabledFor(logging.DEBUG):
+                final_dates = pd.to_datetime(combined_df['date'])
+                final_min = final_dates.min().strftime('%Y-%m-%d')
+                final_max = final_dates.max().strftime('%Y-%m-%d')
+                stock_logger.debug("[DATA_SOURCE] 📋 Final data for %s (API only): %s to %s (%s records)", code, final_min, final_max, len(combined_df))
+                if api_date_ranges:
+                    api_ranges_str = ", ".join([f"{s}~{e}" for s, e in api_date_ranges])
+                    stock_logger.debug("[DATA_SOURCE]   └─ All from API: %s", api_ranges_str)
             
             # Track data source: all from API
             source = 'api'
-            with _data_source_lock:
-                _data_source_stats[code] = source
+            _record_data_source(code, source, fetch_started)
             
             if return_source:
                 return combined_df, source
@@ -501,20 +583,21 @@ def fetch_kline_data(code: str, start_date: str, end_date: str,
     # If we couldn't fetch new data but have database data, return it
     if not df.empty:
         # Recalculate date range for logging
-        df_dates_final = pd.to_datetime(df['date'])
-        final_min_db = df_dates_final.min().strftime('%Y-%m-%d')
-        final_max_db = df_dates_final.max().strftime('%Y-%m-%d')
-        print(f"{Fore.GREEN}[DATA_SOURCE] 📋 Final data for {code} (Database only): {final_min_db} to {final_max_db} ({len(df)} records){Style.RESET_ALL}")
+        if stock_logger.isEnabledFor(logging.DEBUG):
+            df_dates_final = pd.to_datetime(df['date'])
+            final_min_db = df_dates_final.min().strftime('%Y-%m-%d')
+            final_max_db = df_dates_final.max().strftime('%Y-%m-%d')
+            stock_logger.debug("[DATA_SOURCE] 📋 Final data for %s (Database only): %s to %s (%s records)", code, final_min_db, final_max_db, len(df))
         # Track data source: all from database (partial data, but no API fetch)
         source = 'db'
-        with _data_source_lock:
-            _data_source_stats[code] = source
+        _record_data_source(code, source, fetch_started)
         
         if return_source:
             return df, source
         return df
     
-    print(f"{Fore.RED}[DATA_SOURCE] ❌ No data available for {code} (requested: {start_date} to {end_date}){Style.RESET_ALL}")
+    stock_logger.info("[DATA_SOURCE] ❌ No data available for %s (requested: %s to %s)", code, start_date, end_date)
+    FETCH_LATENCY.observe(time.perf_counter() - fetch_started, source='api')
     if return_source:
         return pd.DataFrame(), 'api'  # No data, but attempted API fetch
     return pd.DataFrame()
@@ -554,14 +637,16 @@ def _call_baostock_api_with_timeout(code: str, start_date: str, end_date: str, t
             result = future.result(timeout=timeout)
             return result
         except FutureTimeoutError:
-            print(f"{Fore.RED}[SCAN_CHECKPOINT] ⏱️ Timeout ({timeout}s) calling Baostock API for {code}{Style.RESET_ALL}")
+            stock_logger.warning("[SCAN_CHECKPOINT] ⏱️ Timeout (%ss) calling Baostock API for %s", timeout, code)
             raise
 
 
 def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
                                retry_attempts: int = 3,
                                retry_delay: int = 1,
-                               api_timeout: float = 5.0) -> pd.DataFrame:
+                               api_timeout: float = 5.0,
+                               raise_on_failure: bool = False,
+                               before_request: Optional[Callable[[], None]] = None) -> pd.DataFrame:
     """
     Internal function to fetch K-line data from Baostock API.
     
@@ -572,34 +657,50 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
         retry_attempts: Maximum number of retry attempts
         retry_delay: Delay between retries in seconds
         api_timeout: Timeout for each API call in seconds (default: 5.0)
+        raise_on_failure: If True, raise KlineFetchError when all attempts fail
+            instead of returning an empty DataFrame (which otherwise cannot be
+            told apart from a range without bars)
+        before_request: Called before every API request, retries included
+            (e.g. a rate limiter's acquire)
     
     Returns:
         pd.DataFrame: DataFrame containing K-line data
+    
+    Raises:
+        KlineFetchError: If raise_on_failure is True and all attempts failed
     """
     retries = 0
     
+    def give_up(reason: str) -> pd.DataFrame:
+        if raise_on_failure:
+            raise KlineFetchError(f"Failed to fetch K-line data for {code} after {retry_attempts} attempts ({reason})")
+        return pd.DataFrame()
+    
     while True:
+        if before_request is not None:
+            before_request()
         try:
             # Ensure we're logged in
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔐 Ensuring Baostock login for {code}...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 🔐 Ensuring Baostock login for %s...", code)
             baostock_login()
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Login check completed for {code}{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ Login check completed for %s", code)
             
             # Query historical K-line data with timeout protection
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 📡 Calling Baostock API for {code} (timeout: {api_timeout}s)...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 📡 Calling Baostock API for %s (timeout: %ss)...", code, api_timeout)
             try:
                 rs = _call_baostock_api_with_timeout(code, start_date, end_date, timeout=api_timeout)
                 # Log error message even if error_code is '0' (might contain useful info)
                 error_msg = getattr(rs, 'error_msg', 'N/A')
-                print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Baostock API call returned for {code}, error_code: {rs.error_code}, error_msg: {error_msg}{Style.RESET_ALL}")
+                stock_logger.debug("[SCAN_CHECKPOINT] ✓ Baostock API call returned for %s, error_code: %s, error_msg: %s", code, rs.error_code, error_msg)
             except FutureTimeoutError:
                 # Timeout occurred, treat as error
                 retries += 1
-                print(f"{Fore.RED}[SCAN_CHECKPOINT] ⏱️ Timeout ({api_timeout}s) for {code} (attempt {retries}/{retry_attempts}){Style.RESET_ALL}")
+                BAOSTOCK_ERRORS.inc(kind='timeout')
+                stock_logger.warning("[SCAN_CHECKPOINT] ⏱️ Timeout (%ss) for %s (attempt %s/%s)", api_timeout, code, retries, retry_attempts)
                 
                 if retries >= retry_attempts:
-                    print(f"{Fore.RED}Failed to fetch data for {code} after {retry_attempts} attempts (timeout){Style.RESET_ALL}")
-                    return pd.DataFrame()
+                    stock_logger.error("Failed to fetch data for %s after %s attempts (timeout)", code, retry_attempts)
+                    return give_up('timeout')
                 
                 # Retry with re-login
                 time.sleep(retry_delay * (1 + retries * 0.5))
@@ -609,11 +710,12 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
             # Check for API errors
             if rs.error_code != '0':
                 retries += 1
-                print(f"{Fore.YELLOW}Attempt {retries}/{retry_attempts}: Baostock query failed for {code}. Error: {rs.error_msg}{Style.RESET_ALL}")
+                BAOSTOCK_ERRORS.inc(kind='query_error')
+                stock_logger.warning("Attempt %s/%s: Baostock query failed for %s. Error: %s", retries, retry_attempts, code, rs.error_msg)
                 
                 if retries >= retry_attempts:
-                    print(f"{Fore.RED}Failed to fetch data for {code} after {retry_attempts} attempts{Style.RESET_ALL}")
-                    return pd.DataFrame()
+                    stock_logger.error("Failed to fetch data for %s after %s attempts", code, retry_attempts)
+                    return give_up(f"query error: {rs.error_msg}")
                 
                 # Retry with re-login
                 time.sleep(retry_delay * (1 + retries * 0.5))
@@ -621,7 +723,7 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
                 continue
             
             # Process the data if query was successful
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 📊 Processing result data for {code}...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 📊 Processing result data for %s...", code)
             data_list = []
             
             # Process results with safety limits to prevent infinite loops
@@ -634,12 +736,12 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
             while (rs.error_code == '0') & rs.next():
                 # Check timeout during processing
                 if time.time() - start_process_time > max_process_time:
-                    print(f"{Fore.RED}[SCAN_CHECKPOINT] ⏱️ Timeout ({max_process_time}s) processing results for {code} (processed {row_count} rows){Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] ⏱️ Timeout (%ss) processing results for %s (processed %s rows)", max_process_time, code, row_count)
                     raise FutureTimeoutError(f"Timeout processing results after {row_count} rows")
                 
                 # Safety limit on row count
                 if row_count >= max_rows:
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Reached max rows limit ({max_rows}) for {code}{Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Reached max rows limit (%s) for %s", max_rows, code)
                     break
                 
                 data_list.append(rs.get_row_data())
@@ -649,63 +751,65 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
                 if row_count % 100 == 0:
                     elapsed = time.time() - start_process_time
                     if elapsed > max_process_time:
-                        print(f"{Fore.RED}[SCAN_CHECKPOINT] ⏱️ Timeout ({max_process_time}s) processing results for {code} (processed {row_count} rows){Style.RESET_ALL}")
+                        stock_logger.warning("[SCAN_CHECKPOINT] ⏱️ Timeout (%ss) processing results for %s (processed %s rows)", max_process_time, code, row_count)
                         raise FutureTimeoutError(f"Timeout processing results after {row_count} rows")
             
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Collected {len(data_list)} rows for {code}{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ Collected %s rows for %s", len(data_list), code)
             
             # Convert to DataFrame
             if not data_list:
-                # Get error message for diagnosis
-                error_msg = getattr(rs, 'error_msg', 'N/A')
+                # 诊断信息仅在输出时计算（会读取股票基本信息表）
+                if stock_logger.isEnabledFor(logging.INFO):
+                    # Get error message for diagnosis
+                    error_msg = getattr(rs, 'error_msg', 'N/A')
                 
-                # Check if this might be a non-stock code (bond, fund, etc.)
-                code_num = code.split('.')[-1] if '.' in code else code
-                is_likely_bond = code_num.startswith('11') or code_num.startswith('12')
-                is_likely_fund = code_num.startswith('15') or code_num.startswith('16')
+                    # Check if this might be a non-stock code (bond, fund, etc.)
+                    code_num = code.split('.')[-1] if '.' in code else code
+                    is_likely_bond = code_num.startswith('11') or code_num.startswith('12')
+                    is_likely_fund = code_num.startswith('15') or code_num.startswith('16')
                 
-                diagnosis = []
-                if is_likely_bond:
-                    diagnosis.append("可能是债券代码（11xxxx/12xxxx），Baostock可能不提供债券K线数据")
-                if is_likely_fund:
-                    diagnosis.append("可能是基金代码（15xxxx/16xxxx），Baostock可能不提供基金K线数据")
-                if not is_likely_bond and not is_likely_fund:
-                    # Check if it's a valid stock code format
-                    if len(code_num) != 6 or not code_num.isdigit():
-                        diagnosis.append("股票代码格式异常（应为6位数字）")
-                    else:
-                        diagnosis.append("可能是股票代码，但该日期范围内无数据（可能已退市、停牌或代码不存在）")
+                    diagnosis = []
+                    if is_likely_bond:
+                        diagnosis.append("可能是债券代码（11xxxx/12xxxx），Baostock可能不提供债券K线数据")
+                    if is_likely_fund:
+                        diagnosis.append("可能是基金代码（15xxxx/16xxxx），Baostock可能不提供基金K线数据")
+                    if not is_likely_bond and not is_likely_fund:
+                        # Check if it's a valid stock code format
+                        if len(code_num) != 6 or not code_num.isdigit():
+                            diagnosis.append("股票代码格式异常（应为6位数字）")
+                        else:
+                            diagnosis.append("可能是股票代码，但该日期范围内无数据（可能已退市、停牌或代码不存在）")
                 
-                diagnosis_str = " | ".join(diagnosis) if diagnosis else "未知原因"
+                    diagnosis_str = " | ".join(diagnosis) if diagnosis else "未知原因"
                 
-                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ No data returned for {code} from {start_date} to {end_date}{Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   诊断: {diagnosis_str}{Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   API错误消息: {error_msg}{Style.RESET_ALL}")
+                    stock_logger.info("[SCAN_CHECKPOINT] ⚠️ No data returned for %s from %s to %s", code, start_date, end_date)
+                    stock_logger.info("[SCAN_CHECKPOINT]   诊断: %s", diagnosis_str)
+                    stock_logger.info("[SCAN_CHECKPOINT]   API错误消息: %s", error_msg)
                 
-                # Try to check if code exists in stock basics
-                try:
-                    db = get_stock_database()
-                    stock_basics_df = db.get_stock_basics()
-                    if stock_basics_df is not None and not stock_basics_df.empty:
-                        code_exists = code in stock_basics_df['code'].values
-                        if code_exists:
-                            stock_info = stock_basics_df[stock_basics_df['code'] == code].iloc[0]
-                            stock_type = stock_info.get('type', 'N/A')
-                            stock_status = stock_info.get('status', 'N/A')
-                            stock_name = stock_info.get('code_name') or stock_info.get('name', 'N/A')
-                            print(f"{Fore.CYAN}[SCAN_CHECKPOINT]   股票信息: 名称={stock_name}, 类型={stock_type}, 状态={stock_status}{Style.RESET_ALL}")
-                            if stock_type == '2':
-                                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   ⚠️ 这是指数代码（type=2），不提供K线数据{Style.RESET_ALL}")
-                            if stock_status == '0':
-                                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   ⚠️ 股票状态为0（非活跃），可能已退市或停牌{Style.RESET_ALL}")
-                        else:
-                            print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   ⚠️ 代码不在股票基本信息列表中，可能不存在或不是股票代码{Style.RESET_ALL}")
-                except Exception as e:
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT]   ⚠️ 无法检查股票基本信息: {e}{Style.RESET_ALL}")
+                    # Try to check if code exists in stock basics
+                    try:
+                        db = get_stock_database()
+                        stock_basics_df = db.get_stock_basics()
+                        if stock_basics_df is not None and not stock_basics_df.empty:
+                            code_exists = code in stock_basics_df['code'].values
+                            if code_exists:
+                                stock_info = stock_basics_df[stock_basics_df['code'] == code].iloc[0]
+                                stock_type = stock_info.get('type', 'N/A')
+                                stock_status = stock_info.get('status', 'N/A')
+                                stock_name = stock_info.get('code_name') or stock_info.get('name', 'N/A')
+                                stock_logger.info("[SCAN_CHECKPOINT]   股票信息: 名称=%s, 类型=%s, 状态=%s", stock_name, stock_type, stock_status)
+                                if stock_type == '2':
+                                    stock_logger.info("[SCAN_CHECKPOINT]   ⚠️ 这是指数代码（type=2），不提供K线数据")
+                                if stock_status == '0':
+                                    stock_logger.info("[SCAN_CHECKPOINT]   ⚠️ 股票状态为0（非活跃），可能已退市或停牌")
+                            else:
+                                stock_logger.info("[SCAN_CHECKPOINT]   ⚠️ 代码不在股票基本信息列表中，可能不存在或不是股票代码")
+                    except Exception as e:
+                        stock_logger.info("[SCAN_CHECKPOINT]   ⚠️ 无法检查股票基本信息: %s", e)
                 
                 return pd.DataFrame()
             
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔄 Converting to DataFrame for {code}...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 🔄 Converting to DataFrame for %s...", code)
             df = pd.DataFrame(data_list, columns=rs.fields)
             
             # Convert date column to datetime
@@ -717,17 +821,20 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
                 if col in df.columns:
                     df[col] = pd.to_numeric(df[col], errors='coerce')
             
-            print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ COMPLETE fetch_kline_data for {code}, returning {len(df)} records{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ COMPLETE fetch_kline_data for %s, returning %s records", code, len(df))
             return df
             
+        except KlineFetchError:
+            raise
         except FutureTimeoutError:
             # Timeout exception (should be caught above, but handle here as backup)
             retries += 1
-            print(f"{Fore.RED}Attempt {retries}/{retry_attempts}: Timeout while fetching data for {code}{Style.RESET_ALL}")
+            BAOSTOCK_ERRORS.inc(kind='timeout')
+            stock_logger.warning("Attempt %s/%s: Timeout while fetching data for %s", retries, retry_attempts, code)
             
             if retries >= retry_attempts:
-                print(f"{Fore.RED}Failed to fetch data for {code} after {retry_attempts} attempts (timeout){Style.RESET_ALL}")
-                return pd.DataFrame()
+                stock_logger.error("Failed to fetch data for %s after %s attempts (timeout)", code, retry_attempts)
+                return give_up('timeout')
             
             # Retry with re-login
             time.sleep(retry_delay * (1 + retries * 0.5))
@@ -735,11 +842,12 @@ def _fetch_kline_data_from_api(code: str, start_date: str, end_date: str,
             continue
         except Exception as e:
             retries += 1
-            print(f"{Fore.RED}Attempt {retries}/{retry_attempts}: Exception while fetching data for {code}: {e}{Style.RESET_ALL}")
+            BAOSTOCK_ERRORS.inc(kind='exception')
+            stock_logger.warning("Attempt %s/%s: Exception while fetching data for %s: %s", retries, retry_attempts, code, e)
             
             if retries >= retry_attempts:
-                print(f"{Fore.RED}Failed to fetch data for {code} after {retry_attempts} attempts{Style.RESET_ALL}")
-                return pd.DataFrame()
+                stock_logger.error("Failed to fetch data for %s after %s attempts", code, retry_attempts)
+                return give_up(str(e))
             
             # Retry with re-login
             time.sleep(retry_delay * (1 + retries * 0.5))
@@ -0,0 +1,401 @@
+"""
+Scan feature table module.
+Persists the per-window features of every platform stock found by a scan, plus
+the quick-check features (box range and volatility per window) of every
+analyzed stock, so a scan that only changes threshold settings (box_threshold,
+volatility_threshold, ma_diff_threshold, max_turnover_rate,
+outperform_index_threshold) does not need a full rescan.
+
+Every threshold is a monotone cutoff, so a stock that passes tighter thresholds
+must have passed the scanned ones: tightening is answered by a vectorized filter
+over the stored platform windows. When any threshold is loosened, the quick
+check (a necessary condition for every platform window) is re-applied to the
+stored quick-check features and only the stocks that pass it are analyzed again.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style
+
+try:
+    from .config import ScanConfig
+    from .platform_scanner import finalize_platform_stocks, scan_stocks
+    from .stock_database import get_stock_database
+except ImportError:
+    from api.config import ScanConfig
+    from api.platform_scanner import finalize_platform_stocks, scan_stocks
+    from api.stock_database import get_stock_database
+
+# Bump when the feature columns or their meaning change
+FEATURE_TABLE_VERSION = 2
+
+# Pure cutoffs that can be re-applied over stored features
+# (upper bounds, except outperform_index_threshold which is a lower bound)
+THRESHOLD_FIELDS = [
+    'box_threshold', 'volatility_threshold', 'ma_diff_threshold',
+    'max_turnover_rate', 'outperform_index_threshold'
+]
+
+# Settings applied after analysis by finalize_platform_stocks, or that do not
+# affect results at all; they are not part of the feature set key
+NON_FEATURE_FIELDS = [
+    'scan_date', 'use_scan_cache', 'use_analysis_cache', 'use_feature_table', 'enable_profiling',
+    'max_workers', 'retry_attempts', 'retry_delay', 'use_local_database_first',
+    'expected_count', 'use_fundamental_filter', 'revenue_growth_percentile',
+    'profit_growth_percentile', 'roe_percentile', 'liability_percentile',
+    'pe_percentile', 'pb_percentile', 'fundamental_years_to_check'
+]
+
+# Per-window feature columns (see combined_analyzer window_features)
+FEATURE_COLUMNS = [
+    'box_range', 'volatility', 'ma_diff', 'box_volatility',
+    'avg_turnover_rate', 'max_turnover_rate', 'has_relative_strength', 'outperform_index'
+]
+
+
+def feature_set_key(config_dict: Dict[str, Any], backtest_date: str) -> str:
+    """
+    Generate the feature set key: scan config without thresholds and
+    post-analysis settings, plus the backtest date.
+
+    Args:
+        config_dict: Scan configuration dictionary
+        backtest_date: Backtest date string (YYYY-MM-DD)
+
+    Returns:
+        MD5 hash string
+    """
+    excluded = set(THRESHOLD_FIELDS) | set(NON_FEATURE_FIELDS)
+    clean_config = {k: v for k, v in config_dict.items() if k not in excluded}
+    clean_config['_version'] = FEATURE_TABLE_VERSION
+    config_str = json.dumps(clean_config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(f"{config_str}:{backtest_date}".encode('utf-8')).hexdigest()
+
+
+def extract_thresholds(config_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the threshold settings of a scan config."""
+    defaults = ScanConfig().model_dump()
+    return {field: config_dict.get(field, defaults.get(field)) for field in THRESHOLD_FIELDS}
+
+
+def can_refilter(scanned: Dict[str, Any], requested: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    Check whether requested thresholds are equal to or tighter than the scanned ones.
+
+    Args:
+        scanned: Thresholds the feature set was built with
+        requested: Thresholds of the new scan
+
+    Returns:
+        Tuple of (can refilter, reason when it cannot)
+    """
+    for field in ['box_threshold', 'volatility_threshold', 'ma_diff_threshold', 'max_turnover_rate']:
+        if scanned.get(field) is None or requested.get(field) is None:
+            return False, f"{field} 缺失"
+        if requested[field] > scanned[field]:
+            return False, f"{field} 放宽 ({scanned[field]} -> {requested[field]})"
+
+    # 相对强度为下限阈值：None 表示不限制，任何具体值都更严格
+    scanned_rs = scanned.get('outperform_index_threshold')
+    requested_rs = requested.get('outperform_index_threshold')
+    if scanned_rs is not None:
+        if requested_rs is None or requested_rs < scanned_rs:
+            return False, f"outperform_index_threshold 放宽 ({scanned_rs} -> {requested_rs})"
+
+    return True, ""
+
+
+def build_feature_table(platform_stocks: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Flatten the window_features of platform stocks into a columnar table
+    with one row per (stock, platform window).
+
+    Args:
+        platform_stocks: Platform stocks before fundamental/industry filtering
+
+    Returns:
+        Dict mapping column name to values (code, window and FEATURE_COLUMNS)
+    """
+    table = {column: [] for column in ['code', 'window'] + FEATURE_COLUMNS}
+    for stock in platform_stocks:
+        window_features = stock.get('window_features') or {}
+        for window, features in window_features.items():
+            table['code'].append(stock['code'])
+            table['window'].append(int(window))
+            for column in FEATURE_COLUMNS:
+                table[column].append(features.get(column))
+    return table
+
+
+def filter_feature_table(features: Dict[str, List[Any]],
+                         thresholds: Dict[str, Any],
+                         allow_turnover_spikes: bool = True) -> Dict[str, List[int]]:
+    """
+    Apply thresholds to a feature table with vectorized comparisons.
+    Mirrors the window checks in combined_analyzer / turnover_analyzer.
+
+    Args:
+        features: Columnar feature table from build_feature_table
+        thresholds: Thresholds to apply
+        allow_turnover_spikes: Whether occasional turnover spikes are allowed
+
+    Returns:
+        Dict mapping stock code to its remaining platform windows
+    """
+    frame = pd.DataFrame(features)
+    if frame.empty:
+        return {}
+
+    for column in FEATURE_COLUMNS:
+        if column != 'has_relative_strength':
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    frame['has_relative_strength'] = frame['has_relative_strength'].fillna(False).astype(bool)
+
+    max_turnover = thresholds['max_turnover_rate']
+    volatility_threshold = thresholds['volatility_threshold']
+    no_turnover = frame['avg_turnover_rate'].isna()
+
+    mask = (
+        (frame['box_range'] <= thresholds['box_threshold']) &
+        (frame['volatility'] <= volatility_threshold) &
+        (frame['ma_diff'].isna() | (frame['ma_diff'] <= thresholds['ma_diff_threshold'])) &
+        (frame['box_volatility'].isna() | (frame['box_volatility'] <= volatility_threshold)) &
+        (no_turnover | (frame['avg_turnover_rate'] <= max_turnover))
+    )
+    if not allow_turnover_spikes:
+        # 不允许异常放量时，最大换手率不得超过阈值的1.5倍
+        mask &= (no_turnover | frame['max_turnover_rate'].isna() |
+                 (frame['max_turnover_rate'] <= max_turnover * 1.5))
+
+    passing = frame[mask]
+
+    # 相对强度：只要有一个剩余平台窗口满足阈值即可；没有相对强度结果的股票不过滤
+    outperform_threshold = thresholds.get('outperform_index_threshold')
+    if outperform_threshold is not None and not passing.empty:
+        rs_rows = passing[passing['has_relative_strength']]
+        rs_ok = rs_rows.loc[rs_rows['outperform_index'] >= outperform_threshold, 'code']
+        passing = passing[~passing['code'].isin(rs_rows['code']) | passing['code'].isin(rs_ok)]
+
+    return passing.groupby('code', sort=False)['window'].apply(list).to_dict()
+
+
+def quick_check_candidates(quick_features: Dict[str, Any],
+                           thresholds: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Re-apply the quick check to the stored quick-check features with vectorized comparisons.
+    Mirrors quick_price_check: a stock passes if any window is within both thresholds.
+
+    Args:
+        quick_features: Columnar quick-check features saved with a feature set
+        thresholds: Thresholds to apply
+
+    Returns:
+        Stocks (code, name, industry) that pass the quick check and need a full analysis
+    """
+    if not quick_features.get('code'):
+        return []
+    # 缺失值（JSON 中的 inf/NaN）按未通过处理
+    box_ranges = np.array(quick_features['box_ranges'], dtype=float)
+    volatilities = np.array(quick_features['volatilities'], dtype=float)
+    passed = ((box_ranges <= thresholds['box_threshold']) &
+              (volatilities <= thresholds['volatility_threshold'])).any(axis=1)
+    return [
+        {'code': quick_features['code'][i], 'name': quick_features['name'][i],
+         'industry': quick_features['industry'][i]}
+        for i in np.flatnonzero(passed)
+    ]
+
+
+def _window_entry(value: Any, window: int) -> Any:
+    """Get a window-keyed entry (keys may have become strings after storage)."""
+    if not isinstance(value, dict):
+        return None
+    return value.get(window, value.get(str(window)))
+
+
+def _rebuild_relative_strength(stock: Dict[str, Any], trimmed: Dict[str, Any]) -> None:
+    """
+    Recompute the stock-level relative strength fields from the remaining
+    platform windows, the way analyze_stock derives them (the window with
+    the highest outperform_index, falling back to the first window with a
+    stock return).
+    """
+    window_results = []
+    for window in trimmed['platform_windows']:
+        rs_result = (_window_entry(stock.get('details'), window) or {}).get('relative_strength')
+        if not isinstance(rs_result, dict):
+            features = _window_entry(stock.get('window_features'), window) or {}
+            if not features.get('has_relative_strength'):
+                continue
+            rs_result = {'outperform_index': features.get('outperform_index')}
+        window_results.append(rs_result)
+
+    best = None
+    for rs_result in window_results:
+        outperform_index = rs_result.get('outperform_index')
+        if outperform_index is not None and (best is None or outperform_index > best['outperform_index']):
+            best = rs_result
+
+    if best is not None:
+        trimmed['outperform_index'] = best['outperform_index']
+        if 'stock_return' in best:
+            trimmed['stock_return'] = best.get('stock_return')
+            trimmed['market_return'] = best.get('market_return')
+        elif best['outperform_index'] != stock.get('outperform_index'):
+            # 特征表只保存了相对强度值，最优窗口变化后无法还原涨跌幅
+            trimmed['stock_return'] = None
+            trimmed['market_return'] = None
+        return
+
+    trimmed['outperform_index'] = None
+    fallback = next((rs for rs in window_results if rs.get('stock_return') is not None), None)
+    trimmed['stock_return'] = fallback.get('stock_return') if fallback else None
+    trimmed['market_return'] = fallback.get('market_return') if fallback else None
+
+
+def _trim_stock_windows(stock: Dict[str, Any], windows: List[int]) -> Dict[str, Any]:
+    """
+    Copy a stock keeping only the given platform windows.
+
+    Window-keyed fields are filtered and the stock-level relative strength
+    fields are rebuilt from the remaining windows. mark_lines and
+    box_analysis come from the stock-level position, decline and box
+    analyses and do not depend on which platform windows remain.
+    """
+    kept = {int(w) for w in windows}
+    trimmed = dict(stock)
+    trimmed['platform_windows'] = [w for w in stock.get('platform_windows', []) if int(w) in kept]
+    # 存储后窗口键可能变为字符串，统一按整数比较
+    for field in ['selection_reasons', 'window_features', 'details',
+                  'volume_analysis', 'turnover_analysis']:
+        value = stock.get(field)
+        if isinstance(value, dict):
+            trimmed[field] = {k: v for k, v in value.items() if not str(k).isdigit() or int(k) in kept}
+    if 'outperform_index' in stock:
+        _rebuild_relative_strength(stock, trimmed)
+    return trimmed
+
+
+def save_feature_set(config_dict: Dict[str, Any], backtest_date: str,
+                     platform_stocks: List[Dict[str, Any]],
+                     total_scanned: Optional[int] = None,
+                     success_count: Optional[int] = None,
+                     quick_features: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Save the feature set of a completed scan.
+
+    Args:
+        config_dict: Scan configuration dictionary
+        backtest_date: Backtest date string (YYYY-MM-DD)
+        platform_stocks: Platform stocks before fundamental/industry filtering
+        total_scanned: Total number of stocks scanned
+        success_count: Number of stocks successfully analyzed
+        quick_features: Quick-check features of every analyzed stock (scan stats
+            'quick_features'); without them loosened thresholds need a full rescan
+    """
+    key = feature_set_key(config_dict, backtest_date)
+    features = build_feature_table(platform_stocks)
+    get_stock_database().save_scan_feature_set(
+        key, backtest_date, extract_thresholds(config_dict), platform_stocks, features,
+        total_scanned=total_scanned, success_count=success_count,
+        quick_features=quick_features
+    )
+    analyzed = len(quick_features['code']) if quick_features else 0
+    print(f"{Fore.GREEN}[FEATURE_TABLE] Saved feature set {key[:8]} ({len(platform_stocks)} stocks, {len(features['code'])} windows, {analyzed} quick-check rows){Style.RESET_ALL}")
+
+
+def _reanalyze_candidates(config_dict: Dict[str, Any], backtest_date: str,
+                          key: str, feature_set: Dict[str, Any],
+                          requested: Dict[str, Any]) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Answer a scan with loosened thresholds by analyzing only the stocks whose
+    stored quick-check features pass the requested quick check.
+    Every other stock fails the quick check and cannot have a platform window.
+    The result is saved as the feature set for the requested thresholds.
+    """
+    quick_features = feature_set.get('quick_features')
+    if not quick_features:
+        return None
+
+    candidates = quick_check_candidates(quick_features, requested)
+    print(f"{Fore.CYAN}[FEATURE_TABLE] Feature set {key[:8]}: {len(candidates)}/{len(quick_features['code'])} stocks pass the loosened quick check, re-analyzing them{Style.RESET_ALL}")
+
+    filtered_stocks, scan_stats = scan_stocks(
+        candidates, ScanConfig(**config_dict), end_date=backtest_date, return_stats=True
+    )
+    platform_stocks = scan_stats['platform_stocks']
+    # 快速检查特征与阈值无关，沿用原特征集的全部记录
+    save_feature_set(config_dict, backtest_date, platform_stocks,
+                     total_scanned=feature_set.get('total_scanned'),
+                     success_count=feature_set.get('success_count'),
+                     quick_features=quick_features)
+
+    return filtered_stocks, {
+        'total_scanned': feature_set.get('total_scanned'),
+        'success_count': feature_set.get('success_count'),
+        'platform_count': len(platform_stocks)
+    }
+
+
+def refilter_scan(config_dict: Dict[str, Any],
+                  backtest_date: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Answer a scan from a stored feature set when only thresholds changed.
+    Tightened thresholds are re-applied to the stored platform windows;
+    loosened ones re-analyze only the stocks passing the new quick check.
+
+    Args:
+        config_dict: Scan configuration dictionary
+        backtest_date: Backtest date string (YYYY-MM-DD)
+
+    Returns:
+        Tuple of (filtered and sorted stocks with kline_data, scan stats),
+        or None if no usable feature set exists (caller should run a full scan)
+    """
+    if config_dict.get('use_window_weights'):
+        # 加权得分依赖平台窗口集合，窗口变化后需要重新计算
+        return None
+
+    key = feature_set_key(config_dict, backtest_date)
+    db = get_stock_database()
+    feature_set = db.get_scan_feature_set(key, include_kline=False)
+    if not feature_set:
+        return None
+
+    requested = extract_thresholds(config_dict)
+    ok, reason = can_refilter(feature_set['thresholds'], requested)
+    if not ok:
+        result = _reanalyze_candidates(config_dict, backtest_date, key, feature_set, requested)
+        if result is None:
+            print(f"{Fore.YELLOW}[FEATURE_TABLE] Feature set {key[:8]} not reusable: {reason} (no quick-check features stored){Style.RESET_ALL}")
+        return result
+
+    remaining = filter_feature_table(
+        feature_set['features'], requested,
+        allow_turnover_spikes=config_dict.get('allow_turnover_spikes', True)
+    )
+    platform_stocks = [
+        _trim_stock_windows(stock, remaining[stock['code']])
+        for stock in feature_set['platform_stocks']
+        if stock.get('code') in remaining
+    ]
+    print(f"{Fore.GREEN}[FEATURE_TABLE] Re-filtered feature set {key[:8]}: {len(feature_set['platform_stocks'])} -> {len(platform_stocks)} stocks{Style.RESET_ALL}")
+
+    filtered_stocks, _ = finalize_platform_stocks(platform_stocks, ScanConfig(**config_dict))
+
+    # 只为最终结果加载K线数据
+    refs = [stock['kline_ref'] for stock in filtered_stocks if stock.get('kline_ref')]
+    klines = iter(db.get_kline_data_batch(refs))
+    for stock in filtered_stocks:
+        if stock.get('kline_ref'):
+            stock['kline_data'] = next(klines)['kline_data']
+            del stock['kline_ref']
+
+    return filtered_stocks, {
+        'total_scanned': feature_set.get('total_scanned'),
+        'success_count': feature_set.get('success_count'),
+        'platform_count': len(platform_stocks)
+    }
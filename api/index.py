@@ -3,16 +3,17 @@ from colorama import Fore, Style
 import colorama  # For colored console output
 import traceback
 import pandas as pd
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from pydantic import BaseModel, Field, RootModel, field_validator
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import json
 import asyncio
 import sys
 import os
 import hashlib
+import time
 
 # 添加当前目录到 Python 路径，以便导入模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,11 +23,18 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     from api.config import ScanConfig
     from api.task_manager import task_manager, TaskStatus
-    from api.data_fetcher import fetch_stock_basics, fetch_industry_data, BaostockConnectionManager, set_use_local_database_first
-    from api.platform_scanner import prepare_stock_list, scan_stocks
+    from api.task_queue import get_task_queue
+    from api.data_fetcher import BaostockConnectionManager, set_use_local_database_first, get_data_source_stats
+    from api.platform_scanner import scan_stocks
+    from api.feature_table import save_feature_set, refilter_scan
+    from api.security_master import get_security_master
+    from api.logging_utils import get_logger, get_log_queue_depth
+    from api.metrics import get_metrics_registry, gauge, counter_family
+    from api.cache_manager import get_cache_manager
+    from api.scan_profiler import ScanProfiler
     from api.case_api import router as case_router
-    from api.json_utils import convert_numpy_types, sanitize_float_for_json
-    from api.analyzers.fundamental_analyzer import get_stock_fundamentals
+    from api.json_utils import convert_numpy_types, FastJSONResponse, sse_data
+    from api.analyzers.fundamental_analyzer import get_stock_fundamentals, refresh_fundamentals
     from api.backtest_history_manager import (
         save_backtest_history, get_backtest_history_list, 
         get_backtest_history, delete_backtest_history, clear_all_backtest_history,
@@ -44,11 +52,18 @@ except ImportError:
     # 如果绝对导入失败，尝试相对导入（本地开发环境）
     from .config import ScanConfig
     from .task_manager import task_manager, TaskStatus
-    from .data_fetcher import fetch_stock_basics, fetch_industry_data, BaostockConnectionManager, set_use_local_database_first
-    from .platform_scanner import prepare_stock_list, scan_stocks
+    from .task_queue import get_task_queue
+    from .data_fetcher import BaostockConnectionManager, set_use_local_database_first, get_data_source_stats
+    from .platform_scanner import scan_stocks
+    from .feature_table import save_feature_set, refilter_scan
+    from .security_master import get_security_master
+    from .logging_utils import get_logger, get_log_queue_depth
+    from .metrics import get_metrics_registry, gauge, counter_family
+    from .cache_manager import get_cache_manager
+    from .scan_profiler import ScanProfiler
     from .case_api import router as case_router
-    from .json_utils import convert_numpy_types, sanitize_float_for_json
-    from .analyzers.fundamental_analyzer import get_stock_fundamentals
+    from .json_utils import convert_numpy_types, FastJSONResponse, sse_data
+    from .analyzers.fundamental_analyzer import get_stock_fundamentals, refresh_fundamentals
     from .backtest_history_manager import (
         save_backtest_history, get_backtest_history_list, 
         get_backtest_history, delete_backtest_history, clear_all_backtest_history,
@@ -63,6 +78,9 @@ except ImportError:
     except ImportError:
         batch_scan_manager = None
 
+# Per-stock events of scan/backtest endpoints (level-gated and sampled)
+stock_logger = get_logger('api.stock')
+
 # Import default values from config to ensure consistency
 try:
     from api.config import (
@@ -77,7 +95,8 @@ try:
         DEFAULT_USE_BREAKTHROUGH_CONFIRMATION, DEFAULT_BREAKTHROUGH_CONFIRMATION_DAYS,
         DEFAULT_USE_BREAKTHROUGH_PREDICTION, DEFAULT_USE_WINDOW_WEIGHTS,
         DEFAULT_MAX_TURNOVER_RATE, DEFAULT_ALLOW_TURNOVER_SPIKES,
-        DEFAULT_CHECK_RELATIVE_STRENGTH, DEFAULT_OUTPERFORM_INDEX_THRESHOLD
+        DEFAULT_CHECK_RELATIVE_STRENGTH, DEFAULT_OUTPERFORM_INDEX_THRESHOLD,
+        DEFAULT_RELATIVE_STRENGTH_BENCHMARK, RELATIVE_STRENGTH_BENCHMARKS
     )
 except ImportError:
     # 如果绝对导入失败，尝试相对导入（本地开发环境）
@@ -93,7 +112,8 @@ except ImportError:
         DEFAULT_USE_BREAKTHROUGH_CONFIRMATION, DEFAULT_BREAKTHROUGH_CONFIRMATION_DAYS,
         DEFAULT_USE_BREAKTHROUGH_PREDICTION, DEFAULT_USE_WINDOW_WEIGHTS,
         DEFAULT_MAX_TURNOVER_RATE, DEFAULT_ALLOW_TURNOVER_SPIKES,
-        DEFAULT_CHECK_RELATIVE_STRENGTH, DEFAULT_OUTPERFORM_INDEX_THRESHOLD
+        DEFAULT_CHECK_RELATIVE_STRENGTH, DEFAULT_OUTPERFORM_INDEX_THRESHOLD,
+        DEFAULT_RELATIVE_STRENGTH_BENCHMARK, RELATIVE_STRENGTH_BENCHMARKS
     )
 
 
@@ -187,6 +207,7 @@ class ScanConfigRequest(BaseModel):
     # Relative strength settings
     check_relative_strength: bool = DEFAULT_CHECK_RELATIVE_STRENGTH  # 是否启用相对大盘强度检查（计算并保存相对强度值）
     outperform_index_threshold: Optional[float] = DEFAULT_OUTPERFORM_INDEX_THRESHOLD  # 相对强度阈值，None表示不过滤（计算并保存但不作为筛选条件）
+    relative_strength_benchmark: str = DEFAULT_RELATIVE_STRENGTH_BENCHMARK  # 相对强度基准指数：sh.000001 上证指数 / sz.399001 深证成指 / sh.000300 沪深300
 
     # System settings
     max_workers: int = 5  # Keep concurrency reasonable for serverless
@@ -197,6 +218,9 @@ class ScanConfigRequest(BaseModel):
     
     # Cache settings
     use_scan_cache: bool = True  # 是否使用扫描结果缓存，默认为开启
+    use_analysis_cache: bool = True  # 是否复用个股分析结论缓存（按K线数据版本和分析参数），默认为开启
+    use_feature_table: bool = False  # 是否启用特征表模式（调整阈值时免全量重新扫描），默认为关闭
+    enable_profiling: bool = False  # 是否记录扫描各阶段耗时报告，默认为关闭
     
     # Data source settings
     use_local_database_first: bool = True  # 优先使用本地数据库数据，默认为开启
@@ -209,6 +233,14 @@ class ScanConfigRequest(BaseModel):
             return None
         return v
 
+    @field_validator('relative_strength_benchmark')
+    @classmethod
+    def validate_relative_strength_benchmark(cls, v):
+        """只接受支持的基准指数"""
+        if v not in RELATIVE_STRENGTH_BENCHMARKS:
+            raise ValueError(f"relative_strength_benchmark must be one of {', '.join(RELATIVE_STRENGTH_BENCHMARKS)}")
+        return v
+
 # --- Define response models ---
 
 
@@ -247,7 +279,8 @@ class StockScanResult(BaseModel):
     name: str
     industry: str | None = "未知行业"
     selection_reasons: Dict[int, str]
-    kline_data: List[KlineDataPoint]
+    kline_data: List[KlineDataPoint] = []  # 摘要模式下为空，通过 kline_ref 按需加载
+    kline_ref: Optional[Dict[str, Any]] = None  # K线引用（code + 日期范围）
     mark_lines: Optional[List[MarkLine]] = None
     outperform_index: Optional[float] = None  # 相对强度值（相对于大盘）
     stock_return: Optional[float] = None  # 股票涨跌幅（%）
@@ -259,6 +292,17 @@ class StockScanResult(BaseModel):
     weighted_score: Optional[float] = None  # 窗口权重得分
     weight_details: Optional[Dict[str, Any]] = None  # 权重详情
 
+class KlineRangeRequest(BaseModel):
+    """A single K-line range to load."""
+    code: str
+    start_date: str
+    end_date: str
+
+
+class KlineBatchRequest(BaseModel):
+    """Request model for loading K-line data of multiple stocks in one call."""
+    items: List[KlineRangeRequest] = Field(..., description="需要加载K线的股票及日期范围列表")
+
 # --- Task-related models ---
 
 
@@ -279,13 +323,15 @@ class TaskStatusResponse(BaseModel):
     created_at: float
     updated_at: float
     completed_at: Optional[float] = None
+    profile: Optional[Dict[str, Any]] = None  # 扫描分阶段耗时报告（enable_profiling）
 
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Stock Platform Scanner API",
     description="API for scanning stocks for platform consolidation patterns",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -302,15 +348,23 @@ app.include_router(case_router, prefix="/api")
 
 # Import for platform check endpoint
 try:
-    from api.data_fetcher import fetch_kline_data, build_historical_data
+    from api.data_fetcher import fetch_kline_data, build_historical_data, baostock_logout
     from api.analyzers.combined_analyzer import analyze_stock
     from api.stock_database import get_stock_database
+    from api.platform_check_cache import get_platform_check_cache
+    from api.market_close_scheduler import get_market_close_scheduler, invalidate_market_data_caches
+    from api.kline_sync import sync_kline_data
+    from api.config import PLATFORM_CHECK_WINDOWS, POST_CLOSE_SCHEDULER_ENABLED
 except ImportError:
-    from .data_fetcher import fetch_kline_data, build_historical_data
+    from .data_fetcher import fetch_kline_data, build_historical_data, baostock_logout
     from .analyzers.combined_analyzer import analyze_stock
     from .stock_database import get_stock_database
+    from .platform_check_cache import get_platform_check_cache
+    from .market_close_scheduler import get_market_close_scheduler, invalidate_market_data_caches
+    from .kline_sync import sync_kline_data
+    from .config import PLATFORM_CHECK_WINDOWS, POST_CLOSE_SCHEDULER_ENABLED
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 
 def generate_scan_cache_key(scan_config: Dict[str, Any], backtest_date: str) -> str:
@@ -324,9 +378,11 @@ def generate_scan_cache_key(scan_config: Dict[str, Any], backtest_date: str) ->
     Returns:
         MD5 hash string as cache key
     """
-    # Ensure scan_date and use_scan_cache are not in config_dict
-    # scan_date is passed separately, use_scan_cache doesn't affect cache key
-    clean_config = {k: v for k, v in scan_config.items() if k not in ['scan_date', 'use_scan_cache']}
+    # Ensure scan_date and cache switches are not in config_dict
+    # scan_date is passed separately, cache/feature-table/profiling switches don't affect results
+    clean_config = {k: v for k, v in scan_config.items()
+                    if k not in ['scan_date', 'use_scan_cache', 'use_analysis_cache', 'use_feature_table',
+                                 'enable_profiling']}
     
     # Sort config keys and convert to JSON string for consistent hashing
     config_str = json.dumps(clean_config, sort_keys=True, ensure_ascii=False)
@@ -341,6 +397,58 @@ def generate_scan_cache_key(scan_config: Dict[str, Any], backtest_date: str) ->
     return cache_key
 
 
+def strip_kline_data(stocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Return copies of scan result stocks with kline_data replaced by a kline_ref,
+    so result lists stay small and K-lines can be loaded via /api/kline/batch.
+    Stocks whose range the kline_data table does not fully cover keep their
+    embedded K-lines, since /api/kline/batch could only return part of them.
+    
+    Args:
+        stocks: List of scan result stock dictionaries
+    
+    Returns:
+        List of stock dictionaries, embedded K-lines only where needed
+    """
+    if not stocks:
+        return []
+    try:
+        return get_stock_database().compact_scanned_stocks(stocks)
+    except Exception as e:
+        print(f"{Fore.YELLOW}[KLINE_REF] Failed to check K-line coverage, keeping embedded data: {e}{Style.RESET_ALL}")
+        return list(stocks)
+
+
+def summarize_platform_stock(stock: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the streamed summary of a platform stock found mid-scan: display
+    fields plus a kline_ref instead of the K-line series (the series itself
+    when the kline_data table cannot restore it).
+    
+    Args:
+        stock: Platform stock dictionary from scan_stocks
+    
+    Returns:
+        Summary dictionary
+    """
+    summary = {key: stock.get(key) for key in [
+        'code', 'name', 'industry', 'platform_windows', 'selection_reasons',
+        'outperform_index', 'stock_return', 'market_return', 'weighted_score'
+    ]}
+    if stock.get('kline_data'):
+        stripped = strip_kline_data([stock])[0]
+        if 'kline_ref' in stripped:
+            summary['kline_ref'] = stripped['kline_ref']
+        else:
+            summary['kline_data'] = stripped['kline_data']
+    # NumPy 类型与 NaN 在推送时由 sse_data 一次性处理
+    return summary
+
+
+# Maximum number of K-line ranges per /api/kline/batch request
+MAX_KLINE_BATCH_ITEMS = 200
+
+
 # --- API Endpoints ---
 
 
@@ -366,367 +474,611 @@ async def get_database_stats():
     return stats
 
 
-@app.post("/api/scan/start", response_model=TaskCreationResponse)
-async def start_scan(config_request: ScanConfigRequest, background_tasks: BackgroundTasks):
+def collect_runtime_metrics():
     """
-    Start a stock platform scan as a background task.
-    Returns a task ID that can be used to check the status of the scan.
+    Scrape-time metrics for state owned by other components
+    (task manager, task queue, response cache, log queue, database file).
     """
-    # Initialize colorama for colored console output
-    colorama.init()
+    task_counts = task_manager.count_by_status()
+    yield gauge('tasks', 'Background tasks by status.',
+                [({'status': status}, count) for status, count in task_counts.items()])
+
+    queue_stats = get_task_queue().get_stats()
+    yield gauge('active_tasks', 'Running task queue workers by task kind.',
+                [({'kind': kind}, count) for kind, count in queue_stats['running'].items()])
+
+    # 各任务类型的排队数，以及日志队列积压
+    yield gauge('queue_depth', 'Items waiting in in-process queues.',
+                [({'queue': kind}, count) for kind, count in queue_stats['waiting'].items()] +
+                [({'queue': 'log'}, get_log_queue_depth())])
+
+    cache_stats = get_cache_manager().get_stats()
+    yield counter_family('response_cache_requests_total', 'Response cache lookups by result.',
+                         [({'result': 'hit'}, cache_stats['hits']),
+                          ({'result': 'miss'}, cache_stats['misses'])])
+    yield gauge('response_cache_hit_ratio', 'Response cache hit ratio since start (0-1).',
+                [({}, cache_stats['hit_rate'] / 100)])
+    yield gauge('response_cache_entries', 'Entries in the response cache.',
+                [({}, cache_stats['size'])])
+
+    # 最近一次扫描各数据来源的股票数
+    source_counts = {'db': 0, 'api': 0, 'mixed': 0}
+    for source in get_data_source_stats().values():
+        source_counts[source] = source_counts.get(source, 0) + 1
+    yield gauge('last_scan_stocks_by_source', 'Stocks of the most recent scan by K-line data source.',
+                [({'source': source}, count) for source, count in source_counts.items()])
+
+    db_path = get_stock_database().db_path
+    if os.path.exists(db_path):
+        yield gauge('db_size_bytes', 'Size of the stock database file.',
+                    [({}, os.path.getsize(db_path))])
+
+
+get_metrics_registry().register_collector(collect_runtime_metrics)
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in Prometheus text exposition format (scan, fetch, database,
+    task and cache health) for scraping.
+    """
+    return PlainTextResponse(
+        get_metrics_registry().render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
-    print(f"{Fore.CYAN}======================================{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}Starting stock platform scan task{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}======================================{Style.RESET_ALL}")
 
-    # Create a new task
-    task_id = task_manager.create_task()
+def run_fundamentals_refresh_task(task_id: str, payload: Dict[str, Any]) -> None:
+    """
+    Run a queued fundamentals refresh (task queue handler for kind 'fundamentals').
+    
+    Args:
+        task_id: Task ID
+        payload: Dict with years_to_check
+    """
+    years_to_check = payload.get('years_to_check', 3)
+    try:
+        with BaostockConnectionManager():
+            codes = [stock['code'] for stock in get_security_master().get_stock_list()]
+            task_manager.update_task(
+                task_id,
+                progress=10,
+                message=f"Refreshing fundamentals for {len(codes)} stocks"
+            )
+            saved_count = refresh_fundamentals(codes, years_to_check)
+        task_manager.update_task(
+            task_id,
+            status=TaskStatus.COMPLETED,
+            progress=100,
+            message=f"基本面数据更新完成，新增 {saved_count} 条年报记录",
+            result=[]
+        )
+    except Exception as e:
+        print(f"{Fore.RED}Error in fundamentals refresh task: {e}{Style.RESET_ALL}")
+        traceback.print_exc()
+        task_manager.update_task(
+            task_id,
+            status=TaskStatus.FAILED,
+            error=f"Fundamentals refresh failed: {str(e)}"
+        )
 
-    # Convert request to config dictionary
-    config_dict = config_request.model_dump()
-    print(f"{Fore.YELLOW}Scan configuration:{Style.RESET_ALL}")
-    for key, value in config_dict.items():
-        print(f"  - {key}: {Fore.GREEN}{value}{Style.RESET_ALL}")
+
+@app.post("/api/fundamentals/refresh", response_model=TaskCreationResponse)
+async def start_fundamentals_refresh(years_to_check: int = 3):
+    """
+    Refresh the local fundamentals table for all active stocks as a queued background task.
+    Only annual reports not stored yet (or published since the last check) are fetched.
+    Progress can be checked via /api/scan/status/{task_id}.
+    """
+    # 同一时间只保留一个刷新任务
+    task_id, deduplicated = get_task_queue().submit(
+        'fundamentals', {'years_to_check': years_to_check}, dedupe_key='fundamentals')
+
+    return TaskCreationResponse(
+        task_id=task_id,
+        message=("A fundamentals refresh is already in progress. Use the task ID to check status."
+                 if deduplicated else
+                 "Fundamentals refresh started. Use the task ID to check status.")
+    )
+
+
+def run_scan_task(task_id: str, config_dict: Dict[str, Any]) -> None:
+    """
+    Run a queued scan task (task queue handler for kind 'scan').
     
-    # 特别强调 scan_date 的值
-    if 'scan_date' in config_dict:
-        print(f"{Fore.MAGENTA}[DEBUG] scan_date in config_dict: {config_dict['scan_date']}{Style.RESET_ALL}")
-    else:
-        print(f"{Fore.RED}[DEBUG] ⚠️ scan_date NOT in config_dict!{Style.RESET_ALL}")
+    Args:
+        task_id: Task ID
+        config_dict: ScanConfigRequest fields of the request
+    """
+    config_request = ScanConfigRequest(**config_dict)
+    try:
+        # Check if database is empty and build historical data if needed
+        db = get_stock_database()
+        if db.is_empty():
+            task_manager.update_task(
+                task_id,
+                progress=5,
+                message="Database is empty, building historical data (this may take a while)..."
+            )
+            # Build historical data in background (non-blocking for first access)
+            # For now, we'll just fetch stock basics and let individual queries build data
+            print(f"{Fore.YELLOW}Database is empty, will build data on first access{Style.RESET_ALL}")
+        
+        # Set global database-first preference from config
+        use_db_first = config_dict.get('use_local_database_first', True)
+        set_use_local_database_first(use_db_first)
+        
+        # Fetch stock basics
+        with BaostockConnectionManager():
+            # Prepare stock list from the shared security master (basics + industry)
+            stock_list = get_security_master().get_stock_list(use_local_database_first=use_db_first)
+            task_manager.update_task(
+                task_id,
+                progress=20,
+                message="Loaded stock basic information and industry classification"
+            )
+            
+            # 如果设置了最大股票数量限制，则限制股票列表
+            original_stock_count = len(stock_list)
+            if config_request.max_stock_count and config_request.max_stock_count > 0:
+                stock_list = stock_list[:config_request.max_stock_count]
+                print(f"{Fore.YELLOW}[INDEX] 限制扫描股票数量: {original_stock_count} -> {len(stock_list)} (限制: {config_request.max_stock_count}){Style.RESET_ALL}")
+            
+            task_manager.update_task(
+                task_id,
+                progress=30,
+                message=f"Prepared list of {len(stock_list)} stocks for scanning"
+            )
 
-    # Start the scan in the background
-    def run_scan_task():
-        try:
-            # Check if database is empty and build historical data if needed
+            # Create scan config
+            scan_config = ScanConfig(**config_dict)
+            
+            # 使用配置中的扫描日期，如果没有则使用当前日期
+            scan_date = scan_config.scan_date
+            if scan_date is None:
+                scan_date = datetime.now().strftime('%Y-%m-%d')
+                print(f"{Fore.YELLOW}[INDEX] 未提供扫描日期，使用当前日期: {scan_date}{Style.RESET_ALL}")
+            else:
+                print(f"{Fore.GREEN}[INDEX] ✓ 使用配置的扫描日期: {scan_date}{Style.RESET_ALL}")
+            
+            # 生成缓存键：从 config_dict 中移除 scan_date 和 use_scan_cache，避免影响缓存键
+            # scan_date 会作为单独参数传入，use_scan_cache 不影响扫描结果
+            cache_config_dict = config_dict.copy()
+            original_scan_date_in_dict = cache_config_dict.get('scan_date')
+            cache_config_dict.pop('scan_date', None)  # 移除 scan_date，避免影响缓存键
+            cache_config_dict.pop('use_scan_cache', None)  # 移除 use_scan_cache，避免影响缓存键
+            
+            # 详细日志：显示缓存键生成过程
+            print(f"{Fore.CYAN}[CACHE_DEBUG] 原始 config_dict 中的 scan_date: {original_scan_date_in_dict}{Style.RESET_ALL}")
+            print(f"{Fore.CYAN}[CACHE_DEBUG] 实际使用的 scan_date: {scan_date}{Style.RESET_ALL}")
+            print(f"{Fore.CYAN}[CACHE_DEBUG] 移除 scan_date 后的 config_dict keys: {list(cache_config_dict.keys())[:5]}...{Style.RESET_ALL}")
+            
+            cache_key = generate_scan_cache_key(cache_config_dict, scan_date)
+            print(f"{Fore.CYAN}[INDEX] 缓存键生成: scan_date={scan_date}, cache_key={cache_key[:16]}...{Style.RESET_ALL}")
+            
+            # 检查缓存（如果启用了缓存）
             db = get_stock_database()
-            if db.is_empty():
-                task_manager.update_task(
-                    task_id,
-                    progress=5,
-                    message="Database is empty, building historical data (this may take a while)..."
-                )
-                # Build historical data in background (non-blocking for first access)
-                # For now, we'll just fetch stock basics and let individual queries build data
-                print(f"{Fore.YELLOW}Database is empty, will build data on first access{Style.RESET_ALL}")
+            cached_result = None
+            # 分阶段耗时报告（仅在实际执行扫描时生成）
+            profiler = ScanProfiler() if config_request.enable_profiling else None
+            scan_profile = None
+            if config_request.use_scan_cache:
+                cached_result = db.get_scan_cache(cache_key)
+                if cached_result:
+                    print(f"{Fore.GREEN}[INDEX] 使用扫描结果缓存（use_scan_cache=True）{Style.RESET_ALL}")
+                else:
+                    print(f"{Fore.YELLOW}[INDEX] 缓存未命中，将执行新扫描（use_scan_cache=True）{Style.RESET_ALL}")
+            else:
+                print(f"{Fore.CYAN}[INDEX] 跳过缓存检查，直接执行扫描（use_scan_cache=False）{Style.RESET_ALL}")
             
-            # Set global database-first preference from config
-            use_db_first = config_dict.get('use_local_database_first', True)
-            set_use_local_database_first(use_db_first)
+            # 特征表模式：缓存未命中时，若只是调整了阈值，基于上次扫描的特征表重新筛选（放宽时只重新分析通过快速检查的股票）
+            refiltered = None
+            if not cached_result and config_request.use_feature_table:
+                try:
+                    refiltered = refilter_scan(config_dict, scan_date)
+                except Exception as feature_error:
+                    print(f"{Fore.YELLOW}Warning: Failed to re-filter from feature table: {feature_error}{Style.RESET_ALL}")
             
-            # Fetch stock basics
-            with BaostockConnectionManager():
-                stock_basics_df = fetch_stock_basics(use_local_database_first=use_db_first)
-
-                # Update task status
+            if cached_result:
+                cached_scan_date = cached_result.get('backtest_date', 'unknown')
+                print(f"{Fore.GREEN}找到缓存结果: 请求日期={scan_date}, 缓存中的日期={cached_scan_date}, 扫描配置已缓存{Style.RESET_ALL}")
+                if cached_scan_date != scan_date:
+                    print(f"{Fore.RED}[CACHE_WARNING] ⚠️ 缓存日期不匹配！请求日期={scan_date}, 缓存日期={cached_scan_date}{Style.RESET_ALL}")
+                platform_stocks = cached_result['scanned_stocks']
                 task_manager.update_task(
                     task_id,
-                    progress=10,
-                    message="Fetched stock basic information"
+                    progress=100,
+                    message=f"使用缓存结果，找到 {len(platform_stocks)} 只符合条件的股票"
                 )
-
-                # Fetch industry data
+            elif refiltered is not None:
+                platform_stocks, refilter_stats = refiltered
+                total_scanned = refilter_stats.get('total_scanned') or len(stock_list)
+                success_count = refilter_stats.get('success_count') or len(platform_stocks)
                 try:
-                    industry_df = fetch_industry_data(use_local_database_first=use_db_first)
-                    task_manager.update_task(
-                        task_id,
-                        progress=20,
-                        message="Fetched industry classification data"
-                    )
-                except Exception as e:
-                    print(
-                        f"{Fore.YELLOW}Warning: Failed to fetch industry data: {e}{Style.RESET_ALL}")
-                    industry_df = pd.DataFrame()
-                    task_manager.update_task(
-                        task_id,
-                        progress=20,
-                        message="Warning: Failed to fetch industry data, continuing without it"
-                    )
-
-                # Prepare stock list
-                stock_list = prepare_stock_list(stock_basics_df, industry_df)
-                
-                # 如果设置了最大股票数量限制，则限制股票列表
-                original_stock_count = len(stock_list)
-                if config_request.max_stock_count and config_request.max_stock_count > 0:
-                    stock_list = stock_list[:config_request.max_stock_count]
-                    print(f"{Fore.YELLOW}[INDEX] 限制扫描股票数量: {original_stock_count} -> {len(stock_list)} (限制: {config_request.max_stock_count}){Style.RESET_ALL}")
-                
+                    db.save_scan_cache(cache_key, config_dict, scan_date, platform_stocks,
+                                      total_scanned=total_scanned, success_count=success_count)
+                except Exception as cache_error:
+                    print(f"{Fore.YELLOW}Warning: Failed to save scan cache: {cache_error}{Style.RESET_ALL}")
                 task_manager.update_task(
                     task_id,
-                    progress=30,
-                    message=f"Prepared list of {len(stock_list)} stocks for scanning"
+                    progress=100,
+                    message=f"基于特征表重新筛选，找到 {len(platform_stocks)} 只符合条件的股票"
                 )
+            else:
+                # 缓存未命中，执行扫描
+                # Define progress update callback
+                def update_progress(progress=None, message=None):
+                    if progress is not None and message is not None:
+                        # Scale progress to 30-100 range (30% for preparation, 70% for scanning)
+                        # When progress=100 from scan_stocks, scale to 100 (not 90)
+                        if progress >= 100:
+                            scaled_progress = 100  # Full completion
+                            # NOTE: Don't mark as COMPLETED here - wait until result is processed
+                            # This prevents result from being None when status is COMPLETED
+                            task_manager.update_task(
+                                task_id, 
+                                progress=scaled_progress, 
+                                message=message
+                            )
+                        else:
+                            scaled_progress = 30 + int(progress * 0.7)  # Scale 0-100 to 30-100
+                            task_manager.update_task(
+                                task_id, progress=scaled_progress, message=message)
 
-                # Create scan config
-                scan_config = ScanConfig(**config_dict)
-                
-                # 使用配置中的扫描日期，如果没有则使用当前日期
-                scan_date = scan_config.scan_date
-                if scan_date is None:
-                    scan_date = datetime.now().strftime('%Y-%m-%d')
-                    print(f"{Fore.YELLOW}[INDEX] 未提供扫描日期，使用当前日期: {scan_date}{Style.RESET_ALL}")
-                else:
-                    print(f"{Fore.GREEN}[INDEX] ✓ 使用配置的扫描日期: {scan_date}{Style.RESET_ALL}")
-                
-                # 生成缓存键：从 config_dict 中移除 scan_date 和 use_scan_cache，避免影响缓存键
-                # scan_date 会作为单独参数传入，use_scan_cache 不影响扫描结果
-                cache_config_dict = config_dict.copy()
-                original_scan_date_in_dict = cache_config_dict.get('scan_date')
-                cache_config_dict.pop('scan_date', None)  # 移除 scan_date，避免影响缓存键
-                cache_config_dict.pop('use_scan_cache', None)  # 移除 use_scan_cache，避免影响缓存键
-                
-                # 详细日志：显示缓存键生成过程
-                print(f"{Fore.CYAN}[CACHE_DEBUG] 原始 config_dict 中的 scan_date: {original_scan_date_in_dict}{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}[CACHE_DEBUG] 实际使用的 scan_date: {scan_date}{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}[CACHE_DEBUG] 移除 scan_date 后的 config_dict keys: {list(cache_config_dict.keys())[:5]}...{Style.RESET_ALL}")
-                
-                cache_key = generate_scan_cache_key(cache_config_dict, scan_date)
-                print(f"{Fore.CYAN}[INDEX] 缓存键生成: scan_date={scan_date}, cache_key={cache_key[:16]}...{Style.RESET_ALL}")
-                
-                # 检查缓存（如果启用了缓存）
-                db = get_stock_database()
-                cached_result = None
-                if config_request.use_scan_cache:
-                    cached_result = db.get_scan_cache(cache_key)
-                    if cached_result:
-                        print(f"{Fore.GREEN}[INDEX] 使用扫描结果缓存（use_scan_cache=True）{Style.RESET_ALL}")
+                # Run the scan
+                try:
+                    print(f"{Fore.CYAN}[INDEX] Starting scan_stocks with {len(stock_list)} stocks, scan_date={scan_date}{Style.RESET_ALL}")
+                    scan_result = scan_stocks(
+                        stock_list, scan_config, update_progress, end_date=scan_date, return_stats=True,
+                        profiler=profiler,
+                        on_platform_stock=lambda stock: task_manager.append_partial_result(
+                            task_id, summarize_platform_stock(stock)))
+                    if isinstance(scan_result, tuple):
+                        platform_stocks, scan_stats = scan_result
+                        total_scanned = scan_stats.get('total_scanned', len(stock_list))
+                        success_count = scan_stats.get('success_count', len(platform_stocks))
+                        # 特征表模式：保存筛选前平台股及其窗口特征、全部股票的快速检查特征，供后续调整阈值时复用
+                        if config_request.use_feature_table and 'platform_stocks' in scan_stats:
+                            try:
+                                save_feature_set(config_dict, scan_date, scan_stats['platform_stocks'],
+                                                 total_scanned=total_scanned, success_count=success_count,
+                                                 quick_features=scan_stats.get('quick_features'))
+                            except Exception as feature_error:
+                                print(f"{Fore.YELLOW}Warning: Failed to save feature table: {feature_error}{Style.RESET_ALL}")
                     else:
-                        print(f"{Fore.YELLOW}[INDEX] 缓存未命中，将执行新扫描（use_scan_cache=True）{Style.RESET_ALL}")
-                else:
-                    print(f"{Fore.CYAN}[INDEX] 跳过缓存检查，直接执行扫描（use_scan_cache=False）{Style.RESET_ALL}")
-                
-                if cached_result:
-                    cached_scan_date = cached_result.get('backtest_date', 'unknown')
-                    print(f"{Fore.GREEN}找到缓存结果: 请求日期={scan_date}, 缓存中的日期={cached_scan_date}, 扫描配置已缓存{Style.RESET_ALL}")
-                    if cached_scan_date != scan_date:
-                        print(f"{Fore.RED}[CACHE_WARNING] ⚠️ 缓存日期不匹配！请求日期={scan_date}, 缓存日期={cached_scan_date}{Style.RESET_ALL}")
-                    platform_stocks = cached_result['scanned_stocks']
-                    task_manager.update_task(
-                        task_id,
-                        progress=100,
-                        message=f"使用缓存结果，找到 {len(platform_stocks)} 只符合条件的股票"
-                    )
-                else:
-                    # 缓存未命中，执行扫描
-                    # Define progress update callback
-                    def update_progress(progress=None, message=None):
-                        if progress is not None and message is not None:
-                            # Scale progress to 30-100 range (30% for preparation, 70% for scanning)
-                            # When progress=100 from scan_stocks, scale to 100 (not 90)
-                            if progress >= 100:
-                                scaled_progress = 100  # Full completion
-                                # NOTE: Don't mark as COMPLETED here - wait until result is processed
-                                # This prevents result from being None when status is COMPLETED
-                                task_manager.update_task(
-                                    task_id, 
-                                    progress=scaled_progress, 
-                                    message=message
-                                )
-                            else:
-                                scaled_progress = 30 + int(progress * 0.7)  # Scale 0-100 to 30-100
-                                task_manager.update_task(
-                                    task_id, progress=scaled_progress, message=message)
+                        # Backward compatibility: if function doesn't return stats
+                        platform_stocks = scan_result
+                        total_scanned = len(stock_list)
+                        success_count = len(platform_stocks)  # 近似值
+                    print(f"{Fore.GREEN}[INDEX] ✓ scan_stocks completed successfully, returned {len(platform_stocks)} stocks{Style.RESET_ALL}")
+                    print(f"{Fore.CYAN}[INDEX] First few stocks: {[s.get('code', 'unknown') for s in platform_stocks[:5]]}{Style.RESET_ALL}")
+                    
+                    # 保存扫描结果到缓存（仅当结果不为空时）
+                    save_start = time.perf_counter()
+                    if platform_stocks and len(platform_stocks) > 0:
+                        try:
+                            db.save_scan_cache(cache_key, config_dict, scan_date, platform_stocks,
+                                              total_scanned=total_scanned, success_count=success_count)
+                            print(f"{Fore.GREEN}扫描结果已保存到缓存（{len(platform_stocks)}个股票），统计：{success_count}/{total_scanned}{Style.RESET_ALL}")
+                        except Exception as cache_error:
+                            print(f"{Fore.YELLOW}Warning: Failed to save scan cache: {cache_error}{Style.RESET_ALL}")
+                    else:
+                        # 即使结果为空，也保存统计信息
+                        try:
+                            db.save_scan_cache(cache_key, config_dict, scan_date, platform_stocks,
+                                              total_scanned=total_scanned, success_count=success_count)
+                            print(f"{Fore.YELLOW}扫描结果为空，但已保存统计信息：{success_count}/{total_scanned}{Style.RESET_ALL}")
+                        except Exception as cache_error:
+                            print(f"{Fore.YELLOW}Warning: Failed to save scan cache: {cache_error}{Style.RESET_ALL}")
+
+                    # 生成分阶段耗时报告，随任务状态返回并保存到扫描历史
+                    if profiler:
+                        profiler.record('serialize.scan_cache', time.perf_counter() - save_start)
+                        scan_profile = profiler.report()
+                        try:
+                            db.save_scan_profile(cache_key, scan_profile)
+                        except Exception as profile_error:
+                            print(f"{Fore.YELLOW}Warning: Failed to save scan profile: {profile_error}{Style.RESET_ALL}")
+                except Exception as scan_error:
+                    # Even if scan had errors, try to return partial results
+                    print(f"{Fore.RED}[INDEX] ✗ Scan encountered error: {scan_error}{Style.RESET_ALL}")
+                    import traceback
+                    traceback.print_exc()
+                    # Set empty list if scan completely failed
+                    platform_stocks = []
+                    print(f"{Fore.YELLOW}[INDEX] Continuing with empty platform_stocks list{Style.RESET_ALL}")
+
+            # CRITICAL FIX: Process results first, then mark as COMPLETED with result
+            # This ensures result is never null when status is COMPLETED
+            print(f"{Fore.CYAN}[INDEX] Starting to process {len(platform_stocks)} stocks into result format{Style.RESET_ALL}")
+            result_stocks = []
+            result_processing_error = None
+            processed_count = 0
+            failed_count = 0
+            
+            try:
+                # Process results for API response
+                for idx, stock in enumerate(platform_stocks):
+                    processed_count += 1
+                    stock_code = stock.get('code', 'unknown')
+                    stock_name = stock.get('name', 'unknown')
+                    
+                    # Convert kline_data to KlineDataPoint objects
+                    kline_data = []
+                    kline_data_points = stock.get('kline_data', [])
+                    
+                    if not kline_data_points:
+                        stock_logger.warning("[INDEX] Warning: Stock %s (%s) has no kline_data, skipping", stock_code, stock_name)
+                        failed_count += 1
+                        continue
+                    
+                    for point in kline_data_points:
+                        try:
+                            kline_point = {
+                                'date': str(point.get('date')),
+                                'open': float(point['open']) if point.get('open') is not None else None,
+                                'high': float(point['high']) if point.get('high') is not None else None,
+                                'low': float(point['low']) if point.get('low') is not None else None,
+                                'close': float(point['close']) if point.get('close') is not None else None,
+                                'volume': float(point['volume']) if point.get('volume') is not None else None,
+                                'turn': float(point['turn']) if point.get('turn') is not None else None,
+                                'preclose': float(point['preclose']) if point.get('preclose') is not None else None,
+                                'pctChg': float(point['pctChg']) if point.get('pctChg') is not None else None,
+                                'peTTM': float(point['peTTM']) if point.get('peTTM') is not None else None,
+                                'pbMRQ': float(point['pbMRQ']) if point.get('pbMRQ') is not None else None,
+                            }
+                            kline_data.append(KlineDataPoint(**kline_point))
+                        except Exception as e:
+                            print(
+                                f"{Fore.YELLOW}[INDEX] Warning: Failed to process K-line data point for {stock_code}: {e}{Style.RESET_ALL}")
+                            continue
 
-                    # Run the scan
+                    # Create StockScanResult object
                     try:
-                        print(f"{Fore.CYAN}[INDEX] Starting scan_stocks with {len(stock_list)} stocks, scan_date={scan_date}{Style.RESET_ALL}")
-                        scan_result = scan_stocks(
-                            stock_list, scan_config, update_progress, end_date=scan_date, return_stats=True)
-                        if isinstance(scan_result, tuple):
-                            platform_stocks, scan_stats = scan_result
-                            total_scanned = scan_stats.get('total_scanned', len(stock_list))
-                            success_count = scan_stats.get('success_count', len(platform_stocks))
-                        else:
-                            # Backward compatibility: if function doesn't return stats
-                            platform_stocks = scan_result
-                            total_scanned = len(stock_list)
-                            success_count = len(platform_stocks)  # 近似值
-                        print(f"{Fore.GREEN}[INDEX] ✓ scan_stocks completed successfully, returned {len(platform_stocks)} stocks{Style.RESET_ALL}")
-                        print(f"{Fore.CYAN}[INDEX] First few stocks: {[s.get('code', 'unknown') for s in platform_stocks[:5]]}{Style.RESET_ALL}")
+                        # 处理标记线数据
+                        mark_lines = []
+                        if 'mark_lines' in stock:
+                            for mark in stock['mark_lines']:
+                                try:
+                                    mark_lines.append(MarkLine(**mark))
+                                except Exception as e:
+                                    print(
+                                        f"{Fore.YELLOW}[INDEX] Warning: Failed to process mark line for {stock_code}: {e}{Style.RESET_ALL}")
+                                    continue
+
+                        # 转换字典键从整数到字符串（volume_analysis 和 turnover_analysis）
+                        def convert_dict_keys_to_str(d: dict) -> dict:
+                            """将字典的键从整数转换为字符串"""
+                            if not d or not isinstance(d, dict):
+                                return d
+                            return {str(k): v for k, v in d.items()}
                         
-                        # 保存扫描结果到缓存（仅当结果不为空时）
-                        if platform_stocks and len(platform_stocks) > 0:
-                            try:
-                                db.save_scan_cache(cache_key, config_dict, scan_date, platform_stocks,
-                                                  total_scanned=total_scanned, success_count=success_count)
-                                print(f"{Fore.GREEN}扫描结果已保存到缓存（{len(platform_stocks)}个股票），统计：{success_count}/{total_scanned}{Style.RESET_ALL}")
-                            except Exception as cache_error:
-                                print(f"{Fore.YELLOW}Warning: Failed to save scan cache: {cache_error}{Style.RESET_ALL}")
-                        else:
-                            # 即使结果为空，也保存统计信息
-                            try:
-                                db.save_scan_cache(cache_key, config_dict, scan_date, platform_stocks,
-                                                  total_scanned=total_scanned, success_count=success_count)
-                                print(f"{Fore.YELLOW}扫描结果为空，但已保存统计信息：{success_count}/{total_scanned}{Style.RESET_ALL}")
-                            except Exception as cache_error:
-                                print(f"{Fore.YELLOW}Warning: Failed to save scan cache: {cache_error}{Style.RESET_ALL}")
-                    except Exception as scan_error:
-                        # Even if scan had errors, try to return partial results
-                        print(f"{Fore.RED}[INDEX] ✗ Scan encountered error: {scan_error}{Style.RESET_ALL}")
+                        volume_analysis = stock.get('volume_analysis')
+                        turnover_analysis = stock.get('turnover_analysis')
+                        
+                        result_stock = StockScanResult(
+                            code=stock['code'],
+                            name=stock['name'],
+                            industry=stock.get('industry', '未知行业'),
+                            selection_reasons=stock.get(
+                                'selection_reasons', {}),
+                            kline_data=kline_data,
+                            mark_lines=mark_lines,
+                            outperform_index=stock.get('outperform_index'),
+                            stock_return=stock.get('stock_return'),
+                            market_return=stock.get('market_return'),
+                            volume_analysis=convert_dict_keys_to_str(volume_analysis),
+                            breakthrough_prediction=stock.get('breakthrough_prediction'),
+                            turnover_analysis=convert_dict_keys_to_str(turnover_analysis),
+                            box_analysis=stock.get('box_analysis'),
+                            weighted_score=stock.get('weighted_score'),
+                            weight_details=stock.get('weight_details')
+                        )
+                        result_stocks.append(result_stock)
+                        
+                        # Log progress every 10 stocks
+                        if len(result_stocks) % 10 == 0:
+                            print(f"{Fore.CYAN}[INDEX] Processed {len(result_stocks)}/{len(platform_stocks)} stocks successfully{Style.RESET_ALL}")
+                    except Exception as e:
+                        failed_count += 1
+                        print(
+                            f"{Fore.RED}[INDEX] Error creating StockScanResult for {stock_code} ({stock_name}): {e}{Style.RESET_ALL}")
                         import traceback
                         traceback.print_exc()
-                        # Set empty list if scan completely failed
-                        platform_stocks = []
-                        print(f"{Fore.YELLOW}[INDEX] Continuing with empty platform_stocks list{Style.RESET_ALL}")
-
-                # CRITICAL FIX: Process results first, then mark as COMPLETED with result
-                # This ensures result is never null when status is COMPLETED
-                print(f"{Fore.CYAN}[INDEX] Starting to process {len(platform_stocks)} stocks into result format{Style.RESET_ALL}")
-                result_stocks = []
-                result_processing_error = None
-                processed_count = 0
-                failed_count = 0
+                        continue
                 
-                try:
-                    # Process results for API response
-                    for idx, stock in enumerate(platform_stocks):
-                        processed_count += 1
-                        stock_code = stock.get('code', 'unknown')
-                        stock_name = stock.get('name', 'unknown')
-                        
-                        # Convert kline_data to KlineDataPoint objects
-                        kline_data = []
-                        kline_data_points = stock.get('kline_data', [])
-                        
-                        if not kline_data_points:
-                            print(f"{Fore.YELLOW}[INDEX] Warning: Stock {stock_code} ({stock_name}) has no kline_data, skipping{Style.RESET_ALL}")
-                            failed_count += 1
-                            continue
-                        
-                        for point in kline_data_points:
-                            try:
-                                kline_point = {
-                                    'date': str(point.get('date')),
-                                    'open': float(point['open']) if point.get('open') is not None else None,
-                                    'high': float(point['high']) if point.get('high') is not None else None,
-                                    'low': float(point['low']) if point.get('low') is not None else None,
-                                    'close': float(point['close']) if point.get('close') is not None else None,
-                                    'volume': float(point['volume']) if point.get('volume') is not None else None,
-                                    'turn': float(point['turn']) if point.get('turn') is not None else None,
-                                    'preclose': float(point['preclose']) if point.get('preclose') is not None else None,
-                                    'pctChg': float(point['pctChg']) if point.get('pctChg') is not None else None,
-                                    'peTTM': float(point['peTTM']) if point.get('peTTM') is not None else None,
-                                    'pbMRQ': float(point['pbMRQ']) if point.get('pbMRQ') is not None else None,
-                                }
-                                kline_data.append(KlineDataPoint(**kline_point))
-                            except Exception as e:
-                                print(
-                                    f"{Fore.YELLOW}[INDEX] Warning: Failed to process K-line data point for {stock_code}: {e}{Style.RESET_ALL}")
-                                continue
-
-                        # Create StockScanResult object
-                        try:
-                            # 处理标记线数据
-                            mark_lines = []
-                            if 'mark_lines' in stock:
-                                for mark in stock['mark_lines']:
-                                    try:
-                                        mark_lines.append(MarkLine(**mark))
-                                    except Exception as e:
-                                        print(
-                                            f"{Fore.YELLOW}[INDEX] Warning: Failed to process mark line for {stock_code}: {e}{Style.RESET_ALL}")
-                                        continue
-
-                            # 转换字典键从整数到字符串（volume_analysis 和 turnover_analysis）
-                            def convert_dict_keys_to_str(d: dict) -> dict:
-                                """将字典的键从整数转换为字符串"""
-                                if not d or not isinstance(d, dict):
-                                    return d
-                                return {str(k): v for k, v in d.items()}
-                            
-                            volume_analysis = stock.get('volume_analysis')
-                            turnover_analysis = stock.get('turnover_analysis')
-                            
-                            result_stock = StockScanResult(
-                                code=stock['code'],
-                                name=stock['name'],
-                                industry=stock.get('industry', '未知行业'),
-                                selection_reasons=stock.get(
-                                    'selection_reasons', {}),
-                                kline_data=kline_data,
-                                mark_lines=mark_lines,
-                                outperform_index=stock.get('outperform_index'),
-                                stock_return=stock.get('stock_return'),
-                                market_return=stock.get('market_return'),
-                                volume_analysis=convert_dict_keys_to_str(volume_analysis),
-                                breakthrough_prediction=stock.get('breakthrough_prediction'),
-                                turnover_analysis=convert_dict_keys_to_str(turnover_analysis),
-                                box_analysis=stock.get('box_analysis'),
-                                weighted_score=stock.get('weighted_score'),
-                                weight_details=stock.get('weight_details')
-                            )
-                            result_stocks.append(result_stock)
-                            
-                            # Log progress every 10 stocks
-                            if len(result_stocks) % 10 == 0:
-                                print(f"{Fore.CYAN}[INDEX] Processed {len(result_stocks)}/{len(platform_stocks)} stocks successfully{Style.RESET_ALL}")
-                        except Exception as e:
-                            failed_count += 1
-                            print(
-                                f"{Fore.RED}[INDEX] Error creating StockScanResult for {stock_code} ({stock_name}): {e}{Style.RESET_ALL}")
-                            import traceback
-                            traceback.print_exc()
-                            continue
-                    
-                    print(f"{Fore.GREEN}[INDEX] Result processing complete: {len(result_stocks)} successful, {failed_count} failed out of {len(platform_stocks)} total{Style.RESET_ALL}")
-                except Exception as e:
-                    # If result processing fails, log error but continue with empty result
-                    result_processing_error = str(e)
-                    print(f"{Fore.RED}Error processing results: {e}{Style.RESET_ALL}")
-                    import traceback
-                    traceback.print_exc()
-                    # result_stocks remains empty list, which is acceptable
-
-                # Get the current task to preserve the detailed message from scan_stocks
-                current_task = task_manager.get_task(task_id)
-                if current_task and current_task.message and "Processed" in current_task.message:
-                    # Use the detailed message from scan_stocks (contains processed count, errors, etc.)
-                    # But update it with actual result count
-                    base_message = current_task.message
-                    if len(result_stocks) != len(platform_stocks):
-                        completion_message = f"{base_message} (Filtered to {len(result_stocks)} stocks for display)"
-                    else:
-                        completion_message = base_message
+                print(f"{Fore.GREEN}[INDEX] Result processing complete: {len(result_stocks)} successful, {failed_count} failed out of {len(platform_stocks)} total{Style.RESET_ALL}")
+            except Exception as e:
+                # If result processing fails, log error but continue with empty result
+                result_processing_error = str(e)
+                print(f"{Fore.RED}Error processing results: {e}{Style.RESET_ALL}")
+                import traceback
+                traceback.print_exc()
+                # result_stocks remains empty list, which is acceptable
+
+            # Get the current task to preserve the detailed message from scan_stocks
+            current_task = task_manager.get_task(task_id)
+            if current_task and current_task.message and "Processed" in current_task.message:
+                # Use the detailed message from scan_stocks (contains processed count, errors, etc.)
+                # But update it with actual result count
+                base_message = current_task.message
+                if len(result_stocks) != len(platform_stocks):
+                    completion_message = f"{base_message} (Filtered to {len(result_stocks)} stocks for display)"
                 else:
-                    # Fallback to basic message if detailed message not available
-                    if len(result_stocks) == 0 and len(platform_stocks) == 0:
-                        completion_message = "Scan completed but no platform stocks found. Some stocks may have been skipped due to timeout."
-                    else:
-                        completion_message = f"Scan completed. Found {len(platform_stocks)} platform stocks, returning {len(result_stocks)} stocks."
-                
-                # Add error info to message if result processing had errors
-                if result_processing_error:
-                    completion_message += f" (Warning: Some results may be incomplete due to processing error: {result_processing_error})"
-                
-                # Mark as COMPLETED with result (never null - at least empty list)
-                # This ensures status=COMPLETED always has a valid result
-                result_data = [stock.model_dump() for stock in result_stocks]  # Always a list, never None
-                print(f"{Fore.CYAN}[INDEX] Preparing to update task with {len(result_data)} results (type: {type(result_data)}){Style.RESET_ALL}")
-                task_manager.update_task(
-                    task_id,
-                    status=TaskStatus.COMPLETED,
-                    progress=100,
-                    message=completion_message,
-                    result=result_data  # Always a list, never None
-                )
-                # Verify the result was set correctly
-                verify_task = task_manager.get_task(task_id)
-                if verify_task:
-                    print(f"{Fore.GREEN}Task {task_id} marked as COMPLETED with {len(result_data)} results. Verified: result is {type(verify_task.result)} (None: {verify_task.result is None}, length: {len(verify_task.result) if verify_task.result else 'N/A'}){Style.RESET_ALL}")
+                    completion_message = base_message
+            else:
+                # Fallback to basic message if detailed message not available
+                if len(result_stocks) == 0 and len(platform_stocks) == 0:
+                    completion_message = "Scan completed but no platform stocks found. Some stocks may have been skipped due to timeout."
                 else:
-                    print(f"{Fore.RED}ERROR: Task {task_id} not found after update!{Style.RESET_ALL}")
-
-        except Exception as e:
-            print(f"{Fore.RED}Error in scan task: {e}{Style.RESET_ALL}")
-            traceback.print_exc()
+                    completion_message = f"Scan completed. Found {len(platform_stocks)} platform stocks, returning {len(result_stocks)} stocks."
+            
+            # Add error info to message if result processing had errors
+            if result_processing_error:
+                completion_message += f" (Warning: Some results may be incomplete due to processing error: {result_processing_error})"
+            
+            # Mark as COMPLETED with result (never null - at least empty list)
+            # This ensures status=COMPLETED always has a valid result
+            result_data = [stock.model_dump() for stock in result_stocks]  # Always a list, never None
+            print(f"{Fore.CYAN}[INDEX] Preparing to update task with {len(result_data)} results (type: {type(result_data)}){Style.RESET_ALL}")
             task_manager.update_task(
                 task_id,
-                status=TaskStatus.FAILED,
-                error=f"Scan failed: {str(e)}\n{traceback.format_exc()}"
+                status=TaskStatus.COMPLETED,
+                progress=100,
+                message=completion_message,
+                result=result_data,  # Always a list, never None
+                profile=scan_profile
             )
+            # Verify the result was set correctly
+            verify_task = task_manager.get_task(task_id)
+            if verify_task:
+                print(f"{Fore.GREEN}Task {task_id} marked as COMPLETED with {len(result_data)} results. Verified: result is {type(verify_task.result)} (None: {verify_task.result is None}, length: {len(verify_task.result) if verify_task.result else 'N/A'}){Style.RESET_ALL}")
+            else:
+                print(f"{Fore.RED}ERROR: Task {task_id} not found after update!{Style.RESET_ALL}")
+
+    except Exception as e:
+        print(f"{Fore.RED}Error in scan task: {e}{Style.RESET_ALL}")
+        traceback.print_exc()
+        task_manager.update_task(
+            task_id,
+            status=TaskStatus.FAILED,
+            error=f"Scan failed: {str(e)}\n{traceback.format_exc()}"
+        )
+
 
-    # Start the task in the background
-    background_tasks.add_task(run_scan_task)
+def submit_scan_task(config_dict: Dict[str, Any]) -> Tuple[str, bool]:
+    """
+    Queue a scan, coalescing it onto a queued or running scan with the same
+    scan cache key (config and date).
+
+    Args:
+        config_dict: Scan configuration (a missing scan_date is set to today)
+
+    Returns:
+        Tuple of (task ID, True if an existing task was returned)
+    """
+    # 未指定扫描日期时在提交时确定，保证合并键与实际扫描日期一致
+    if not config_dict.get('scan_date'):
+        config_dict['scan_date'] = datetime.now().strftime('%Y-%m-%d')
+
+    # 按扫描缓存键合并进行中的请求：配置与日期相同的扫描仍在排队或运行时，
+    # 后来的调用方直接复用该任务的进度和结果，而不是重复扫描
+    cache_config_dict = {k: v for k, v in config_dict.items() if k != 'scan_date'}
+    cache_key = generate_scan_cache_key(cache_config_dict, config_dict['scan_date'])
+    return get_task_queue().submit('scan', config_dict, dedupe_key=cache_key)
+
+
+def run_post_close_task(task_id: str, payload: Dict[str, Any]) -> None:
+    """
+    Run the post-close task (task queue handler for kind 'post_close'):
+    append the day's bars for all codes, invalidate the caches built from
+    older data and queue the default-config scan to warm the scan cache.
+
+    Args:
+        task_id: Task ID
+        payload: Dict with date (YYYY-MM-DD)
+    """
+    trade_date = payload['date']
+    task_manager.update_task(task_id, progress=5, message=f"同步 {trade_date} 的K线数据")
+
+    def report(done: int, total: int) -> None:
+        task_manager.update_task(
+            task_id,
+            progress=5 + int(done / max(total, 1) * 80),
+            message=f"同步 {trade_date} 的K线数据: {done}/{total}"
+        )
+
+    summary = sync_kline_data(end_date=trade_date, progress=report)
+
+    if summary['rows'] == 0 and summary['up_to_date'] == 0 and summary['failed'] and not summary['empty']:
+        # 所有请求都失败：数据源不可用，不能当作非交易日处理
+        task_manager.update_task(
+            task_id,
+            status=TaskStatus.FAILED,
+            message=f"{trade_date} K线同步失败：{summary['failed']} 只股票请求失败，数据源可能不可用",
+            error=f"K-line sync failed for all {summary['failed']} requested codes"
+        )
+        return
+
+    if summary['rows'] == 0 and summary['up_to_date'] == 0:
+        # 没有任何股票有当日数据：非交易日（节假日）或数据源尚未发布
+        task_manager.update_task(
+            task_id,
+            status=TaskStatus.COMPLETED,
+            progress=100,
+            message=f"{trade_date} 无K线数据（非交易日或数据尚未发布），跳过缓存预热",
+            result=[]
+        )
+        return
+
+    # 只有写入了新数据才使缓存失效；重启后补跑时保留已预热的扫描结果
+    invalidated = invalidate_market_data_caches(trade_date) if summary['rows'] else {}
+    scan_task_id, _ = submit_scan_task(ScanConfigRequest(scan_date=trade_date).model_dump())
+    task_manager.update_task(
+        task_id,
+        status=TaskStatus.COMPLETED,
+        progress=100,
+        message=(f"{trade_date} 写入 {summary['rows']} 条K线（{summary['updated']} 只股票，"
+                 f"{summary['failed']} 只失败），清除扫描缓存 {invalidated.get('scan_cache', 0)} 条，"
+                 f"默认扫描任务 {scan_task_id}"),
+        result=[]
+    )
+
+
+# 任务队列处理函数（批量扫描的处理函数在 batch_scan_manager 中注册）
+get_task_queue().register_handler('fundamentals', run_fundamentals_refresh_task)
+get_task_queue().register_handler('scan', run_scan_task)
+get_task_queue().register_handler('post_close', run_post_close_task)
+
+
+@app.on_event("startup")
+def resume_task_queue():
+    """Resume queued tasks that were pending or running when the service stopped."""
+    get_task_queue().start()
+
+
+@app.on_event("startup")
+def start_market_close_scheduler():
+    """Start the scheduler that syncs the day's bars and warms caches after the close."""
+    if POST_CLOSE_SCHEDULER_ENABLED:
+        get_market_close_scheduler().start()
+
+
+@app.post("/api/scan/start", response_model=TaskCreationResponse)
+async def start_scan(config_request: ScanConfigRequest):
+    """
+    Start a stock platform scan as a queued background task.
+    Returns a task ID that can be used to check the status of the scan;
+    while a scan with the same scan cache key (config and date) is queued or
+    running, later requests are coalesced onto it and return its task ID.
+    """
+    # Initialize colorama for colored console output
+    colorama.init()
+
+    print(f"{Fore.CYAN}======================================{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}Starting stock platform scan task{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}======================================{Style.RESET_ALL}")
+
+    # Convert request to config dictionary
+    config_dict = config_request.model_dump()
+    print(f"{Fore.YELLOW}Scan configuration:{Style.RESET_ALL}")
+    for key, value in config_dict.items():
+        print(f"  - {key}: {Fore.GREEN}{value}{Style.RESET_ALL}")
+    
+    # 特别强调 scan_date 的值
+    if 'scan_date' in config_dict:
+        print(f"{Fore.MAGENTA}[DEBUG] scan_date in config_dict: {config_dict['scan_date']}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[DEBUG] ⚠️ scan_date NOT in config_dict!{Style.RESET_ALL}")
+
+    task_id, deduplicated = submit_scan_task(config_dict)
+    if deduplicated:
+        print(f"{Fore.GREEN}[INDEX] 相同扫描正在进行，合并到任务 {task_id}{Style.RESET_ALL}")
+        return TaskCreationResponse(
+            task_id=task_id,
+            message="An identical scan is already in progress. Use the task ID to check status."
+        )
 
     # Return task ID
     return TaskCreationResponse(
@@ -735,17 +1087,161 @@ async def start_scan(config_request: ScanConfigRequest, background_tasks: Backgr
     )
 
 
+def load_finished_task(task_id: str, include_kline: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Load a finished task from the task queue table, shaped like Task.to_dict().
+
+    Args:
+        task_id: Task ID
+        include_kline: Whether to rehydrate kline_data of result stocks
+
+    Returns:
+        Task dictionary, or None if the task is unknown or still unfinished
+    """
+    try:
+        record = get_stock_database().get_finished_queued_task(task_id, include_kline=include_kline)
+    except Exception as e:
+        print(f"{Fore.YELLOW}[INDEX] Failed to load task {task_id} from task queue: {e}{Style.RESET_ALL}")
+        return None
+    if record is None:
+        return None
+
+    def to_timestamp(value: Optional[str]) -> Optional[float]:
+        # SQLite CURRENT_TIMESTAMP 为 UTC 时间字符串
+        if not value:
+            return None
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+    created_at = to_timestamp(record['created_at'])
+    completed_at = to_timestamp(record['finished_at'])
+    return {
+        "task_id": record['task_id'],
+        "status": record['status'],
+        "progress": 100 if record['status'] == 'completed' else 0,
+        "message": record['message'] or '',
+        "result": record['result'],
+        "error": record['error'],
+        "created_at": created_at,
+        "updated_at": completed_at or created_at,
+        "completed_at": completed_at,
+        "profile": None
+    }
+
+
 @app.get("/api/scan/status/{task_id}", response_model=TaskStatusResponse)
-async def get_scan_status(task_id: str):
+async def get_scan_status(task_id: str, include_kline: bool = False):
     """
     Get the status of a scan task.
+
+    By default the result list is a summary without kline_data; K-lines can be
+    loaded via /api/kline/batch or by passing include_kline=true.
     """
     task = task_manager.get_task(task_id)
-    if not task:
+    if task:
+        task_dict = task.to_dict()
+    else:
+        # 内存中没有（如服务已重启）时，读取任务队列中保存的结果
+        task_dict = load_finished_task(task_id, include_kline)
+        if task_dict is None:
+            raise HTTPException(
+                status_code=404, detail=f"Task with ID {task_id} not found")
+
+    if not include_kline and task_dict.get('result'):
+        task_dict['result'] = strip_kline_data(task_dict['result'])
+    # 直接返回响应，NumPy 类型与 NaN 由 FastJSONResponse 一次性处理
+    return FastJSONResponse(content=task_dict)
+
+
+@app.get("/api/scan/stream/{task_id}")
+async def stream_scan(task_id: str, include_kline: bool = False):
+    """
+    Stream a scan task with Server-Sent Events.
+
+    Events (JSON in the data field, distinguished by type):
+      - progress: progress and message whenever they change
+      - stock: a platform stock as soon as the scan finds it (summary with
+        kline_ref; provisional, fundamental/industry filters and sorting are
+        applied to the final result only)
+      - result: the final result list, as returned by /api/scan/status
+      - error: the task failed or does not exist
+    """
+    if not task_manager.get_task(task_id):
         raise HTTPException(
             status_code=404, detail=f"Task with ID {task_id} not found")
 
-    return task.to_dict()
+    async def generate():
+        sent_stocks = 0
+        last_progress = None
+        while True:
+            task = task_manager.get_task(task_id)
+            if not task:
+                error_data = {'type': 'error', 'message': f"Task with ID {task_id} not found"}
+                yield sse_data(error_data)
+                return
+
+            # 先发送新发现的平台股，再发送进度，保证进度中的数量不超前于已推送的股票
+            for stock in task_manager.get_partial_results(task_id, sent_stocks):
+                sent_stocks += 1
+                yield sse_data({'type': 'stock', 'data': stock})
+
+            progress = (task.status.value, task.progress, task.message)
+            if progress != last_progress:
+                last_progress = progress
+                update = {'type': 'progress', 'status': task.status.value,
+                          'progress': task.progress, 'message': task.message}
+                yield sse_data(update)
+
+            if task.status == TaskStatus.FAILED:
+                error_data = {'type': 'error', 'message': task.error or task.message}
+                yield sse_data(error_data)
+                return
+            if task.status == TaskStatus.COMPLETED:
+                result = task.result or []
+                if not include_kline:
+                    result = strip_kline_data(result)
+                yield sse_data({'type': 'result', 'data': result})
+                return
+
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.post("/api/kline/batch")
+async def get_kline_batch(request: KlineBatchRequest):
+    """
+    批量获取多只股票指定日期范围的K线数据（直接从数据库读取）
+    """
+    if len(request.items) > MAX_KLINE_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多请求 {MAX_KLINE_BATCH_ITEMS} 个K线范围"
+        )
+    try:
+        from api.stock_database import get_stock_database
+        db = get_stock_database()
+        results = db.get_kline_data_batch([item.model_dump() for item in request.items])
+        return FastJSONResponse(content={
+            "success": True,
+            "data": results,
+            "count": len(results)
+        })
+    except Exception as e:
+        print(f"{Fore.RED}批量获取K线数据失败: {e}{Style.RESET_ALL}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"批量获取K线数据失败: {str(e)}"
+        )
 
 # Legacy endpoint for backward compatibility
 
@@ -818,18 +1314,8 @@ async def run_scan(config_request: ScanConfigRequest):
         
         # Fetch stock basics
         with BaostockConnectionManager():
-            stock_basics_df = fetch_stock_basics(use_local_database_first=use_db_first)
-
-            # Fetch industry data
-            try:
-                industry_df = fetch_industry_data(use_local_database_first=use_db_first)
-            except Exception as e:
-                print(
-                    f"{Fore.YELLOW}Warning: Failed to fetch industry data: {e}{Style.RESET_ALL}")
-                industry_df = pd.DataFrame()
-
-            # Prepare stock list
-            stock_list = prepare_stock_list(stock_basics_df, industry_df)
+            # Prepare stock list from the shared security master (basics + industry)
+            stock_list = get_security_master().get_stock_list(use_local_database_first=use_db_first)
             
             # 如果设置了最大股票数量限制，则限制股票列表
             original_stock_count = len(stock_list)
@@ -1051,10 +1537,15 @@ class PlatformCheckResponse(BaseModel):
 
 
 @app.post("/api/platform/check", response_model=PlatformCheckResponse)
-async def check_platform(request: PlatformCheckRequest):
+def check_platform(request: PlatformCheckRequest):
     """
     Check if a single stock is in a platform period, has breakthrough signals, and confirmed breakthrough.
     Returns detailed analysis with explanations.
+
+    Fast path for interactive use: the name comes from the security master
+    index, K-lines are read from the local database when it covers the range,
+    Baostock is only logged into when data is actually missing, and repeated
+    checks of unchanged data are answered from an in-memory cache.
     """
     try:
         code = request.code.strip()
@@ -1066,174 +1557,172 @@ async def check_platform(request: PlatformCheckRequest):
                 detail="Invalid stock code format. Expected format: 'sh.600000' or 'sz.000001'"
             )
         
-        # Fetch stock basic information to get name
-        with BaostockConnectionManager():
-            stock_basics_df = fetch_stock_basics()
-            stock_info = stock_basics_df[stock_basics_df['code'] == code]
-            
-            if stock_info.empty:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Stock code {code} not found"
-                )
-            
-            # Support both 'code_name' (from API) and 'name' (from database)
-            stock_name = stock_info.iloc[0].get('code_name') or stock_info.iloc[0].get('name', '')
-            
-            # Calculate date range (use comprehensive windows for single stock check)
-            # Include common windows: 30, 60, 90, 80, 100, 120 to match scan results
-            comprehensive_windows = sorted(list(set([30, 60, 90, 80, 100, 120])))
-            max_window = max(comprehensive_windows)
-            # Use query_date if provided, otherwise use today
-            if request.query_date:
-                try:
-                    end_date = datetime.strptime(request.query_date, '%Y-%m-%d').strftime('%Y-%m-%d')
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Invalid query_date format. Expected format: 'YYYY-MM-DD'"
-                    )
-            else:
-                end_date = datetime.now().strftime('%Y-%m-%d')
-            # Calculate start_date based on end_date
-            # Ensure minimum data range for proper analysis (minimum 180 days)
-            end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-            min_data_days = max(max_window * 2, 180)
-            start_date = (end_datetime - timedelta(days=min_data_days)).strftime('%Y-%m-%d')
-            
-            # Fetch K-line data
-            df = fetch_kline_data(code, start_date, end_date)
-            
-            if df.empty:
+        # Use query_date if provided, otherwise use today
+        if request.query_date:
+            try:
+                end_date = datetime.strptime(request.query_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
                 raise HTTPException(
-                    status_code=404,
-                    detail=f"No K-line data available for {code}"
+                    status_code=400,
+                    detail="Invalid query_date format. Expected format: 'YYYY-MM-DD'"
                 )
-            
-            # Prepare analysis config (use comprehensive windows for single stock check)
-            analysis_config = {
-                'windows': comprehensive_windows,
-                'box_threshold': DEFAULT_BOX_THRESHOLD,
-                'ma_diff_threshold': DEFAULT_MA_DIFF_THRESHOLD,
-                'volatility_threshold': DEFAULT_VOLATILITY_THRESHOLD,
-                'volume_change_threshold': DEFAULT_VOLUME_CHANGE_THRESHOLD,
-                'volume_stability_threshold': DEFAULT_VOLUME_STABILITY_THRESHOLD,
-                'volume_increase_threshold': DEFAULT_VOLUME_INCREASE_THRESHOLD,
-                'use_volume_analysis': DEFAULT_USE_VOLUME_ANALYSIS,
-                'use_breakthrough_prediction': True,  # Always enable for single stock check
-                'use_breakthrough_confirmation': True,  # Always enable for single stock check
-                'breakthrough_confirmation_days': DEFAULT_BREAKTHROUGH_CONFIRMATION_DAYS,
-                'use_low_position': DEFAULT_USE_LOW_POSITION,
-                'high_point_lookback_days': DEFAULT_HIGH_POINT_LOOKBACK_DAYS,
-                'decline_period_days': DEFAULT_DECLINE_PERIOD_DAYS,
-                'decline_threshold': DEFAULT_DECLINE_THRESHOLD,
-                'use_rapid_decline_detection': DEFAULT_USE_RAPID_DECLINE_DETECTION,
-                'rapid_decline_days': DEFAULT_RAPID_DECLINE_DAYS,
-                'rapid_decline_threshold': DEFAULT_RAPID_DECLINE_THRESHOLD,
-                'use_box_detection': DEFAULT_USE_BOX_DETECTION,
-                'box_quality_threshold': DEFAULT_BOX_QUALITY_THRESHOLD,
-                'use_window_weights': False,  # Not needed for single stock check
+        else:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+        
+        # 同一股票、同一日期且K线未变化时直接复用上次的检查结果：
+        # 先按 (代码, 日期) 和有效期查找，再用覆盖索引的版本戳校验，命中时不读取K线
+        check_cache = get_platform_check_cache()
+        db = get_stock_database()
+        kline_stamp = db.get_kline_coverage_stamp(code)
+        if kline_stamp is not None:
+            cached_response = check_cache.get(code, end_date, kline_stamp)
+            if cached_response is not None:
+                return cached_response
+        
+        # Look up the stock name in the shared security master index
+        stock_info = get_security_master().get(code)
+        if stock_info is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Stock code {code} not found"
+            )
+        stock_name = stock_info['name']
+        
+        # Calculate start_date based on end_date
+        # Ensure minimum data range for proper analysis (minimum 180 days)
+        end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
+        min_data_days = max(max(PLATFORM_CHECK_WINDOWS) * 2, 180)
+        start_date = (end_datetime - timedelta(days=min_data_days)).strftime('%Y-%m-%d')
+        
+        # Fetch K-line data (database only when it covers the range; missing
+        # ranges log into Baostock on demand)
+        df = fetch_kline_data(code, start_date, end_date, use_local_database_first=True)
+        
+        if df.empty:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No K-line data available for {code}"
+            )
+        
+        # Prepare analysis config (use comprehensive windows for single stock check)
+        analysis_config = {
+            'windows': PLATFORM_CHECK_WINDOWS,
+            'box_threshold': DEFAULT_BOX_THRESHOLD,
+            'ma_diff_threshold': DEFAULT_MA_DIFF_THRESHOLD,
+            'volatility_threshold': DEFAULT_VOLATILITY_THRESHOLD,
+            'volume_change_threshold': DEFAULT_VOLUME_CHANGE_THRESHOLD,
+            'volume_stability_threshold': DEFAULT_VOLUME_STABILITY_THRESHOLD,
+            'volume_increase_threshold': DEFAULT_VOLUME_INCREASE_THRESHOLD,
+            'use_volume_analysis': DEFAULT_USE_VOLUME_ANALYSIS,
+            'use_breakthrough_prediction': True,  # Always enable for single stock check
+            'use_breakthrough_confirmation': True,  # Always enable for single stock check
+            'breakthrough_confirmation_days': DEFAULT_BREAKTHROUGH_CONFIRMATION_DAYS,
+            'use_low_position': DEFAULT_USE_LOW_POSITION,
+            'high_point_lookback_days': DEFAULT_HIGH_POINT_LOOKBACK_DAYS,
+            'decline_period_days': DEFAULT_DECLINE_PERIOD_DAYS,
+            'decline_threshold': DEFAULT_DECLINE_THRESHOLD,
+            'use_rapid_decline_detection': DEFAULT_USE_RAPID_DECLINE_DETECTION,
+            'rapid_decline_days': DEFAULT_RAPID_DECLINE_DAYS,
+            'rapid_decline_threshold': DEFAULT_RAPID_DECLINE_THRESHOLD,
+            'use_box_detection': DEFAULT_USE_BOX_DETECTION,
+            'box_quality_threshold': DEFAULT_BOX_QUALITY_THRESHOLD,
+            'use_window_weights': False,  # Not needed for single stock check
+        }
+        
+        # Perform comprehensive analysis
+        analysis_result = analyze_stock(df, **analysis_config)
+        
+        # Extract results and convert NumPy types to Python native types
+        is_platform = convert_numpy_types(analysis_result.get('is_platform', False))
+        platform_windows = convert_numpy_types(analysis_result.get('platform_windows', []))
+        
+        # Check for breakthrough signals
+        breakthrough_prediction = convert_numpy_types(analysis_result.get('breakthrough_prediction', {}))
+        has_breakthrough_signal = convert_numpy_types(breakthrough_prediction.get('has_breakthrough_signal', False))
+        
+        # Check for breakthrough confirmation
+        has_breakthrough_confirmation = convert_numpy_types(analysis_result.get('has_breakthrough_confirmation', False))
+        has_breakthrough = convert_numpy_types(analysis_result.get('has_breakthrough', False))
+        
+        # Build explanation (convert NumPy types in nested structures)
+        explanation = convert_numpy_types({
+            'platform_status': '是平台期' if is_platform else '不是平台期',
+            'platform_windows': platform_windows,
+            'breakthrough_signal': {
+                'has_signal': has_breakthrough_signal,
+                'signal_count': breakthrough_prediction.get('signal_count', 0),
+                'signals': breakthrough_prediction.get('signals', {}),
+                'details': breakthrough_prediction.get('details', {})
+            },
+            'breakthrough_confirmation': {
+                'has_breakthrough': has_breakthrough,
+                'has_confirmation': has_breakthrough_confirmation,
+                'details': analysis_result.get('breakthrough_confirmation_details', {})
+            },
+            'analysis_details': {
+                'windows_checked': analysis_result.get('windows_checked', []),
+                'details': analysis_result.get('details', {}),
+                'selection_reasons': analysis_result.get('selection_reasons', {})
             }
-            
-            # Perform comprehensive analysis
-            analysis_result = analyze_stock(df, **analysis_config)
-            
-            # Extract results and convert NumPy types to Python native types
-            is_platform = convert_numpy_types(analysis_result.get('is_platform', False))
-            platform_windows = convert_numpy_types(analysis_result.get('platform_windows', []))
-            
-            # Check for breakthrough signals
-            breakthrough_prediction = convert_numpy_types(analysis_result.get('breakthrough_prediction', {}))
-            has_breakthrough_signal = convert_numpy_types(breakthrough_prediction.get('has_breakthrough_signal', False))
-            
-            # Check for breakthrough confirmation
-            has_breakthrough_confirmation = convert_numpy_types(analysis_result.get('has_breakthrough_confirmation', False))
-            has_breakthrough = convert_numpy_types(analysis_result.get('has_breakthrough', False))
-            
-            # Build explanation (convert NumPy types in nested structures)
-            explanation = convert_numpy_types({
-                'platform_status': '是平台期' if is_platform else '不是平台期',
-                'platform_windows': platform_windows,
-                'breakthrough_signal': {
-                    'has_signal': has_breakthrough_signal,
-                    'signal_count': breakthrough_prediction.get('signal_count', 0),
-                    'signals': breakthrough_prediction.get('signals', {}),
-                    'details': breakthrough_prediction.get('details', {})
-                },
-                'breakthrough_confirmation': {
-                    'has_breakthrough': has_breakthrough,
-                    'has_confirmation': has_breakthrough_confirmation,
-                    'details': analysis_result.get('breakthrough_confirmation_details', {})
-                },
-                'analysis_details': {
-                    'windows_checked': analysis_result.get('windows_checked', []),
-                    'details': analysis_result.get('details', {}),
-                    'selection_reasons': analysis_result.get('selection_reasons', {})
-                }
-            })
-            
-            # Convert K-line data to response format
-            kline_data = []
-            for _, row in df.iterrows():
-                kline_point = {
-                    'date': str(row.get('date', '')),
-                    'open': float(row['open']) if pd.notna(row.get('open')) else None,
-                    'high': float(row['high']) if pd.notna(row.get('high')) else None,
-                    'low': float(row['low']) if pd.notna(row.get('low')) else None,
-                    'close': float(row['close']) if pd.notna(row.get('close')) else None,
-                    'volume': float(row['volume']) if pd.notna(row.get('volume')) else None,
-                    'turn': float(row['turn']) if pd.notna(row.get('turn')) else None,
-                    'preclose': float(row['preclose']) if pd.notna(row.get('preclose')) else None,
-                    'pctChg': float(row['pctChg']) if pd.notna(row.get('pctChg')) else None,
-                    'peTTM': float(row['peTTM']) if pd.notna(row.get('peTTM')) else None,
-                    'pbMRQ': float(row['pbMRQ']) if pd.notna(row.get('pbMRQ')) else None,
-                }
-                kline_data.append(KlineDataPoint(**kline_point))
-            
-            # Get mark lines from analysis result
-            mark_lines = []
-            if 'mark_lines' in analysis_result:
-                for mark in analysis_result['mark_lines']:
-                    try:
-                        mark_lines.append(MarkLine(**mark))
-                    except Exception as e:
-                        print(f"Warning: Failed to process mark line: {e}")
-                        continue
-            
-            # Get fundamental analysis data
+        })
+        
+        # Convert K-line data to response format
+        kline_columns = ['open', 'high', 'low', 'close', 'volume', 'turn',
+                         'preclose', 'pctChg', 'peTTM', 'pbMRQ']
+        kline_frame = df.reindex(columns=kline_columns).apply(pd.to_numeric, errors='coerce')
+        kline_frame = kline_frame.astype(object).where(kline_frame.notna(), None)
+        kline_frame.insert(0, 'date', df['date'].astype(str) if 'date' in df.columns else '')
+        kline_data = [KlineDataPoint(**point) for point in kline_frame.to_dict(orient='records')]
+        
+        # Get mark lines from analysis result
+        mark_lines = []
+        if 'mark_lines' in analysis_result:
+            for mark in analysis_result['mark_lines']:
+                try:
+                    mark_lines.append(MarkLine(**mark))
+                except Exception as e:
+                    print(f"Warning: Failed to process mark line: {e}")
+                    continue
+        
+        # Get fundamental analysis data
+        fundamental_analysis = None
+        try:
+            fundamental_data = get_stock_fundamentals(code, years_to_check=3)
+            if fundamental_data:
+                # Convert NumPy types and format the data
+                fundamental_analysis = convert_numpy_types({
+                    'avg_revenue_growth': fundamental_data.get('avg_revenue_growth'),
+                    'revenue_growth_consistent': fundamental_data.get('revenue_growth_consistent', False),
+                    'avg_profit_growth': fundamental_data.get('avg_profit_growth'),
+                    'profit_growth_consistent': fundamental_data.get('profit_growth_consistent', False),
+                    'avg_roe': fundamental_data.get('avg_roe'),
+                    'roe_consistent': fundamental_data.get('roe_consistent', False),
+                    'avg_liability_ratio': fundamental_data.get('avg_liability_ratio'),
+                    'liability_ratio_consistent': fundamental_data.get('liability_ratio_consistent', False),
+                    'pe_ttm': fundamental_data.get('pe_ttm'),
+                    'pb_mrq': fundamental_data.get('pb_mrq')
+                })
+        except Exception as e:
+            print(f"Warning: Failed to get fundamental analysis for {code}: {e}")
             fundamental_analysis = None
-            try:
-                fundamental_data = get_stock_fundamentals(code, years_to_check=3)
-                if fundamental_data:
-                    # Convert NumPy types and format the data
-                    fundamental_analysis = convert_numpy_types({
-                        'avg_revenue_growth': fundamental_data.get('avg_revenue_growth'),
-                        'revenue_growth_consistent': fundamental_data.get('revenue_growth_consistent', False),
-                        'avg_profit_growth': fundamental_data.get('avg_profit_growth'),
-                        'profit_growth_consistent': fundamental_data.get('profit_growth_consistent', False),
-                        'avg_roe': fundamental_data.get('avg_roe'),
-                        'roe_consistent': fundamental_data.get('roe_consistent', False),
-                        'avg_liability_ratio': fundamental_data.get('avg_liability_ratio'),
-                        'liability_ratio_consistent': fundamental_data.get('liability_ratio_consistent', False),
-                        'pe_ttm': fundamental_data.get('pe_ttm'),
-                        'pb_mrq': fundamental_data.get('pb_mrq')
-                    })
-            except Exception as e:
-                print(f"Warning: Failed to get fundamental analysis for {code}: {e}")
-                fundamental_analysis = None
-            
-            return PlatformCheckResponse(
-                code=code,
-                name=stock_name,
-                is_platform=is_platform,
-                has_breakthrough_signal=has_breakthrough_signal,
-                has_breakthrough_confirmation=has_breakthrough_confirmation,
-                platform_windows=platform_windows,
-                explanation=explanation,
-                kline_data=kline_data,
-                mark_lines=mark_lines if mark_lines else None,
-                fundamental_analysis=fundamental_analysis
-            )
+        
+        response = PlatformCheckResponse(
+            code=code,
+            name=stock_name,
+            is_platform=is_platform,
+            has_breakthrough_signal=has_breakthrough_signal,
+            has_breakthrough_confirmation=has_breakthrough_confirmation,
+            platform_windows=platform_windows,
+            explanation=explanation,
+            kline_data=kline_data,
+            mark_lines=mark_lines if mark_lines else None,
+            fundamental_analysis=fundamental_analysis
+        )
+        
+        # 获取K线期间若写入了新数据（版本戳变化），本次不缓存，下次请求再缓存
+        if kline_stamp is not None and db.get_kline_coverage_stamp(code) == kline_stamp:
+            check_cache.put(code, end_date, kline_stamp, response)
+        return response
             
     except HTTPException:
         raise
@@ -1245,6 +1734,9 @@ async def check_platform(request: PlatformCheckRequest):
             status_code=500,
             detail=f"Error analyzing stock: {str(e)}"
         )
+    finally:
+        # 只有实际缺数据时才会登录 Baostock；请求结束后释放本线程的连接
+        baostock_logout()
 
 # 注意：我们已经有了根端点 (/), 不需要额外的 /api 端点
 
@@ -1431,21 +1923,8 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
     filtered_indices = 0
     filtered_inactive = 0
     
-    # 获取股票基本信息用于类型检查
-    db = get_stock_database()
-    stock_basics_df = db.get_stock_basics()
-    stock_type_map = {}
-    stock_status_map = {}
-    
-    if stock_basics_df is not None and not stock_basics_df.empty:
-        # 数据库返回的列名可能是 'code_name' 而不是 'name'
-        for _, row in stock_basics_df.iterrows():
-            code = row['code']
-            # 尝试多种可能的列名
-            stock_type = row.get('type', row.get('stock_type', '1'))
-            stock_status = row.get('status', row.get('stock_status', '1'))
-            stock_type_map[code] = str(stock_type)  # 确保是字符串类型
-            stock_status_map[code] = str(stock_status)  # 确保是字符串类型
+    # 获取股票基本信息用于类型检查（共享的证券主数据索引）
+    security_master = get_security_master()
     
     for stock in request.selected_stocks:
         code = stock.get('code', '')
@@ -1453,24 +1932,20 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
             continue
         
         # 优先使用数据库中的类型，如果没有则使用股票对象中的类型，最后默认为'1'（普通股票）
-        stock_type = stock_type_map.get(code)
-        if stock_type is None:
-            stock_type = str(stock.get('type', '1'))
-        
-        stock_status = stock_status_map.get(code)
-        if stock_status is None:
-            stock_status = str(stock.get('status', '1'))
+        security = security_master.get(code)
+        stock_type = security['type'] if security else str(stock.get('type', '1'))
+        stock_status = security['status'] if security else str(stock.get('status', '1'))
         
         # 跳过指数代码（type=2）
         if stock_type == '2' or stock_type == 2:
             filtered_indices += 1
-            print(f"{Fore.YELLOW}跳过指数代码: {code} ({stock.get('name', '')}){Style.RESET_ALL}")
+            stock_logger.debug("跳过指数代码: %s (%s)", code, stock.get('name', ''))
             continue
         
         # 跳过非活跃股票（status=0）
         if stock_status == '0' or stock_status == 0:
             filtered_inactive += 1
-            print(f"{Fore.YELLOW}跳过非活跃股票: {code} ({stock.get('name', '')}){Style.RESET_ALL}")
+            stock_logger.debug("跳过非活跃股票: %s (%s)", code, stock.get('name', ''))
             continue
         
         # 添加到有效股票列表
@@ -1485,7 +1960,7 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
     # 让后续的K线数据获取来决定是否真的没有可用股票
     if len(valid_stocks) == 0 and len(request.selected_stocks) > 0:
         print(f"{Fore.RED}警告: 所有股票都被过滤掉了！原始股票数: {len(request.selected_stocks)}, 过滤后: {len(valid_stocks)}{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}调试信息: 数据库中有 {len(stock_type_map)} 只股票的类型信息{Style.RESET_ALL}")
+        print(f"{Fore.CYAN}调试信息: 证券主数据索引版本 {security_master.version}{Style.RESET_ALL}")
         # 如果所有股票都被过滤，尝试使用原始列表（可能是数据库信息不完整）
         valid_stocks = request.selected_stocks
         print(f"{Fore.YELLOW}使用原始股票列表继续回测（可能包含指数代码或非活跃股票）{Style.RESET_ALL}")
@@ -1523,7 +1998,7 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
                 kline_df = fetch_kline_data(code, start_date, end_date)
             
             if kline_df.empty:
-                print(f"{Fore.YELLOW}Warning: {code} ({name}) 在 {start_date} 到 {end_date} 期间无数据，跳过{Style.RESET_ALL}")
+                stock_logger.info("Warning: %s (%s) 在 %s 到 %s 期间无数据，跳过", code, name, start_date, end_date)
                 continue
             
             # 确保数据按日期排序
@@ -1567,11 +2042,11 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
                     kline_data_points.append(kline_point)
                 kline_data_dict[code] = kline_data_points
             except Exception as e:
-                print(f"{Fore.YELLOW}Warning: 收集股票 {code} 的K线数据失败: {e}{Style.RESET_ALL}")
+                stock_logger.warning("Warning: 收集股票 %s 的K线数据失败: %s", code, e)
                 import traceback
                 traceback.print_exc()
         except Exception as e:
-            print(f"{Fore.YELLOW}Warning: 获取股票 {code} 的K线数据失败: {e}{Style.RESET_ALL}")
+            stock_logger.warning("Warning: 获取股票 %s 的K线数据失败: %s", code, e)
             continue
     
     print(f"{Fore.GREEN}成功获取 {len(stock_kline_map)} 只股票的K线数据{Style.RESET_ALL}")
@@ -2099,7 +2574,7 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
                 break
         
         kline_data_result[code] = filtered_points
-        print(f"{Fore.CYAN}股票 {code}: 买入日={buy_date}, 卖出日={sell_date}, K线数据点数={len(filtered_points)}/{len(kline_points)}{Style.RESET_ALL}")
+        stock_logger.debug("股票 %s: 买入日=%s, 卖出日=%s, K线数据点数=%s/%s", code, buy_date, sell_date, len(filtered_points), len(kline_points))
     
     response = BacktestResponse(
         summary=BacktestSummary(
@@ -2122,18 +2597,25 @@ def run_backtest_with_progress(request: BacktestRequest, progress_callback=None)
     return response
 
 
+def run_backtest_in_slot(request: BacktestRequest):
+    """
+    在任务队列的 backtest 槽位中执行回测（阻塞，需在工作线程中调用）
+    与扫描等后台任务共用任务队列的并发上限，交互式回测优先级最高
+    """
+    with get_task_queue().slot('backtest'):
+        return run_backtest_with_progress(request, progress_callback=None)
+
+
 @app.post("/api/backtest")
 async def run_backtest(request: BacktestRequest):
     """
     执行回测（同步版本，不支持进度推送）
     """
     try:
-        result = run_backtest_with_progress(request, progress_callback=None)
+        result = await asyncio.to_thread(run_backtest_in_slot, request)
         # 转换为字典并清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        result_dict = result.model_dump()
-        sanitized_dict = sanitize_float_for_json(result_dict)
-        # 直接返回清理后的字典，避免 Pydantic 验证 None 值的问题
-        return JSONResponse(content=sanitized_dict)
+        # 直接返回字典，避免 Pydantic 验证 None 值的问题；inf/nan 由 FastJSONResponse 转为 null
+        return FastJSONResponse(content=result.model_dump())
     except HTTPException:
         raise
     except Exception as e:
@@ -2169,7 +2651,11 @@ async def run_backtest_stream(request: BacktestRequest):
     
     def run_backtest_task():
         try:
-            result = run_backtest_with_progress(request, progress_callback=progress_callback)
+            # 占用任务队列的回测名额；需要等待时先推送排队进度
+            with get_task_queue().slot(
+                    'backtest',
+                    on_wait=lambda ahead: progress_callback(0, f"排队等待中，前面还有 {ahead} 个任务")):
+                result = run_backtest_with_progress(request, progress_callback=progress_callback)
             result_container['result'] = result
             progress_queue.put({'type': 'done'})  # 标记完成
         except Exception as e:
@@ -2193,7 +2679,7 @@ async def run_backtest_stream(request: BacktestRequest):
                                 break
                             
                             # 发送进度更新
-                            yield f"data: {json.dumps(update, ensure_ascii=False)}\n\n"
+                            yield sse_data(update)
                         except queue.Empty:
                             # 队列为空，检查任务是否完成
                             if future.done():
@@ -2212,14 +2698,12 @@ async def run_backtest_stream(request: BacktestRequest):
                     'type': 'error',
                     'message': result_container['error']
                 }
-                yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+                yield sse_data(error_data)
             else:
                 result = result_container['result']
+                # 无效的浮点值（inf, -inf, nan）在保存和推送时由 dumps_json 转为 null
                 result_dict = result.model_dump()
                 
-                # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-                result_dict = sanitize_float_for_json(result_dict)
-                
                 # 自动保存回测历史
                 try:
                     config_dict = {
@@ -2246,14 +2730,14 @@ async def run_backtest_stream(request: BacktestRequest):
                     'type': 'result',
                     'data': result_dict
                 }
-                yield f"data: {json.dumps(result_data, ensure_ascii=False, default=str)}\n\n"
+                yield sse_data(result_data)
                 
         except Exception as e:
             error_data = {
                 'type': 'error',
                 'message': str(e)
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield sse_data(error_data)
     
     return StreamingResponse(
         generate(),
@@ -2301,13 +2785,12 @@ async def get_backtest_history_list_endpoint(
             end_date=end_date,
             use_current_quarter=use_current_quarter
         )
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_records = sanitize_float_for_json(records)
-        return {
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content={
             "success": True,
-            "data": sanitized_records,
+            "data": records,
             "count": len(records)
-        }
+        })
     except Exception as e:
         print(f"{Fore.RED}获取回测历史列表失败: {e}{Style.RESET_ALL}")
         import traceback
@@ -2330,12 +2813,11 @@ async def get_backtest_history_endpoint(history_id: str):
                 status_code=404,
                 detail=f"回测历史记录不存在: {history_id}"
             )
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_record = sanitize_float_for_json(record)
-        return {
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content={
             "success": True,
-            "data": sanitized_record
-        }
+            "data": record
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -2532,7 +3014,7 @@ async def run_batch_backtest(request: BatchBacktestRequest):
                 
                 # 执行回测
                 print(f"{Fore.CYAN}[{idx + 1}/{total}] 执行回测: 止损={combination.get('stop_loss_percent')}%, 止盈={combination.get('take_profit_percent')}%{Style.RESET_ALL}")
-                result = run_backtest_with_progress(backtest_request, progress_callback=None)
+                result = await asyncio.to_thread(run_backtest_in_slot, backtest_request)
                 result_dict = result.model_dump()
                 
                 # 保存回测历史
@@ -2563,16 +3045,14 @@ async def run_batch_backtest(request: BatchBacktestRequest):
         
         print(f"{Fore.GREEN}批量回测完成: 总计={total}, 完成={completed}, 跳过={skipped}, 失败={failed}{Style.RESET_ALL}")
         
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_results = sanitize_float_for_json(results)
-        
-        return BatchBacktestResult(
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content=BatchBacktestResult(
             total=total,
             completed=completed,
             skipped=skipped,
             failed=failed,
-            results=sanitized_results
-        )
+            results=results
+        ).model_dump())
         
     except HTTPException:
         raise
@@ -2610,11 +3090,11 @@ async def get_scan_history_list_endpoint(
             end_date=end_date,
             use_current_quarter=use_current_quarter
         )
-        return {
+        return FastJSONResponse(content={
             "success": True,
             "data": records,
             "count": len(records)
-        }
+        })
     except Exception as e:
         print(f"{Fore.RED}获取扫描历史列表失败: {e}{Style.RESET_ALL}")
         import traceback
@@ -2626,21 +3106,24 @@ async def get_scan_history_list_endpoint(
 
 
 @app.get("/api/scan/history/{cache_key}")
-async def get_scan_history_endpoint(cache_key: str):
+async def get_scan_history_endpoint(cache_key: str, include_kline: bool = False):
     """
     获取单个扫描历史记录详情
+    
+    Args:
+        include_kline: 是否返回每只股票的K线数据（默认只返回 kline_ref，K线通过 /api/kline/batch 按需加载）
     """
     try:
-        record = get_scan_history(cache_key)
+        record = get_scan_history(cache_key, include_kline=include_kline)
         if record is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"扫描历史记录不存在: {cache_key}"
             )
-        return {
+        return FastJSONResponse(content={
             "success": True,
             "data": record
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -2750,6 +3233,7 @@ class BatchScanRequest(BaseModel):
     # Relative strength settings
     check_relative_strength: bool = DEFAULT_CHECK_RELATIVE_STRENGTH  # 是否启用相对大盘强度检查（计算并保存相对强度值）
     outperform_index_threshold: Optional[float] = DEFAULT_OUTPERFORM_INDEX_THRESHOLD  # 相对强度阈值，None表示不过滤（计算并保存但不作为筛选条件）
+    relative_strength_benchmark: str = DEFAULT_RELATIVE_STRENGTH_BENCHMARK  # 相对强度基准指数：sh.000001 上证指数 / sz.399001 深证成指 / sh.000300 沪深300
     max_workers: int = 5
     retry_attempts: int = 2
     retry_delay: int = 1
@@ -2766,6 +3250,14 @@ class BatchScanRequest(BaseModel):
             return None
         return v
 
+    @field_validator('relative_strength_benchmark')
+    @classmethod
+    def validate_relative_strength_benchmark(cls, v):
+        """只接受支持的基准指数"""
+        if v not in RELATIVE_STRENGTH_BENCHMARKS:
+            raise ValueError(f"relative_strength_benchmark must be one of {', '.join(RELATIVE_STRENGTH_BENCHMARKS)}")
+        return v
+
 
 class BatchScanTaskResponse(BaseModel):
     """Response model for batch scan task creation"""
@@ -2916,9 +3408,12 @@ async def cancel_batch_scan_task(task_id: str):
 
 
 @app.get("/api/batch-scan/tasks/{task_id}/results")
-async def get_batch_scan_results(task_id: str):
+async def get_batch_scan_results(task_id: str, include_kline: bool = False):
     """
     获取批量扫描任务的所有扫描结果
+    
+    Args:
+        include_kline: 是否返回每只股票的K线数据（默认只返回 kline_ref）
     """
     try:
         from api.stock_database import get_stock_database
@@ -2932,14 +3427,13 @@ async def get_batch_scan_results(task_id: str):
                 detail=f"批量扫描任务不存在: {task_id}"
             )
         
-        results = db.get_batch_scan_results(task_id)
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_results = sanitize_float_for_json(results)
-        return {
+        results = db.get_batch_scan_results(task_id, include_kline=include_kline)
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content={
             "success": True,
-            "data": sanitized_results,
+            "data": results,
             "count": len(results)
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -2953,25 +3447,27 @@ async def get_batch_scan_results(task_id: str):
 
 
 @app.get("/api/batch-scan/results/{result_id}")
-async def get_batch_scan_result(result_id: str):
+async def get_batch_scan_result(result_id: str, include_kline: bool = False):
     """
     获取单个批量扫描结果详情
+    
+    Args:
+        include_kline: 是否返回每只股票的K线数据（默认只返回 kline_ref）
     """
     try:
         from api.stock_database import get_stock_database
         db = get_stock_database()
-        result = db.get_batch_scan_result(result_id)
+        result = db.get_batch_scan_result(result_id, include_kline=include_kline)
         if not result:
             raise HTTPException(
                 status_code=404,
                 detail=f"批量扫描结果不存在: {result_id}"
             )
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_result = sanitize_float_for_json(result)
-        return {
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content={
             "success": True,
-            "data": sanitized_result
-        }
+            "data": result
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -3468,7 +3964,7 @@ async def run_batch_task_backtest(task_id: str, request: BatchTaskBacktestReques
                 backtest_request = BacktestRequest(**backtest_request_dict)
                 
                 # 执行回测
-                result = run_backtest_with_progress(backtest_request, progress_callback=None)
+                result = await asyncio.to_thread(run_backtest_in_slot, backtest_request)
                 result_dict = result.model_dump()
                 
                 # 如果是累计余额的平均分配策略，计算下一个周期的初始资金（当前周期的结算余额）
@@ -3573,16 +4069,14 @@ async def run_batch_task_backtest(task_id: str, request: BatchTaskBacktestReques
         
         print(f"{Fore.GREEN}批量任务回测完成: 总计={total}, 完成={completed}, 失败={failed}{Style.RESET_ALL}")
         
-        # 清理无效的浮点值（inf, -inf, nan）以避免 JSON 序列化错误
-        sanitized_results = sanitize_float_for_json(results)
-        
-        return BatchTaskBacktestResult(
+        # 无效的浮点值（inf, -inf, nan）由 FastJSONResponse 转为 null
+        return FastJSONResponse(content=BatchTaskBacktestResult(
             task_id=task_id,
             total=total,
             completed=completed,
             failed=failed,
-            results=sanitized_results
-        )
+            results=results
+        ).model_dump())
         
     except HTTPException:
         raise
@@ -3682,7 +4176,7 @@ async def retry_failed_backtest(task_id: str, history_id: str):
         )
         
         # 执行回测
-        result = run_backtest_with_progress(backtest_request, progress_callback=None)
+        result = await asyncio.to_thread(run_backtest_in_slot, backtest_request)
         result_dict = result.model_dump()
         
         # 更新历史记录（将失败记录更新为成功）
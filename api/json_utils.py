@@ -3,7 +3,7 @@ JSON utilities for handling special values like NaN and Infinity.
 """
 import json
 import math
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List
 
 try:
     import numpy as np
@@ -11,6 +11,24 @@ try:
 except ImportError:
     HAS_NUMPY = False
 
+try:
+    import pandas as pd
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    from fastapi.responses import JSONResponse
+    HAS_FASTAPI = True
+except ImportError:
+    HAS_FASTAPI = False
+
 
 def sanitize_float_for_json(value: Any) -> Any:
     """
@@ -108,30 +126,114 @@ def convert_numpy_types(value: Any) -> Any:
     return value
 
 
-def sanitize_task_result(task_result: Union[List[Dict[str, Any]], None]) -> Union[List[Dict[str, Any]], None]:
+def _json_default(value: Any) -> Any:
     """
-    Sanitize task result for JSON serialization.
+    Fallback converter for values the JSON encoder does not handle natively
+    (NumPy scalars/arrays, pandas Timestamps, pydantic models, sets).
+    Missing values (pd.NaT, pd.NA) become None.
+    """
+    # NaT 也是 datetime 的子类，必须在 isoformat 分支之前处理
+    if HAS_PANDAS and (value is pd.NaT or value is pd.NA):
+        return None
+    if HAS_NUMPY:
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_key(key: Any) -> str:
+    """Convert a dictionary key to the string both encoders write."""
+    if isinstance(key, str):
+        return key
+    if HAS_NUMPY and isinstance(key, np.generic):
+        key = key.item()
+    if isinstance(key, bool) or key is None:
+        return json.dumps(key)
+    return str(key)
+
+
+def _with_str_keys(value: Any) -> Any:
+    """Copy nested dicts/lists with every dictionary key converted by _json_key."""
+    if isinstance(value, dict):
+        return {_json_key(k): _with_str_keys(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_with_str_keys(item) for item in value]
+    return value
+
+
+def _to_jsonable(value: Any) -> Any:
+    """
+    Single-pass conversion used when orjson is unavailable: converts NumPy types
+    and maps NaN/Infinity to None while walking the structure once.
+    """
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    if isinstance(value, dict):
+        return {_json_key(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(item) for item in value]
+    return _to_jsonable(_json_default(value))
+
+
+def dumps_json(value: Any) -> bytes:
+    """
+    Serialize a value to UTF-8 JSON bytes.
+    NumPy scalars/arrays are supported and NaN/Infinity become null, so callers
+    do not need to run convert_numpy_types/sanitize_float_for_json first.
 
     Args:
-        task_result: The task result to sanitize
+        value: The value to serialize
 
     Returns:
-        The sanitized task result
+        JSON encoded bytes
     """
-    if task_result is None:
-        return None
+    if HAS_ORJSON:
+        # orjson 原生输出 NaN/Infinity 为 null，并直接序列化 NumPy 数组
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        try:
+            return orjson.dumps(value, default=_json_default, option=options)
+        except orjson.JSONEncodeError:
+            # NumPy 整数等键 orjson 不接受（也不经过 default），转成字符串键后重试
+            return orjson.dumps(_with_str_keys(value), default=_json_default, option=options)
+    return json.dumps(
+        _to_jsonable(value),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+def sse_data(value: Any) -> str:
+    """
+    Format a value as a Server-Sent Events data message, serialized with
+    dumps_json (NumPy types and NaN/Infinity handled in the same pass).
+
+    Args:
+        value: The event payload
 
-    sanitized_result = []
-    for stock in task_result:
-        sanitized_stock = sanitize_float_for_json(stock)
-        # Also convert NumPy types
-        sanitized_stock = convert_numpy_types(sanitized_stock)
+    Returns:
+        The 'data: ...' message including the terminating blank line
+    """
+    return f"data: {dumps_json(value).decode('utf-8')}\n\n"
 
-        # 特别处理K线数据
-        if 'kline_data' in sanitized_stock and sanitized_stock['kline_data']:
-            sanitized_stock['kline_data'] = sanitize_kline_data(
-                sanitized_stock['kline_data'])
 
-        sanitized_result.append(sanitized_stock)
+if HAS_FASTAPI:
+    class FastJSONResponse(JSONResponse):
+        """
+        JSON response rendered with dumps_json (orjson when available).
+        Return it directly from endpoints to skip FastAPI's jsonable_encoder pass.
+        """
+        media_type = "application/json"
 
-    return sanitized_result
+        def render(self, content: Any) -> bytes:
+            return dumps_json(content)
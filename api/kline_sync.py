@@ -0,0 +1,263 @@
+"""
+K-line sync module.
+Incremental market-wide K-line ingest: each code's last stored date is read
+from the kline_coverage index, only the bars after it are requested from
+Baostock (parallel workers sharing one request rate limit), and the new bars
+are written in bulk, KLINE_SYNC_BATCH_SIZE codes per transaction. Keeping the
+database current this way means user scans read K-lines from the database
+instead of backfilling them from the API inside the request.
+
+Runs as part of the post-close task (market_close_scheduler.py) and from the
+command line (from the project root):
+    python -m api.kline_sync
+    python -m api.kline_sync --end-date 2024-06-28 --workers 8 --rate-limit 30
+    python -m api.kline_sync --codes sh.600000 sz.000001 --output summary.json
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+from colorama import Fore, Style
+
+try:
+    from .config import (KLINE_SYNC_WORKERS, KLINE_SYNC_RATE_LIMIT,
+                         KLINE_SYNC_BATCH_SIZE, KLINE_SYNC_NEW_CODE_DAYS,
+                         RELATIVE_STRENGTH_BENCHMARKS)
+    from .data_fetcher import _fetch_kline_data_from_api, baostock_logout, latest_published_trading_day
+    from .logging_utils import setup_logging
+    from .security_master import get_security_master
+    from .stock_database import get_stock_database
+except ImportError:
+    from api.config import (KLINE_SYNC_WORKERS, KLINE_SYNC_RATE_LIMIT,
+                            KLINE_SYNC_BATCH_SIZE, KLINE_SYNC_NEW_CODE_DAYS,
+                            RELATIVE_STRENGTH_BENCHMARKS)
+    from api.data_fetcher import _fetch_kline_data_from_api, baostock_logout, latest_published_trading_day
+    from api.logging_utils import setup_logging
+    from api.security_master import get_security_master
+    from api.stock_database import get_stock_database
+
+# Index K-lines the scanner reads besides the stock list (relative strength benchmarks)
+MARKET_INDEX_CODES = list(RELATIVE_STRENGTH_BENCHMARKS)
+
+# Failed codes listed in the summary (the count is always complete)
+MAX_REPORTED_FAILURES = 50
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all sync workers.
+    Thread-safe; acquire() blocks until a request may be sent.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Initialize the limiter.
+
+        Args:
+            rate: Requests per second (<= 0 disables limiting)
+            burst: Bucket size (defaults to one second of requests)
+        """
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until one is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def plan_sync(codes: List[str], end_date: str, include_new: bool = True) -> Dict[str, Any]:
+    """
+    Work out the date range to request for each code from the coverage index.
+
+    Args:
+        codes: Stock codes to sync
+        end_date: Last date to sync (YYYY-MM-DD)
+        include_new: Whether codes without stored K-lines are synced
+            (KLINE_SYNC_NEW_CODE_DAYS of history)
+
+    Returns:
+        Dict with ranges (code -> start date), up_to_date and new_codes counts
+    """
+    coverage = get_stock_database().get_kline_coverage()
+    new_code_start = (datetime.strptime(end_date, '%Y-%m-%d')
+                      - timedelta(days=KLINE_SYNC_NEW_CODE_DAYS)).strftime('%Y-%m-%d')
+
+    ranges: Dict[str, str] = {}
+    up_to_date = 0
+    new_codes = 0
+    for code in codes:
+        stored = coverage.get(code)
+        if stored is None:
+            if include_new:
+                ranges[code] = new_code_start
+                new_codes += 1
+            continue
+        last_date = stored[1]
+        if last_date >= end_date:
+            up_to_date += 1
+            continue
+        # 只请求最新一根K线之后的区间
+        next_day = datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)
+        ranges[code] = next_day.strftime('%Y-%m-%d')
+    return {'ranges': ranges, 'up_to_date': up_to_date, 'new_codes': new_codes}
+
+
+def sync_kline_data(end_date: Optional[str] = None,
+                    codes: Optional[List[str]] = None,
+                    workers: int = KLINE_SYNC_WORKERS,
+                    rate_limit: float = KLINE_SYNC_RATE_LIMIT,
+                    include_new: bool = True,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Fetch the K-lines each code is missing up to end_date and save them in bulk.
+
+    Args:
+        end_date: Last date to sync (YYYY-MM-DD); defaults to the latest
+            trading day whose bars are published
+        codes: Codes to sync; defaults to the scan stock list plus the market index
+        workers: Number of parallel fetch threads
+        rate_limit: Total Baostock requests per second across workers (<= 0: unlimited)
+        include_new: Whether codes without stored K-lines are synced
+        progress: Called with (codes done, codes to fetch) as fetching proceeds
+
+    Returns:
+        Summary dict: end_date, codes, up_to_date, new_codes, requested,
+        updated, empty, failed, failed_codes, rows and seconds
+    """
+    started = time.perf_counter()
+    end_date = end_date or latest_published_trading_day()
+    if codes is None:
+        codes = [stock['code'] for stock in get_security_master().get_stock_list()] + MARKET_INDEX_CODES
+    plan = plan_sync(codes, end_date, include_new)
+    ranges = plan['ranges']
+
+    db = get_stock_database()
+    limiter = RateLimiter(rate_limit)
+    lock = threading.Lock()
+    buffer: Dict[str, pd.DataFrame] = {}
+    counts = {'done': 0, 'updated': 0, 'empty': 0, 'rows': 0}
+    failed_codes: List[str] = []
+
+    def flush(frames: Dict[str, pd.DataFrame]) -> None:
+        rows = db.save_kline_data_bulk(frames)
+        with lock:
+            counts['rows'] += rows
+
+    def fetch_chunk(chunk: List[str]) -> None:
+        # 每个线程按顺序处理一组股票，结束时退出本线程的 Baostock 登录
+        try:
+            for code in chunk:
+                try:
+                    # 每次请求（包括重试）都经过限流；重试耗尽时抛出异常，计为失败而不是无数据
+                    df = _fetch_kline_data_from_api(code, ranges[code], end_date,
+                                                    raise_on_failure=True,
+                                                    before_request=limiter.acquire)
+                except Exception as e:
+                    print(f"{Fore.YELLOW}[KLINE_SYNC] Failed to fetch {code}: {e}{Style.RESET_ALL}")
+                    df = None
+                batch = None
+                with lock:
+                    counts['done'] += 1
+                    if df is None:
+                        failed_codes.append(code)
+                    elif df.empty:
+                        counts['empty'] += 1
+                    else:
+                        counts['updated'] += 1
+                        buffer[code] = df
+                        if len(buffer) >= KLINE_SYNC_BATCH_SIZE:
+                            batch = dict(buffer)
+                            buffer.clear()
+                    if progress and counts['done'] % 100 == 0:
+                        progress(counts['done'], len(ranges))
+                if batch:
+                    flush(batch)
+        finally:
+            baostock_logout()
+
+    pending = list(ranges)
+    if pending:
+        workers = max(1, min(workers, len(pending)))
+        print(f"{Fore.CYAN}[KLINE_SYNC] Syncing {len(pending)} codes up to {end_date} "
+              f"({workers} workers, {rate_limit:g} req/s){Style.RESET_ALL}")
+        chunks = [pending[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kline-sync') as executor:
+            list(executor.map(fetch_chunk, chunks))
+        if buffer:
+            flush(dict(buffer))
+        if progress:
+            progress(len(pending), len(pending))
+
+    summary = {
+        'end_date': end_date,
+        'codes': len(codes),
+        'up_to_date': plan['up_to_date'],
+        'new_codes': plan['new_codes'],
+        'requested': len(pending),
+        'updated': counts['updated'],
+        'empty': counts['empty'],
+        'failed': len(failed_codes),
+        'failed_codes': sorted(failed_codes)[:MAX_REPORTED_FAILURES],
+        'rows': counts['rows'],
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    color = Fore.YELLOW if failed_codes else Fore.GREEN
+    print(f"{color}[KLINE_SYNC] Done in {summary['seconds']}s: {summary['rows']} rows for "
+          f"{summary['updated']} codes, {summary['up_to_date']} already up to date, "
+          f"{summary['empty']} without new bars, {summary['failed']} failed{Style.RESET_ALL}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Incremental K-line sync for the whole market')
+    parser.add_argument('--end-date', help='Last date to sync (default: latest published trading day)')
+    parser.add_argument('--codes', nargs='+', help='Only sync these codes (default: all scan stocks and the index)')
+    parser.add_argument('--workers', type=int, default=KLINE_SYNC_WORKERS, help='Parallel fetch threads')
+    parser.add_argument('--rate-limit', type=float, default=KLINE_SYNC_RATE_LIMIT,
+                        help='Total Baostock requests per second (0 = unlimited)')
+    parser.add_argument('--skip-new', action='store_true', help='Skip codes without stored K-lines')
+    parser.add_argument('--output', help='Write the JSON summary to this file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.end_date:
+        try:
+            datetime.strptime(args.end_date, '%Y-%m-%d')
+        except ValueError:
+            parser.error('--end-date must be YYYY-MM-DD')
+
+    setup_logging(level='WARNING')
+    summary = sync_kline_data(end_date=args.end_date, codes=args.codes, workers=args.workers,
+                              rate_limit=args.rate_limit, include_new=not args.skip_new)
+
+    output = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
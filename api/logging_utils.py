@@ -0,0 +1,142 @@
+"""
+Logging utilities module.
+Structured, level-gated logging for the scan hot path. Records are passed to a
+background listener thread through a queue, so worker threads never format
+messages or write to stdout themselves; messages use lazy %-style arguments
+and are only formatted when a record actually passes its logger's level.
+Per-stock events are sampled to keep large scans from flooding the logs.
+"""
+import atexit
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from colorama import Fore, Style
+
+try:
+    from .config import LOG_LEVEL, LOG_LEVELS, LOG_STOCK_EVENT_SAMPLE_EVERY
+except ImportError:
+    from api.config import LOG_LEVEL, LOG_LEVELS, LOG_STOCK_EVENT_SAMPLE_EVERY
+
+# Root of all platform loggers (subsystem 'scanner' -> logger 'platform.scanner')
+ROOT_LOGGER_NAME = 'platform'
+
+# Suffix of per-stock event loggers, which are sampled
+STOCK_EVENT_SUFFIX = '.stock'
+
+_LEVEL_COLORS = {
+    logging.DEBUG: Fore.WHITE,
+    logging.INFO: Fore.CYAN,
+    logging.WARNING: Fore.YELLOW,
+    logging.ERROR: Fore.RED,
+    logging.CRITICAL: Fore.RED,
+}
+
+_listener: Optional[QueueListener] = None
+_log_queue: Optional[queue.Queue] = None
+_setup_lock = threading.Lock()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that hands the record over unformatted.
+    The default QueueHandler.prepare() formats the message in the calling
+    thread; here formatting is left to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _ColorFormatter(logging.Formatter):
+    """Formatter that colors each line by level, matching the existing console output."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        color = _LEVEL_COLORS.get(record.levelno, '')
+        return f"{color}{super().format(record)}{Style.RESET_ALL}"
+
+
+class StockEventSampler(logging.Filter):
+    """
+    Pass one in every N records per message template.
+    WARNING and above are never sampled.
+    """
+
+    def __init__(self, every: int = LOG_STOCK_EVENT_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        # 按消息模板计数（不格式化参数），同一类事件每 N 条输出 1 条
+        with self._lock:
+            count = self._counts.get(record.msg, 0)
+            self._counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+def setup_logging(level: Optional[str] = None,
+                  levels: Optional[Dict[str, str]] = None) -> None:
+    """
+    Install the queued console handler and per-subsystem levels.
+    Safe to call more than once; the handler is only installed the first time.
+
+    Args:
+        level: Root platform log level (defaults to config LOG_LEVEL)
+        levels: Per-subsystem levels (defaults to config LOG_LEVELS)
+    """
+    global _listener, _log_queue
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+
+    with _setup_lock:
+        if _listener is None:
+            log_queue: queue.Queue = queue.Queue(-1)
+            _log_queue = log_queue
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(_ColorFormatter('%(message)s'))
+            _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+            _listener.start()
+            atexit.register(_listener.stop)
+
+            root.addHandler(_DeferredQueueHandler(log_queue))
+            root.propagate = False
+
+    root.setLevel((level or LOG_LEVEL).upper())
+    for subsystem, subsystem_level in (levels if levels is not None else LOG_LEVELS).items():
+        logging.getLogger(f"{ROOT_LOGGER_NAME}.{subsystem}").setLevel(subsystem_level.upper())
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """
+    Get the logger of a subsystem (e.g. 'scanner', 'scanner.stock').
+    Loggers ending in '.stock' get a per-template sampler.
+
+    Args:
+        subsystem: Subsystem name
+
+    Returns:
+        Logger instance
+    """
+    setup_logging_once()
+    logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{subsystem}")
+    if subsystem.endswith(STOCK_EVENT_SUFFIX) and not any(
+            isinstance(f, StockEventSampler) for f in logger.filters):
+        logger.addFilter(StockEventSampler())
+    return logger
+
+
+def setup_logging_once() -> None:
+    """Call setup_logging() with config defaults if it has not run yet."""
+    if _listener is None:
+        setup_logging()
+
+
+def get_log_queue_depth() -> int:
+    """Get the number of log records waiting for the listener thread."""
+    return _log_queue.qsize() if _log_queue is not None else 0
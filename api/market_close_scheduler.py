@@ -0,0 +1,167 @@
+"""
+Market close scheduler module.
+After the A-share close (15:00) the data source publishes the day's bars; on
+every trading day at POST_CLOSE_RUN_TIME this scheduler queues a 'post_close'
+task that syncs the day's bars for all codes (kline_sync.sync_kline_data),
+invalidates the caches derived from K-line data and pre-computes the
+default-config scan, so the first scan of the evening is served from cache.
+
+The task handler lives in index.py (it submits the scan); this module provides
+the scheduling loop and the cache invalidation step it runs.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from colorama import Fore, Style
+
+try:
+    from .config import POST_CLOSE_RUN_TIME
+    from .cache_manager import invalidate_kline_cache
+    from .data_fetcher import is_trading_day
+    from .platform_check_cache import get_platform_check_cache
+    from .stock_database import get_stock_database
+    from .task_queue import get_task_queue
+except ImportError:
+    from api.config import POST_CLOSE_RUN_TIME
+    from api.cache_manager import invalidate_kline_cache
+    from api.data_fetcher import is_trading_day
+    from api.platform_check_cache import get_platform_check_cache
+    from api.stock_database import get_stock_database
+    from api.task_queue import get_task_queue
+
+def invalidate_market_data_caches(trade_date: str) -> Dict[str, int]:
+    """
+    Drop caches built from K-line data older than trade_date's bars.
+
+    Scan results and feature sets cached for trade_date were computed before
+    the day's bars existed and are deleted; cached K-line ranges and
+    single-stock checks are dropped as a whole (the analysis cache is keyed by
+    K-line data version and needs no invalidation).
+
+    Args:
+        trade_date: Trading day whose bars were just written (YYYY-MM-DD)
+
+    Returns:
+        Dict with the number of scan_cache, feature_sets and kline_cache entries removed
+    """
+    db = get_stock_database()
+    scan_entries = db.clear_scan_cache(backtest_date=trade_date)
+    feature_sets = db.clear_scan_feature_sets(backtest_date=trade_date)
+    kline_entries = invalidate_kline_cache()
+    get_platform_check_cache().clear()
+    return {'scan_cache': scan_entries, 'feature_sets': feature_sets, 'kline_cache': kline_entries}
+
+
+class MarketCloseScheduler:
+    """
+    Background thread that queues the 'post_close' task once per trading day.
+    The task is deduplicated by date, so a restart after the run time
+    re-queues it at most while the previous one is still pending or running.
+    """
+
+    def __init__(self, run_time: str = POST_CLOSE_RUN_TIME):
+        """
+        Initialize the scheduler (not started).
+
+        Args:
+            run_time: Local time of day to run at, 'HH:MM'
+        """
+        hour, minute = run_time.split(':')
+        self.run_hour = int(hour)
+        self.run_minute = int(minute)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def next_run(self, now: Optional[datetime] = None) -> datetime:
+        """
+        Get the next run time after now (non-trading days are skipped).
+
+        Args:
+            now: Reference time (defaults to the current local time)
+
+        Returns:
+            Datetime of the next run
+        """
+        now = now or datetime.now()
+        run_at = now.replace(hour=self.run_hour, minute=self.run_minute, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        while not is_trading_day(run_at.strftime('%Y-%m-%d')):
+            run_at += timedelta(days=1)
+        return run_at
+
+    def start(self) -> None:
+        """
+        Start the scheduling thread. If today is a trading day and the run
+        time has passed, today's task is queued immediately.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True, name='market-close-scheduler')
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduling thread."""
+        self._stop.set()
+
+    def submit(self, trade_date: str) -> str:
+        """
+        Queue the post-close task for a date.
+
+        Args:
+            trade_date: Trading day (YYYY-MM-DD)
+
+        Returns:
+            Task ID (of the already queued task if there is one)
+        """
+        task_id, deduplicated = get_task_queue().submit(
+            'post_close', {'date': trade_date}, dedupe_key=f'post_close:{trade_date}')
+        if not deduplicated:
+            print(f"{Fore.CYAN}[POST_CLOSE] Queued post-close task {task_id} for {trade_date}{Style.RESET_ALL}")
+        return task_id
+
+    def _loop(self) -> None:
+        now = datetime.now()
+        today_run = now.replace(hour=self.run_hour, minute=self.run_minute, second=0, microsecond=0)
+        if now >= today_run and is_trading_day(today_run.strftime('%Y-%m-%d')):
+            # 服务在运行时刻之后启动：补跑当天的任务
+            self._submit_safely(today_run.strftime('%Y-%m-%d'))
+
+        run_at = self.next_run(now)
+        while True:
+            print(f"{Fore.CYAN}[POST_CLOSE] Next post-close run at {run_at:%Y-%m-%d %H:%M}{Style.RESET_ALL}")
+            if self._stop.wait(max(0.0, (run_at - datetime.now()).total_seconds())):
+                break
+            self._submit_safely(run_at.strftime('%Y-%m-%d'))
+            run_at = self.next_run(max(run_at, datetime.now()))
+
+    def _submit_safely(self, trade_date: str) -> None:
+        # 提交失败不能终止调度线程
+        try:
+            self.submit(trade_date)
+        except Exception as e:
+            print(f"{Fore.RED}[POST_CLOSE] Failed to queue post-close task for {trade_date}: {e}{Style.RESET_ALL}")
+
+
+# Global scheduler instance
+_market_close_scheduler: Optional[MarketCloseScheduler] = None
+_market_close_scheduler_lock = threading.Lock()
+
+
+def get_market_close_scheduler() -> MarketCloseScheduler:
+    """
+    Get the global market close scheduler instance (thread-safe singleton).
+
+    Returns:
+        MarketCloseScheduler instance
+    """
+    global _market_close_scheduler
+    if _market_close_scheduler is None:
+        with _market_close_scheduler_lock:
+            if _market_close_scheduler is None:
+                _market_close_scheduler = MarketCloseScheduler()
+    return _market_close_scheduler
@@ -0,0 +1,253 @@
+"""
+Metrics module.
+Process-wide counters and histograms for scan, fetch and database health,
+rendered in the Prometheus text exposition format (served at /api/metrics).
+
+Instrumented code updates counters and histograms as events happen; state that
+already lives elsewhere (task manager, response cache, log queue) is read by
+collectors when the endpoint is scraped, so it is never duplicated.
+"""
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# Prefix of every metric name
+METRIC_PREFIX = 'stock_scanner_'
+
+# Histogram buckets (seconds)
+FETCH_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SCAN_DURATION_BUCKETS = (5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+
+# (labels, value) samples of one metric family
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+def _escape_label_value(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels. Thread-safe."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """
+        Increase the counter.
+
+        Args:
+            amount: Amount to add (non-negative)
+            **labels: Label values (one per labelname)
+        """
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        """Render the counter in text exposition format."""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            labels = dict(zip(self.labelnames, key))
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels. Thread-safe."""
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...],
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record one observation.
+
+        Args:
+            value: Observed value (seconds for the histograms in this module)
+            **labels: Label values (one per labelname)
+        """
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = counts
+            # 只计入第一个满足的桶，渲染时再累加
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        """Render the histogram in text exposition format."""
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, counts in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), counts[:-1]):
+                cumulative += count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registry of counters, histograms and scrape-time collectors.
+    A collector returns (name, type, documentation, samples) tuples for state
+    owned by other modules; a failing collector is skipped, not fatal.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str,
+                labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Get or create a counter (name without METRIC_PREFIX)."""
+        with self._lock:
+            full_name = METRIC_PREFIX + name
+            if full_name not in self._metrics:
+                self._metrics[full_name] = Counter(full_name, documentation, labelnames)
+            return self._metrics[full_name]
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...],
+                  labelnames: Tuple[str, ...] = ()) -> Histogram:
+        """Get or create a histogram (name without METRIC_PREFIX)."""
+        with self._lock:
+            full_name = METRIC_PREFIX + name
+            if full_name not in self._metrics:
+                self._metrics[full_name] = Histogram(full_name, documentation, buckets, labelnames)
+            return self._metrics[full_name]
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Samples]]]) -> None:
+        """Register a function called on every scrape."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render all metrics in Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            Exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                lines.append(f"# collector {getattr(collector, '__name__', 'unknown')} failed: {type(e).__name__}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                full_name = METRIC_PREFIX + name
+                lines.append(f"# HELP {full_name} {documentation}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# Global metrics registry
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """
+    Get the global metrics registry.
+
+    Returns:
+        MetricsRegistry instance
+    """
+    return _registry
+
+
+# --- Metrics updated by instrumented code ---
+
+FETCH_LATENCY = _registry.histogram(
+    'kline_fetch_duration_seconds',
+    'K-line fetch latency by data source (db, api or mixed).',
+    FETCH_LATENCY_BUCKETS, ('source',))
+
+BAOSTOCK_ERRORS = _registry.counter(
+    'baostock_errors_total',
+    'Baostock failures by kind (login, query_error, timeout, exception).',
+    ('kind',))
+
+DB_LOCK_WAIT = _registry.histogram(
+    'db_lock_wait_seconds',
+    'Time spent waiting for the stock database lock by operation.',
+    LOCK_WAIT_BUCKETS, ('operation',))
+
+SCAN_DURATION = _registry.histogram(
+    'scan_duration_seconds',
+    'Wall time of scan_stocks runs.',
+    SCAN_DURATION_BUCKETS)
+
+SCANNED_STOCKS = _registry.counter(
+    'scanned_stocks_total',
+    'Stocks processed by scan_stocks.')
+
+ANALYSIS_CACHE_REQUESTS = _registry.counter(
+    'analysis_cache_requests_total',
+    'Per-stock analysis cache lookups by result (hit or miss).',
+    ('result',))
+
+COALESCED_TASKS = _registry.counter(
+    'coalesced_tasks_total',
+    'Task submissions attached to an identical queued or running task, by kind.',
+    ('kind',))
+
+
+def gauge(name: str, documentation: str, samples: Samples) -> Tuple[str, str, str, Samples]:
+    """Build a gauge family for a collector."""
+    return name, 'gauge', documentation, samples
+
+
+def counter_family(name: str, documentation: str, samples: Samples) -> Tuple[str, str, str, Samples]:
+    """Build a counter family for a collector (for counters kept by other modules)."""
+    return name, 'counter', documentation, samples
@@ -0,0 +1,108 @@
+"""
+Platform check cache module.
+In-memory LRU cache of /api/platform/check responses for frequently checked
+stocks, keyed by (code, query date) and validated against the stock's
+kline_coverage stamp (StockDatabase.get_kline_coverage_stamp), so an answer is
+reused only while the stock's K-lines are unchanged, without reading them.
+Entries also expire after PLATFORM_CHECK_CACHE_TTL_SECONDS, which bounds how
+stale the embedded fundamentals can get.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+try:
+    from .config import PLATFORM_CHECK_CACHE_SIZE, PLATFORM_CHECK_CACHE_TTL_SECONDS
+except ImportError:
+    from api.config import PLATFORM_CHECK_CACHE_SIZE, PLATFORM_CHECK_CACHE_TTL_SECONDS
+
+
+class PlatformCheckCache:
+    """
+    LRU cache of single-stock check results.
+    Thread-safe.
+    """
+
+    def __init__(self, max_size: int = PLATFORM_CHECK_CACHE_SIZE,
+                 ttl_seconds: float = PLATFORM_CHECK_CACHE_TTL_SECONDS):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of entries (least recently used are evicted)
+            ttl_seconds: Lifetime of an entry in seconds
+        """
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        # (code, date) -> (K-line version stamp, stored at, value)
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[str, float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code: str, query_date: str, data_version: str) -> Optional[Any]:
+        """
+        Get a cached result.
+
+        Args:
+            code: Stock code
+            query_date: Query date (YYYY-MM-DD)
+            data_version: K-line version stamp the result must match
+
+        Returns:
+            Cached value, or None on miss
+        """
+        key = (code, query_date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != data_version or time.time() - entry[1] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, code: str, query_date: str, data_version: str, value: Any) -> None:
+        """
+        Store a result.
+
+        Args:
+            code: Stock code
+            query_date: Query date (YYYY-MM-DD)
+            data_version: K-line version stamp the result was computed from
+            value: Result to cache
+        """
+        key = (code, query_date)
+        with self._lock:
+            self._entries[key] = (data_version, time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Global platform check cache instance
+_platform_check_cache: Optional[PlatformCheckCache] = None
+_platform_check_cache_lock = threading.Lock()
+
+
+def get_platform_check_cache() -> PlatformCheckCache:
+    """
+    Get the global platform check cache instance (thread-safe singleton).
+
+    Returns:
+        PlatformCheckCache instance
+    """
+    global _platform_check_cache
+    if _platform_check_cache is None:
+        with _platform_check_cache_lock:
+            if _platform_check_cache is None:
+                _platform_check_cache = PlatformCheckCache()
+    return _platform_check_cache
@@ -3,9 +3,9 @@ Platform Scanner module for scanning stocks for platform consolidation patterns.
 """
 import pandas as pd
 import numpy as np
-import math
 from typing import List, Dict, Any, Optional, Tuple
 import time
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, CancelledError
 from tqdm import tqdm
@@ -13,15 +13,24 @@ from colorama import Fore, Style
 import platform as platform_module
 
 from .data_fetcher import fetch_kline_data, baostock_login, get_data_source_stats, clear_data_source_stats, BaostockConnectionManager
-from .industry_filter import apply_industry_diversity_filter
-from .config import ScanConfig
+from .ranking import build_score_array, select_top_stocks
+from .config import ScanConfig, DEFAULT_RELATIVE_STRENGTH_BENCHMARK
+from .analysis_cache import StockAnalysisCache, compute_quick_features
+from .logging_utils import get_logger
+from .scan_profiler import ScanProfiler, profile_stage, record_stage
+from .metrics import SCAN_DURATION, SCANNED_STOCKS, ANALYSIS_CACHE_REQUESTS
 
 # Import analyzers
 from .analyzers.price_analyzer import analyze_price
 from .analyzers.volume_analyzer import analyze_volume
 from .analyzers.combined_analyzer import analyze_stock
+from .analyzers.frame_utils import prepare_analysis_frame
+from .analyzers.relative_strength_analyzer import MarketReference
 from .analyzers.fundamental_analyzer import analyze_fundamentals
 
+logger = get_logger('scanner')
+stock_logger = get_logger('scanner.stock')
+
 
 def should_use_process_pool() -> bool:
     """
@@ -117,11 +126,122 @@ def _fetch_kline_with_tracking(code: str, name: str, start_date: str, end_date:
         raise
 
 
+def _run_analyze_stock(df: pd.DataFrame, config: ScanConfig,
+                       market_reference: Optional[MarketReference], end_date: str) -> Dict[str, Any]:
+    """
+    Run analyze_stock with the analyzer settings from a scan config.
+
+    Args:
+        df: K-line DataFrame of the stock
+        config: Scan configuration
+        market_reference: Benchmark series for relative strength, built once per scan
+        end_date: Scan end date
+
+    Returns:
+        analyze_stock result dictionary
+    """
+    return analyze_stock(
+        df,
+        config.windows,
+        config.box_threshold,
+        config.ma_diff_threshold,
+        config.volatility_threshold,
+        config.volume_change_threshold,
+        config.volume_stability_threshold,
+        config.volume_increase_threshold,
+        config.use_volume_analysis,
+        config.use_breakthrough_prediction,
+        config.use_window_weights,
+        config.window_weights,
+        config.use_low_position,
+        config.high_point_lookback_days,
+        config.decline_period_days,
+        config.decline_threshold,
+        config.use_rapid_decline_detection,
+        config.rapid_decline_days,
+        config.rapid_decline_threshold,
+        config.use_breakthrough_confirmation,
+        config.breakthrough_confirmation_days,
+        config.use_box_detection,
+        config.box_quality_threshold,
+        config.max_turnover_rate,
+        config.allow_turnover_spikes,
+        getattr(config, 'check_relative_strength', False),
+        getattr(config, 'outperform_index_threshold', None),
+        None,
+        end_date,
+        market_reference
+    )
+
+
+def finalize_platform_stocks(platform_stocks: List[Dict[str, Any]],
+                             config: ScanConfig) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Apply the post-analysis stages to platform stocks: fundamental filter,
+    then top-K selection by multi-criteria score with industry quotas.
+
+    Args:
+        platform_stocks: Stocks that met the platform criteria
+        config: Scan configuration
+
+    Returns:
+        Tuple of (filtered and sorted stocks, count after fundamental filter)
+    """
+    # Apply fundamental analysis filter if enabled
+    if config.use_fundamental_filter:
+        print(f"{Fore.CYAN}Applying fundamental analysis filter...{Style.RESET_ALL}")
+        fundamental_filtered_stocks = analyze_fundamentals(
+            platform_stocks,
+            use_fundamental_filter=config.use_fundamental_filter,
+            revenue_growth_percentile=config.revenue_growth_percentile,
+            profit_growth_percentile=config.profit_growth_percentile,
+            roe_percentile=config.roe_percentile,
+            liability_percentile=config.liability_percentile,
+            pe_percentile=config.pe_percentile,
+            pb_percentile=config.pb_percentile,
+            years_to_check=config.fundamental_years_to_check
+        )
+        fundamental_count = len(fundamental_filtered_stocks)
+        print(f"{Fore.GREEN}Fundamental analysis complete. {fundamental_count} stocks passed out of {len(platform_stocks)}.{Style.RESET_ALL}")
+    else:
+        fundamental_filtered_stocks = platform_stocks
+        fundamental_count = len(platform_stocks)
+        print(f"{Fore.YELLOW}Fundamental analysis filter disabled.{Style.RESET_ALL}")
+
+    # Rank and select: top expected_count stocks with industry diversity
+    # Priority order (higher priority first):
+    # 1. Breakthrough confirmation & breakthrough precursor signals
+    # 2. Box quality
+    # Ties are broken by stock code, so results do not depend on the order
+    # concurrent processing finished in
+    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Ranking {len(fundamental_filtered_stocks)} stocks with industry diversity (expected_count={config.expected_count}){Style.RESET_ALL}")
+    scores = build_score_array(fundamental_filtered_stocks, config)
+    selected = select_top_stocks(fundamental_filtered_stocks, scores, config.expected_count)
+    filtered_stocks = [fundamental_filtered_stocks[i] for i in selected]
+    
+    sorted_count = len(filtered_stocks)
+    print(f"{Fore.GREEN}Selected {sorted_count} stocks by breakthrough signals and box quality.{Style.RESET_ALL}")
+    
+    # Log sorting details for first few stocks
+    if sorted_count > 0:
+        print(f"{Fore.CYAN}Top 5 stocks after sorting:{Style.RESET_ALL}")
+        for rank, i in enumerate(selected[:5], 1):
+            stock, score = fundamental_filtered_stocks[i], scores[i]
+            print(f"  {rank}. {stock.get('code', 'unknown')} ({stock.get('name', 'unknown')}): "
+                  f"confirmation={score['confirmation']}, signals={score['signals']}, box_quality={score['box_quality']:.2f}")
+    
+    print(f"{Fore.GREEN}[SCAN_CHECKPOINT] Sorting complete, preparing to return results{Style.RESET_ALL}")
+
+    return filtered_stocks, fundamental_count
+
+
 def scan_stocks(stock_list: List[Dict[str, Any]],
                 config: ScanConfig,
                 update_progress: Optional[callable] = None,
                 end_date: Optional[str] = None,
-                return_stats: bool = False) -> List[Dict[str, Any]]:
+                return_stats: bool = False,
+                profiler: Optional[ScanProfiler] = None,
+                on_platform_stock: Optional[callable] = None) -> List[Dict[str, Any]]:
     """
     Scan stocks for platform consolidation patterns.
 
@@ -130,10 +250,16 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
         config: Scan configuration
         update_progress: Optional callback for updating progress
         end_date: Optional end date in 'YYYY-MM-DD' format. If not provided, uses current date.
+        return_stats: If True, also return a stats dict (counts, pre-filter platform stocks, profile)
+        profiler: Optional ScanProfiler to record stage timings into; created automatically
+            when config.enable_profiling is set (ThreadPoolExecutor scans only)
+        on_platform_stock: Optional callback called with each platform stock as soon as it
+            is found (before fundamental/industry filtering and sorting)
 
     Returns:
         List of stocks that meet platform criteria
     """
+    scan_started = time.perf_counter()
     # Calculate date range
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
@@ -160,12 +286,13 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
     
     # Fetch market index data for relative strength calculation (if enabled)
     market_df = pd.DataFrame()
+    market_index_code = getattr(config, 'relative_strength_benchmark', None) or DEFAULT_RELATIVE_STRENGTH_BENCHMARK
     if getattr(config, 'check_relative_strength', False):
         try:
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Fetching market index data (sh.000001) for relative strength calculation...{Style.RESET_ALL}")
-            market_index_code = "sh.000001"  # 上证指数
+            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Fetching market index data ({market_index_code}) for relative strength calculation...{Style.RESET_ALL}")
             with BaostockConnectionManager():
-                market_df = fetch_kline_data(market_index_code, start_date, end_date)
+                market_df = prepare_analysis_frame(
+                    fetch_kline_data(market_index_code, start_date, end_date))
             if not market_df.empty:
                 print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ Market index data fetched: {len(market_df)} records{Style.RESET_ALL}")
             else:
@@ -173,6 +300,66 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
         except Exception as e:
             print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Error fetching market index data: {e}, relative strength calculation will be skipped{Style.RESET_ALL}")
             market_df = pd.DataFrame()
+    # 基准指数的交易日序号和累计对数收益只构建一次，所有股票共用
+    market_reference = MarketReference(market_df, market_index_code)
+    # 分阶段耗时分析（enable_profiling）：同一个 profiler 在数据获取线程和分析线程上激活
+    if profiler is None and getattr(config, 'enable_profiling', False):
+        profiler = ScanProfiler()
+
+    def profiling():
+        """Activate the scan profiler on the current thread (no-op when profiling is off)."""
+        return profiler.activate() if profiler else nullcontext()
+
+    # Per-stock analysis cache keyed by (code, K-line data version, analyzer config)
+    analysis_cache = StockAnalysisCache(
+        config, end_date, market_df,
+        enabled=getattr(config, 'use_analysis_cache', True)
+    )
+
+    def analyze_with_cache(stock_code: str, df: pd.DataFrame) -> Dict[str, Any]:
+        """Reuse a cached verdict for unchanged data and config, otherwise analyze."""
+        with profiling():
+            with profile_stage('analyze.cache_lookup'):
+                cached = analysis_cache.get(stock_code, df)
+            if cached is not None:
+                return cached
+            with profile_stage('analyze.total'):
+                result = _run_analyze_stock(df, config, market_reference, end_date)
+            analysis_cache.put(stock_code, df, result)
+            return result
+
+    # 特征表模式：记录每只已分析股票的快速检查特征（与阈值无关），放宽阈值时用于圈定候选股
+    collect_quick_features = return_stats and getattr(config, 'use_feature_table', False)
+    quick_features = {'windows': list(config.windows), 'code': [], 'name': [], 'industry': [],
+                      'box_ranges': [], 'volatilities': []}
+
+    def record_quick_features(stock: Dict[str, Any], df: pd.DataFrame,
+                              analysis_result: Dict[str, Any]) -> None:
+        """Append a stock's quick-check features; stocks without features can never be platforms."""
+        if not collect_quick_features:
+            return
+        try:
+            features = compute_quick_features(df, config.windows, analysis_result)
+        except Exception as e:
+            stock_logger.warning("[SCAN_CHECKPOINT] Failed to compute quick features for %s: %s", stock.get('code'), e)
+            return
+        if features is None:
+            return
+        quick_features['code'].append(stock['code'])
+        quick_features['name'].append(stock.get('name'))
+        quick_features['industry'].append(stock.get('industry', 'Unknown'))
+        quick_features['box_ranges'].append(features['box_ranges'])
+        quick_features['volatilities'].append(features['volatilities'])
+
+    def emit_platform_stock(platform_stock: Dict[str, Any]) -> None:
+        """Hand a newly found platform stock to on_platform_stock; errors never stop the scan."""
+        if on_platform_stock is None:
+            return
+        try:
+            on_platform_stock(platform_stock)
+        except Exception as e:
+            stock_logger.warning("[SCAN_CHECKPOINT] on_platform_stock failed for %s: %s", platform_stock.get('code'), e)
+
     print(f"{Fore.YELLOW}Scan parameters:{Style.RESET_ALL}")
     print(
         f"  - Date range: {Fore.GREEN}{start_date} to {end_date}{Style.RESET_ALL}")
@@ -277,17 +464,21 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                 from .data_fetcher import fetch_kline_data
                 with stocks_lock:
                     started_stocks.add(code)
-                print(f"{Fore.MAGENTA}[SCAN_CHECKPOINT] 🚀 TASK STARTED in thread {threading.current_thread().name} for {code} ({name}){Style.RESET_ALL}")
+                stock_logger.debug("[SCAN_CHECKPOINT] 🚀 TASK STARTED in thread %s for %s (%s)", threading.current_thread().name, code, name)
                 try:
-                    result, source = fetch_kline_data(code, start_date, end_date, retry_attempts, retry_delay, api_timeout, use_local_database_first=use_db_first, return_source=True)
+                    with profiling():
+                        fetch_start = time.perf_counter()
+                        result, source = fetch_kline_data(code, start_date, end_date, retry_attempts, retry_delay, api_timeout, use_local_database_first=use_db_first, return_source=True)
+                        # 按数据来源（db/api/mixed）分别统计获取耗时
+                        record_stage(f'fetch.{source}', time.perf_counter() - fetch_start)
                     with stocks_lock:
                         completed_stocks.add(code)
-                    print(f"{Fore.MAGENTA}[SCAN_CHECKPOINT] ✅ TASK FINISHED for {code} ({name}), returning {len(result)} rows{Style.RESET_ALL}")
+                    stock_logger.debug("[SCAN_CHECKPOINT] ✅ TASK FINISHED for %s (%s), returning %s rows", code, name, len(result))
                     return result, source
                 except Exception as e:
                     with stocks_lock:
                         completed_stocks.add(code)  # Mark as completed even if failed
-                    print(f"{Fore.RED}[SCAN_CHECKPOINT] 💥 TASK EXCEPTION for {code} ({name}): {e}{Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] 💥 TASK EXCEPTION for %s (%s): %s", code, name, e)
                     raise
             fetch_func = fetch_with_tracking
         else:
@@ -426,7 +617,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                             error_count += 1
                             processed_count += 1
                             completed_futures.add(future)  # Mark as processed
-                            print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Marking {stock['code']} ({stock['name']}) as error (watchdog timeout){Style.RESET_ALL}")
+                            stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Marking %s (%s) as error (watchdog timeout)", stock['code'], stock['name'])
                             pbar.set_postfix(success=success_count, empty=empty_count,
                                              error=error_count, platform=platform_count)
                             pbar.update(1)
@@ -464,7 +655,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                                 stock = future_to_stock[future]
                                 error_count += 1
                                 processed_count += 1
-                                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Marking {stock['code']} as error (timeout){Style.RESET_ALL}")
+                                stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Marking %s as error (timeout)", stock['code'])
                                 pbar.update(1)
                             break
                     
@@ -508,60 +699,32 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
 
                     if df.empty:
                         empty_count += 1
-                        if processed_count % 100 == 0:
-                            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] {stock_code}: Empty data (Total empty: {empty_count}){Style.RESET_ALL}")
+                        stock_logger.info("[SCAN_CHECKPOINT] %s: Empty data (Total empty: %s)", stock_code, empty_count)
                         pbar.set_postfix(success=success_count, empty=empty_count,
                                          error=error_count, platform=platform_count)
                         pbar.update(1)
                         continue
 
                     # Analyze for platform periods
-                    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔬 Starting analysis for {stock_code} ({stock_name})...{Style.RESET_ALL}")
-                    analysis_result = analyze_stock(
-                        df,
-                        config.windows,
-                        config.box_threshold,
-                        config.ma_diff_threshold,
-                        config.volatility_threshold,
-                        config.volume_change_threshold,
-                        config.volume_stability_threshold,
-                        config.volume_increase_threshold,
-                        config.use_volume_analysis,
-                        config.use_breakthrough_prediction,
-                        config.use_window_weights,
-                        config.window_weights,
-                        config.use_low_position,
-                        config.high_point_lookback_days,
-                        config.decline_period_days,
-                        config.decline_threshold,
-                        config.use_rapid_decline_detection,
-                        config.rapid_decline_days,
-                        config.rapid_decline_threshold,
-                        config.use_breakthrough_confirmation,
-                        config.breakthrough_confirmation_days,
-                        config.use_box_detection,
-                        config.box_quality_threshold,
-                        config.max_turnover_rate,
-                        config.allow_turnover_spikes,
-                        getattr(config, 'check_relative_strength', False),
-                        getattr(config, 'outperform_index_threshold', None),
-                        market_df,
-                        end_date
-                    )
-                    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Analysis completed for {stock_code}, is_platform: {analysis_result['is_platform']}{Style.RESET_ALL}")
+                    stock_logger.debug("[SCAN_CHECKPOINT] 🔬 Starting analysis for %s (%s)...", stock_code, stock_name)
+                    analysis_result = analyze_with_cache(stock_code, df)
+                    record_quick_features(stock, df, analysis_result)
+                    stock_logger.debug("[SCAN_CHECKPOINT] ✓ Analysis completed for %s, is_platform: %s", stock_code, analysis_result['is_platform'])
 
                     success_count += 1
 
                     # If it's a platform stock, add to results
                     if analysis_result["is_platform"]:
                         platform_count += 1
-                        print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ Platform found: {stock_code} ({stock_name}) - Total platforms: {platform_count}{Style.RESET_ALL}")
+                        logger.info("[SCAN_CHECKPOINT] ✓ Platform found: %s (%s) - Total platforms: %s", stock_code, stock_name, platform_count)
 
                         # Create result object
                         outperform_index = analysis_result.get("outperform_index")
                         stock_return = analysis_result.get("stock_return")
                         market_return = analysis_result.get("market_return")
-                        print(f"[RELATIVE_STRENGTH_DEBUG] Stock {stock_code} ({stock_name}): outperform_index={outperform_index}, stock_return={stock_return}, market_return={market_return}")
+                        stock_logger.debug("[RELATIVE_STRENGTH_DEBUG] Stock %s (%s): outperform_index=%s, stock_return=%s, market_return=%s", stock_code, stock_name, outperform_index, stock_return, market_return)
+                        with profiling(), profile_stage('serialize.kline_records'):
+                            kline_records = df.to_dict(orient='records')
                         
                         platform_stock = {
                             'code': stock_code,
@@ -570,17 +733,17 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                             'platform_windows': analysis_result["platform_windows"],
                             'details': analysis_result["details"],
                             'selection_reasons': analysis_result["selection_reasons"],
-                            'kline_data': df.to_dict(orient='records'),
+                            'kline_data': kline_records,
                             'outperform_index': outperform_index,
                             'stock_return': stock_return,
-                            'market_return': market_return
+                            'market_return': market_return,
+                            'window_features': analysis_result.get("window_features", {})
                         }
 
                         # Add mark lines if available
                         if "mark_lines" in analysis_result:
                             platform_stock['mark_lines'] = analysis_result["mark_lines"]
-                            print(
-                                f"{Fore.GREEN}添加标记线数据到股票 {stock_code}: {analysis_result['mark_lines']}{Style.RESET_ALL}")
+                            stock_logger.debug("添加标记线数据到股票 %s: %s", stock_code, analysis_result['mark_lines'])
 
                         # Add volume analysis results if available
                         if config.use_volume_analysis and "volume_analysis" in analysis_result:
@@ -614,6 +777,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                             platform_stock['box_analysis'] = analysis_result["box_analysis"]
 
                         platform_stocks.append(platform_stock)
+                        emit_platform_stock(platform_stock)
 
                     # Update progress
                     if update_progress and processed_count % 10 == 0:  # Update every 10 stocks
@@ -630,13 +794,13 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
 
                 except CancelledError:
                     error_count += 1
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] 🚫 Cancelled: {stock_code} ({stock_name}) by watchdog{Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] 🚫 Cancelled: %s (%s) by watchdog", stock_code, stock_name)
                 except TimeoutError:
                     error_count += 1
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⏱️ Timeout (15s) processing stock {stock_code} ({stock_name}), processed: {processed_count}/{total_stocks}{Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] ⏱️ Timeout (15s) processing stock %s (%s), processed: %s/%s", stock_code, stock_name, processed_count, total_stocks)
                 except Exception as e:
                     error_count += 1
-                    print(f"{Fore.RED}[SCAN_CHECKPOINT] ❌ Error processing stock {stock_code} ({stock_name}): {e}{Style.RESET_ALL}")
+                    stock_logger.error("[SCAN_CHECKPOINT] ❌ Error processing stock %s (%s): %s", stock_code, stock_name, e)
                     import traceback
                     traceback.print_exc()
 
@@ -664,7 +828,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                     error_count += 1
                     processed_count += 1
                     completed_futures.add(future)  # Mark as processed
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Marking {stock['code']} ({stock['name']}) as error (incomplete){Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Marking %s (%s) as error (incomplete)", stock['code'], stock['name'])
                     pbar.set_postfix(success=success_count, empty=empty_count,
                                      error=error_count, platform=platform_count)
                     pbar.update(1)
@@ -686,7 +850,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                     error_count += 1
                     processed_count += 1
                     completed_futures.add(future)
-                    print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Marking {stock['code']} ({stock['name']}) as error (missing){Style.RESET_ALL}")
+                    stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Marking %s (%s) as error (missing)", stock['code'], stock['name'])
                     pbar.set_postfix(success=success_count, empty=empty_count,
                                      error=error_count, platform=platform_count)
                     pbar.update(1)
@@ -718,31 +882,16 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                     df = future.result(timeout=2.0)  # Quick timeout
                     if not df.empty:
                         # Quick analysis
-                        analysis_result = analyze_stock(
-                            df, config.windows, config.box_threshold,
-                            config.ma_diff_threshold, config.volatility_threshold,
-                            config.volume_change_threshold, config.volume_stability_threshold,
-                            config.volume_increase_threshold, config.use_volume_analysis,
-                            config.use_breakthrough_prediction, config.use_window_weights,
-                            config.window_weights, config.use_low_position,
-                            config.high_point_lookback_days, config.decline_period_days,
-                            config.decline_threshold, config.use_rapid_decline_detection,
-                            config.rapid_decline_days, config.rapid_decline_threshold,
-                            config.use_breakthrough_confirmation,
-                            config.breakthrough_confirmation_days,
-                            config.use_box_detection, config.box_quality_threshold,
-                            config.max_turnover_rate, config.allow_turnover_spikes,
-                            getattr(config, 'check_relative_strength', False),
-                            getattr(config, 'outperform_index_threshold', 0.0),
-                            market_df,
-                            end_date
-                        )
+                        analysis_result = analyze_with_cache(stock_code, df)
+                        record_quick_features(stock, df, analysis_result)
                         if analysis_result["is_platform"]:
                             platform_count += 1
                             outperform_index = analysis_result.get("outperform_index")
                             stock_return = analysis_result.get("stock_return")
                             market_return = analysis_result.get("market_return")
-                            print(f"[RELATIVE_STRENGTH_DEBUG] Stock {stock_code} ({stock_name}): outperform_index={outperform_index}, stock_return={stock_return}, market_return={market_return}")
+                            stock_logger.debug("[RELATIVE_STRENGTH_DEBUG] Stock %s (%s): outperform_index=%s, stock_return=%s, market_return=%s", stock_code, stock_name, outperform_index, stock_return, market_return)
+                            with profiling(), profile_stage('serialize.kline_records'):
+                                kline_records = df.to_dict(orient='records')
                             
                             platform_stock = {
                                 'code': stock_code, 'name': stock_name,
@@ -750,16 +899,18 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                                 'platform_windows': analysis_result["platform_windows"],
                                 'details': analysis_result["details"],
                                 'selection_reasons': analysis_result["selection_reasons"],
-                                'kline_data': df.to_dict(orient='records'),
+                                'kline_data': kline_records,
                                 'outperform_index': outperform_index,
                                 'stock_return': stock_return,
-                                'market_return': market_return
+                                'market_return': market_return,
+                                'window_features': analysis_result.get("window_features", {})
                             }
                             if "mark_lines" in analysis_result:
                                 platform_stock['mark_lines'] = analysis_result["mark_lines"]
                             if "turnover_analysis" in analysis_result:
                                 platform_stock['turnover_analysis'] = analysis_result["turnover_analysis"]
                             platform_stocks.append(platform_stock)
+                            emit_platform_stock(platform_stock)
                             success_count += 1
                         else:
                             success_count += 1
@@ -798,6 +949,8 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
         traceback.print_exc()
         # Continue with filtering even if executor had issues
     finally:
+        # Persist newly computed per-stock verdicts for later scans
+        analysis_cache.flush()
         # Ensure we always reach this point even if executor shutdown had issues
         print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ========================================{Style.RESET_ALL}")
         print(f"{Fore.GREEN}[SCAN_CHECKPOINT] Executor context exited, proceeding with filtering...{Style.RESET_ALL}")
@@ -829,7 +982,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                 for future in incomplete_futures:
                     if future in future_to_stock:
                         stock = future_to_stock[future]
-                        print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Task {stock['code']} ({stock['name']}) did not complete{Style.RESET_ALL}")
+                        stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Task %s (%s) did not complete", stock['code'], stock['name'])
             except Exception as e:
                 print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Could not check incomplete tasks: {e}{Style.RESET_ALL}")
     
@@ -837,108 +990,8 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
     print(f"{Fore.GREEN}[SCAN_CHECKPOINT] Found {platform_count} platform stocks, starting filters...{Style.RESET_ALL}")
     print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Platform stocks list length: {len(platform_stocks)}{Style.RESET_ALL}")
 
-    # Apply fundamental analysis filter if enabled
-    if config.use_fundamental_filter:
-        print(f"{Fore.CYAN}Applying fundamental analysis filter...{Style.RESET_ALL}")
-        fundamental_filtered_stocks = analyze_fundamentals(
-            platform_stocks,
-            use_fundamental_filter=config.use_fundamental_filter,
-            revenue_growth_percentile=config.revenue_growth_percentile,
-            profit_growth_percentile=config.profit_growth_percentile,
-            roe_percentile=config.roe_percentile,
-            liability_percentile=config.liability_percentile,
-            pe_percentile=config.pe_percentile,
-            pb_percentile=config.pb_percentile,
-            years_to_check=config.fundamental_years_to_check
-        )
-        fundamental_count = len(fundamental_filtered_stocks)
-        print(f"{Fore.GREEN}Fundamental analysis complete. {fundamental_count} stocks passed out of {platform_count}.{Style.RESET_ALL}")
-    else:
-        fundamental_filtered_stocks = platform_stocks
-        fundamental_count = platform_count
-        print(f"{Fore.YELLOW}Fundamental analysis filter disabled.{Style.RESET_ALL}")
-
-    # Apply industry diversity filter
-    # IMPORTANT: Sort stocks by code before filtering to ensure deterministic results
-    # This is necessary because concurrent processing may produce different orders
-    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Sorting stocks by code for deterministic filtering...{Style.RESET_ALL}")
-    fundamental_filtered_stocks_sorted = sorted(
-        fundamental_filtered_stocks,
-        key=lambda s: s.get('code', '')
-    )
-    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Applying industry diversity filter on {len(fundamental_filtered_stocks_sorted)} stocks (expected_count={config.expected_count}){Style.RESET_ALL}")
-    try:
-        filtered_stocks = apply_industry_diversity_filter(
-            fundamental_filtered_stocks_sorted,
-            expected_count=config.expected_count
-        )
-        print(f"{Fore.GREEN}[SCAN_CHECKPOINT] Industry filter complete, selected {len(filtered_stocks)} stocks{Style.RESET_ALL}")
-    except Exception as e:
-        print(f"{Fore.RED}[SCAN_CHECKPOINT] ⚠️ Error in industry filter: {e}{Style.RESET_ALL}")
-        import traceback
-        traceback.print_exc()
-        # Fallback: return all stocks if filter fails (use sorted version for consistency)
-        filtered_stocks = fundamental_filtered_stocks_sorted
-        print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] Using all {len(filtered_stocks)} stocks as fallback{Style.RESET_ALL}")
-
-    # Sort by breakthrough & breakthrough precursor signals, then by box quality
-    # Priority order (higher priority first):
-    # 1. Breakthrough confirmation & breakthrough precursor signals
-    # 2. Box quality
-    print(f"{Fore.CYAN}[SCAN_CHECKPOINT] Starting multi-criteria sorting...{Style.RESET_ALL}")
-    
-    def calculate_sort_score(stock: Dict[str, Any]) -> Tuple[int, int, float]:
-        """
-        Calculate a composite score for sorting stocks.
-        Returns: (has_confirmation, signal_count, box_quality)
-        - has_confirmation: 1 if has breakthrough confirmation, 0 otherwise (highest priority)
-        - signal_count: number of breakthrough precursor indicators (second priority)
-        - box_quality: box quality score (third priority, higher is better)
-        """
-        has_confirmation = 0
-        signal_count = 0
-        box_quality = 0.0
-        
-        # Check for breakthrough confirmation (highest priority)
-        if config.use_breakthrough_confirmation:
-            if stock.get('has_breakthrough_confirmation', False):
-                has_confirmation = 1
-        
-        # Check for breakthrough prediction signals
-        if config.use_breakthrough_prediction and 'breakthrough_prediction' in stock:
-            breakthrough_pred = stock['breakthrough_prediction']
-            if isinstance(breakthrough_pred, dict):
-                signal_count = breakthrough_pred.get('signal_count', 0)
-        
-        # Get box quality score (third priority)
-        if config.use_box_detection and 'box_analysis' in stock:
-            box_analysis = stock['box_analysis']
-            if isinstance(box_analysis, dict):
-                box_quality = box_analysis.get('box_quality', 0.0)
-                # Ensure box_quality is a valid number
-                if not isinstance(box_quality, (int, float)) or (isinstance(box_quality, float) and (math.isnan(box_quality) or math.isinf(box_quality))):
-                    box_quality = 0.0
-        
-        return (has_confirmation, signal_count, box_quality)
-    
-    # Sort stocks: first by has_confirmation (descending), then by signal_count (descending), then by box_quality (descending)
-    filtered_stocks.sort(
-        key=lambda stock: calculate_sort_score(stock),
-        reverse=True
-    )
-    
-    sorted_count = len(filtered_stocks)
-    print(f"{Fore.GREEN}Sorted {sorted_count} stocks by breakthrough signals and box quality.{Style.RESET_ALL}")
-    
-    # Log sorting details for first few stocks
-    if sorted_count > 0:
-        print(f"{Fore.CYAN}Top 5 stocks after sorting:{Style.RESET_ALL}")
-        for i, stock in enumerate(filtered_stocks[:5], 1):
-            score = calculate_sort_score(stock)
-            print(f"  {i}. {stock.get('code', 'unknown')} ({stock.get('name', 'unknown')}): "
-                  f"confirmation={score[0]}, signals={score[1]}, box_quality={score[2]:.2f}")
-    
-    print(f"{Fore.GREEN}[SCAN_CHECKPOINT] Sorting complete, preparing to return results{Style.RESET_ALL}")
+    with profiling(), profile_stage('filter.finalize'):
+        filtered_stocks, fundamental_count = finalize_platform_stocks(platform_stocks, config)
 
     # Get data source statistics
     # For ProcessPoolExecutor, use collected_data_sources (from return values)
@@ -1002,7 +1055,7 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
                             completed_futures.add(future)
                             if missing_count <= 5 and future in future_to_stock:  # Only log if few missing
                                 stock = future_to_stock[future]
-                                print(f"{Fore.YELLOW}[SCAN_CHECKPOINT] ⚠️ Final cleanup: Marking {stock['code']} as error{Style.RESET_ALL}")
+                                stock_logger.warning("[SCAN_CHECKPOINT] ⚠️ Final cleanup: Marking %s as error", stock['code'])
                             if processed_count >= total_stocks:
                                 break
                 except Exception as e:
@@ -1035,11 +1088,23 @@ def scan_stocks(stock_list: List[Dict[str, Any]],
     if filtered_stocks:
         print(f"{Fore.CYAN}[SCAN_CHECKPOINT] First stock code: {filtered_stocks[0].get('code', 'unknown') if isinstance(filtered_stocks[0], dict) else 'N/A'}{Style.RESET_ALL}")
     
+    # 监控指标：扫描耗时、处理股票数、分析缓存命中情况
+    SCAN_DURATION.observe(time.perf_counter() - scan_started)
+    SCANNED_STOCKS.inc(total_stocks)
+    ANALYSIS_CACHE_REQUESTS.inc(analysis_cache.hits, result='hit')
+    ANALYSIS_CACHE_REQUESTS.inc(analysis_cache.misses, result='miss')
+    
     # Return statistics if requested
     if return_stats:
         return filtered_stocks, {
             'total_scanned': total_stocks,
-            'success_count': success_count
+            'success_count': success_count,
+            # 行业/基本面筛选前的平台股（供 feature_table 保存特征集）
+            'platform_stocks': platform_stocks,
+            # 每只已分析股票的快速检查特征（仅 use_feature_table 时收集，否则为 None）
+            'quick_features': quick_features if collect_quick_features else None,
+            # 分阶段耗时报告（未开启 enable_profiling 时为 None）
+            'profile': profiler.report() if profiler else None
         }
     
     return filtered_stocks
@@ -0,0 +1,118 @@
+"""
+Ranking module.
+Cross-sectional ranking of platform stocks after analysis: the sort score of
+every candidate is extracted once into a compact NumPy record array, and the
+top expected_count stocks are picked under per-industry quotas with bounded
+heaps (O(n log k)), so the full result dicts are never sorted.
+
+Sort score, compared in order (higher first): breakthrough confirmation,
+breakthrough precursor signal count, box quality. Ties are broken by stock
+code so results do not depend on the order analysis finished in.
+"""
+import heapq
+from typing import Any, Dict, List
+
+import numpy as np
+
+try:
+    from .config import ScanConfig
+    from .industry_filter import allocate_industry_slots
+except ImportError:
+    from api.config import ScanConfig
+    from api.industry_filter import allocate_industry_slots
+
+# One record per candidate stock
+SCORE_DTYPE = np.dtype([
+    ('confirmation', np.int8),
+    ('signals', np.int16),
+    ('box_quality', np.float64),
+])
+
+
+def build_score_array(stocks: List[Dict[str, Any]], config: ScanConfig) -> np.ndarray:
+    """
+    Extract the sort score of each stock (disabled criteria score 0).
+
+    Args:
+        stocks: Platform stock dictionaries
+        config: Scan configuration (use_breakthrough_confirmation,
+            use_breakthrough_prediction and use_box_detection)
+
+    Returns:
+        Record array of SCORE_DTYPE, aligned with stocks
+    """
+    scores = np.zeros(len(stocks), dtype=SCORE_DTYPE)
+    if config.use_breakthrough_confirmation:
+        scores['confirmation'] = [1 if stock.get('has_breakthrough_confirmation') else 0
+                                  for stock in stocks]
+    if config.use_breakthrough_prediction:
+        scores['signals'] = [_signal_count(stock.get('breakthrough_prediction')) for stock in stocks]
+    if config.use_box_detection:
+        box_quality = np.array([
+            _box_quality(stock.get('box_analysis')) for stock in stocks
+        ], dtype=np.float64)
+        # NaN/inf 统一视为 0，只在这里校验一次
+        box_quality[~np.isfinite(box_quality)] = 0.0
+        scores['box_quality'] = box_quality
+    return scores
+
+
+def _signal_count(prediction: Any) -> int:
+    if not isinstance(prediction, dict):
+        return 0
+    return int(prediction.get('signal_count') or 0)
+
+
+def _box_quality(box_analysis: Any) -> float:
+    if not isinstance(box_analysis, dict):
+        return 0.0
+    value = box_analysis.get('box_quality', 0.0)
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def select_top_stocks(stocks: List[Dict[str, Any]], scores: np.ndarray,
+                      expected_count: int) -> List[int]:
+    """
+    Pick the best-scored stocks under per-industry quotas
+    (industry_filter.allocate_industry_slots). Quota slots an industry cannot
+    fill go to the best remaining stocks of any industry.
+
+    Args:
+        stocks: Platform stock dictionaries
+        scores: Score array from build_score_array
+        expected_count: Number of stocks to return
+
+    Returns:
+        Indices of the selected stocks, best first
+    """
+    codes = [stock.get('code', '') for stock in stocks]
+    confirmation = scores['confirmation'].tolist()
+    signals = scores['signals'].tolist()
+    box_quality = scores['box_quality'].tolist()
+
+    def rank_key(i: int):
+        return (-confirmation[i], -signals[i], -box_quality[i], codes[i])
+
+    if len(stocks) <= expected_count:
+        return sorted(range(len(stocks)), key=rank_key)
+
+    industries = [stock.get('industry', 'Unknown') for stock in stocks]
+    industry_slots = allocate_industry_slots(industries, expected_count)
+    by_industry: Dict[str, List[int]] = {}
+    for i, industry in enumerate(industries):
+        by_industry.setdefault(industry, []).append(i)
+
+    selected: List[int] = []
+    for industry, indices in by_industry.items():
+        slots = industry_slots[industry]
+        if slots:
+            selected.extend(heapq.nsmallest(slots, indices, key=rank_key))
+
+    if len(selected) < expected_count:
+        chosen = set(selected)
+        remaining = (i for i in range(len(stocks)) if i not in chosen)
+        selected.extend(heapq.nsmallest(expected_count - len(selected), remaining, key=rank_key))
+
+    selected.sort(key=rank_key)
+    return selected
+
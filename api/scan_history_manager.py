@@ -5,7 +5,6 @@ Manages scan history records stored in database.
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, date
 from .stock_database import get_stock_database
-from .json_utils import sanitize_float_for_json, convert_numpy_types, sanitize_kline_data
 
 # Maximum number of history records to keep
 MAX_HISTORY_RECORDS = 100
@@ -48,45 +47,6 @@ def get_current_quarter_range() -> Tuple[str, str]:
     return start_date_str, end_date_str
 
 
-def sanitize_scan_history_record(record: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Sanitize scan history record for JSON serialization.
-    Removes invalid float values (NaN, Infinity) and converts NumPy types.
-    
-    Args:
-        record: The scan history record to sanitize
-    
-    Returns:
-        Sanitized scan history record
-    """
-    if not record:
-        return record
-    
-    try:
-        # First convert NumPy types, then sanitize floats
-        # This ensures we handle nested structures properly
-        sanitized = convert_numpy_types(record)
-        sanitized = sanitize_float_for_json(sanitized)
-        
-        # Special handling for scannedStocks (if present)
-        if 'scannedStocks' in sanitized and isinstance(sanitized['scannedStocks'], list):
-            sanitized_stocks = []
-            for stock in sanitized['scannedStocks']:
-                # Stock data might already be sanitized, but ensure kline_data is handled
-                if isinstance(stock, dict) and 'kline_data' in stock:
-                    if stock['kline_data']:
-                        stock['kline_data'] = sanitize_kline_data(stock['kline_data'])
-                sanitized_stocks.append(stock)
-            sanitized['scannedStocks'] = sanitized_stocks
-        
-        return sanitized
-    except Exception as e:
-        # If sanitization fails, return the original record
-        # This prevents the API from crashing, but may still cause JSON errors
-        print(f"Warning: Failed to sanitize scan history record: {e}")
-        return record
-
-
 def get_scan_history_list(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -114,25 +74,23 @@ def get_scan_history_list(
         start_date=start_date,
         end_date=end_date
     )
-    # Sanitize all records before returning
-    return [sanitize_scan_history_record(record) for record in records]
+    # NumPy 类型与 NaN/Infinity 在响应序列化时统一处理（FastJSONResponse）
+    return records
 
 
-def get_scan_history(cache_key: str) -> Optional[Dict[str, Any]]:
+def get_scan_history(cache_key: str, include_kline: bool = True) -> Optional[Dict[str, Any]]:
     """
     Get a specific scan history record by cache_key.
     
     Args:
         cache_key: The cache key of the scan record
+        include_kline: Whether to include each stock's kline_data (otherwise only kline_ref)
     
     Returns:
         Full scan history record if found, None otherwise
     """
     db = get_stock_database()
-    record = db.get_scan_history(cache_key)
-    if record:
-        return sanitize_scan_history_record(record)
-    return None
+    return db.get_scan_history(cache_key, include_kline=include_kline)
 
 
 def delete_scan_history(cache_key: str) -> bool:
@@ -0,0 +1,165 @@
+"""
+Scan profiler module.
+Opt-in per-stage timing for scans (enabled with ScanConfig.enable_profiling).
+Instrumented code records stage durations against the profiler that is active
+on the current thread; when no profiler is active, recording is a no-op, so
+the instrumentation costs one thread-local lookup per call site.
+
+Stages are named '<area>.<step>', e.g. 'db.lock_wait', 'fetch.api',
+'analyze.quick_check', 'serialize.kline_records'. The report aggregates the
+samples of each stage into count, total, mean and percentiles (milliseconds).
+
+Only ThreadPoolExecutor scans are profiled; worker processes of a
+ProcessPoolExecutor do not share the profiler.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Percentiles included in the report for each stage
+PROFILE_PERCENTILES = (50, 90, 99)
+
+_thread_local = threading.local()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ScanProfiler:
+    """
+    Collects per-stage timing samples of one scan.
+    Thread-safe: worker threads record concurrently.
+    """
+
+    def __init__(self):
+        """Initialize an empty profiler and start the wall clock."""
+        self._samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Record one duration sample for a stage.
+
+        Args:
+            stage: Stage name (e.g. 'db.query')
+            seconds: Duration in seconds
+        """
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    @contextmanager
+    def activate(self) -> Iterator['ScanProfiler']:
+        """Make this profiler the active one on the current thread."""
+        previous = getattr(_thread_local, 'profiler', None)
+        _thread_local.profiler = self
+        try:
+            yield self
+        finally:
+            _thread_local.profiler = previous
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Aggregate samples into a timing report.
+
+        Returns:
+            Dict with wall_time_ms and per-stage statistics, stages ordered
+            by total time (largest first)
+        """
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        wall_time = time.perf_counter() - self._started_at
+
+        stages = {}
+        for stage, values in sorted(samples.items(), key=lambda item: sum(item[1]), reverse=True):
+            total = sum(values)
+            stats = {
+                'count': len(values),
+                'total_ms': round(total * 1000, 3),
+                'mean_ms': round(total / len(values) * 1000, 3),
+            }
+            for pct in PROFILE_PERCENTILES:
+                stats[f'p{pct}_ms'] = round(_percentile(values, pct) * 1000, 3)
+            stats['max_ms'] = round(values[-1] * 1000, 3)
+            stages[stage] = stats
+
+        return {
+            'wall_time_ms': round(wall_time * 1000, 3),
+            'stages': stages
+        }
+
+
+def get_active_profiler() -> Optional[ScanProfiler]:
+    """Get the profiler active on the current thread (None if profiling is off)."""
+    return getattr(_thread_local, 'profiler', None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration on the active profiler, if any."""
+    profiler = getattr(_thread_local, 'profiler', None)
+    if profiler is not None:
+        profiler.record(stage, seconds)
+
+
+@contextmanager
+def profile_stage(stage: str) -> Iterator[None]:
+    """Time the enclosed block as one sample of a stage (no-op without an active profiler)."""
+    profiler = getattr(_thread_local, 'profiler', None)
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(stage, time.perf_counter() - start)
+
+
+class _StageTimer:
+    """Records consecutive steps of a function as laps of one clock."""
+
+    def __init__(self, profiler: ScanProfiler, prefix: str):
+        self._profiler = profiler
+        self._prefix = prefix
+        self._last = time.perf_counter()
+
+    def lap(self, step: str) -> None:
+        """Record the time since the previous lap as stage '<prefix>.<step>'."""
+        now = time.perf_counter()
+        self._profiler.record(f"{self._prefix}.{step}", now - self._last)
+        self._last = now
+
+
+class _NullStageTimer:
+    """Stage timer used when profiling is off."""
+
+    def lap(self, step: str) -> None:
+        pass
+
+
+_NULL_STAGE_TIMER = _NullStageTimer()
+
+
+def stage_timer(prefix: str):
+    """
+    Get a lap timer for the steps of a function.
+
+    Args:
+        prefix: Stage name prefix (e.g. 'analyze')
+
+    Returns:
+        Timer whose lap(step) records '<prefix>.<step>'; a no-op timer
+        when no profiler is active
+    """
+    profiler = getattr(_thread_local, 'profiler', None)
+    if profiler is None:
+        return _NULL_STAGE_TIMER
+    return _StageTimer(profiler, prefix)
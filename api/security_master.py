@@ -0,0 +1,144 @@
+"""
+Security master module.
+In-process index of per-stock metadata (code -> name, type, status, industry)
+and of the prepared scan stock list. Built once from the stock_basics and
+industry_data tables and shared by all endpoints; it is rebuilt only when
+StockDatabase.save_stock_basics / save_industry_data bump basics_version.
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from colorama import Fore, Style
+
+try:
+    from .data_fetcher import fetch_stock_basics, fetch_industry_data
+    from .platform_scanner import prepare_stock_list
+    from .stock_database import get_stock_database
+except ImportError:
+    from api.data_fetcher import fetch_stock_basics, fetch_industry_data
+    from api.platform_scanner import prepare_stock_list
+    from api.stock_database import get_stock_database
+
+
+class SecurityMaster:
+    """
+    Versioned security master index.
+    Thread-safe: lookups read immutable snapshots, rebuilds are serialized.
+    """
+
+    def __init__(self):
+        """Initialize an empty index (loaded lazily on first access)."""
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._stock_list: List[Dict[str, Any]] = []
+
+    def _ensure_loaded(self) -> None:
+        """Build the index if it was never built or basics/industry data changed since."""
+        db = get_stock_database()
+        if self._version is not None and self._version == db.basics_version:
+            return
+
+        with self._lock:
+            if self._version is not None and self._version == db.basics_version:
+                return
+
+            # 先记录版本再查询：查询期间发生的写入会使下次访问重新加载，而不是被当作已加载
+            version = db.basics_version
+
+            # 数据库为空时会回退到 API 获取并写入数据库
+            basics_df = fetch_stock_basics(use_local_database_first=True)
+            try:
+                industry_df = fetch_industry_data(use_local_database_first=True)
+            except Exception as e:
+                print(f"{Fore.YELLOW}[SECURITY_MASTER] Warning: Failed to load industry data: {e}{Style.RESET_ALL}")
+                industry_df = pd.DataFrame()
+
+            stock_list = prepare_stock_list(basics_df, industry_df)
+
+            # 构建 code -> 元数据 索引（包含指数和非活跃股票，供回测过滤使用）
+            name_column = 'code_name' if 'code_name' in basics_df.columns else 'name'
+            names = basics_df[name_column] if name_column in basics_df.columns else pd.Series('', index=basics_df.index)
+            industries = {}
+            if not industry_df.empty and 'industry' in industry_df.columns:
+                industries = dict(zip(industry_df['code'], industry_df['industry']))
+            records = {
+                code: {
+                    'code': code,
+                    'name': name or '',
+                    'type': str(stock_type),
+                    'status': str(status),
+                    'industry': industries.get(code) or 'Unknown'
+                }
+                for code, name, stock_type, status in zip(
+                    basics_df['code'], names, basics_df['type'], basics_df['status'])
+            }
+
+            self._records = records
+            self._stock_list = stock_list
+            self._version = version
+            print(f"{Fore.GREEN}[SECURITY_MASTER] Loaded {len(records)} securities, {len(stock_list)} scannable stocks (version {self._version}){Style.RESET_ALL}")
+
+    @property
+    def version(self) -> Optional[int]:
+        """Basics version the current index was built from (None before first load)."""
+        return self._version
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        Get metadata for a security.
+
+        Args:
+            code: Stock code (e.g. 'sh.600000')
+
+        Returns:
+            Dict with code, name, type, status and industry, or None if unknown
+        """
+        self._ensure_loaded()
+        return self._records.get(code)
+
+    def get_stock_list(self, use_local_database_first: bool = True) -> List[Dict[str, Any]]:
+        """
+        Get the scan stock list (active stocks, no indices/convertible bonds, with industry).
+
+        Args:
+            use_local_database_first: If False, re-fetch basics and industry data from the API first
+
+        Returns:
+            New list of stock dictionaries (safe for callers to modify)
+        """
+        if not use_local_database_first:
+            # 从 API 重新获取并写入数据库，写入会使索引失效并在下方重建
+            fetch_stock_basics(use_local_database_first=False)
+            try:
+                fetch_industry_data(use_local_database_first=False)
+            except Exception as e:
+                print(f"{Fore.YELLOW}[SECURITY_MASTER] Warning: Failed to fetch industry data: {e}{Style.RESET_ALL}")
+        self._ensure_loaded()
+        return [dict(stock) for stock in self._stock_list]
+
+    def invalidate(self) -> None:
+        """Force a rebuild on next access."""
+        with self._lock:
+            self._version = None
+
+
+# Global security master instance
+_security_master: Optional[SecurityMaster] = None
+_security_master_lock = threading.Lock()
+
+
+def get_security_master() -> SecurityMaster:
+    """
+    Get the global security master instance (thread-safe singleton).
+
+    Returns:
+        SecurityMaster instance
+    """
+    global _security_master
+    if _security_master is None:
+        with _security_master_lock:
+            if _security_master is None:
+                _security_master = SecurityMaster()
+    return _security_master
@@ -6,12 +6,27 @@ import os
 import sqlite3
 import pandas as pd
 import json
+import zlib
 from typing import Optional, List, Tuple, Dict, Any
 from datetime import datetime, timedelta, date, timezone
 from threading import Lock
 import threading
 from contextlib import contextmanager
 
+try:
+    from .logging_utils import get_logger
+    from .scan_profiler import record_stage
+    from .metrics import DB_LOCK_WAIT
+    from .json_utils import dumps_json
+except ImportError:
+    from api.logging_utils import get_logger
+    from api.scan_profiler import record_stage
+    from api.metrics import DB_LOCK_WAIT
+    from api.json_utils import dumps_json
+
+# Per-stock database events (lock waits, query timings)
+stock_logger = get_logger('database.stock')
+
 # Define database directory and file
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 DB_FILE = os.path.join(DB_DIR, 'stocks.db')
@@ -61,6 +76,96 @@ def normalize_timestamp_to_utc(timestamp) -> str:
     return str(timestamp)
 
 
+# K-line columns restored when rehydrating compact scan results
+KLINE_REF_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume', 'turn',
+                     'preclose', 'pctChg', 'peTTM', 'pbMRQ']
+
+
+def encode_scan_payload(payload: Any) -> bytes:
+    """
+    Encode a scan result payload as zlib-compressed compact JSON.
+    
+    Args:
+        payload: JSON-serializable payload (non-serializable values fall back to str)
+    
+    Returns:
+        Compressed bytes suitable for a BLOB column
+    """
+    text = json.dumps(payload, ensure_ascii=False, default=str, separators=(',', ':'))
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def decode_scan_payload(blob: bytes) -> Any:
+    """
+    Decode a payload produced by encode_scan_payload.
+    
+    Args:
+        blob: Compressed bytes
+    
+    Returns:
+        Decoded payload
+    """
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def _kline_date_str(value: Any) -> Optional[str]:
+    """Normalize a K-line date value (Timestamp/str) to 'YYYY-MM-DD'."""
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def latest_percent_b(kline_data: List[Dict[str, Any]], period: int = 20,
+                     std_dev: float = 2.0) -> Optional[float]:
+    """
+    Calculate %B of the last close against Bollinger Bands over the last
+    period closes (sample std), the same way the frontend does from kline_data.
+    
+    Args:
+        kline_data: List of K-line records ordered by date
+        period: Bollinger period
+        std_dev: Band width in standard deviations
+    
+    Returns:
+        %B value, or None if there are not enough valid closes
+    """
+    if len(kline_data) < period:
+        return None
+    closes = [point.get('close') for point in kline_data[-period:]]
+    if any(not isinstance(c, (int, float)) or c != c for c in closes):
+        return None
+    middle = sum(closes) / period
+    std = (sum((c - middle) ** 2 for c in closes) / (period - 1)) ** 0.5
+    band_width = 2 * std * std_dev
+    if band_width == 0:
+        return 0.5
+    return (closes[-1] - (middle - std * std_dev)) / band_width
+
+
+def build_kline_ref(code: str, kline_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a K-line reference (code + date range) for an embedded K-line series.
+    The latest %B is kept in the reference so result lists can be filtered and
+    ranged by %B without loading the K-lines.
+    
+    Args:
+        code: Stock code
+        kline_data: Non-empty list of K-line records ordered by date
+    
+    Returns:
+        Dict with code, start_date, end_date, count and percent_b
+    """
+    return {
+        'code': code,
+        'start_date': _kline_date_str(kline_data[0].get('date')),
+        'end_date': _kline_date_str(kline_data[-1].get('date')),
+        'count': len(kline_data),
+        'percent_b': latest_percent_b(kline_data)
+    }
+
+
 class StockDatabase:
     """
     Thread-safe SQLite database manager for stock historical data.
@@ -77,10 +182,35 @@ class StockDatabase:
         self._lock = Lock()
         self._local = threading.local()
         self._pid = os.getpid()  # Track the process ID
+        # Incremented whenever stock basics or industry data are written, so indexes
+        # and caches built from them (security master, basics cache) can invalidate.
+        # Persisted in data_versions: survives restarts and is unique across processes
+        self._basics_version = 0
         
         # Initialize database on first use
         self._initialize_database()
     
+    @property
+    def basics_version(self) -> int:
+        """Persisted version counter of stock basics / industry data (bumped on every save)."""
+        return self._basics_version
+    
+    def _bump_data_version(self, conn: sqlite3.Connection, name: str) -> int:
+        """
+        Increment a persisted data version inside a write transaction. Must hold lock.
+        
+        Args:
+            conn: Connection of the open transaction
+            name: Version name (row of data_versions)
+        
+        Returns:
+            The new version
+        """
+        conn.execute('INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)', (name,))
+        conn.execute('UPDATE data_versions SET version = version + 1 WHERE name = ?', (name,))
+        row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+        return row[0]
+    
     def _get_connection(self) -> sqlite3.Connection:
         """
         Get a thread-local and process-local database connection.
@@ -187,6 +317,25 @@ class StockDatabase:
                 ON kline_data(date)
             ''')
             
+            # Create kline_coverage table: stored date range per stock, kept up to date
+            # by the K-line save methods (coverage index for incremental sync)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS kline_coverage (
+                    code TEXT PRIMARY KEY,
+                    first_date TEXT NOT NULL,
+                    last_date TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 旧数据库首次升级时从 kline_data 构建覆盖索引
+            cursor.execute('SELECT COUNT(*) FROM kline_coverage')
+            if cursor.fetchone()[0] == 0:
+                cursor.execute('''
+                    INSERT INTO kline_coverage (code, first_date, last_date)
+                    SELECT code, MIN(date), MAX(date) FROM kline_data GROUP BY code
+                ''')
+            
             # Create cases table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS cases (
@@ -256,6 +405,23 @@ class StockDatabase:
             except sqlite3.OperationalError:
                 pass  # Column already exists
             
+            # Compressed payload (K-line stripped to references) and stock count
+            try:
+                cursor.execute('ALTER TABLE scan_cache ADD COLUMN scanned_stocks_blob BLOB')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
+            try:
+                cursor.execute('ALTER TABLE scan_cache ADD COLUMN stock_count INTEGER')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
+            # Stage timing report of the scan (JSON, only when enable_profiling was set)
+            try:
+                cursor.execute('ALTER TABLE scan_cache ADD COLUMN scan_profile TEXT')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
             # Add batch_task_id column to backtest_history if it doesn't exist
             try:
                 cursor.execute('ALTER TABLE backtest_history ADD COLUMN batch_task_id TEXT')
@@ -342,7 +508,251 @@ class StockDatabase:
                 ON batch_scan_results(scan_date)
             ''')
             
+            # Create analysis_cache table for per-stock analysis verdicts
+            # Keyed by stock code, K-line data version and analyzer config hash
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    code TEXT NOT NULL,
+                    data_version TEXT NOT NULL,
+                    config_hash TEXT NOT NULL,
+                    result BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (config_hash, code, data_version)
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_cache_created_at 
+                ON analysis_cache(created_at)
+            ''')
+            
+            # Create scan_feature_sets table for threshold re-filtering
+            # Stores pre-filter platform stocks and their per-window features
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_feature_sets (
+                    feature_key TEXT PRIMARY KEY,
+                    backtest_date TEXT NOT NULL,
+                    thresholds TEXT NOT NULL,
+                    stocks_blob BLOB NOT NULL,
+                    features_blob BLOB NOT NULL,
+                    stock_count INTEGER,
+                    total_scanned INTEGER,
+                    success_count INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create fundamentals table for annual report metrics (one row per stock/report)
+            # has_report = 0 marks a report that was not yet published when last checked
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fundamentals (
+                    code TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    quarter INTEGER NOT NULL,
+                    pub_date TEXT,
+                    stat_date TEXT,
+                    yoy_asset REAL,
+                    yoy_pni REAL,
+                    roe_avg REAL,
+                    liability_to_asset REAL,
+                    has_report INTEGER NOT NULL DEFAULT 1,
+                    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (code, year, quarter)
+                )
+            ''')
+            
+            # Create data_versions table for persisted data version counters (e.g. basics)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # Create task_queue table for durable background tasks (scans, batch scans, refreshes)
+            # Unfinished tasks (pending/running) are resumed when the service restarts
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS task_queue (
+                    task_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    dedupe_key TEXT,
+                    payload TEXT,
+                    message TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_task_queue_status 
+                ON task_queue(status, priority, created_at)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_task_queue_dedupe 
+                ON task_queue(kind, dedupe_key)
+            ''')
+            
+            # Result of completed tasks, so task status survives a restart
+            try:
+                cursor.execute('ALTER TABLE task_queue ADD COLUMN result_blob BLOB')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
+            # Compressed payload columns for batch scan results
+            try:
+                cursor.execute('ALTER TABLE batch_scan_results ADD COLUMN scanned_stocks_blob BLOB')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
+            try:
+                cursor.execute('ALTER TABLE batch_scan_results ADD COLUMN stock_count INTEGER')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
+            # Quick-check features of every analyzed stock of a feature set
+            try:
+                cursor.execute('ALTER TABLE scan_feature_sets ADD COLUMN quick_features_blob BLOB')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
             conn.commit()
+            
+            cursor.execute("SELECT version FROM data_versions WHERE name = 'basics'")
+            row = cursor.fetchone()
+            self._basics_version = row[0] if row else 0
+    
+    def _covered_kline_ref(self, cursor: sqlite3.Cursor, code: str,
+                           kline: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Build a kline_ref for an embedded K-line series if the kline_data table
+        fully covers its range. Must be called with the lock held.
+        
+        Args:
+            cursor: Database cursor
+            code: Stock code
+            kline: Non-empty embedded K-line series
+        
+        Returns:
+            The reference, or None if the table cannot restore the series
+        """
+        kline_ref = build_kline_ref(code, kline)
+        cursor.execute('''
+            SELECT COUNT(*) FROM kline_data
+            WHERE code = ? AND date >= ? AND date <= ?
+        ''', (code, kline_ref['start_date'], kline_ref['end_date']))
+        stored_count = cursor.fetchone()[0]
+        return kline_ref if stored_count == len(kline) else None
+    
+    def _compact_scanned_stocks(self, cursor: sqlite3.Cursor,
+                                scanned_stocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Replace embedded kline_data with a reference (code + date range) when the
+        kline_data table fully covers that range. Must be called with the lock held.
+        
+        Args:
+            cursor: Cursor of the current transaction
+            scanned_stocks: List of scanned stock dictionaries
+        
+        Returns:
+            New list of stock dictionaries (input is not modified)
+        """
+        compact = []
+        for stock in scanned_stocks or []:
+            kline = stock.get('kline_data') if isinstance(stock, dict) else None
+            code = stock.get('code') if isinstance(stock, dict) else None
+            if not kline or not code:
+                compact.append(stock)
+                continue
+            
+            # 仅当数据库完整覆盖该区间时才用引用替代，否则保留原始数据
+            kline_ref = self._covered_kline_ref(cursor, code, kline)
+            if kline_ref is None:
+                compact.append(stock)
+                continue
+            
+            stock = dict(stock)
+            del stock['kline_data']
+            stock['kline_ref'] = kline_ref
+            compact.append(stock)
+        return compact
+    
+    def compact_scanned_stocks(self, scanned_stocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Replace embedded kline_data with a kline_ref wherever the kline_data
+        table can restore it; other stocks keep their K-lines.
+        
+        Args:
+            scanned_stocks: List of scanned stock dictionaries
+        
+        Returns:
+            New list of stock dictionaries (input is not modified)
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            return self._compact_scanned_stocks(cursor, scanned_stocks)
+    
+    def _hydrate_scanned_stocks(self, cursor: sqlite3.Cursor,
+                                scanned_stocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Restore kline_data for stocks stored with a kline_ref. Must be called with the lock held.
+        
+        Args:
+            cursor: Database cursor
+            scanned_stocks: List of (possibly compact) stock dictionaries
+        
+        Returns:
+            The same list with kline_data restored in place
+        """
+        for stock in scanned_stocks:
+            if not isinstance(stock, dict):
+                continue
+            ref = stock.pop('kline_ref', None)
+            if not ref:
+                continue
+            cursor.execute(f'''
+                SELECT {', '.join(KLINE_REF_COLUMNS)}
+                FROM kline_data
+                WHERE code = ? AND date >= ? AND date <= ?
+                ORDER BY date ASC
+            ''', (ref.get('code'), ref.get('start_date'), ref.get('end_date')))
+            stock['kline_data'] = [dict(zip(KLINE_REF_COLUMNS, row)) for row in cursor.fetchall()]
+        return scanned_stocks
+    
+    def _load_scanned_stocks(self, cursor: sqlite3.Cursor, text: Optional[str],
+                             blob: Optional[bytes], include_kline: bool = True) -> List[Dict[str, Any]]:
+        """
+        Load scanned stocks from either the compressed BLOB or the legacy JSON text column.
+        Must be called with the lock held.
+        
+        Args:
+            cursor: Database cursor
+            text: Legacy scanned_stocks JSON text
+            blob: Compressed payload (takes precedence when present)
+            include_kline: Whether to rehydrate kline_data from the kline_data table
+                (otherwise embedded K-lines the table covers become a kline_ref)
+        
+        Returns:
+            List of scanned stock dictionaries
+        """
+        if blob:
+            scanned_stocks = decode_scan_payload(blob)
+        else:
+            scanned_stocks = json.loads(text) if text else []
+        if not isinstance(scanned_stocks, list):
+            return []
+        if include_kline:
+            return self._hydrate_scanned_stocks(cursor, scanned_stocks)
+        
+        # 不需要K线时，记录中仍内嵌的K线（旧格式或数据库未完整覆盖）能还原的才替换为引用
+        return self._compact_scanned_stocks(cursor, scanned_stocks)
     
     def is_empty(self) -> bool:
         """
@@ -367,6 +777,8 @@ class StockDatabase:
         """
         with self._lock:
             with self._transaction() as conn:
+                version = self._bump_data_version(conn, 'basics')
+                
                 # Get list of new stock codes
                 new_codes = set(df['code'].tolist())
                 
@@ -413,6 +825,8 @@ class StockDatabase:
                 finally:
                     # Always re-enable foreign key constraints
                     conn.execute('PRAGMA foreign_keys=ON')
+            # 提交后才更新版本：回滚的写入不改变版本
+            self._basics_version = version
     
     def get_stock_basics(self) -> Optional[pd.DataFrame]:
         """
@@ -440,6 +854,8 @@ class StockDatabase:
         """
         with self._lock:
             with self._transaction() as conn:
+                version = self._bump_data_version(conn, 'basics')
+                
                 # Clear existing data
                 conn.execute('DELETE FROM industry_data')
                 
@@ -454,6 +870,7 @@ class StockDatabase:
                         row.get('industry', ''),
                         datetime.now()
                     ))
+            self._basics_version = version
     
     def get_industry_data(self) -> Optional[pd.DataFrame]:
         """
@@ -482,13 +899,14 @@ class StockDatabase:
             DataFrame containing K-line data
         """
         import time
-        from colorama import Fore, Style
         start_time = time.time()
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔒 Acquiring DB lock for get_kline_data({code})...{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] 🔒 Acquiring DB lock for get_kline_data(%s)...", code)
         
         with self._lock:
             lock_acquired = time.time()
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ DB lock acquired for {code} (waited {lock_acquired - start_time:.3f}s){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ DB lock acquired for %s (waited %.3fs)", code, lock_acquired - start_time)
+            record_stage('db.lock_wait', lock_acquired - start_time)
+            DB_LOCK_WAIT.observe(lock_acquired - start_time, operation='query')
             
             conn = self._get_connection()
             query = '''
@@ -498,10 +916,11 @@ class StockDatabase:
                 WHERE code = ? AND date >= ? AND date <= ?
                 ORDER BY date ASC
             '''
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 📖 Executing SQL query for {code}...{Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] 📖 Executing SQL query for %s...", code)
             df = pd.read_sql_query(query, conn, params=(code, start_date, end_date))
             query_end = time.time()
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ Query completed for {code} (took {query_end - lock_acquired:.3f}s, {len(df)} rows){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ Query completed for %s (took %.3fs, %s rows)", code, query_end - lock_acquired, len(df))
+            record_stage('db.query', query_end - lock_acquired)
             
             if not df.empty:
                 # Convert date column to datetime
@@ -515,6 +934,36 @@ class StockDatabase:
             
             return df
     
+    def get_kline_data_batch(self, ranges: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Get K-line records for multiple (code, start_date, end_date) ranges in one call.
+        
+        Args:
+            ranges: List of dicts with 'code', 'start_date' and 'end_date' keys
+        
+        Returns:
+            List of dicts (same order as ranges) with code, start_date, end_date
+            and kline_data (list of records with 'YYYY-MM-DD' dates)
+        """
+        results = []
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            for item in ranges:
+                cursor.execute(f'''
+                    SELECT {', '.join(KLINE_REF_COLUMNS)}
+                    FROM kline_data
+                    WHERE code = ? AND date >= ? AND date <= ?
+                    ORDER BY date ASC
+                ''', (item['code'], item['start_date'], item['end_date']))
+                results.append({
+                    'code': item['code'],
+                    'start_date': item['start_date'],
+                    'end_date': item['end_date'],
+                    'kline_data': [dict(zip(KLINE_REF_COLUMNS, row)) for row in cursor.fetchall()]
+                })
+        return results
+    
     def get_kline_date_range(self, code: str) -> Optional[Tuple[str, str]]:
         """
         Get the date range of available K-line data for a stock.
@@ -529,8 +978,8 @@ class StockDatabase:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT MIN(date), MAX(date) 
-                FROM kline_data 
+                SELECT first_date, last_date 
+                FROM kline_coverage 
                 WHERE code = ?
             ''', (code,))
             result = cursor.fetchone()
@@ -551,21 +1000,24 @@ class StockDatabase:
             return
         
         import time
-        from colorama import Fore, Style
         start_time = time.time()
-        print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 🔒 Acquiring DB lock for save_kline_data({code}, {len(df)} rows)...{Style.RESET_ALL}")
+        stock_logger.debug("[SCAN_CHECKPOINT] 🔒 Acquiring DB lock for save_kline_data(%s, %s rows)...", code, len(df))
         
         with self._lock:
             lock_acquired = time.time()
-            print(f"{Fore.CYAN}[SCAN_CHECKPOINT] ✓ DB lock acquired for save {code} (waited {lock_acquired - start_time:.3f}s){Style.RESET_ALL}")
+            stock_logger.debug("[SCAN_CHECKPOINT] ✓ DB lock acquired for save %s (waited %.3fs)", code, lock_acquired - start_time)
+            record_stage('db.save_lock_wait', lock_acquired - start_time)
+            DB_LOCK_WAIT.observe(lock_acquired - start_time, operation='save')
             
             with self._transaction() as conn:
-                print(f"{Fore.CYAN}[SCAN_CHECKPOINT] 💾 Starting transaction to save {len(df)} rows for {code}...{Style.RESET_ALL}")
+                stock_logger.debug("[SCAN_CHECKPOINT] 💾 Starting transaction to save %s rows for %s...", len(df), code)
+                saved_dates = []
                 for idx, row in df.iterrows():
                     # Convert date to string if it's a datetime
                     date_str = str(row['date'])
                     if isinstance(row['date'], pd.Timestamp):
                         date_str = row['date'].strftime('%Y-%m-%d')
+                    saved_dates.append(date_str)
                     
                     conn.execute('''
                         INSERT OR REPLACE INTO kline_data 
@@ -587,9 +1039,111 @@ class StockDatabase:
                         row.get('pbMRQ'),
                         datetime.now()
                     ))
+                self._update_kline_coverage(conn, [(code, min(saved_dates), max(saved_dates))])
                 
                 save_end = time.time()
-                print(f"{Fore.GREEN}[SCAN_CHECKPOINT] ✓ Transaction committed for {code} (took {save_end - lock_acquired:.3f}s){Style.RESET_ALL}")
+                stock_logger.debug("[SCAN_CHECKPOINT] ✓ Transaction committed for %s (took %.3fs)", code, save_end - lock_acquired)
+                record_stage('db.save', save_end - lock_acquired)
+    
+    def save_kline_data_bulk(self, frames: Dict[str, pd.DataFrame]) -> int:
+        """
+        Save K-line data of many stocks in one transaction (e.g. the daily bars
+        of the whole market after close). Uses INSERT OR REPLACE like save_kline_data.
+        
+        Args:
+            frames: Dict mapping stock code to its K-line DataFrame
+        
+        Returns:
+            Number of rows written
+        """
+        import time
+        columns = ['open', 'high', 'low', 'close', 'volume', 'turn',
+                   'preclose', 'pctChg', 'peTTM', 'pbMRQ']
+        now = datetime.now()
+        rows = []
+        ranges = []
+        for code, df in frames.items():
+            if df is None or df.empty:
+                continue
+            dates = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d').tolist()
+            # tolist() 转为 Python 原生类型，sqlite3 无法绑定 numpy 整数
+            values = [df[column].tolist() if column in df.columns else [None] * len(df)
+                      for column in columns]
+            for date_str, *row in zip(dates, *values):
+                rows.append((code, date_str, *row, now))
+            ranges.append((code, min(dates), max(dates)))
+        if not rows:
+            return 0
+        
+        start_time = time.time()
+        with self._lock:
+            DB_LOCK_WAIT.observe(time.time() - start_time, operation='save')
+            with self._transaction() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO kline_data 
+                    (code, date, open, high, low, close, volume, turn, 
+                     preclose, pctChg, peTTM, pbMRQ, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                self._update_kline_coverage(conn, ranges)
+        return len(rows)
+    
+    def _update_kline_coverage(self, conn: sqlite3.Connection,
+                               ranges: List[Tuple[str, str, str]]) -> None:
+        """
+        Widen the coverage index with newly saved date ranges. Must be called
+        inside the transaction that saved the rows.
+        
+        Args:
+            conn: Connection of the open transaction
+            ranges: List of (code, first_date, last_date) tuples
+        """
+        now = datetime.now()
+        conn.executemany('''
+            INSERT INTO kline_coverage (code, first_date, last_date, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(code) DO UPDATE SET
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date),
+                updated_at = excluded.updated_at
+        ''', [(code, first_date, last_date, now) for code, first_date, last_date in ranges])
+    
+    def get_kline_coverage_stamp(self, code: str) -> Optional[str]:
+        """
+        Get a cheap version stamp of a stock's stored K-lines from the coverage
+        index. Every save of the stock's K-lines changes it.
+        
+        Args:
+            code: Stock code
+        
+        Returns:
+            Stamp string, or None if no K-lines are stored for the stock
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT first_date, last_date, updated_at
+                FROM kline_coverage
+                WHERE code = ?
+            ''', (code,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return f"{row[0]}:{row[1]}:{row[2]}"
+    
+    def get_kline_coverage(self) -> Dict[str, Tuple[str, str]]:
+        """
+        Get the stored K-line date range of every stock (from the coverage index).
+        
+        Returns:
+            Dict mapping stock code to (first_date, last_date) in 'YYYY-MM-DD' format
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT code, first_date, last_date FROM kline_coverage')
+            return {code: (first_date, last_date) for code, first_date, last_date in cursor.fetchall()}
     
     def get_missing_date_ranges(self, code: str, start_date: str, end_date: str) -> List[Tuple[str, str]]:
         """
@@ -912,7 +1466,8 @@ class StockDatabase:
                         ''', (
                             history_id,
                             json.dumps(config, ensure_ascii=False),
-                            json.dumps(result, ensure_ascii=False),
+                            # NaN/Infinity 保存为 null
+                            dumps_json(result).decode('utf-8'),
                             now,
                             batch_task_id
                         ))
@@ -1322,17 +1877,25 @@ class StockDatabase:
                 cursor.execute('SELECT cache_key FROM scan_cache WHERE cache_key = ?', (cache_key,))
                 exists = cursor.fetchone() is not None
                 
+                # K线数据以引用形式保存，其余内容压缩为二进制
+                payload = sqlite3.Binary(encode_scan_payload(
+                    self._compact_scanned_stocks(cursor, scanned_stocks)))
+                stock_count = len(scanned_stocks) if scanned_stocks else 0
+                
                 if exists:
                     # Update existing record, preserve created_at
                     cursor.execute('''
                         UPDATE scan_cache 
                         SET scan_config = ?, backtest_date = ?, scanned_stocks = ?, 
+                            scanned_stocks_blob = ?, stock_count = ?, scan_profile = NULL,
                             total_scanned = ?, success_count = ?, updated_at = ?
                         WHERE cache_key = ?
                     ''', (
                         json.dumps(scan_config, sort_keys=True, ensure_ascii=False),
                         backtest_date,
-                        json.dumps(scanned_stocks, ensure_ascii=False, default=str),
+                        '[]',
+                        payload,
+                        stock_count,
                         total_scanned,
                         success_count,
                         now_utc,
@@ -1342,25 +1905,44 @@ class StockDatabase:
                     # Insert new record with both created_at and updated_at
                     cursor.execute('''
                         INSERT INTO scan_cache 
-                        (cache_key, scan_config, backtest_date, scanned_stocks, total_scanned, success_count, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        (cache_key, scan_config, backtest_date, scanned_stocks, scanned_stocks_blob, stock_count,
+                         total_scanned, success_count, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (
                         cache_key,
                         json.dumps(scan_config, sort_keys=True, ensure_ascii=False),
                         backtest_date,
-                        json.dumps(scanned_stocks, ensure_ascii=False, default=str),
+                        '[]',
+                        payload,
+                        stock_count,
                         total_scanned,
                         success_count,
                         now_utc,
                         now_utc
                     ))
     
-    def get_scan_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+    def save_scan_profile(self, cache_key: str, profile: Dict[str, Any]) -> None:
+        """
+        Attach a scan stage timing report to a scan cache record.
+        
+        Args:
+            cache_key: Cache key of the scan record
+            profile: Report from ScanProfiler.report()
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                conn.execute(
+                    'UPDATE scan_cache SET scan_profile = ? WHERE cache_key = ?',
+                    (json.dumps(profile, ensure_ascii=False), cache_key)
+                )
+    
+    def get_scan_cache(self, cache_key: str, include_kline: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get scan results from cache.
         
         Args:
             cache_key: Unique cache key (hash of scan_config + backtest_date)
+            include_kline: Whether to rehydrate kline_data for each stock
         
         Returns:
             Dictionary containing scan_config, backtest_date, and scanned_stocks,
@@ -1370,7 +1952,7 @@ class StockDatabase:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT scan_config, backtest_date, scanned_stocks, created_at
+                SELECT scan_config, backtest_date, scanned_stocks, created_at, scanned_stocks_blob
                 FROM scan_cache
                 WHERE cache_key = ?
             ''', (cache_key,))
@@ -1382,17 +1964,20 @@ class StockDatabase:
             return {
                 'scan_config': json.loads(row[0]),
                 'backtest_date': row[1],
-                'scanned_stocks': json.loads(row[2]),
+                'scanned_stocks': self._load_scanned_stocks(cursor, row[2], row[4], include_kline),
                 'created_at': normalize_timestamp_to_utc(row[3])
             }
     
-    def clear_scan_cache(self, cache_key: Optional[str] = None) -> int:
+    def clear_scan_cache(self, cache_key: Optional[str] = None,
+                         backtest_date: Optional[str] = None) -> int:
         """
-        Clear scan cache. If cache_key is provided, clear only that entry.
+        Clear scan cache. If cache_key is provided, clear only that entry; if
+        backtest_date is provided, clear the entries of that date.
         Otherwise, clear all cache entries.
         
         Args:
             cache_key: Optional cache key to clear specific entry
+            backtest_date: Optional scan date (YYYY-MM-DD) to clear
         
         Returns:
             Number of records deleted
@@ -1402,6 +1987,8 @@ class StockDatabase:
                 cursor = conn.cursor()
                 if cache_key:
                     cursor.execute('DELETE FROM scan_cache WHERE cache_key = ?', (cache_key,))
+                elif backtest_date:
+                    cursor.execute('DELETE FROM scan_cache WHERE backtest_date = ?', (backtest_date,))
                 else:
                     cursor.execute('SELECT COUNT(*) FROM scan_cache')
                     count = cursor.fetchone()[0]
@@ -1432,7 +2019,8 @@ class StockDatabase:
             
             # Build query based on filters
             query = '''
-                SELECT cache_key, scan_config, backtest_date, scanned_stocks, total_scanned, success_count, created_at, updated_at
+                SELECT cache_key, scan_config, backtest_date, total_scanned, success_count, created_at, updated_at,
+                       stock_count, CASE WHEN stock_count IS NULL THEN scanned_stocks END
                 FROM scan_cache
                 WHERE 1=1
             '''
@@ -1457,34 +2045,40 @@ class StockDatabase:
             for row in rows:
                 try:
                     scan_config = json.loads(row[1])
-                    scanned_stocks = json.loads(row[3])  # row[3] is scanned_stocks, row[2] is backtest_date
+                    # 新格式直接使用 stock_count 列，旧记录才需要解析 scanned_stocks
+                    if row[7] is not None:
+                        stock_count = row[7]
+                    else:
+                        scanned_stocks = json.loads(row[8]) if row[8] else []
+                        stock_count = len(scanned_stocks) if isinstance(scanned_stocks, list) else 0
                 except (json.JSONDecodeError, TypeError) as e:
                     # If JSON parsing fails, skip this record or use empty values
                     print(f"Warning: Failed to parse JSON for scan cache {row[0]}: {e}")
                     scan_config = {}
-                    scanned_stocks = []
+                    stock_count = 0
                 
                 record = {
                     'id': row[0],  # Use cache_key as id
                     'cacheKey': row[0],
-                    'createdAt': normalize_timestamp_to_utc(row[6]),
-                    'updatedAt': normalize_timestamp_to_utc(row[7]),
+                    'createdAt': normalize_timestamp_to_utc(row[5]),
+                    'updatedAt': normalize_timestamp_to_utc(row[6]),
                     'scanDate': row[2],  # backtest_date is the scan date
-                    'stockCount': len(scanned_stocks) if isinstance(scanned_stocks, list) else 0,
+                    'stockCount': stock_count,
                     'scanConfig': scan_config,
-                    'totalScanned': row[4],  # total_scanned
-                    'successCount': row[5]  # success_count
+                    'totalScanned': row[3],  # total_scanned
+                    'successCount': row[4]  # success_count
                 }
                 records.append(record)
             
             return records
     
-    def get_scan_history(self, cache_key: str) -> Optional[Dict[str, Any]]:
+    def get_scan_history(self, cache_key: str, include_kline: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get a specific scan history record by cache_key.
         
         Args:
             cache_key: The cache key of the scan record
+            include_kline: Whether to rehydrate kline_data for each stock
         
         Returns:
             Full scan history record if found, None otherwise
@@ -1493,7 +2087,8 @@ class StockDatabase:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT cache_key, scan_config, backtest_date, scanned_stocks, created_at, updated_at
+                SELECT cache_key, scan_config, backtest_date, scanned_stocks, created_at, updated_at,
+                       scanned_stocks_blob, scan_profile
                 FROM scan_cache
                 WHERE cache_key = ?
             ''', (cache_key,))
@@ -1504,8 +2099,8 @@ class StockDatabase:
             
             try:
                 scan_config = json.loads(row[1])
-                scanned_stocks = json.loads(row[3])  # row[3] is scanned_stocks, row[2] is backtest_date
-            except (json.JSONDecodeError, TypeError) as e:
+                scanned_stocks = self._load_scanned_stocks(cursor, row[3], row[6], include_kline)
+            except (json.JSONDecodeError, TypeError, zlib.error) as e:
                 print(f"Warning: Failed to parse JSON for scan cache {row[0]}: {e}")
                 scan_config = {}
                 scanned_stocks = []
@@ -1517,7 +2112,8 @@ class StockDatabase:
                 'updatedAt': normalize_timestamp_to_utc(row[5]),
                 'scanDate': row[2],  # backtest_date is the scan date
                 'scanConfig': scan_config,
-                'scannedStocks': scanned_stocks
+                'scannedStocks': scanned_stocks,
+                'profile': json.loads(row[7]) if row[7] else None
             }
     
     def delete_scan_history(self, cache_key: str) -> bool:
@@ -1713,6 +2309,22 @@ class StockDatabase:
                 
                 return cursor.rowcount > 0
     
+    def get_batch_scan_result_dates(self, task_id: str) -> List[str]:
+        """
+        Get the scan dates that already have a result for a batch scan task.
+        
+        Args:
+            task_id: Task ID
+            
+        Returns:
+            List of scan dates (YYYY-MM-DD)
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT DISTINCT scan_date FROM batch_scan_results WHERE task_id = ?', (task_id,))
+            return [row[0] for row in cursor.fetchall()]
+    
     def save_batch_scan_result(self, result_id: str, task_id: str, scan_date: str,
                                scan_config: Dict[str, Any], scanned_stocks: List[Dict[str, Any]],
                                total_scanned: int, success_count: int) -> None:
@@ -1731,26 +2343,32 @@ class StockDatabase:
         with self._lock:
             with self._transaction() as conn:
                 cursor = conn.cursor()
+                payload = sqlite3.Binary(encode_scan_payload(
+                    self._compact_scanned_stocks(cursor, scanned_stocks)))
                 cursor.execute('''
                     INSERT INTO batch_scan_results 
-                    (id, task_id, scan_date, scan_config, scanned_stocks, total_scanned, success_count, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    (id, task_id, scan_date, scan_config, scanned_stocks, scanned_stocks_blob, stock_count,
+                     total_scanned, success_count, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (
                     result_id,
                     task_id,
                     scan_date,
                     json.dumps(scan_config, ensure_ascii=False),
-                    json.dumps(scanned_stocks, ensure_ascii=False, default=str),
+                    '[]',
+                    payload,
+                    len(scanned_stocks) if scanned_stocks else 0,
                     total_scanned,
                     success_count
                 ))
     
-    def get_batch_scan_results(self, task_id: str) -> List[Dict[str, Any]]:
+    def get_batch_scan_results(self, task_id: str, include_kline: bool = True) -> List[Dict[str, Any]]:
         """
         Get all scan results for a batch scan task.
         
         Args:
             task_id: Task ID
+            include_kline: Whether to rehydrate kline_data for each stock
             
         Returns:
             List of scan result dictionaries
@@ -1759,7 +2377,8 @@ class StockDatabase:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, task_id, scan_date, scan_config, scanned_stocks, total_scanned, success_count, created_at
+                SELECT id, task_id, scan_date, scan_config, scanned_stocks, total_scanned, success_count, created_at,
+                       scanned_stocks_blob
                 FROM batch_scan_results
                 WHERE task_id = ?
                 ORDER BY scan_date ASC
@@ -1770,8 +2389,8 @@ class StockDatabase:
             for row in rows:
                 try:
                     scan_config = json.loads(row[3])
-                    scanned_stocks = json.loads(row[4])
-                except (json.JSONDecodeError, TypeError):
+                    scanned_stocks = self._load_scanned_stocks(cursor, row[4], row[8], include_kline)
+                except (json.JSONDecodeError, TypeError, zlib.error):
                     scan_config = {}
                     scanned_stocks = []
                 
@@ -1789,12 +2408,13 @@ class StockDatabase:
             
             return results
     
-    def get_batch_scan_result(self, result_id: str) -> Optional[Dict[str, Any]]:
+    def get_batch_scan_result(self, result_id: str, include_kline: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get a specific batch scan result by ID.
         
         Args:
             result_id: Result ID
+            include_kline: Whether to rehydrate kline_data for each stock
             
         Returns:
             Result dictionary if found, None otherwise
@@ -1803,7 +2423,8 @@ class StockDatabase:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, task_id, scan_date, scan_config, scanned_stocks, total_scanned, success_count, created_at
+                SELECT id, task_id, scan_date, scan_config, scanned_stocks, total_scanned, success_count, created_at,
+                       scanned_stocks_blob
                 FROM batch_scan_results
                 WHERE id = ?
             ''', (result_id,))
@@ -1814,8 +2435,8 @@ class StockDatabase:
             
             try:
                 scan_config = json.loads(row[3])
-                scanned_stocks = json.loads(row[4])
-            except (json.JSONDecodeError, TypeError):
+                scanned_stocks = self._load_scanned_stocks(cursor, row[4], row[8], include_kline)
+            except (json.JSONDecodeError, TypeError, zlib.error):
                 scan_config = {}
                 scanned_stocks = []
             
@@ -1850,6 +2471,469 @@ class StockDatabase:
                 cursor.execute('DELETE FROM batch_scan_tasks WHERE id = ?', (task_id,))
                 return cursor.rowcount > 0
     
+    def get_analysis_cache_entry(self, config_hash: str, code: str,
+                                 data_version: str) -> Optional[bytes]:
+        """
+        Get one cached per-stock analysis entry.
+        
+        Args:
+            config_hash: Hash of the analyzer-relevant config subset
+            code: Stock code
+            data_version: K-line data version of the stock
+        
+        Returns:
+            The encoded result, or None if not cached
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT result
+                FROM analysis_cache
+                WHERE config_hash = ? AND code = ? AND data_version = ?
+            ''', (config_hash, code, data_version))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def save_analysis_cache_entries(self, config_hash: str,
+                                    entries: List[Tuple[str, str, bytes]],
+                                    max_age_days: Optional[int] = None) -> None:
+        """
+        Save per-stock analysis results in one transaction.
+        
+        Args:
+            config_hash: Hash of the analyzer-relevant config subset
+            entries: List of (code, data_version, encoded_result)
+            max_age_days: If provided, delete entries older than this many days
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO analysis_cache 
+                    (code, data_version, config_hash, result, created_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', [(code, version, config_hash, sqlite3.Binary(blob)) for code, version, blob in entries])
+                
+                if max_age_days is not None:
+                    conn.execute('''
+                        DELETE FROM analysis_cache
+                        WHERE created_at < datetime('now', ?)
+                    ''', (f'-{int(max_age_days)} days',))
+    
+    def clear_analysis_cache(self) -> int:
+        """
+        Clear all per-stock analysis cache entries.
+        
+        Returns:
+            Number of records deleted
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM analysis_cache')
+                return cursor.rowcount
+    
+    def save_scan_feature_set(self, feature_key: str, backtest_date: str,
+                              thresholds: Dict[str, Any],
+                              platform_stocks: List[Dict[str, Any]],
+                              features: Dict[str, List[Any]],
+                              total_scanned: Optional[int] = None,
+                              success_count: Optional[int] = None,
+                              quick_features: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Save a scan feature set (pre-filter platform stocks and their per-window features).
+        
+        Args:
+            feature_key: Hash of the threshold-independent scan config + backtest date
+            backtest_date: Backtest date string (YYYY-MM-DD)
+            thresholds: Threshold values the feature set was scanned with
+            platform_stocks: Platform stocks before fundamental/industry filtering
+            features: Columnar feature table (column name -> values)
+            total_scanned: Total number of stocks scanned
+            success_count: Number of stocks successfully analyzed
+            quick_features: Columnar quick-check features of every analyzed stock
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                now_utc = datetime.now(timezone.utc).isoformat()
+                stocks_blob = sqlite3.Binary(encode_scan_payload(
+                    self._compact_scanned_stocks(cursor, platform_stocks)))
+                quick_blob = (sqlite3.Binary(encode_scan_payload(quick_features))
+                              if quick_features is not None else None)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO scan_feature_sets
+                    (feature_key, backtest_date, thresholds, stocks_blob, features_blob,
+                     quick_features_blob, stock_count, total_scanned, success_count,
+                     created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    feature_key,
+                    backtest_date,
+                    json.dumps(thresholds, sort_keys=True, ensure_ascii=False),
+                    stocks_blob,
+                    sqlite3.Binary(encode_scan_payload(features)),
+                    quick_blob,
+                    len(platform_stocks),
+                    total_scanned,
+                    success_count,
+                    now_utc,
+                    now_utc
+                ))
+    
+    def get_scan_feature_set(self, feature_key: str,
+                             include_kline: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get a scan feature set.
+        
+        Args:
+            feature_key: Hash of the threshold-independent scan config + backtest date
+            include_kline: Whether to rehydrate kline_data for each stock
+        
+        Returns:
+            Dictionary containing backtest_date, thresholds, platform_stocks, features,
+            quick_features (None for older sets) and scan statistics, or None if not found
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT backtest_date, thresholds, stocks_blob, features_blob, created_at,
+                       total_scanned, success_count, quick_features_blob
+                FROM scan_feature_sets
+                WHERE feature_key = ?
+            ''', (feature_key,))
+            row = cursor.fetchone()
+            
+            if not row:
+                return None
+            
+            try:
+                return {
+                    'backtest_date': row[0],
+                    'thresholds': json.loads(row[1]),
+                    'platform_stocks': self._load_scanned_stocks(cursor, '[]', row[2], include_kline),
+                    'features': decode_scan_payload(row[3]),
+                    'quick_features': decode_scan_payload(row[7]) if row[7] else None,
+                    'created_at': normalize_timestamp_to_utc(row[4]),
+                    'total_scanned': row[5],
+                    'success_count': row[6]
+                }
+            except (json.JSONDecodeError, TypeError, zlib.error):
+                return None
+    
+    def clear_scan_feature_sets(self, backtest_date: Optional[str] = None) -> int:
+        """
+        Clear scan feature sets (only those of backtest_date if provided).
+        
+        Args:
+            backtest_date: Optional scan date (YYYY-MM-DD) to clear
+        
+        Returns:
+            Number of records deleted
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                if backtest_date:
+                    cursor.execute('DELETE FROM scan_feature_sets WHERE backtest_date = ?', (backtest_date,))
+                else:
+                    cursor.execute('DELETE FROM scan_feature_sets')
+                return cursor.rowcount
+    
+    def save_fundamentals(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Save fundamental report records in one transaction.
+        
+        Args:
+            records: List of dicts with code, year, quarter, pub_date, stat_date,
+                     yoy_asset, yoy_pni, roe_avg, liability_to_asset and has_report
+        """
+        if not records:
+            return
+        with self._lock:
+            with self._transaction() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO fundamentals
+                    (code, year, quarter, pub_date, stat_date, yoy_asset, yoy_pni,
+                     roe_avg, liability_to_asset, has_report, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', [(
+                    record['code'],
+                    int(record['year']),
+                    int(record.get('quarter', 4)),
+                    record.get('pub_date'),
+                    record.get('stat_date'),
+                    record.get('yoy_asset'),
+                    record.get('yoy_pni'),
+                    record.get('roe_avg'),
+                    record.get('liability_to_asset'),
+                    1 if record.get('has_report', True) else 0
+                ) for record in records])
+    
+    def get_fundamentals(self, codes: List[str], years: List[int],
+                         quarter: int = 4) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """
+        Get stored fundamental report records.
+        
+        Args:
+            codes: Stock codes
+            years: Report years
+            quarter: Report quarter (4 = annual report)
+        
+        Returns:
+            Dict mapping code -> year -> record (records include has_report and fetched_at)
+        """
+        result: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        if not codes or not years:
+            return result
+        columns = ['code', 'year', 'quarter', 'pub_date', 'stat_date', 'yoy_asset', 'yoy_pni',
+                   'roe_avg', 'liability_to_asset', 'has_report', 'fetched_at']
+        year_placeholders = ','.join('?' * len(years))
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            # 分批查询，避免超过 SQLite 参数数量上限
+            for i in range(0, len(codes), 500):
+                chunk = codes[i:i + 500]
+                cursor.execute(f'''
+                    SELECT {', '.join(columns)}
+                    FROM fundamentals
+                    WHERE quarter = ? AND year IN ({year_placeholders})
+                      AND code IN ({','.join('?' * len(chunk))})
+                ''', [quarter, *years, *chunk])
+                for row in cursor.fetchall():
+                    record = dict(zip(columns, row))
+                    record['has_report'] = bool(record['has_report'])
+                    record['fetched_at'] = normalize_timestamp_to_utc(record['fetched_at'])
+                    result.setdefault(record['code'], {})[record['year']] = record
+        return result
+    
+    def get_latest_valuations(self, codes: List[str],
+                              since_date: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Get the latest non-null peTTM / pbMRQ per stock from local K-line data.
+        
+        Args:
+            codes: Stock codes
+            since_date: Optional earliest K-line date to consider (YYYY-MM-DD)
+        
+        Returns:
+            Dict mapping code to {'pe_ttm': ..., 'pb_mrq': ...}; stocks without local data are omitted
+        """
+        result = {}
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            for code in codes:
+                valuation = {}
+                for column, key in (('peTTM', 'pe_ttm'), ('pbMRQ', 'pb_mrq')):
+                    cursor.execute(f'''
+                        SELECT {column} FROM kline_data
+                        WHERE code = ? AND date >= ? AND {column} IS NOT NULL
+                        ORDER BY date DESC LIMIT 1
+                    ''', (code, since_date or ''))
+                    row = cursor.fetchone()
+                    if row:
+                        valuation[key] = row[0]
+                if valuation:
+                    result[code] = valuation
+        return result
+    
+    def enqueue_task(self, task_id: str, kind: str, priority: int,
+                     payload: Dict[str, Any], dedupe_key: Optional[str] = None) -> None:
+        """
+        Persist a new pending task of the task queue.
+        
+        Args:
+            task_id: Task ID
+            kind: Task kind (e.g. 'scan', 'batch_scan')
+            priority: Priority (lower runs first)
+            payload: JSON-serializable task arguments
+            dedupe_key: Optional key identifying identical requests
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                conn.execute('''
+                    INSERT INTO task_queue (task_id, kind, priority, status, dedupe_key, payload, created_at)
+                    VALUES (?, ?, ?, 'pending', ?, ?, CURRENT_TIMESTAMP)
+                ''', (task_id, kind, priority, dedupe_key, json.dumps(payload, ensure_ascii=False, default=str)))
+    
+    def find_active_queued_task(self, kind: str, dedupe_key: str) -> Optional[str]:
+        """
+        Find a pending or running queued task with the same kind and dedupe key.
+        
+        Args:
+            kind: Task kind
+            dedupe_key: Dedupe key
+        
+        Returns:
+            Task ID, or None if there is no such task
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT task_id FROM task_queue
+                WHERE kind = ? AND dedupe_key = ? AND status IN ('pending', 'running')
+                ORDER BY created_at ASC LIMIT 1
+            ''', (kind, dedupe_key))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def update_queued_task(self, task_id: str, status: Optional[str] = None,
+                           message: Optional[str] = None, error: Optional[str] = None) -> None:
+        """
+        Update the state of a queued task.
+        Moving to 'running' sets started_at and counts an attempt; moving to a
+        final state ('completed', 'failed') sets finished_at.
+        
+        Args:
+            task_id: Task ID
+            status: New status
+            message: Status message
+            error: Error message
+        """
+        updates = []
+        values = []
+        if status is not None:
+            updates.append('status = ?')
+            values.append(status)
+            if status == 'running':
+                updates.append('started_at = CURRENT_TIMESTAMP')
+                updates.append('attempts = attempts + 1')
+            elif status in ('completed', 'failed'):
+                updates.append('finished_at = CURRENT_TIMESTAMP')
+        if message is not None:
+            updates.append('message = ?')
+            values.append(message)
+        if error is not None:
+            updates.append('error = ?')
+            values.append(error)
+        if not updates:
+            return
+        values.append(task_id)
+        with self._lock:
+            with self._transaction() as conn:
+                conn.execute(f"UPDATE task_queue SET {', '.join(updates)} WHERE task_id = ?", values)
+    
+    def get_unfinished_queued_tasks(self) -> List[Dict[str, Any]]:
+        """
+        Get pending and running queued tasks (oldest first).
+        
+        Returns:
+            List of task dictionaries (task_id, kind, priority, status, dedupe_key, payload, attempts)
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT task_id, kind, priority, status, dedupe_key, payload, attempts
+                FROM task_queue
+                WHERE status IN ('pending', 'running')
+                ORDER BY created_at ASC
+            ''')
+            rows = cursor.fetchall()
+        
+        tasks = []
+        for row in rows:
+            try:
+                payload = json.loads(row[5]) if row[5] else {}
+            except json.JSONDecodeError:
+                payload = {}
+            tasks.append({
+                'task_id': row[0],
+                'kind': row[1],
+                'priority': row[2],
+                'status': row[3],
+                'dedupe_key': row[4],
+                'payload': payload,
+                'attempts': row[6] or 0
+            })
+        return tasks
+    
+    def save_queued_task_result(self, task_id: str, result: Any) -> None:
+        """
+        Save the result of a finished queued task (compressed; K-lines of result
+        stocks are stored as references when the kline_data table covers them).
+        
+        Args:
+            task_id: Task ID
+            result: JSON-serializable task result
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                if isinstance(result, list):
+                    result = self._compact_scanned_stocks(cursor, result)
+                cursor.execute('UPDATE task_queue SET result_blob = ? WHERE task_id = ?',
+                               (sqlite3.Binary(encode_scan_payload(result)), task_id))
+    
+    def get_finished_queued_task(self, task_id: str,
+                                 include_kline: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get a completed or failed queued task with its saved result.
+        
+        Args:
+            task_id: Task ID
+            include_kline: Whether to rehydrate kline_data of result stocks
+        
+        Returns:
+            Task dictionary (task_id, kind, status, message, error, created_at,
+            finished_at, result), or None if there is no such finished task
+        """
+        with self._lock:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT task_id, kind, status, message, error, created_at, finished_at, result_blob
+                FROM task_queue
+                WHERE task_id = ? AND status IN ('completed', 'failed')
+            ''', (task_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            result = None
+            if row[7]:
+                try:
+                    result = decode_scan_payload(row[7])
+                    if isinstance(result, list):
+                        result = (self._hydrate_scanned_stocks(cursor, result) if include_kline
+                                  else result)
+                except (json.JSONDecodeError, TypeError, zlib.error) as e:
+                    print(f"Warning: Failed to decode result of task {task_id}: {e}")
+        
+        return {
+            'task_id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'message': row[3],
+            'error': row[4],
+            'created_at': row[5],
+            'finished_at': row[6],
+            'result': result
+        }
+    
+    def prune_task_queue(self, max_age_days: int) -> int:
+        """
+        Delete finished queued tasks older than max_age_days.
+        
+        Args:
+            max_age_days: Maximum age in days
+        
+        Returns:
+            Number of deleted tasks
+        """
+        with self._lock:
+            with self._transaction() as conn:
+                cursor = conn.execute('''
+                    DELETE FROM task_queue
+                    WHERE status IN ('completed', 'failed')
+                    AND finished_at < datetime('now', ?)
+                ''', (f'-{int(max_age_days)} days',))
+                return cursor.rowcount
+    
     def close(self):
         """
         Close all database connections.
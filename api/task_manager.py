@@ -9,12 +9,6 @@ from typing import Dict, Any, Optional, List, Callable
 import threading
 import traceback
 
-try:
-    from api.json_utils import sanitize_task_result
-except ImportError:
-    # 如果绝对导入失败，尝试相对导入（本地开发环境）
-    from .json_utils import sanitize_task_result
-
 
 class TaskStatus(Enum):
     """Enum representing the possible states of a task."""
@@ -37,12 +31,15 @@ class Task:
         self.created_at = time.time()
         self.updated_at = time.time()
         self.completed_at = None
+        self.profile = None  # Scan stage timing report (enable_profiling)
+        self.partial_results = []  # Platform stocks found so far (streamed before completion)
 
     def update(self, status: Optional[TaskStatus] = None,
                progress: Optional[int] = None,
                message: Optional[str] = None,
                result: Any = None,
-               error: Optional[str] = None) -> None:
+               error: Optional[str] = None,
+               profile: Optional[Dict[str, Any]] = None) -> None:
         """Update task status and details."""
         if status:
             self.status = status
@@ -61,23 +58,28 @@ class Task:
         if error is not None:
             self.error = error
 
+        if profile is not None:
+            self.profile = profile
+
         self.updated_at = time.time()
 
     def to_dict(self) -> Dict[str, Any]:
-        """Convert task to dictionary for API responses."""
-        # Sanitize result to handle NaN and Infinity values
-        sanitized_result = sanitize_task_result(self.result)
+        """Convert task to dictionary for API responses.
 
+        NaN/Infinity and NumPy values in result are left as-is; they are
+        handled when the response is rendered (see json_utils.dumps_json).
+        """
         return {
             "task_id": self.task_id,
             "status": self.status.value,
             "progress": self.progress,
             "message": self.message,
-            "result": sanitized_result,
+            "result": self.result,
             "error": self.error,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
-            "completed_at": self.completed_at
+            "completed_at": self.completed_at,
+            "profile": self.profile
         }
 
 
@@ -93,9 +95,9 @@ class TaskManager:
             cls._instance = super(TaskManager, cls).__new__(cls)
         return cls._instance
 
-    def create_task(self) -> str:
-        """Create a new task and return its ID."""
-        task_id = str(uuid.uuid4())
+    def create_task(self, task_id: Optional[str] = None) -> str:
+        """Create a new task and return its ID (a given ID is used to restore queued tasks)."""
+        task_id = task_id or str(uuid.uuid4())
         with self._lock:
             self._tasks[task_id] = Task(task_id)
         return task_id
@@ -112,6 +114,20 @@ class TaskManager:
             if task:
                 task.update(**kwargs)
 
+    def append_partial_result(self, task_id: str, item: Dict[str, Any]) -> None:
+        """Append an intermediate result (e.g. a platform stock found mid-scan)."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task:
+                task.partial_results.append(item)
+                task.updated_at = time.time()
+
+    def get_partial_results(self, task_id: str, start: int = 0) -> List[Dict[str, Any]]:
+        """Get the intermediate results of a task from index start on."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task.partial_results[start:] if task else []
+
     def run_task_in_background(self, task_id: str, func: Callable, *args, **kwargs) -> None:
         """Run a function in a background thread and track its status."""
         def wrapper():
@@ -161,6 +177,14 @@ class TaskManager:
             for task_id in task_ids_to_remove:
                 del self._tasks[task_id]
 
+    def count_by_status(self) -> Dict[str, int]:
+        """Count tasks per status (without serializing their results)."""
+        counts = {status.value: 0 for status in TaskStatus}
+        with self._lock:
+            for task in self._tasks.values():
+                counts[task.status.value] += 1
+        return counts
+
     def get_all_tasks(self) -> List[Dict[str, Any]]:
         """Get all tasks as dictionaries."""
         with self._lock:
@@ -0,0 +1,311 @@
+"""
+Task queue module.
+Durable queue for background work (scans, batch scans, fundamentals refreshes)
+backed by the task_queue table of the stock database, with a global worker
+limit, per-kind concurrency limits and priorities (config TASK_QUEUE_*).
+
+Queued tasks are persisted on submit and resumed after a restart; their
+progress and results live in the TaskManager as before, and the result of a
+completed task is also saved with its row so it can be read after a restart.
+Work that runs inside a request (backtests) takes a slot() instead, so it
+competes for the same workers at its own priority without being persisted.
+"""
+import itertools
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from colorama import Fore, Style
+
+try:
+    from .config import (TASK_QUEUE_MAX_WORKERS, TASK_QUEUE_CONCURRENCY,
+                         TASK_QUEUE_PRIORITIES, TASK_QUEUE_RETENTION_DAYS)
+    from .metrics import COALESCED_TASKS
+    from .stock_database import get_stock_database
+    from .task_manager import task_manager, TaskStatus
+except ImportError:
+    from api.config import (TASK_QUEUE_MAX_WORKERS, TASK_QUEUE_CONCURRENCY,
+                            TASK_QUEUE_PRIORITIES, TASK_QUEUE_RETENTION_DAYS)
+    from api.metrics import COALESCED_TASKS
+    from api.stock_database import get_stock_database
+    from api.task_manager import task_manager, TaskStatus
+
+# Handler signature: handler(task_id, payload). It reports progress through
+# task_manager and may set the final status itself; if it returns without
+# doing so the task is marked completed, if it raises the task is marked failed.
+TaskHandler = Callable[[str, Dict[str, Any]], None]
+
+# Priority of kinds missing from TASK_QUEUE_PRIORITIES
+DEFAULT_PRIORITY = 50
+
+
+class _QueueEntry:
+    """A queued task or an in-request slot waiting for a worker."""
+
+    def __init__(self, kind: str, priority: int, seq: int,
+                 task_id: Optional[str] = None, payload: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.priority = priority
+        self.seq = seq
+        self.task_id = task_id
+        self.payload = payload
+        # 仅 slot 使用：获得执行资格时置位
+        self.granted = threading.Event()
+
+    def __lt__(self, other: '_QueueEntry') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class TaskQueue:
+    """
+    Priority task queue with per-kind concurrency limits.
+    Thread-safe; scheduling decisions are made under one condition lock.
+    """
+
+    def __init__(self, max_workers: int = TASK_QUEUE_MAX_WORKERS,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 priorities: Optional[Dict[str, int]] = None):
+        """
+        Initialize the queue (tasks are not resumed until start()).
+
+        Args:
+            max_workers: Maximum number of tasks/slots running at once
+            concurrency: Per-kind concurrency limits (kinds not listed are
+                limited only by max_workers)
+            priorities: Per-kind priorities (lower runs first)
+        """
+        self.max_workers = max(1, max_workers)
+        self.concurrency = dict(TASK_QUEUE_CONCURRENCY if concurrency is None else concurrency)
+        self.priorities = dict(TASK_QUEUE_PRIORITIES if priorities is None else priorities)
+        self._handlers: Dict[str, Tuple[TaskHandler, bool]] = {}
+        self._waiting: List[_QueueEntry] = []
+        self._running: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._submit_lock = threading.Lock()
+        self._started = False
+
+    def register_handler(self, kind: str, handler: TaskHandler, resumable: bool = True) -> None:
+        """
+        Register the function that runs tasks of a kind.
+
+        Args:
+            kind: Task kind
+            handler: Function called as handler(task_id, payload) on a worker thread
+            resumable: If False, tasks interrupted by a restart are marked
+                failed instead of being run again
+        """
+        self._handlers[kind] = (handler, resumable)
+
+    def priority_of(self, kind: str) -> int:
+        """Get the priority of a task kind (lower runs first)."""
+        return self.priorities.get(kind, DEFAULT_PRIORITY)
+
+    def start(self) -> None:
+        """
+        Resume unfinished tasks from the database and prune old finished ones.
+        Call once handlers are registered; later calls do nothing.
+        """
+        with self._submit_lock:
+            if self._started:
+                return
+            self._started = True
+
+            db = get_stock_database()
+            try:
+                pruned = db.prune_task_queue(TASK_QUEUE_RETENTION_DAYS)
+                if pruned:
+                    print(f"{Fore.CYAN}[TASK_QUEUE] Pruned {pruned} finished tasks{Style.RESET_ALL}")
+            except Exception as e:
+                print(f"{Fore.YELLOW}[TASK_QUEUE] Failed to prune task queue: {e}{Style.RESET_ALL}")
+
+            resumed = 0
+            for record in db.get_unfinished_queued_tasks():
+                task_id, kind = record['task_id'], record['kind']
+                handler = self._handlers.get(kind)
+                if handler is None or (record['status'] == 'running' and not handler[1]):
+                    # 无法恢复的任务（未注册类型或不可重跑的中断任务）标记为失败
+                    db.update_queued_task(task_id, status='failed', error='服务重启，任务中断且无法恢复')
+                    continue
+
+                task_manager.create_task(task_id)
+                message = '服务重启后恢复，排队中'
+                task_manager.update_task(task_id, message=message)
+                db.update_queued_task(task_id, status='pending', message=message)
+                with self._cond:
+                    self._waiting.append(_QueueEntry(
+                        kind, record['priority'], next(self._seq), task_id, record['payload']))
+                resumed += 1
+
+            if resumed:
+                print(f"{Fore.GREEN}[TASK_QUEUE] Resumed {resumed} unfinished tasks{Style.RESET_ALL}")
+            with self._cond:
+                self._dispatch()
+
+    def submit(self, kind: str, payload: Dict[str, Any],
+               dedupe_key: Optional[str] = None,
+               priority: Optional[int] = None) -> Tuple[str, bool]:
+        """
+        Queue a task.
+
+        Args:
+            kind: Task kind (must have a registered handler)
+            payload: JSON-serializable arguments passed to the handler
+            dedupe_key: If a pending/running task of the same kind has this
+                key, it is returned instead of queuing a new one
+            priority: Override of the kind's priority
+
+        Returns:
+            Tuple of (task ID, True if an existing task was returned)
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for task kind '{kind}'")
+        self.start()
+
+        db = get_stock_database()
+        priority = self.priority_of(kind) if priority is None else priority
+        # 查重与入队需原子完成，避免两个相同请求同时入队
+        with self._submit_lock:
+            if dedupe_key:
+                existing = db.find_active_queued_task(kind, dedupe_key)
+                if existing and task_manager.get_task(existing):
+                    COALESCED_TASKS.inc(kind=kind)
+                    return existing, True
+            task_id = task_manager.create_task()
+            db.enqueue_task(task_id, kind, priority, payload, dedupe_key)
+
+        with self._cond:
+            entry = _QueueEntry(kind, priority, next(self._seq), task_id, payload)
+            self._waiting.append(entry)
+            ahead = sum(1 for other in self._waiting if other < entry)
+            self._dispatch()
+            if entry in self._waiting:
+                task_manager.update_task(task_id, message=f"排队中，前面还有 {ahead} 个任务")
+        return task_id, False
+
+    @contextmanager
+    def slot(self, kind: str, priority: Optional[int] = None,
+             on_wait: Optional[Callable[[int], None]] = None) -> Iterator[None]:
+        """
+        Run the enclosed block as a task of the given kind (blocking until a
+        worker is free). Not persisted: for work tied to a live request.
+
+        Args:
+            kind: Task kind (used for concurrency limit and default priority)
+            priority: Override of the kind's priority
+            on_wait: Called with the number of entries ahead if the block has to wait
+        """
+        priority = self.priority_of(kind) if priority is None else priority
+        with self._cond:
+            entry = _QueueEntry(kind, priority, next(self._seq))
+            self._waiting.append(entry)
+            self._dispatch()
+            ahead = sum(1 for other in self._waiting if other < entry)
+        if not entry.granted.is_set() and on_wait:
+            on_wait(ahead)
+        entry.granted.wait()
+        try:
+            yield
+        finally:
+            self._release(kind)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get running and waiting counts per kind.
+
+        Returns:
+            Dict with 'running' and 'waiting' dicts mapping kind to count
+        """
+        with self._cond:
+            waiting: Dict[str, int] = {}
+            for entry in self._waiting:
+                waiting[entry.kind] = waiting.get(entry.kind, 0) + 1
+            return {'running': dict(self._running), 'waiting': waiting}
+
+    def _dispatch(self) -> None:
+        """Start waiting entries while workers are free. Must hold self._cond."""
+        while self._waiting and sum(self._running.values()) < self.max_workers:
+            # 按优先级找第一个所属类型未达并发上限的条目
+            entry = None
+            for candidate in sorted(self._waiting):
+                limit = self.concurrency.get(candidate.kind)
+                if limit is None or self._running.get(candidate.kind, 0) < limit:
+                    entry = candidate
+                    break
+            if entry is None:
+                return
+            self._waiting.remove(entry)
+            self._running[entry.kind] = self._running.get(entry.kind, 0) + 1
+
+            if entry.task_id is None:
+                entry.granted.set()
+            else:
+                thread = threading.Thread(target=self._run, args=(entry,), daemon=True,
+                                          name=f"task-{entry.kind}-{entry.task_id[:8]}")
+                thread.start()
+
+    def _release(self, kind: str) -> None:
+        """Free a worker of a kind and start the next waiting entries."""
+        with self._cond:
+            self._running[kind] = max(0, self._running.get(kind, 0) - 1)
+            self._dispatch()
+
+    def _run(self, entry: _QueueEntry) -> None:
+        """Run a queued task on a worker thread and persist its outcome."""
+        db = get_stock_database()
+        task_id = entry.task_id
+        try:
+            db.update_queued_task(task_id, status='running', message='Task started')
+            task_manager.update_task(task_id, status=TaskStatus.RUNNING, message="Task started")
+            handler, _ = self._handlers[entry.kind]
+            try:
+                handler(task_id, entry.payload or {})
+            except Exception as e:
+                print(f"{Fore.RED}[TASK_QUEUE] Task {task_id} ({entry.kind}) failed: {e}{Style.RESET_ALL}")
+                traceback.print_exc()
+                task_manager.update_task(
+                    task_id,
+                    status=TaskStatus.FAILED,
+                    error=f"Task failed: {str(e)}\n{traceback.format_exc()}",
+                    message=f"Task failed: {str(e)}"
+                )
+
+            task = task_manager.get_task(task_id)
+            if task and task.status == TaskStatus.FAILED:
+                db.update_queued_task(task_id, status='failed', message=task.message,
+                                      error=(task.error or '')[:2000])
+            else:
+                if task and task.status != TaskStatus.COMPLETED:
+                    task_manager.update_task(task_id, status=TaskStatus.COMPLETED, progress=100)
+                if task and task.result is not None:
+                    # 保存结果，服务重启后仍可通过任务 ID 查询
+                    db.save_queued_task_result(task_id, task.result)
+                db.update_queued_task(task_id, status='completed',
+                                      message=task.message if task else None)
+        except Exception as e:
+            # 队列表写入失败不应影响后续任务调度
+            print(f"{Fore.RED}[TASK_QUEUE] Error running task {task_id}: {e}{Style.RESET_ALL}")
+            traceback.print_exc()
+        finally:
+            self._release(entry.kind)
+
+
+# Global task queue instance
+_task_queue: Optional[TaskQueue] = None
+_task_queue_lock = threading.Lock()
+
+
+def get_task_queue() -> TaskQueue:
+    """
+    Get the global task queue instance (thread-safe singleton).
+
+    Returns:
+        TaskQueue instance
+    """
+    global _task_queue
+    if _task_queue is None:
+        with _task_queue_lock:
+            if _task_queue is None:
+                _task_queue = TaskQueue()
+    return _task_queue
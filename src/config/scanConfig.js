@@ -57,6 +57,7 @@ export function getDefaultScanConfig() {
     // 进入平台期后的相对强度参数
     check_relative_strength: true, // 启用相对大盘强度检查（计算并保存相对强度值）
     outperform_index_threshold: null, // 相对强度阈值，null表示不过滤（计算并保存但不作为筛选条件）
+    relative_strength_benchmark: 'sh.000001', // 相对强度基准指数：sh.000001 上证指数 / sz.399001 深证成指 / sh.000300 沪深300
 
     // 基本面筛选参数
     use_fundamental_filter: false, // 是否启用基本面筛选
@@ -74,6 +75,9 @@ export function getDefaultScanConfig() {
     
     // 系统设置
     use_scan_cache: false, // 是否使用扫描结果缓存，默认为关闭
+    use_analysis_cache: true, // 是否复用个股分析结论缓存（K线与分析参数不变时），默认为开启
+    use_feature_table: false, // 特征表模式：仅收紧阈值时直接在上次扫描的特征表上重新筛选，默认为关闭
+    enable_profiling: false, // 记录扫描各阶段耗时报告（随任务状态返回并保存到扫描历史），默认为关闭
     max_stock_count: null, // 扫描股票数量限制，null或0表示全量扫描
     use_local_database_first: true // 优先使用本地数据库数据，默认为开启
   }
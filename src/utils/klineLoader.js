@@ -0,0 +1,127 @@
+/**
+ * K线数据按需加载工具函数
+ *
+ * 扫描结果接口默认只返回每只股票的 kline_ref（code + 日期范围），
+ * 需要绘图或计算时再通过 /api/kline/batch 批量加载K线数据。
+ */
+import axios from 'axios'
+
+// 与后端 MAX_KLINE_BATCH_ITEMS 保持一致
+const MAX_BATCH_ITEMS = 200
+
+// 正在加载中的请求（key: code|start|end），避免同一只股票被重复请求
+const inflight = new Map()
+
+function refKey (stock) {
+  const ref = stock.kline_ref
+  return `${ref.code || stock.code}|${ref.start_date}|${ref.end_date}`
+}
+
+function hasKlineData (stock) {
+  return Array.isArray(stock.kline_data) && stock.kline_data.length > 0
+}
+
+async function loadChunk (chunk) {
+  try {
+    const response = await axios.post('/platform/api/kline/batch', {
+      items: chunk.map(stock => ({
+        code: stock.kline_ref.code || stock.code,
+        start_date: stock.kline_ref.start_date,
+        end_date: stock.kline_ref.end_date
+      }))
+    })
+    if (response.data.success && Array.isArray(response.data.data)) {
+      // 返回结果与请求顺序一致
+      return response.data.data.map(item => item.kline_data || [])
+    }
+  } catch (e) {
+    console.warn('批量加载K线数据失败:', e)
+  }
+  return chunk.map(() => null)
+}
+
+/**
+ * 为缺少K线数据的股票批量加载K线，并写回 stock.kline_data
+ * 只在需要绘图或计算时调用（例如当前页的缩略图、打开完整K线图），不要对整个结果列表预加载
+ * @param {Array} stocks - 扫描结果股票列表（包含 kline_ref）
+ * @returns {Promise<Array>} - 同一个股票列表（已填充 kline_data）
+ */
+export async function ensureKlineData(stocks) {
+  if (!Array.isArray(stocks) || stocks.length === 0) {
+    return stocks
+  }
+
+  const needed = stocks.filter(stock => stock && stock.kline_ref && !hasKlineData(stock))
+  if (needed.length === 0) {
+    return stocks
+  }
+
+  // 同一 kline_ref 只请求一次，已在加载中的直接复用
+  const pending = new Map()
+  needed.forEach(stock => {
+    const key = refKey(stock)
+    if (!inflight.has(key) && !pending.has(key)) {
+      pending.set(key, stock)
+    }
+  })
+
+  const unique = Array.from(pending.values())
+  for (let i = 0; i < unique.length; i += MAX_BATCH_ITEMS) {
+    const chunk = unique.slice(i, i + MAX_BATCH_ITEMS)
+    const request = loadChunk(chunk)
+    chunk.forEach((stock, idx) => {
+      const key = refKey(stock)
+      const result = request.then(results => results[idx])
+      inflight.set(key, result)
+      result.finally(() => inflight.delete(key))
+    })
+  }
+
+  await Promise.all(needed.map(stock =>
+    inflight.get(refKey(stock)).then(klineData => {
+      if (klineData) stock.kline_data = klineData
+    })
+  ))
+
+  return stocks
+}
+
+/**
+ * 判断计算 %B 是否还需要加载K线：新的 kline_ref 已带后端计算的 percent_b，只有旧记录需要K线
+ * @param {Object} stock - 股票对象
+ * @returns {boolean}
+ */
+export function needsKlineForPercentB(stock) {
+  return !!(stock && stock.kline_ref && !hasKlineData(stock) && !('percent_b' in stock.kline_ref))
+}
+
+/**
+ * 只为无法直接得到 %B 的股票（旧记录）加载K线
+ * @param {Array} stocks - 股票列表
+ * @returns {Promise<number>} - 加载K线的股票数量
+ */
+export async function ensurePercentBKlineData(stocks) {
+  const pending = Array.isArray(stocks) ? stocks.filter(needsKlineForPercentB) : []
+  if (pending.length > 0) {
+    await ensureKlineData(pending)
+  }
+  return pending.length
+}
+
+/**
+ * 为统计计算加载K线：只加载缺少 %B（旧记录）或缺少 turnover_analysis（需要从K线计算换手率）的股票
+ * @param {Array} stocks - 股票列表
+ * @returns {Promise<number>} - 加载K线的股票数量
+ */
+export async function ensureStatisticsKlineData(stocks) {
+  const pending = Array.isArray(stocks) ? stocks.filter(stock =>
+    stock && stock.kline_ref && !hasKlineData(stock) && (
+      needsKlineForPercentB(stock) ||
+      !stock.turnover_analysis || Object.keys(stock.turnover_analysis).length === 0
+    )
+  ) : []
+  if (pending.length > 0) {
+    await ensureKlineData(pending)
+  }
+  return pending.length
+}
@@ -256,13 +256,18 @@ function calculateBollingerBands(klineData, period = 20, stdDev = 2.0) {
 /**
  * 从股票数据中提取 %B (Percent B) 值
  * %B = (收盘价 - 布林下轨) / (布林上轨 - 布林下轨)
- * @param {Object} stock - 股票对象，包含 kline_data
+ * 没有 kline_data 时使用后端在 kline_ref 中给出的 percent_b（同样的计算方式）
+ * @param {Object} stock - 股票对象，包含 kline_data 或 kline_ref
  * @returns {number|null} - %B 值，如果无法计算返回null
  */
 export function extractPercentB(stock) {
-  if (!stock || !stock.kline_data || !Array.isArray(stock.kline_data) || stock.kline_data.length === 0) {
+  if (!stock) {
     return null
   }
+  if (!stock.kline_data || !Array.isArray(stock.kline_data) || stock.kline_data.length === 0) {
+    const percentB = stock.kline_ref ? stock.kline_ref.percent_b : null
+    return typeof percentB === 'number' ? percentB : null
+  }
   
   // 计算布林带（使用默认参数：周期20，标准差2.0）
   const bb = calculateBollingerBands(stock.kline_data, 20, 2.0)
@@ -0,0 +1,89 @@
+"""
+Tests for the read-only frame contract of the analyzers: a prepared K-line
+frame is analyzed through views, without DataFrame copies on the hot path.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.analyzers.combined_analyzer import analyze_stock  # noqa: E402
+from api.analyzers.frame_utils import prepare_analysis_frame  # noqa: E402
+from api.analyzers.price_analyzer import quick_price_check  # noqa: E402
+
+
+def _kline_frame(days: int = 240) -> pd.DataFrame:
+    """Synthetic K-lines: a decline from 20 to 10, then a quiet platform around 10."""
+    rng = np.random.default_rng(0)
+    decline = np.linspace(20.0, 10.0, days // 2)
+    platform = 10.0 + rng.normal(0.0, 0.05, days - len(decline))
+    close = np.concatenate([decline, platform])
+    return pd.DataFrame({
+        'date': pd.bdate_range('2024-01-01', periods=days),
+        'open': close * 0.998,
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': np.where(np.arange(days) < len(decline), 3e6, 1e6) * rng.uniform(0.95, 1.05, days),
+        'turn': rng.uniform(0.8, 1.2, days),
+    })
+
+
+@pytest.fixture
+def no_frame_copies(monkeypatch):
+    """Make any DataFrame.copy() call fail the test."""
+    def fail_copy(self, *args, **kwargs):
+        raise AssertionError('DataFrame.copy() called on the analysis hot path')
+    monkeypatch.setattr(pd.DataFrame, 'copy', fail_copy)
+
+
+def test_prepare_analysis_frame_returns_conforming_frame_as_is():
+    df = _kline_frame()
+    assert prepare_analysis_frame(df) is df
+
+
+def test_prepare_analysis_frame_normalizes_raw_frame():
+    raw = _kline_frame().iloc[::-1].set_index(np.arange(240, 0, -1))
+    raw['date'] = raw['date'].dt.strftime('%Y-%m-%d')
+    frame = prepare_analysis_frame(raw)
+    assert pd.api.types.is_datetime64_any_dtype(frame['date'])
+    assert frame['date'].is_monotonic_increasing
+    assert isinstance(frame.index, pd.RangeIndex) and frame.index.start == 0
+
+
+def test_quick_price_check_reads_a_view(monkeypatch):
+    df = _kline_frame()
+    seen = []
+    original = pd.Series.max
+
+    def spy_max(self, *args, **kwargs):
+        seen.append(self.to_numpy())
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(pd.Series, 'max', spy_max)
+    quick_price_check(df, 60, 1.0, 1.0)
+    assert seen, 'quick_price_check did not read the window'
+    assert any(np.shares_memory(values, df['high'].to_numpy()) for values in seen)
+
+
+@pytest.mark.parametrize('use_box_detection', [True, False])
+def test_analyze_stock_does_not_copy_prepared_frame(no_frame_copies, use_box_detection):
+    # 突破预测需要在自己的结果上加指标列（technical_indicators 复制一次），不在此覆盖
+    df = _kline_frame()
+    market_df = _kline_frame()[['date', 'close']]
+    result = analyze_stock(
+        df, windows=[30, 60, 90],
+        box_threshold=0.5, ma_diff_threshold=0.1, volatility_threshold=0.5,
+        use_box_detection=use_box_detection,
+        use_low_position=True, decline_period_days=250, use_rapid_decline_detection=True,
+        use_breakthrough_prediction=False, use_breakthrough_confirmation=True,
+        check_relative_strength=True, market_df=market_df,
+        end_date=df['date'].iloc[-1].strftime('%Y-%m-%d'),
+    )
+    # 必须走完整条分析路径（含位置、下跌与相对强度分析），否则测试覆盖不到各分析器
+    assert result['is_platform']
+    assert result['relative_strength_analysis']